@@ -0,0 +1,353 @@
+"""Memory-model admission control for generation jobs
+
+MemoryPredictor estimates the peak extra VRAM and host RAM a job needs on top
+of what is already resident (model weights), from the shape of the request:
+audio length, batch size, LM size, offload mode and tiled decode. Like the job
+cost model in acestep.job_scheduler it is a small ridge regression pulled
+towards a prior, refitted from the peaks measured around every job
+(PeakMemoryProbe).
+
+AdmissionController turns predictions into decisions: run the job as is,
+split its batch into sequential sub-batches that fit, or defer it until
+running jobs release memory.
+"""
+
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from acestep.job_scheduler import DEFAULT_DURATION_SECONDS, lm_size_factor, ridge_fit
+
+# Weights loaded onto the GPU for a job when the models are offloaded to CPU between jobs (GB)
+DIT_WEIGHTS_GB = 4.5
+LM_WEIGHTS_GB = {"0.6B": 1.5, "1.7B": 4.0, "4B": 9.0}
+
+# Prior slopes (GB per audio-minute of one batch item) before any measurement
+_PRIOR_VRAM_PER_MINUTE = 0.4  # latents, DiT activations, CFG copies
+_PRIOR_VRAM_TILE = 1.0  # one tiled VAE decode window per batch item
+_PRIOR_VRAM_UNTILED_PER_MINUTE = 3.0  # full-length VAE decode
+_PRIOR_RAM_PER_MINUTE = 0.1  # decoded audio and latents kept on CPU
+
+ACTION_ACCEPT = "accept"
+ACTION_SPLIT = "split"
+ACTION_DEFER = "defer"
+
+
+def memory_features(
+    duration: Optional[float],
+    batch_size: int,
+    use_tiled_decode: bool = True,
+) -> Tuple[float, float, float, float]:
+    """
+    Feature vector (fixed, audio-minutes, tiled decode windows, untiled decode minutes) of a job.
+
+    audio-minutes = minutes of audio x batch size; decode memory is bounded by the
+    tile size with tiled decode and grows with the whole batch without it.
+    """
+    seconds = float(duration) if duration and float(duration) > 0 else DEFAULT_DURATION_SECONDS
+    batch = max(1, int(batch_size or 1))
+    minutes = seconds / 60.0 * batch
+    if use_tiled_decode:
+        return (1.0, minutes, float(batch), 0.0)
+    return (1.0, minutes, 0.0, minutes)
+
+
+class _RidgeModel:
+    """Linear model fitted on recent (features, value) samples, regularized towards a prior."""
+
+    def __init__(self, prior: Sequence[float], window: int = 50, prior_weight: float = 2.0) -> None:
+        self._prior = list(prior)
+        self._coef = list(prior)
+        self._prior_weight = prior_weight
+        self._samples: Deque[Tuple[Tuple[float, ...], float]] = deque(maxlen=max(1, window))
+
+    @property
+    def coef(self) -> List[float]:
+        return list(self._coef)
+
+    def predict(self, features: Sequence[float]) -> float:
+        return max(0.0, sum(w * x for w, x in zip(self._coef, features)))
+
+    def observe(self, features: Sequence[float], value: float) -> None:
+        self._samples.append((tuple(features), float(value)))
+        coef = ridge_fit(self._samples, self._prior, self._prior_weight)
+        if coef is not None:
+            self._coef = coef
+
+
+class MemoryPredictor:
+    """
+    Predicts peak extra VRAM / RAM (GB) of a job, one model per memory mode.
+
+    The mode (offload settings, LM size, whether the job runs the LM) changes what is
+    loaded during the job, so each mode keeps its own calibrated fixed term; the
+    per-minute slopes start from the same priors.
+    """
+
+    def __init__(
+        self,
+        offload_to_cpu: bool = False,
+        offload_dit_to_cpu: bool = False,
+        lm_offload_to_cpu: bool = False,
+        window: int = 50,
+    ) -> None:
+        self.offload_to_cpu = offload_to_cpu
+        self.offload_dit_to_cpu = offload_dit_to_cpu
+        self.lm_offload_to_cpu = lm_offload_to_cpu
+        self._window = window
+        self._vram: Dict[Tuple, _RidgeModel] = {}
+        self._ram: Dict[Tuple, _RidgeModel] = {}
+        self._lock = Lock()
+
+    def _mode(self, lm_model: Optional[str], thinking: bool) -> Tuple:
+        return (self.offload_to_cpu, self.offload_dit_to_cpu, self.lm_offload_to_cpu, lm_size_factor(lm_model), thinking)
+
+    def _models(self, lm_model: Optional[str], thinking: bool) -> Tuple[_RidgeModel, _RidgeModel]:
+        mode = self._mode(lm_model, thinking)
+        if mode not in self._vram:
+            fixed = 0.5
+            if self.offload_to_cpu or self.offload_dit_to_cpu:
+                fixed += DIT_WEIGHTS_GB
+            if thinking and self.lm_offload_to_cpu:
+                size = next((s for s in LM_WEIGHTS_GB if s.lower() in (lm_model or "").lower()), "0.6B")
+                fixed += LM_WEIGHTS_GB[size]
+            self._vram[mode] = _RidgeModel(
+                [fixed, _PRIOR_VRAM_PER_MINUTE, _PRIOR_VRAM_TILE, _PRIOR_VRAM_UNTILED_PER_MINUTE], self._window
+            )
+            # Host RAM holds the offloaded weights while they are on CPU; only the job's own data is extra
+            self._ram[mode] = _RidgeModel([0.5, _PRIOR_RAM_PER_MINUTE, 0.0, _PRIOR_RAM_PER_MINUTE], self._window)
+        return self._vram[mode], self._ram[mode]
+
+    def predict(self, features: Sequence[float], lm_model: Optional[str] = None, thinking: bool = False) -> Tuple[float, float]:
+        """(peak extra VRAM GB, peak extra RAM GB) for a job with the given memory_features()."""
+        with self._lock:
+            vram, ram = self._models(lm_model, thinking)
+            return vram.predict(features), ram.predict(features)
+
+    def observe(
+        self,
+        features: Sequence[float],
+        vram_gb: Optional[float],
+        ram_gb: Optional[float],
+        lm_model: Optional[str] = None,
+        thinking: bool = False,
+    ) -> None:
+        """Record measured peaks (None when not measurable, e.g. no CUDA) and refit."""
+        with self._lock:
+            vram, ram = self._models(lm_model, thinking)
+            if vram_gb is not None and vram_gb > 0:
+                vram.observe(features, vram_gb)
+            if ram_gb is not None and ram_gb >= 0:
+                ram.observe(features, ram_gb)
+
+    def coefficients(self) -> List[Dict[str, object]]:
+        with self._lock:
+            return [
+                {"mode": list(mode), "vram": self._vram[mode].coef, "ram": self._ram[mode].coef}
+                for mode in self._vram
+            ]
+
+
+@dataclass
+class AdmissionDecision:
+    action: str  # ACTION_ACCEPT / ACTION_SPLIT / ACTION_DEFER
+    batch_sizes: List[int]  # sub-batches to run one after another (a single entry unless split)
+    predicted_vram_gb: float  # peak extra VRAM of the largest sub-batch
+    predicted_ram_gb: float
+    reason: str = ""
+
+
+@dataclass
+class _Reservation:
+    vram_gb: float
+    ram_gb: float
+    started_at: float = field(default_factory=time.time)
+
+
+class AdmissionController:
+    """
+    Accepts, splits or defers jobs so their predicted peaks fit the memory budget.
+
+    The VRAM budget is total VRAM x vram_fraction minus what is resident when idle;
+    running jobs hold reservations of their predicted peaks until release().
+    Models may be loaded lazily, so the resident baseline is re-measured whenever
+    the GPU is idle (calibrate_resident).
+    """
+
+    def __init__(
+        self,
+        predictor: MemoryPredictor,
+        vram_total_gb: float,
+        vram_fraction: float = 0.9,
+        min_free_ram_gb: float = 2.0,
+    ) -> None:
+        self.predictor = predictor
+        self.vram_total_gb = vram_total_gb
+        self.vram_fraction = vram_fraction
+        self.min_free_ram_gb = min_free_ram_gb
+        self.resident_vram_gb = 0.0
+        self._reservations: Dict[str, _Reservation] = {}
+        self._lock = Lock()
+
+    def calibrate_resident(self, extra_gb: float = 0.0) -> None:
+        """
+        Record the VRAM held while idle (loaded weights) as the baseline of the budget.
+
+        extra_gb is added for weights known to be loaded later (e.g. pooled DiT models).
+        Only meaningful while no job runs.
+        """
+        try:
+            import torch
+            if torch.cuda.is_available():
+                self.resident_vram_gb = torch.cuda.memory_allocated() / (1024 ** 3) + max(0.0, extra_gb)
+        except Exception:
+            pass
+
+    @property
+    def vram_budget_gb(self) -> float:
+        return max(0.0, self.vram_total_gb * self.vram_fraction - self.resident_vram_gb)
+
+    def reserved(self) -> Tuple[float, float]:
+        with self._lock:
+            return (
+                sum(r.vram_gb for r in self._reservations.values()),
+                sum(r.ram_gb for r in self._reservations.values()),
+            )
+
+    def running(self) -> int:
+        with self._lock:
+            return len(self._reservations)
+
+    def _fits(self, vram_gb: float, ram_gb: float, vram_free: float, ram_free: float) -> bool:
+        vram_ok = self.vram_total_gb <= 0 or vram_gb <= vram_free
+        return vram_ok and ram_gb <= ram_free
+
+    def decide(
+        self,
+        duration: Optional[float],
+        batch_size: int,
+        use_tiled_decode: bool = True,
+        lm_model: Optional[str] = None,
+        thinking: bool = False,
+        ram_available_gb: Optional[float] = None,
+    ) -> AdmissionDecision:
+        """
+        Decide how to run a job given what other running jobs have reserved.
+
+        - accept: the whole batch fits now
+        - split: the largest sub-batch that fits on an idle GPU runs repeatedly
+        - defer: it would fit (possibly split) once running jobs finish
+        """
+        batch = max(1, int(batch_size or 1))
+        reserved_vram, reserved_ram = self.reserved()
+        # RAM: available now (already net of running jobs' usage) minus the hard floor
+        ram_free_idle = math.inf if ram_available_gb is None else ram_available_gb - self.min_free_ram_gb
+        vram_free_idle = self.vram_budget_gb
+
+        def _predict(b: int) -> Tuple[float, float]:
+            return self.predictor.predict(memory_features(duration, b, use_tiled_decode), lm_model, thinking)
+
+        # Largest sub-batch that fits with the GPU to itself
+        sub = batch
+        while sub > 1 and not self._fits(*_predict(sub), vram_free_idle, ram_free_idle):
+            sub -= 1
+        vram_gb, ram_gb = _predict(sub)
+        batch_sizes = [sub] * (batch // sub) + ([batch % sub] if batch % sub else [])
+
+        if not self._fits(vram_gb, ram_gb, vram_free_idle, ram_free_idle):
+            # Even one audio is predicted not to fit: nothing smaller exists, run it alone
+            return AdmissionDecision(
+                ACTION_SPLIT if batch > 1 else ACTION_ACCEPT, [1] * batch, vram_gb, ram_gb,
+                reason=f"predicted {vram_gb:.1f}GB VRAM per audio exceeds budget {vram_free_idle:.1f}GB",
+            )
+        if reserved_vram > 0 and not self._fits(vram_gb, ram_gb, vram_free_idle - reserved_vram, ram_free_idle):
+            return AdmissionDecision(
+                ACTION_DEFER, batch_sizes, vram_gb, ram_gb,
+                reason=f"{reserved_vram:.1f}GB VRAM reserved by running jobs",
+            )
+        if sub < batch:
+            return AdmissionDecision(
+                ACTION_SPLIT, batch_sizes, vram_gb, ram_gb,
+                reason=f"batch {batch} predicted over budget, running {len(batch_sizes)} sub-batches",
+            )
+        return AdmissionDecision(ACTION_ACCEPT, batch_sizes, vram_gb, ram_gb)
+
+    def max_batch_items(
+        self,
+        duration: Optional[float],
+        use_tiled_decode: bool = True,
+        lm_model: Optional[str] = None,
+        thinking: bool = False,
+        limit: int = 64,
+    ) -> int:
+        """Largest number of audios of this shape predicted to fit on an idle GPU (at least 1)."""
+        budget = self.vram_budget_gb
+        if self.vram_total_gb <= 0:
+            return limit
+        items = 1
+        while items < limit:
+            vram_gb, _ = self.predictor.predict(memory_features(duration, items + 1, use_tiled_decode), lm_model, thinking)
+            if vram_gb > budget:
+                break
+            items += 1
+        return items
+
+    def reserve(self, job_id: str, vram_gb: float, ram_gb: float) -> None:
+        with self._lock:
+            self._reservations[job_id] = _Reservation(vram_gb, ram_gb)
+
+    def release(self, job_id: str) -> None:
+        with self._lock:
+            self._reservations.pop(job_id, None)
+
+
+def available_ram_gb() -> float:
+    """Host RAM currently available to new allocations (GB)."""
+    from acestep.memory_manager import get_system_memory_info
+    return get_system_memory_info()["available_gb"]
+
+
+class PeakMemoryProbe:
+    """
+    Context manager measuring the peak extra VRAM and RAM (GB) of the code it wraps.
+
+    VRAM uses torch.cuda peak statistics (None without CUDA); RAM is the growth of the
+    process RSS, sampled at exit. Peaks are only meaningful if nothing else runs on
+    the same device meanwhile.
+    """
+
+    def __init__(self) -> None:
+        self.vram_gb: Optional[float] = None
+        self.ram_gb: Optional[float] = None
+        self._cuda = False
+        self._vram_start = 0
+        self._ram_start = 0.0
+
+    def __enter__(self) -> "PeakMemoryProbe":
+        from acestep.memory_manager import get_process_memory_gb
+        try:
+            import torch
+            self._cuda = torch.cuda.is_available()
+            if self._cuda:
+                torch.cuda.synchronize()
+                self._vram_start = torch.cuda.memory_allocated()
+                torch.cuda.reset_peak_memory_stats()
+        except Exception:
+            self._cuda = False
+        self._ram_start = get_process_memory_gb()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        from acestep.memory_manager import get_process_memory_gb
+        if self._cuda:
+            try:
+                import torch
+                torch.cuda.synchronize()
+                self.vram_gb = max(0, torch.cuda.max_memory_allocated() - self._vram_start) / (1024 ** 3)
+            except Exception:
+                self.vram_gb = None
+        self.ram_gb = max(0.0, get_process_memory_gb() - self._ram_start)
+        return False
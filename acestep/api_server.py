@@ -10,7 +10,9 @@ Endpoints:
 - GET  /health                Health check
 
 NOTE:
-- In-memory queue and job store -> run uvicorn with workers=1.
+- Default in-memory queue and job store -> run uvicorn with workers=1.
+- ACESTEP_JOB_STORE=shared keeps them in LocalCache (diskcache) so several
+  processes on one host can serve the same queue (--workers N).
 """
 
 from __future__ import annotations
@@ -18,8 +20,10 @@ from __future__ import annotations
 import asyncio
 import glob
 import json
+import math
 import os
 import random
+import socket
 import sys
 import time
 import traceback
@@ -28,10 +32,10 @@ import urllib.parse
 from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass, replace
 from pathlib import Path
 from threading import Lock
-from typing import Any, Dict, List, Literal, Optional
+from typing import Any, Dict, List, Literal, Optional, Tuple
 from uuid import uuid4
 
 try:
@@ -69,11 +73,37 @@ from acestep.constants import (
 from acestep.inference import (
     GenerationParams,
     GenerationConfig,
+    GenerationResult,
     generate_music,
+    generate_music_batch,
+    run_lm_phase,
+    run_dit_phase,
+    run_dit_phase_batch,
+    emit_cached_audio,
+    lookup_cached_result,
+    store_cached_result,
     create_sample,
     format_sample,
 )
+from acestep.admission import (
+    ACTION_DEFER,
+    ACTION_SPLIT,
+    AdmissionController,
+    AdmissionDecision,
+    MemoryPredictor,
+    PeakMemoryProbe,
+    available_ram_gb,
+    memory_features,
+)
+from acestep.audio_utils import StreamingAudioEncoder
+from acestep.cancellation import AllCancelledToken, CancellationToken, run_cancellable
 from acestep.gradio_ui.events.results_handlers import _build_generation_info
+from acestep.job_scheduler import DEFAULT_DURATION_SECONDS, JobCostEstimator, PriorityJobQueue, job_features
+from acestep.model_pool import DiTModelPool, ModelSpec, parse_model_specs
+from acestep.embedding_cache import get_embedding_cache
+from acestep.latent_cache import get_latent_cache
+from acestep.offload_engine import get_residency_planner
+from acestep.result_cache import get_result_cache
 from acestep.gpu_config import (
     get_gpu_config,
     get_gpu_memory_gb,
@@ -221,6 +251,7 @@ RESULT_EXPIRE_SECONDS = 7 * 24 * 60 * 60  # 7 days
 TASK_TIMEOUT_SECONDS = 3600  # 1 hour
 JOB_STORE_CLEANUP_INTERVAL = 300  # 5 minutes - interval for cleaning up old jobs
 JOB_STORE_MAX_AGE_SECONDS = 86400  # 24 hours - completed jobs older than this will be cleaned
+SHARED_KEY_PREFIX = "ace_step_v1.5_shared_"  # Job store/queue keys in LocalCache (ACESTEP_JOB_STORE=shared)
 STATUS_MAP = {"queued": 0, "running": 0, "succeeded": 1, "failed": 2}
 
 LM_DEFAULT_TEMPERATURE = 0.85
@@ -273,6 +304,7 @@ CUSTOM_EXAMPLE_DATA: List[Dict[str, Any]] = _load_all_examples(sample_mode="cust
 # =============================================================================
 
 _api_key: Optional[str] = None
+_api_key_priorities: Dict[str, int] = {}
 
 
 def set_api_key(key: Optional[str]):
@@ -281,18 +313,52 @@ def set_api_key(key: Optional[str]):
     _api_key = key
 
 
+def set_api_key_priorities(spec: Optional[str]):
+    """
+    Set per-API-key priority classes from "key1:0,key2:2" (smaller = served first).
+
+    Keys listed here are accepted as API keys in addition to ACESTEP_API_KEY.
+    """
+    global _api_key_priorities
+    priorities: Dict[str, int] = {}
+    for part in (spec or "").split(","):
+        key, sep, cls = part.strip().rpartition(":")
+        if not sep or not key:
+            continue
+        try:
+            priorities[key] = int(cls)
+        except ValueError:
+            print(f"[API Server] Ignoring invalid API key priority entry for key ending '...{key[-4:]}'")
+    _api_key_priorities = priorities
+
+
+def _is_valid_api_key(token: str) -> bool:
+    return token == _api_key or token in _api_key_priorities
+
+
+def _auth_required() -> bool:
+    return _api_key is not None or bool(_api_key_priorities)
+
+
+def _api_key_priority(token: Optional[str], default: int) -> int:
+    """Priority class of the API key used for a request."""
+    if token is None:
+        return default
+    return _api_key_priorities.get(token, default)
+
+
 def verify_token_from_request(body: dict, authorization: Optional[str] = None) -> Optional[str]:
     """
     Verify API key from request body (ai_token) or Authorization header.
     Returns the token if valid, None if no auth required.
     """
-    if _api_key is None:
+    if not _auth_required():
         return None  # No auth required
 
     # Try ai_token from body first
     ai_token = body.get("ai_token") if body else None
     if ai_token:
-        if ai_token == _api_key:
+        if _is_valid_api_key(ai_token):
             return ai_token
         raise HTTPException(status_code=401, detail="Invalid ai_token")
 
@@ -302,7 +368,7 @@ def verify_token_from_request(body: dict, authorization: Optional[str] = None) -
             token = authorization[7:]
         else:
             token = authorization
-        if token == _api_key:
+        if _is_valid_api_key(token):
             return token
         raise HTTPException(status_code=401, detail="Invalid API key")
 
@@ -312,7 +378,7 @@ def verify_token_from_request(body: dict, authorization: Optional[str] = None) -
 
 async def verify_api_key(authorization: Optional[str] = Header(None)):
     """Verify API key from Authorization header (legacy, for non-body endpoints)"""
-    if _api_key is None:
+    if not _auth_required():
         return  # No auth required
 
     if not authorization:
@@ -324,7 +390,7 @@ async def verify_api_key(authorization: Optional[str] = Header(None)):
     else:
         token = authorization
 
-    if token != _api_key:
+    if not _is_valid_api_key(token):
         raise HTTPException(status_code=401, detail="Invalid API key")
 
 # Parameter aliases for request parsing
@@ -490,6 +556,10 @@ class GenerateMusicRequest(BaseModel):
 
     audio_format: str = "mp3"
     use_tiled_decode: bool = True
+    stream: bool = Field(
+        default=False,
+        description="Expose decoded audio at /v1/jobs/{task_id}/stream while the VAE decode runs.",
+    )
 
     # 5Hz LM (server-side): used for metadata completion and (when thinking=True) codes generation.
     lm_model_path: Optional[str] = None  # e.g. "acestep-5Hz-lm-0.6B"
@@ -569,11 +639,137 @@ class _JobRecord:
     env: str = "development"
 
 
+@dataclass
+class _StageHandoff:
+    """A job that finished the LM stage and waits for the DiT stage (pipeline mode)."""
+    job_id: str
+    req: GenerateMusicRequest
+    handler: Any
+    model_name: str
+    prepared: Dict[str, Any]  # params/config and final caption/lyrics/metas from _prepare_generation
+    lm_phase: Dict[str, Any]  # metadata and audio codes from run_lm_phase
+    lm_seconds: float
+    batch_key: Optional[Tuple[Any, ...]]
+    cache_key: Optional[str] = None  # result cache key (see acestep.result_cache)
+
+
+class _AudioStreamBuffer:
+    """
+    Decoded audio chunks of one streaming job.
+
+    The generation thread pushes [batch, channels, samples] CPU chunks from tiled_decode;
+    any number of HTTP responses on the event loop read them from the start, in order.
+    """
+
+    def __init__(self, sample_rate: int = 48000) -> None:
+        self.sample_rate = sample_rate
+        self._lock = Lock()
+        self._chunks: List[Any] = []
+        self._done = False
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def _notify(self) -> None:
+        with self._lock:
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # Event loop already closed (server shutting down)
+                pass
+
+    def push(self, chunk: Any) -> None:
+        with self._lock:
+            if self._done:
+                return
+            self._chunks.append(chunk)
+        self._notify()
+
+    def close(self) -> None:
+        with self._lock:
+            self._done = True
+        self._notify()
+
+    async def iter_chunks(self):
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._lock:
+            self._waiters.append(waiter)
+        idx = 0
+        try:
+            while True:
+                event.clear()
+                with self._lock:
+                    new_chunks = self._chunks[idx:]
+                    done = self._done
+                idx += len(new_chunks)
+                for chunk in new_chunks:
+                    yield chunk
+                if done:
+                    return
+                await event.wait()
+        finally:
+            with self._lock:
+                self._waiters.remove(waiter)
+
+
+class _JobNotifier:
+    """
+    Wakes coroutines waiting for a job status change (long-poll, SSE).
+
+    notify() may be called from any thread; waiters are woken on their own event loop.
+    A waiter is registered before the caller reads the job status, so a change that
+    lands in between is never missed.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+
+    def register(self, job_ids: List[str]) -> Tuple[asyncio.AbstractEventLoop, asyncio.Event]:
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            for job_id in job_ids:
+                self._waiters.setdefault(job_id, []).append(waiter)
+        return waiter
+
+    def unregister(self, job_ids: List[str], waiter: Tuple[asyncio.AbstractEventLoop, asyncio.Event]) -> None:
+        with self._lock:
+            for job_id in job_ids:
+                waiters = self._waiters.get(job_id)
+                if not waiters:
+                    continue
+                if waiter in waiters:
+                    waiters.remove(waiter)
+                if not waiters:
+                    del self._waiters[job_id]
+
+    @staticmethod
+    async def wait(waiter: Tuple[asyncio.AbstractEventLoop, asyncio.Event], timeout: float) -> bool:
+        """True if notified within timeout seconds."""
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout=max(0.0, timeout))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def notify(self, job_id: str) -> None:
+        with self._lock:
+            waiters = list(self._waiters.get(job_id, ()))
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # Event loop already closed (server shutting down)
+                pass
+
+
 class _JobStore:
     def __init__(self, max_age_seconds: int = JOB_STORE_MAX_AGE_SECONDS) -> None:
         self._lock = Lock()
         self._jobs: Dict[str, _JobRecord] = {}
         self._max_age = max_age_seconds
+        self.notifier = _JobNotifier()
 
     def create(self) -> _JobRecord:
         job_id = str(uuid4())
@@ -603,6 +799,7 @@ class _JobStore:
             rec = self._jobs[job_id]
             rec.status = "running"
             rec.started_at = time.time()
+        self.notifier.notify(job_id)
 
     def mark_succeeded(self, job_id: str, result: Dict[str, Any]) -> None:
         with self._lock:
@@ -611,6 +808,7 @@ class _JobStore:
             rec.finished_at = time.time()
             rec.result = result
             rec.error = None
+        self.notifier.notify(job_id)
 
     def mark_failed(self, job_id: str, error: str) -> None:
         with self._lock:
@@ -619,6 +817,7 @@ class _JobStore:
             rec.finished_at = time.time()
             rec.result = None
             rec.error = error
+        self.notifier.notify(job_id)
 
     def cleanup_old_jobs(self, max_age_seconds: Optional[int] = None) -> int:
         """
@@ -664,6 +863,214 @@ class _JobStore:
             return stats
 
 
+class _SharedJobStore:
+    """
+    Job store + FIFO queue shared by several API processes through LocalCache (diskcache/SQLite).
+
+    Same interface as _JobStore, plus queue operations with claim/lease semantics:
+    a process claims the head of the queue under a lease it keeps renewing while the
+    job runs; if the process dies, the lease expires and any process puts the job back
+    at the head of the queue (requeue_expired).
+    """
+
+    def __init__(self, cache, max_age_seconds: int = JOB_STORE_MAX_AGE_SECONDS) -> None:
+        self._cache = cache
+        self._max_age = max_age_seconds
+        self._worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._held_lock = Lock()
+        self._held: Dict[str, float] = {}  # job_id -> lease seconds, jobs claimed by this process
+        self._queue_key = f"{SHARED_KEY_PREFIX}queue"
+        # Only sees changes made by this process; waiters also re-read the store periodically
+        self.notifier = _JobNotifier()
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{SHARED_KEY_PREFIX}job:{job_id}"
+
+    def _payload_key(self, job_id: str) -> str:
+        return f"{SHARED_KEY_PREFIX}payload:{job_id}"
+
+    def _lease_key(self, job_id: str) -> str:
+        return f"{SHARED_KEY_PREFIX}lease:{job_id}"
+
+    def _put(self, rec: _JobRecord) -> None:
+        # Finished records expire on their own; queued/running ones live until they finish
+        ex = self._max_age if rec.status in ("succeeded", "failed") else None
+        self._cache.set(self._job_key(rec.job_id), asdict(rec), ex=ex)
+
+    def _update(self, job_id: str, **fields: Any) -> None:
+        with self._cache.transact():
+            rec = self.get(job_id)
+            if rec is None:
+                raise KeyError(job_id)
+            for k, v in fields.items():
+                setattr(rec, k, v)
+            self._put(rec)
+
+    def create(self) -> _JobRecord:
+        return self.create_with_id(str(uuid4()))
+
+    def create_with_id(self, job_id: str, env: str = "development") -> _JobRecord:
+        """Create job record with specified ID"""
+        rec = _JobRecord(job_id=job_id, status="queued", created_at=time.time(), env=env)
+        self._put(rec)
+        return rec
+
+    def get(self, job_id: str) -> Optional[_JobRecord]:
+        data = self._cache.get(self._job_key(job_id))
+        if not data:
+            return None
+        return _JobRecord(**json.loads(data))
+
+    def delete(self, job_id: str) -> None:
+        self._cache.delete(self._job_key(job_id))
+
+    def mark_running(self, job_id: str) -> None:
+        self._update(job_id, status="running", started_at=time.time())
+        self.notifier.notify(job_id)
+
+    def mark_succeeded(self, job_id: str, result: Dict[str, Any]) -> None:
+        if self._finish(job_id, status="succeeded", finished_at=time.time(), result=result, error=None):
+            self.notifier.notify(job_id)
+
+    def mark_failed(self, job_id: str, error: str) -> None:
+        if self._finish(job_id, status="failed", finished_at=time.time(), result=None, error=error):
+            self.notifier.notify(job_id)
+
+    def _finish(self, job_id: str, **fields: Any) -> bool:
+        """
+        Store the outcome of a job and drop its lease and payload.
+
+        A no-op (returns False) when this process claimed the job but its lease
+        expired and the job was requeued: the outcome belongs to the new run.
+        """
+        with self._held_lock:
+            held = self._held.pop(job_id, None) is not None
+        with self._cache.transact():
+            if held:
+                if not self._owns_lease(job_id):
+                    print(f"[API Server] Dropping stale result of job {job_id}: lease lost to another run")
+                    return False
+                self._cache.delete(self._lease_key(job_id))
+                self._cache.delete(self._payload_key(job_id))
+            self._update(job_id, **fields)
+        return True
+
+    def _owns_lease(self, job_id: str) -> bool:
+        lease = json.loads(self._cache.get(self._lease_key(job_id)) or "{}")
+        return lease.get("worker") == self._worker_id
+
+    def cleanup_old_jobs(self, max_age_seconds: Optional[int] = None) -> int:
+        """
+        Clean up completed jobs older than max_age_seconds.
+
+        Finished records also carry a TTL, so this only catches records written
+        with a longer max age. Returns the number of jobs removed.
+        """
+        max_age = max_age_seconds if max_age_seconds is not None else self._max_age
+        now = time.time()
+        removed = 0
+        for key in self._cache.keys(f"{SHARED_KEY_PREFIX}job:*"):
+            rec = self.get(key[len(f"{SHARED_KEY_PREFIX}job:"):])
+            if rec and rec.status in ("succeeded", "failed"):
+                if now - (rec.finished_at or rec.created_at) > max_age:
+                    self.delete(rec.job_id)
+                    removed += 1
+        return removed
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get statistics about jobs in the store."""
+        stats = {"total": 0, "queued": 0, "running": 0, "succeeded": 0, "failed": 0}
+        for key in self._cache.keys(f"{SHARED_KEY_PREFIX}job:*"):
+            rec = self.get(key[len(f"{SHARED_KEY_PREFIX}job:"):])
+            if rec is None:
+                continue
+            stats["total"] += 1
+            if rec.status in stats:
+                stats[rec.status] += 1
+        return stats
+
+    # ------------------------------------------------------------------
+    # Queue with claim/lease
+    # ------------------------------------------------------------------
+    def enqueue(self, job_id: str, payload: Dict[str, Any], maxsize: int) -> Optional[int]:
+        """Append a job to the shared queue. Returns its 1-based position, or None if the queue is full."""
+        with self._cache.transact():
+            if maxsize > 0 and self._cache.llen(self._queue_key) >= maxsize:
+                return None
+            self._cache.set(self._payload_key(job_id), payload)
+            return self._cache.rpush(self._queue_key, job_id)
+
+    def claim(self, lease_seconds: float) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Atomically pop the head of the queue and lease it to this process."""
+        with self._cache.transact():
+            job_id = self._cache.lpop(self._queue_key)
+            if job_id is None:
+                return None
+            self._cache.set(self._lease_key(job_id), {"worker": self._worker_id, "expires_at": time.time() + lease_seconds})
+            payload = self._cache.get(self._payload_key(job_id))
+        with self._held_lock:
+            self._held[job_id] = lease_seconds
+        return job_id, json.loads(payload) if payload else {}
+
+    def renew_leases(self) -> None:
+        """Extend the leases of every job this process is still working on."""
+        with self._held_lock:
+            held = dict(self._held)
+        now = time.time()
+        for job_id, lease_seconds in held.items():
+            with self._cache.transact():
+                if not self._owns_lease(job_id):
+                    continue  # Lost the lease (expired and requeued elsewhere)
+                lease = json.loads(self._cache.get(self._lease_key(job_id)))
+                lease["expires_at"] = now + lease_seconds
+                self._cache.set(self._lease_key(job_id), lease)
+
+    def requeue_expired(self) -> List[str]:
+        """Put jobs whose lease expired (crashed or stuck process) back at the head of the queue."""
+        requeued = []
+        now = time.time()
+        for key in self._cache.keys(f"{SHARED_KEY_PREFIX}lease:*"):
+            job_id = key[len(f"{SHARED_KEY_PREFIX}lease:"):]
+            with self._cache.transact():
+                lease = json.loads(self._cache.get(key) or "{}")
+                if not lease or lease.get("expires_at", 0) > now:
+                    continue
+                self._cache.delete(key)
+                rec = self.get(job_id)
+                if rec is None or rec.status in ("succeeded", "failed"):
+                    continue
+                rec.status = "queued"
+                rec.started_at = None
+                self._put(rec)
+                self._cache.lpush(self._queue_key, job_id)
+                requeued.append(job_id)
+        return requeued
+
+    def remove_queued(self, job_id: str) -> bool:
+        """Take a job that no process has claimed yet out of the queue. Returns whether it was queued."""
+        with self._cache.transact():
+            if not self._cache.lrem(self._queue_key, 0, job_id):
+                return False
+            self._cache.delete(self._payload_key(job_id))
+        return True
+
+    def request_cancel(self, job_id: str) -> None:
+        """Ask whichever process runs job_id to cancel it (seen by its cancel watcher)."""
+        self._cache.set(f"{SHARED_KEY_PREFIX}cancel:{job_id}", "1", ex=self._max_age)
+
+    def cancel_requested(self, job_id: str) -> bool:
+        return self._cache.exists(f"{SHARED_KEY_PREFIX}cancel:{job_id}")
+
+    def queue_position(self, job_id: str) -> int:
+        try:
+            return self._cache.lrange(self._queue_key, 0, -1).index(job_id) + 1
+        except ValueError:
+            return 0
+
+    def queue_size(self) -> int:
+        return self._cache.llen(self._queue_key)
+
+
 def _env_bool(name: str, default: bool) -> bool:
     v = os.getenv(name)
     if v is None:
@@ -773,6 +1180,48 @@ def _is_instrumental(lyrics: str) -> bool:
     return lyrics_clean in ("[inst]", "[instrumental]")
 
 
+def _request_batch_size(req: GenerateMusicRequest) -> int:
+    """Number of audios a request generates (the API default is 2, like gradio_ui)."""
+    return max(1, req.batch_size if req.batch_size is not None else 2)
+
+
+def _batch_compat_key(req: GenerateMusicRequest, duration_bucket: float) -> Optional[Tuple[Any, ...]]:
+    """
+    Key under which queued requests can share one DiT batch, or None if the request must run alone.
+
+    Requests merge only when everything the DiT sampler sees as a batch-wide setting matches.
+    Durations are bucketed: shorter items are padded to the longest one in the batch and trimmed back.
+    """
+    # Source-audio tasks (repaint/lego/extract/...) depend on per-request audio lengths and masks.
+    # That includes covers of a source file: only covers conditioned on audio codes alone batch.
+    if req.src_audio_path or req.task_type not in ("text2music", "cover"):
+        return None
+    # Streamed jobs decode on their own so chunks reach the client as soon as they exist
+    if req.stream:
+        return None
+    if req.audio_duration and req.audio_duration > 0 and duration_bucket > 0:
+        duration_key: Any = int(math.ceil(float(req.audio_duration) / duration_bucket))
+    else:
+        duration_key = "auto"
+    has_codes = bool(req.audio_code_string and req.audio_code_string.strip())
+    return (
+        req.model or "",
+        req.task_type,
+        # thinking / user codes turn text2music into a code-conditioned (cover) generation
+        bool(req.thinking) or has_codes,
+        req.inference_steps,
+        req.guidance_scale,
+        req.shift,
+        req.infer_method,
+        req.use_adg,
+        req.cfg_interval_start,
+        req.cfg_interval_end,
+        req.audio_cover_strength,
+        tuple(_parse_timesteps(req.timesteps) or ()),
+        duration_key,
+    )
+
+
 class RequestParser:
     """Parse request parameters from multiple sources with alias support."""
 
@@ -848,11 +1297,26 @@ async def _save_upload_to_temp(upload: StarletteUploadFile, *, prefix: str) -> s
 
 
 def create_app() -> FastAPI:
-    store = _JobStore()
+    # ACESTEP_JOB_STORE=shared keeps the job store and queue in LocalCache so several
+    # API processes (uvicorn workers, or one process per GPU) serve the same queue.
+    SHARED_JOB_STORE = os.getenv("ACESTEP_JOB_STORE", "memory").strip().lower() == "shared"
+    JOB_LEASE_SECONDS = float(os.getenv("ACESTEP_JOB_LEASE_SECONDS", "60"))
+    JOB_POLL_INTERVAL = float(os.getenv("ACESTEP_JOB_POLL_INTERVAL", "0.5"))
+
+    # Long-poll (/query_result wait=...) and SSE (/v1/jobs/{id}/events) status delivery
+    LONG_POLL_MAX_SECONDS = float(os.getenv("ACESTEP_LONG_POLL_MAX_SECONDS", "60"))
+    SSE_KEEPALIVE_SECONDS = float(os.getenv("ACESTEP_SSE_KEEPALIVE_SECONDS", "15"))
+    if SHARED_JOB_STORE:
+        from acestep.local_cache import get_local_cache
+        shared_cache_dir = os.path.join(_get_project_root(), ".cache", "acestep", "local_redis")
+        store = _SharedJobStore(get_local_cache(shared_cache_dir))
+    else:
+        store = _JobStore()
 
     # API Key authentication (from environment variable)
     api_key = os.getenv("ACESTEP_API_KEY", None)
     set_api_key(api_key)
+    set_api_key_priorities(os.getenv("ACESTEP_API_KEY_PRIORITIES", ""))
 
     QUEUE_MAXSIZE = int(os.getenv("ACESTEP_QUEUE_MAXSIZE", "200"))
     WORKER_COUNT = int(os.getenv("ACESTEP_QUEUE_WORKERS", "1"))  # Single GPU recommended
@@ -860,6 +1324,62 @@ def create_app() -> FastAPI:
     INITIAL_AVG_JOB_SECONDS = float(os.getenv("ACESTEP_AVG_JOB_SECONDS", "5.0"))
     AVG_WINDOW = int(os.getenv("ACESTEP_AVG_WINDOW", "50"))
 
+    # Scheduling: "sjf" = estimated-shortest-job-first with aging, "fifo" = arrival order
+    SCHED_POLICY = os.getenv("ACESTEP_SCHED_POLICY", "sjf").strip().lower()
+    SCHED_AGING_RATE = float(os.getenv("ACESTEP_SCHED_AGING_RATE", "1.0"))  # score credit per second waited
+    SCHED_CLASS_SECONDS = float(os.getenv("ACESTEP_SCHED_CLASS_SECONDS", "300"))  # penalty per priority class
+    SCHED_DEFAULT_PRIORITY = int(os.getenv("ACESTEP_SCHED_DEFAULT_PRIORITY", "1"))
+    cost_estimator = JobCostEstimator(INITIAL_AVG_JOB_SECONDS, window=AVG_WINDOW)
+
+    def _job_features(req: GenerateMusicRequest) -> Tuple[float, float, float]:
+        parsed_timesteps = _parse_timesteps(req.timesteps)
+        return job_features(
+            duration=req.audio_duration,
+            inference_steps=len(parsed_timesteps) if parsed_timesteps else req.inference_steps,
+            batch_size=_request_batch_size(req),
+            thinking=bool(req.thinking),
+            lm_model=req.lm_model_path or os.getenv("ACESTEP_LM_MODEL_PATH", "acestep-5Hz-lm-0.6B"),
+        )
+
+    def _estimate_job_seconds(req: GenerateMusicRequest) -> float:
+        return cost_estimator.estimate(_job_features(req))
+
+    # Cross-request batching: merge compatible queued jobs into one DiT forward pass
+    BATCH_MAX_JOBS = int(os.getenv("ACESTEP_BATCH_MAX_JOBS", "4"))  # 1 disables batching
+    BATCH_MAX_ITEMS = int(os.getenv("ACESTEP_BATCH_MAX_ITEMS", "0"))  # 0 = GPU tier max batch size
+    BATCH_WINDOW_MS = float(os.getenv("ACESTEP_BATCH_WINDOW_MS", "50"))
+    BATCH_DURATION_BUCKET = float(os.getenv("ACESTEP_BATCH_DURATION_BUCKET", "30"))
+    # Shared mode: jobs a process claims ahead of running them. Batching and cost/priority
+    # ordering only see these; the shared queue itself hands jobs out in arrival order.
+    SHARED_CLAIM_JOBS = max(1, int(os.getenv("ACESTEP_SHARED_CLAIM_JOBS", str(max(1, BATCH_MAX_JOBS)))))
+
+    # LM -> DiT pipeline: overlap job N+1's LM phase with job N's DiT/VAE phase
+    PIPELINE_LM_DIT = _env_bool("ACESTEP_PIPELINE_LM_DIT", False)
+    PIPELINE_DEPTH = int(os.getenv("ACESTEP_PIPELINE_DEPTH", "1"))  # LM-finished jobs waiting for DiT
+
+    # Streaming: how long decoded chunks of a finished stream=true job stay readable
+    STREAM_RETAIN_SECONDS = float(os.getenv("ACESTEP_STREAM_RETAIN_SECONDS", "60"))
+
+    # Admission control: predict each job's peak VRAM/RAM and split or defer what would not fit
+    ADMISSION_ENABLED = _env_bool("ACESTEP_ADMISSION", True)
+    ADMISSION_VRAM_FRACTION = float(os.getenv("ACESTEP_ADMISSION_VRAM_FRACTION", "0.9"))
+    ADMISSION_MIN_FREE_RAM_GB = float(os.getenv("ACESTEP_ADMISSION_MIN_FREE_RAM_GB", "2"))
+    ADMISSION_MAX_DEFER_SECONDS = float(os.getenv("ACESTEP_ADMISSION_MAX_DEFER_SECONDS", "120"))
+
+    # DiT model pool: extra model variants and how much VRAM their weights may hold at once
+    DIT_MODELS = os.getenv("ACESTEP_DIT_MODELS", "")
+    DIT_POOL_VRAM_GB = float(os.getenv("ACESTEP_DIT_POOL_VRAM_GB", "0"))  # 0 = keep every model resident
+    DIT_POOL_PREFETCH = _env_bool("ACESTEP_DIT_POOL_PREFETCH", True)
+
+    def _admission_shape(req: GenerateMusicRequest) -> Dict[str, Any]:
+        """Request fields the memory model depends on (besides the batch size)."""
+        return {
+            "duration": req.audio_duration,
+            "use_tiled_decode": bool(req.use_tiled_decode or req.stream),
+            "lm_model": req.lm_model_path or os.getenv("ACESTEP_LM_MODEL_PATH", "acestep-5Hz-lm-0.6B"),
+            "thinking": bool(req.thinking),
+        }
+
     def _path_to_audio_url(path: str) -> str:
         """Convert local file path to downloadable relative URL"""
         if not path:
@@ -915,44 +1435,53 @@ def create_app() -> FastAPI:
         app.state._llm_init_error = None
         app.state._llm_init_lock = Lock()
 
-        # Multi-model support: secondary DiT handlers
-        handler2 = None
-        handler3 = None
-        config_path2 = os.getenv("ACESTEP_CONFIG_PATH2", "").strip()
-        config_path3 = os.getenv("ACESTEP_CONFIG_PATH3", "").strip()
-        
-        if config_path2:
-            handler2 = AceStepHandler()
-        if config_path3:
-            handler3 = AceStepHandler()
-        
-        app.state.handler2 = handler2
-        app.state.handler3 = handler3
-        app.state._initialized2 = False
-        app.state._initialized3 = False
+        # Multi-model support: the primary handler plus any number of DiT variants in a pool
         app.state._config_path = os.getenv("ACESTEP_CONFIG_PATH", "acestep-v15-turbo")
-        app.state._config_path2 = config_path2
-        app.state._config_path3 = config_path3
+        app.state.model_pool = None  # DiTModelPool, created once the primary model is loaded
 
         max_workers = int(os.getenv("ACESTEP_API_WORKERS", "1"))
         executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Pipeline mode runs the LM stage on its own thread so it overlaps DiT work in `executor`
+        lm_executor = ThreadPoolExecutor(max_workers=1)
 
         # Queue & observability
-        app.state.job_queue = asyncio.Queue(maxsize=QUEUE_MAXSIZE)  # (job_id, req)
-        app.state.pending_ids = deque()  # queued job_ids
-        app.state.pending_lock = asyncio.Lock()
+        # In shared mode the real queue lives in the store; the local queue only buffers
+        # the SHARED_CLAIM_JOBS jobs this process has claimed next.
+        if SHARED_JOB_STORE:
+            print(
+                f"[API Server] Shared job store: claiming up to {SHARED_CLAIM_JOBS} jobs per process; "
+                "batching and cost/priority ordering apply to claimed jobs, the shared queue is FIFO"
+            )
+        app.state.job_queue = PriorityJobQueue(
+            maxsize=SHARED_CLAIM_JOBS if SHARED_JOB_STORE else QUEUE_MAXSIZE,
+            aging_rate=SCHED_AGING_RATE,
+            class_seconds=SCHED_CLASS_SECONDS,
+            use_cost=SCHED_POLICY != "fifo",
+        )  # (job_id, req)
+        app.state.handoff_queue = asyncio.Queue(maxsize=max(1, PIPELINE_DEPTH))  # LM stage -> DiT stage
+        app.state.admission = None  # AdmissionController, created once the models are loaded
+        app.state.admission_cond = asyncio.Condition()  # notified whenever a reservation is released
 
         # temp files per job (from multipart uploads)
         app.state.job_temp_files = {}  # job_id -> list[path]
         app.state.job_temp_files_lock = asyncio.Lock()
 
+        # decoded audio of stream=true jobs
+        app.state.audio_streams = {}  # job_id -> _AudioStreamBuffer
+
+        # cancellation of queued / running jobs
+        app.state.cancel_tokens = {}  # job_id -> CancellationToken
+
         # stats
         app.state.stats_lock = asyncio.Lock()
         app.state.recent_durations = deque(maxlen=AVG_WINDOW)
+        app.state.running_jobs = {}  # job_id -> (started_at, estimated seconds)
+        app.state.cost_estimator = cost_estimator
         app.state.avg_job_seconds = INITIAL_AVG_JOB_SECONDS
 
         app.state.handler = handler
         app.state.executor = executor
+        app.state.lm_executor = lm_executor
         app.state.job_store = store
         app.state._python_executable = sys.executable
         
@@ -1060,437 +1589,1038 @@ def create_app() -> FastAPI:
             result_key = f"{RESULT_KEY_PREFIX}{job_id}"
             local_cache.set(result_key, result_data, ex=RESULT_EXPIRE_SECONDS)
 
-        async def _run_one_job(job_id: str, req: GenerateMusicRequest) -> None:
-            job_store: _JobStore = app.state.job_store
+        def _select_dit_handler(job_id: str, req: GenerateMusicRequest) -> Tuple[AceStepHandler, str]:
+            """Pick the pooled DiT handler for req.model (falls back to the primary model).
+
+            The handler's weights may not be on the GPU: run it inside model_pool.acquire().
+            """
+            pool: DiTModelPool = app.state.model_pool
+            selected_model_name = pool.resolve(req.model)
+            if req.model and req.model != selected_model_name:
+                print(f"[API Server] Job {job_id}: Model '{req.model}' not found in {pool.names()}, using primary: {selected_model_name}")
+            elif req.model:
+                print(f"[API Server] Job {job_id}: Using model: {selected_model_name}")
+            return pool.get(selected_model_name), selected_model_name
+
+        def _prefetch_next_model() -> None:
+            """Start loading the DiT of the next queued job in the background if it is not resident."""
+            pool: Optional[DiTModelPool] = app.state.model_pool
+            if pool is None or not DIT_POOL_PREFETCH:
+                return
+            for _, next_req in app.state.job_queue.peek(1):
+                pool.prefetch(pool.resolve(next_req.model))
+
+        def _prepare_generation(req: GenerateMusicRequest, h: AceStepHandler) -> Dict[str, Any]:
+            """Run request preprocessing (sample mode / format via LM) and build GenerationParams/Config."""
             llm: LLMHandler = app.state.llm_handler
-            executor: ThreadPoolExecutor = app.state.executor
 
-            await _ensure_initialized()
-            job_store.mark_running(job_id)
-            
-            # Select DiT handler based on user's model choice
-            # Default: use primary handler
-            selected_handler: AceStepHandler = app.state.handler
-            selected_model_name = _get_model_name(app.state._config_path)
-            
-            if req.model:
-                model_matched = False
-                
-                # Check if it matches the second model
-                if app.state.handler2 and getattr(app.state, "_initialized2", False):
-                    model2_name = _get_model_name(app.state._config_path2)
-                    if req.model == model2_name:
-                        selected_handler = app.state.handler2
-                        selected_model_name = model2_name
-                        model_matched = True
-                        print(f"[API Server] Job {job_id}: Using second model: {model2_name}")
-                
-                # Check if it matches the third model
-                if not model_matched and app.state.handler3 and getattr(app.state, "_initialized3", False):
-                    model3_name = _get_model_name(app.state._config_path3)
-                    if req.model == model3_name:
-                        selected_handler = app.state.handler3
-                        selected_model_name = model3_name
-                        model_matched = True
-                        print(f"[API Server] Job {job_id}: Using third model: {model3_name}")
-                
-                if not model_matched:
-                    available_models = [_get_model_name(app.state._config_path)]
-                    if app.state.handler2 and getattr(app.state, "_initialized2", False):
-                        available_models.append(_get_model_name(app.state._config_path2))
-                    if app.state.handler3 and getattr(app.state, "_initialized3", False):
-                        available_models.append(_get_model_name(app.state._config_path3))
-                    print(f"[API Server] Job {job_id}: Model '{req.model}' not found in {available_models}, using primary: {selected_model_name}")
-            
-            # Use selected handler for generation
-            h: AceStepHandler = selected_handler
 
-            def _blocking_generate() -> Dict[str, Any]:
-                """Generate music using unified inference logic from acestep.inference"""
-                
-                def _ensure_llm_ready() -> None:
-                    """Ensure LLM handler is initialized when needed"""
-                    with app.state._llm_init_lock:
-                        initialized = getattr(app.state, "_llm_initialized", False)
-                        had_error = getattr(app.state, "_llm_init_error", None)
-                        if initialized or had_error is not None:
-                            return
-
-                        project_root = _get_project_root()
-                        checkpoint_dir = os.path.join(project_root, "checkpoints")
-                        lm_model_path = (req.lm_model_path or os.getenv("ACESTEP_LM_MODEL_PATH") or "acestep-5Hz-lm-0.6B").strip()
-                        backend = (req.lm_backend or os.getenv("ACESTEP_LM_BACKEND") or "vllm").strip().lower()
-                        if backend not in {"vllm", "pt"}:
-                            backend = "vllm"
-
-                        # Auto-download LM model if not present
-                        lm_model_name = _get_model_name(lm_model_path)
-                        if lm_model_name:
-                            try:
-                                _ensure_model_downloaded(lm_model_name, checkpoint_dir)
-                            except Exception as e:
-                                print(f"[API Server] Warning: Failed to download LM model {lm_model_name}: {e}")
-
-                        lm_device = os.getenv("ACESTEP_LM_DEVICE", os.getenv("ACESTEP_DEVICE", "auto"))
-                        lm_offload = _env_bool("ACESTEP_LM_OFFLOAD_TO_CPU", False)
-
-                        status, ok = llm.initialize(
-                            checkpoint_dir=checkpoint_dir,
-                            lm_model_path=lm_model_path,
-                            backend=backend,
-                            device=lm_device,
-                            offload_to_cpu=lm_offload,
-                            dtype=h.dtype,
-                        )
-                        if not ok:
-                            app.state._llm_init_error = status
-                        else:
-                            app.state._llm_initialized = True
-
-                def _normalize_metas(meta: Dict[str, Any]) -> Dict[str, Any]:
-                    """Ensure a stable `metas` dict (keys always present)."""
-                    meta = meta or {}
-                    out: Dict[str, Any] = dict(meta)
-
-                    # Normalize key aliases
-                    if "keyscale" not in out and "key_scale" in out:
-                        out["keyscale"] = out.get("key_scale")
-                    if "timesignature" not in out and "time_signature" in out:
-                        out["timesignature"] = out.get("time_signature")
-
-                    # Ensure required keys exist
-                    for k in ["bpm", "duration", "genres", "keyscale", "timesignature"]:
-                        if out.get(k) in (None, ""):
-                            out[k] = "N/A"
-                    return out
-
-                # Normalize LM sampling parameters
-                lm_top_k = req.lm_top_k if req.lm_top_k and req.lm_top_k > 0 else 0
-                lm_top_p = req.lm_top_p if req.lm_top_p and req.lm_top_p < 1.0 else 0.9
-
-                # Determine if LLM is needed
-                thinking = bool(req.thinking)
-                sample_mode = bool(req.sample_mode)
-                has_sample_query = bool(req.sample_query and req.sample_query.strip())
-                use_format = bool(req.use_format)
-                use_cot_caption = bool(req.use_cot_caption)
-                use_cot_language = bool(req.use_cot_language)
-                
-                # LLM is needed for:
-                # - thinking mode (LM generates audio codes)
-                # - sample_mode (LM generates random caption/lyrics/metas)
-                # - sample_query/description (LM generates from description)
-                # - use_format (LM enhances caption/lyrics)
-                # - use_cot_caption or use_cot_language (LM enhances metadata)
-                need_llm = thinking or sample_mode or has_sample_query or use_format or use_cot_caption or use_cot_language
-
-                # Ensure LLM is ready if needed
-                if need_llm:
-                    _ensure_llm_ready()
-                    if getattr(app.state, "_llm_init_error", None):
-                        raise RuntimeError(f"5Hz LM init failed: {app.state._llm_init_error}")
-
-                # Handle sample mode or description: generate caption/lyrics/metas via LM
-                caption = req.prompt
-                lyrics = req.lyrics
-                bpm = req.bpm
-                key_scale = req.key_scale
-                time_signature = req.time_signature
-                audio_duration = req.audio_duration
-
-                # Save original user input for metas
-                original_prompt = req.prompt or ""
-                original_lyrics = req.lyrics or ""
-                
-                if sample_mode or has_sample_query:
-                    # Parse description hints from sample_query (if provided)
-                    sample_query = req.sample_query if has_sample_query else "NO USER INPUT"
-                    parsed_language, parsed_instrumental = _parse_description_hints(sample_query)
-
-                    # Determine vocal_language with priority:
-                    # 1. User-specified vocal_language (if not default "en")
-                    # 2. Language parsed from description
-                    # 3. None (no constraint)
-                    if req.vocal_language and req.vocal_language not in ("en", "unknown", ""):
-                        sample_language = req.vocal_language
-                    else:
-                        sample_language = parsed_language
-
-                    sample_result = create_sample(
-                        llm_handler=llm,
-                        query=sample_query,
-                        instrumental=parsed_instrumental,
-                        vocal_language=sample_language,
-                        temperature=req.lm_temperature,
-                        top_k=lm_top_k if lm_top_k > 0 else None,
-                        top_p=lm_top_p if lm_top_p < 1.0 else None,
-                        use_constrained_decoding=True,
+            def _ensure_llm_ready() -> None:
+                """Ensure LLM handler is initialized when needed"""
+                with app.state._llm_init_lock:
+                    initialized = getattr(app.state, "_llm_initialized", False)
+                    had_error = getattr(app.state, "_llm_init_error", None)
+                    if initialized or had_error is not None:
+                        return
+
+                    project_root = _get_project_root()
+                    checkpoint_dir = os.path.join(project_root, "checkpoints")
+                    lm_model_path = (req.lm_model_path or os.getenv("ACESTEP_LM_MODEL_PATH") or "acestep-5Hz-lm-0.6B").strip()
+                    backend = (req.lm_backend or os.getenv("ACESTEP_LM_BACKEND") or "vllm").strip().lower()
+                    if backend not in {"vllm", "pt"}:
+                        backend = "vllm"
+
+                    # Auto-download LM model if not present
+                    lm_model_name = _get_model_name(lm_model_path)
+                    if lm_model_name:
+                        try:
+                            _ensure_model_downloaded(lm_model_name, checkpoint_dir)
+                        except Exception as e:
+                            print(f"[API Server] Warning: Failed to download LM model {lm_model_name}: {e}")
+
+                    lm_device = os.getenv("ACESTEP_LM_DEVICE", os.getenv("ACESTEP_DEVICE", "auto"))
+                    lm_offload = _env_bool("ACESTEP_LM_OFFLOAD_TO_CPU", False)
+
+                    status, ok = llm.initialize(
+                        checkpoint_dir=checkpoint_dir,
+                        lm_model_path=lm_model_path,
+                        backend=backend,
+                        device=lm_device,
+                        offload_to_cpu=lm_offload,
+                        dtype=h.dtype,
                     )
+                    if not ok:
+                        app.state._llm_init_error = status
+                    else:
+                        app.state._llm_initialized = True
+
+            # Normalize LM sampling parameters
+            lm_top_k = req.lm_top_k if req.lm_top_k and req.lm_top_k > 0 else 0
+            lm_top_p = req.lm_top_p if req.lm_top_p and req.lm_top_p < 1.0 else 0.9
+
+            # Determine if LLM is needed
+            thinking = bool(req.thinking)
+            sample_mode = bool(req.sample_mode)
+            has_sample_query = bool(req.sample_query and req.sample_query.strip())
+            use_format = bool(req.use_format)
+            use_cot_caption = bool(req.use_cot_caption)
+            use_cot_language = bool(req.use_cot_language)
+
+            # LLM is needed for:
+            # - thinking mode (LM generates audio codes)
+            # - sample_mode (LM generates random caption/lyrics/metas)
+            # - sample_query/description (LM generates from description)
+            # - use_format (LM enhances caption/lyrics)
+            # - use_cot_caption or use_cot_language (LM enhances metadata)
+            need_llm = thinking or sample_mode or has_sample_query or use_format or use_cot_caption or use_cot_language
+
+            # Ensure LLM is ready if needed
+            if need_llm:
+                _ensure_llm_ready()
+                if getattr(app.state, "_llm_init_error", None):
+                    raise RuntimeError(f"5Hz LM init failed: {app.state._llm_init_error}")
+
+            # Handle sample mode or description: generate caption/lyrics/metas via LM
+            caption = req.prompt
+            lyrics = req.lyrics
+            bpm = req.bpm
+            key_scale = req.key_scale
+            time_signature = req.time_signature
+            audio_duration = req.audio_duration
+
+            # Save original user input for metas
+            original_prompt = req.prompt or ""
+            original_lyrics = req.lyrics or ""
+
+            if sample_mode or has_sample_query:
+                # Parse description hints from sample_query (if provided)
+                sample_query = req.sample_query if has_sample_query else "NO USER INPUT"
+                parsed_language, parsed_instrumental = _parse_description_hints(sample_query)
+
+                # Determine vocal_language with priority:
+                # 1. User-specified vocal_language (if not default "en")
+                # 2. Language parsed from description
+                # 3. None (no constraint)
+                if req.vocal_language and req.vocal_language not in ("en", "unknown", ""):
+                    sample_language = req.vocal_language
+                else:
+                    sample_language = parsed_language
+
+                sample_result = create_sample(
+                    llm_handler=llm,
+                    query=sample_query,
+                    instrumental=parsed_instrumental,
+                    vocal_language=sample_language,
+                    temperature=req.lm_temperature,
+                    top_k=lm_top_k if lm_top_k > 0 else None,
+                    top_p=lm_top_p if lm_top_p < 1.0 else None,
+                    use_constrained_decoding=True,
+                )
 
-                    if not sample_result.success:
-                        raise RuntimeError(f"create_sample failed: {sample_result.error or sample_result.status_message}")
-
-                    # Use generated sample data
-                    caption = sample_result.caption
-                    lyrics = sample_result.lyrics
-                    bpm = sample_result.bpm
-                    key_scale = sample_result.keyscale
-                    time_signature = sample_result.timesignature
-                    audio_duration = sample_result.duration
-
-                # Apply format_sample() if use_format is True and caption/lyrics are provided
-                format_has_duration = False
-
-                if req.use_format and (caption or lyrics):
-                    _ensure_llm_ready()
-                    if getattr(app.state, "_llm_init_error", None):
-                        raise RuntimeError(f"5Hz LM init failed (needed for format): {app.state._llm_init_error}")
-                    
-                    # Build user_metadata from request params (matching bot.py behavior)
-                    user_metadata_for_format = {}
-                    if bpm is not None:
-                        user_metadata_for_format['bpm'] = bpm
-                    if audio_duration is not None and float(audio_duration) > 0:
-                        user_metadata_for_format['duration'] = float(audio_duration)
-                    if key_scale:
-                        user_metadata_for_format['keyscale'] = key_scale
-                    if time_signature:
-                        user_metadata_for_format['timesignature'] = time_signature
-                    if req.vocal_language and req.vocal_language != "unknown":
-                        user_metadata_for_format['language'] = req.vocal_language
-                    
-                    format_result = format_sample(
-                        llm_handler=llm,
-                        caption=caption,
-                        lyrics=lyrics,
-                        user_metadata=user_metadata_for_format if user_metadata_for_format else None,
-                        temperature=req.lm_temperature,
-                        top_k=lm_top_k if lm_top_k > 0 else None,
-                        top_p=lm_top_p if lm_top_p < 1.0 else None,
-                        use_constrained_decoding=True,
-                    )
-                    
-                    if format_result.success:
-                        # Extract all formatted data (matching bot.py behavior)
-                        caption = format_result.caption or caption
-                        lyrics = format_result.lyrics or lyrics
-                        if format_result.duration:
-                            audio_duration = format_result.duration
-                            format_has_duration = True
-                        if format_result.bpm:
-                            bpm = format_result.bpm
-                        if format_result.keyscale:
-                            key_scale = format_result.keyscale
-                        if format_result.timesignature:
-                            time_signature = format_result.timesignature
-
-                # Parse timesteps string to list of floats if provided
-                parsed_timesteps = _parse_timesteps(req.timesteps)
-
-                # Determine actual inference steps (timesteps override inference_steps)
-                actual_inference_steps = len(parsed_timesteps) if parsed_timesteps else req.inference_steps
-
-                # Auto-select instruction based on task_type if user didn't provide custom instruction
-                # This matches gradio behavior which uses TASK_INSTRUCTIONS for each task type
-                instruction_to_use = req.instruction
-                if instruction_to_use == DEFAULT_DIT_INSTRUCTION and req.task_type in TASK_INSTRUCTIONS:
-                    instruction_to_use = TASK_INSTRUCTIONS[req.task_type]
-
-                # Build GenerationParams using unified interface
-                # Note: thinking controls LM code generation, sample_mode only affects CoT metas
-                params = GenerationParams(
-                    task_type=req.task_type,
-                    instruction=instruction_to_use,
-                    reference_audio=req.reference_audio_path,
-                    src_audio=req.src_audio_path,
-                    audio_codes=req.audio_code_string,
+                if not sample_result.success:
+                    raise RuntimeError(f"create_sample failed: {sample_result.error or sample_result.status_message}")
+
+                # Use generated sample data
+                caption = sample_result.caption
+                lyrics = sample_result.lyrics
+                bpm = sample_result.bpm
+                key_scale = sample_result.keyscale
+                time_signature = sample_result.timesignature
+                audio_duration = sample_result.duration
+
+            # Apply format_sample() if use_format is True and caption/lyrics are provided
+            format_has_duration = False
+
+            if req.use_format and (caption or lyrics):
+                _ensure_llm_ready()
+                if getattr(app.state, "_llm_init_error", None):
+                    raise RuntimeError(f"5Hz LM init failed (needed for format): {app.state._llm_init_error}")
+
+                # Build user_metadata from request params (matching bot.py behavior)
+                user_metadata_for_format = {}
+                if bpm is not None:
+                    user_metadata_for_format['bpm'] = bpm
+                if audio_duration is not None and float(audio_duration) > 0:
+                    user_metadata_for_format['duration'] = float(audio_duration)
+                if key_scale:
+                    user_metadata_for_format['keyscale'] = key_scale
+                if time_signature:
+                    user_metadata_for_format['timesignature'] = time_signature
+                if req.vocal_language and req.vocal_language != "unknown":
+                    user_metadata_for_format['language'] = req.vocal_language
+
+                format_result = format_sample(
+                    llm_handler=llm,
                     caption=caption,
                     lyrics=lyrics,
-                    instrumental=_is_instrumental(lyrics),
-                    vocal_language=req.vocal_language,
-                    bpm=bpm,
-                    keyscale=key_scale,
-                    timesignature=time_signature,
-                    duration=audio_duration if audio_duration else -1.0,
-                    inference_steps=req.inference_steps,
-                    seed=req.seed,
-                    guidance_scale=req.guidance_scale,
-                    use_adg=req.use_adg,
-                    cfg_interval_start=req.cfg_interval_start,
-                    cfg_interval_end=req.cfg_interval_end,
-                    shift=req.shift,
-                    infer_method=req.infer_method,
-                    timesteps=parsed_timesteps,
-                    repainting_start=req.repainting_start,
-                    repainting_end=req.repainting_end if req.repainting_end else -1,
-                    audio_cover_strength=req.audio_cover_strength,
-                    # LM parameters
-                    thinking=thinking,  # Use LM for code generation when thinking=True
-                    lm_temperature=req.lm_temperature,
-                    lm_cfg_scale=req.lm_cfg_scale,
-                    lm_top_k=lm_top_k,
-                    lm_top_p=lm_top_p,
-                    lm_negative_prompt=req.lm_negative_prompt,
-                    # use_cot_metas logic:
-                    # - sample_mode: metas already generated, skip Phase 1
-                    # - format with duration: metas already generated, skip Phase 1  
-                    # - format without duration: need Phase 1 to generate duration
-                    # - no format: need Phase 1 to generate all metas
-                    use_cot_metas=not sample_mode and not format_has_duration,
-                    use_cot_caption=req.use_cot_caption,
-                    use_cot_language=req.use_cot_language,
+                    user_metadata=user_metadata_for_format if user_metadata_for_format else None,
+                    temperature=req.lm_temperature,
+                    top_k=lm_top_k if lm_top_k > 0 else None,
+                    top_p=lm_top_p if lm_top_p < 1.0 else None,
                     use_constrained_decoding=True,
                 )
 
-                # Build GenerationConfig - default to 2 audios like gradio_ui
-                batch_size = req.batch_size if req.batch_size is not None else 2
-                config = GenerationConfig(
-                    batch_size=batch_size,
-                    allow_lm_batch=req.allow_lm_batch,
-                    use_random_seed=req.use_random_seed,
-                    seeds=None,  # Let unified logic handle seed generation
-                    audio_format=req.audio_format,
-                    constrained_decoding_debug=req.constrained_decoding_debug,
-                )
+                if format_result.success:
+                    # Extract all formatted data (matching bot.py behavior)
+                    caption = format_result.caption or caption
+                    lyrics = format_result.lyrics or lyrics
+                    if format_result.duration:
+                        audio_duration = format_result.duration
+                        format_has_duration = True
+                    if format_result.bpm:
+                        bpm = format_result.bpm
+                    if format_result.keyscale:
+                        key_scale = format_result.keyscale
+                    if format_result.timesignature:
+                        time_signature = format_result.timesignature
+
+            # Parse timesteps string to list of floats if provided
+            parsed_timesteps = _parse_timesteps(req.timesteps)
+
+            # Determine actual inference steps (timesteps override inference_steps)
+            actual_inference_steps = len(parsed_timesteps) if parsed_timesteps else req.inference_steps
+
+            # Auto-select instruction based on task_type if user didn't provide custom instruction
+            # This matches gradio behavior which uses TASK_INSTRUCTIONS for each task type
+            instruction_to_use = req.instruction
+            if instruction_to_use == DEFAULT_DIT_INSTRUCTION and req.task_type in TASK_INSTRUCTIONS:
+                instruction_to_use = TASK_INSTRUCTIONS[req.task_type]
+
+            # Build GenerationParams using unified interface
+            # Note: thinking controls LM code generation, sample_mode only affects CoT metas
+            params = GenerationParams(
+                task_type=req.task_type,
+                instruction=instruction_to_use,
+                reference_audio=req.reference_audio_path,
+                src_audio=req.src_audio_path,
+                audio_codes=req.audio_code_string,
+                caption=caption,
+                lyrics=lyrics,
+                instrumental=_is_instrumental(lyrics),
+                vocal_language=req.vocal_language,
+                bpm=bpm,
+                keyscale=key_scale,
+                timesignature=time_signature,
+                duration=audio_duration if audio_duration else -1.0,
+                inference_steps=req.inference_steps,
+                seed=req.seed,
+                guidance_scale=req.guidance_scale,
+                use_adg=req.use_adg,
+                cfg_interval_start=req.cfg_interval_start,
+                cfg_interval_end=req.cfg_interval_end,
+                shift=req.shift,
+                infer_method=req.infer_method,
+                timesteps=parsed_timesteps,
+                repainting_start=req.repainting_start,
+                repainting_end=req.repainting_end if req.repainting_end else -1,
+                audio_cover_strength=req.audio_cover_strength,
+                # LM parameters
+                thinking=thinking,  # Use LM for code generation when thinking=True
+                lm_temperature=req.lm_temperature,
+                lm_cfg_scale=req.lm_cfg_scale,
+                lm_top_k=lm_top_k,
+                lm_top_p=lm_top_p,
+                lm_negative_prompt=req.lm_negative_prompt,
+                # use_cot_metas logic:
+                # - sample_mode: metas already generated, skip Phase 1
+                # - format with duration: metas already generated, skip Phase 1  
+                # - format without duration: need Phase 1 to generate duration
+                # - no format: need Phase 1 to generate all metas
+                use_cot_metas=not sample_mode and not format_has_duration,
+                use_cot_caption=req.use_cot_caption,
+                use_cot_language=req.use_cot_language,
+                use_constrained_decoding=True,
+            )
 
-                # Check LLM initialization status
-                llm_is_initialized = getattr(app.state, "_llm_initialized", False)
-                llm_to_pass = llm if llm_is_initialized else None
+            # Build GenerationConfig - default to 2 audios like gradio_ui
+            batch_size = req.batch_size if req.batch_size is not None else 2
+            config = GenerationConfig(
+                batch_size=batch_size,
+                allow_lm_batch=req.allow_lm_batch,
+                use_random_seed=req.use_random_seed,
+                seeds=None,  # Let unified logic handle seed generation
+                audio_format=req.audio_format,
+                constrained_decoding_debug=req.constrained_decoding_debug,
+            )
 
-                # Generate music using unified interface
+            return {
+                "params": params,
+                "config": config,
+                "caption": caption,
+                "lyrics": lyrics,
+                "bpm": bpm,
+                "key_scale": key_scale,
+                "time_signature": time_signature,
+                "audio_duration": audio_duration,
+                "original_prompt": original_prompt,
+                "original_lyrics": original_lyrics,
+            }
+
+        def _build_job_result(
+            req: GenerateMusicRequest,
+            prepared: Dict[str, Any],
+            result: GenerationResult,
+            dit_model_name: str,
+        ) -> Dict[str, Any]:
+            """Turn a GenerationResult into the job result dict stored in the job store."""
+            params: GenerationParams = prepared["params"]
+            caption = prepared["caption"]
+            lyrics = prepared["lyrics"]
+            bpm = prepared["bpm"]
+            key_scale = prepared["key_scale"]
+            time_signature = prepared["time_signature"]
+            audio_duration = prepared["audio_duration"]
+            original_prompt = prepared["original_prompt"]
+            original_lyrics = prepared["original_lyrics"]
+
+            def _normalize_metas(meta: Dict[str, Any]) -> Dict[str, Any]:
+                """Ensure a stable `metas` dict (keys always present)."""
+                meta = meta or {}
+                out: Dict[str, Any] = dict(meta)
+
+                # Normalize key aliases
+                if "keyscale" not in out and "key_scale" in out:
+                    out["keyscale"] = out.get("key_scale")
+                if "timesignature" not in out and "time_signature" in out:
+                    out["timesignature"] = out.get("time_signature")
+
+                # Ensure required keys exist
+                for k in ["bpm", "duration", "genres", "keyscale", "timesignature"]:
+                    if out.get(k) in (None, ""):
+                        out[k] = "N/A"
+                return out
+
+            if not result.success:
+                raise RuntimeError(f"Music generation failed: {result.error or result.status_message}")
+
+            # Extract results
+            audio_paths = [audio["path"] for audio in result.audios if audio.get("path")]
+            first_audio = audio_paths[0] if len(audio_paths) > 0 else None
+            second_audio = audio_paths[1] if len(audio_paths) > 1 else None
+
+            # Get metadata from LM or CoT results
+            lm_metadata = result.extra_outputs.get("lm_metadata", {})
+            metas_out = _normalize_metas(lm_metadata)
+
+            # Update metas with actual values used
+            if params.cot_bpm:
+                metas_out["bpm"] = params.cot_bpm
+            elif bpm:
+                metas_out["bpm"] = bpm
+
+            if params.cot_duration:
+                metas_out["duration"] = params.cot_duration
+            elif audio_duration:
+                metas_out["duration"] = audio_duration
+
+            if params.cot_keyscale:
+                metas_out["keyscale"] = params.cot_keyscale
+            elif key_scale:
+                metas_out["keyscale"] = key_scale
+
+            if params.cot_timesignature:
+                metas_out["timesignature"] = params.cot_timesignature
+            elif time_signature:
+                metas_out["timesignature"] = time_signature
+
+            # Store original user input in metas (not the final/modified values)
+            metas_out["prompt"] = original_prompt
+            metas_out["lyrics"] = original_lyrics
+
+            # Extract seed values for response (comma-separated for multiple audios)
+            seed_values = []
+            for audio in result.audios:
+                audio_params = audio.get("params", {})
+                seed = audio_params.get("seed")
+                if seed is not None:
+                    seed_values.append(str(seed))
+            seed_value = ",".join(seed_values) if seed_values else ""
+
+            # Build generation_info using the helper function (like gradio_ui)
+            time_costs = result.extra_outputs.get("time_costs", {})
+            generation_info = _build_generation_info(
+                lm_metadata=lm_metadata,
+                time_costs=time_costs,
+                seed_value=seed_value,
+                inference_steps=req.inference_steps,
+                num_audios=len(result.audios),
+            )
+
+            def _none_if_na_str(v: Any) -> Optional[str]:
+                if v is None:
+                    return None
+                s = str(v).strip()
+                if s in {"", "N/A"}:
+                    return None
+                return s
+
+            # Get model information
+            lm_model_name = os.getenv("ACESTEP_LM_MODEL_PATH", "acestep-5Hz-lm-0.6B")
+
+            return {
+                "first_audio_path": _path_to_audio_url(first_audio) if first_audio else None,
+                "second_audio_path": _path_to_audio_url(second_audio) if second_audio else None,
+                "audio_paths": [_path_to_audio_url(p) for p in audio_paths],
+                "generation_info": generation_info,
+                "status_message": result.status_message,
+                "seed_value": seed_value,
+                # Final prompt/lyrics (may be modified by thinking/format)
+                "prompt": caption or "",
+                "lyrics": lyrics or "",
+                # metas contains original user input + other metadata
+                "metas": metas_out,
+                "bpm": metas_out.get("bpm") if isinstance(metas_out.get("bpm"), int) else None,
+                "duration": metas_out.get("duration") if isinstance(metas_out.get("duration"), (int, float)) else None,
+                "genres": _none_if_na_str(metas_out.get("genres")),
+                "keyscale": _none_if_na_str(metas_out.get("keyscale")),
+                "timesignature": _none_if_na_str(metas_out.get("timesignature")),
+                "lm_model": lm_model_name,
+                "dit_model": dit_model_name,
+            }
+
+        def _mark_running(job_id: str, req: GenerateMusicRequest) -> None:
+            app.state.job_store.mark_running(job_id)
+            app.state.running_jobs[job_id] = (time.time(), _estimate_job_seconds(req))
+
+        def _audio_chunk_callback(job_id: str):
+            buf: Optional[_AudioStreamBuffer] = app.state.audio_streams.get(job_id)
+            return buf.push if buf is not None else None
+
+        def _close_audio_stream(job_id: str) -> None:
+            """End the job's audio stream (if any) and drop it after STREAM_RETAIN_SECONDS."""
+            buf: Optional[_AudioStreamBuffer] = app.state.audio_streams.get(job_id)
+            if buf is None:
+                return
+            buf.close()
+            asyncio.get_running_loop().call_later(STREAM_RETAIN_SECONDS, app.state.audio_streams.pop, job_id, None)
+
+        def _cancel_token(job_id: str) -> CancellationToken:
+            token = app.state.cancel_tokens.get(job_id)
+            if token is None:
+                token = app.state.cancel_tokens[job_id] = CancellationToken()
+            return token
+
+        def _cancelled_error(job_id: str) -> Optional[str]:
+            """Error stored for a job whose cancellation was requested, None otherwise."""
+            token = app.state.cancel_tokens.get(job_id)
+            if token is None or not token.cancelled:
+                return None
+            return f"Cancelled: {token.reason}"
+
+        def _request_cancel(job_id: str, reason: str) -> None:
+            """Flag a job as cancelled; the thread running it stops at its next LM/diffusion/decode step."""
+            rec = store.get(job_id)
+            if rec is None or rec.status in ("succeeded", "failed"):
+                return
+            _cancel_token(job_id).cancel(reason)
+            if SHARED_JOB_STORE:
+                store.request_cancel(job_id)
+
+        async def _cancel_job(job_id: str, reason: str) -> str:
+            """
+            Cancel a job. Returns "cancelled" for a job taken out of the queue, "cancelling"
+            for a running one (it fails with "Cancelled: ..." within one step) and
+            "finished" when there was nothing left to cancel. Raises KeyError if unknown.
+            """
+            rec = store.get(job_id)
+            if rec is None:
+                raise KeyError(job_id)
+            if rec.status in ("succeeded", "failed"):
+                return "finished"
+            _request_cancel(job_id, reason)
+            removed = False
+            if SHARED_JOB_STORE:
+                removed = await asyncio.get_running_loop().run_in_executor(None, store.remove_queued, job_id)
+            if not removed:
+                removed = app.state.job_queue.remove(job_id) is not None
+            if not removed:
+                return "cancelling"
+            print(f"[API Server] Cancelled queued job {job_id}: {reason}")
+            store.mark_failed(job_id, _cancelled_error(job_id))
+            _update_local_cache(job_id, None, "failed")
+            _close_audio_stream(job_id)
+            await _cleanup_job_temp_files(job_id)
+            app.state.cancel_tokens.pop(job_id, None)
+            return "cancelled"
+
+        app.state.cancel_job = _cancel_job
+        app.state.request_cancel = _request_cancel
+
+        async def _admit(
+            job_id: str,
+            req: GenerateMusicRequest,
+            batch_items: Optional[int] = None,
+            duration: Optional[float] = None,
+            cancel_token: Optional[CancellationToken] = None,
+        ) -> Optional[AdmissionDecision]:
+            """
+            Reserve memory for a job, waiting while running jobs hold too much of it.
+
+            Returns None when admission control is off. A job is never deferred when
+            nothing else is running (waiting would not free anything) nor for longer
+            than ADMISSION_MAX_DEFER_SECONDS, after which it runs as decided.
+            A merged batch is admitted like one job: job_id is then the key of its
+            reservation, batch_items its total audios and duration its longest one.
+            """
+            admission: Optional[AdmissionController] = app.state.admission
+            if admission is None:
+                return None
+            if admission.running() == 0:
+                # Idle GPU: pick up models loaded (or evicted) since the last measurement
+                _calibrate_admission(admission)
+            shape = _admission_shape(req)
+            if duration is not None:
+                shape["duration"] = duration
+            batch_size = batch_items if batch_items is not None else _request_batch_size(req)
+            token = cancel_token if cancel_token is not None else _cancel_token(job_id)
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + ADMISSION_MAX_DEFER_SECONDS
+            announced = False
+            while True:
+                decision = admission.decide(batch_size=batch_size, ram_available_gb=available_ram_gb(), **shape)
+                remaining = deadline - loop.time()
+                if decision.action != ACTION_DEFER or remaining <= 0 or admission.running() == 0:
+                    break
+                if token.cancelled:
+                    break  # Fails right away in run_cancellable
+                if not announced:
+                    print(f"[API Server] Deferring job {job_id}: {decision.reason}")
+                    announced = True
+                async with app.state.admission_cond:
+                    try:
+                        await asyncio.wait_for(app.state.admission_cond.wait(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        pass
+            if decision.action == ACTION_SPLIT:
+                print(f"[API Server] Splitting job {job_id} into sub-batches {decision.batch_sizes}: {decision.reason}")
+            admission.reserve(job_id, decision.predicted_vram_gb, decision.predicted_ram_gb)
+            return decision
+
+        def _calibrate_admission(admission: AdmissionController) -> None:
+            """Re-measure the idle VRAM baseline of admission control."""
+            pool: Optional[DiTModelPool] = app.state.model_pool
+            headroom = 0.0
+            if pool is not None and pool.manage_residency:
+                # Pooled DiT weights may grow up to the pool budget as models are loaded
+                pool_stats = pool.stats()
+                headroom = pool_stats["vram_budget_gb"] - pool_stats["resident_gb"]
+            admission.calibrate_resident(headroom)
+
+        async def _release_admission(job_ids: List[str]) -> None:
+            admission: Optional[AdmissionController] = app.state.admission
+            if admission is None:
+                return
+            for job_id in job_ids:
+                admission.release(job_id)
+            async with app.state.admission_cond:
+                app.state.admission_cond.notify_all()
+
+        def _observe_memory(
+            req: GenerateMusicRequest, batch_items: int, probe: PeakMemoryProbe, duration: Optional[float] = None,
+        ) -> None:
+            """Feed measured peaks to the memory model; only a job running alone measures its own peak."""
+            admission: Optional[AdmissionController] = app.state.admission
+            if admission is None or admission.running() > 1:
+                return
+            shape = _admission_shape(req)
+            if duration is not None:
+                shape["duration"] = duration
+            features = memory_features(shape["duration"], batch_items, shape["use_tiled_decode"])
+            admission.predictor.observe(features, probe.vram_gb, probe.ram_gb, shape["lm_model"], shape["thinking"])
+
+        def _max_batch_items(req: GenerateMusicRequest) -> int:
+            """How many audios shaped like req may share one batch (BATCH_MAX_ITEMS, memory model or GPU tier)."""
+            if BATCH_MAX_ITEMS > 0:
+                return BATCH_MAX_ITEMS
+            admission: Optional[AdmissionController] = app.state.admission
+            if admission is not None:
+                shape = _admission_shape(req)
+                # Jobs of the same duration bucket are batched together: size for the longest one
+                if shape["duration"] and shape["duration"] > 0 and BATCH_DURATION_BUCKET > 0:
+                    shape["duration"] = math.ceil(shape["duration"] / BATCH_DURATION_BUCKET) * BATCH_DURATION_BUCKET
+                return admission.max_batch_items(**shape)
+            gpu_config = getattr(app.state, "gpu_config", None)
+            return gpu_config.max_batch_size_with_lm if gpu_config else 4
+
+        def _generate_split(
+            h: AceStepHandler,
+            llm_to_pass: Optional[LLMHandler],
+            params: GenerationParams,
+            config: GenerationConfig,
+            batch_sizes: List[int],
+        ) -> GenerationResult:
+            """Run one request as sequential sub-batches (admission split) and merge their results."""
+            results: List[GenerationResult] = []
+            offset = 0
+            for size in batch_sizes:
+                seeds = config.seeds
+                if isinstance(seeds, list):
+                    seeds = seeds[offset:offset + size] or None
                 result = generate_music(
                     dit_handler=h,
                     llm_handler=llm_to_pass,
                     params=params,
-                    config=config,
+                    config=replace(config, batch_size=size, seeds=seeds),
                     save_dir=app.state.temp_audio_dir,
                     progress=None,
                 )
-
                 if not result.success:
-                    raise RuntimeError(f"Music generation failed: {result.error or result.status_message}")
-
-                # Extract results
-                audio_paths = [audio["path"] for audio in result.audios if audio.get("path")]
-                first_audio = audio_paths[0] if len(audio_paths) > 0 else None
-                second_audio = audio_paths[1] if len(audio_paths) > 1 else None
-
-                # Get metadata from LM or CoT results
-                lm_metadata = result.extra_outputs.get("lm_metadata", {})
-                metas_out = _normalize_metas(lm_metadata)
-                
-                # Update metas with actual values used
-                if params.cot_bpm:
-                    metas_out["bpm"] = params.cot_bpm
-                elif bpm:
-                    metas_out["bpm"] = bpm
-                    
-                if params.cot_duration:
-                    metas_out["duration"] = params.cot_duration
-                elif audio_duration:
-                    metas_out["duration"] = audio_duration
-                    
-                if params.cot_keyscale:
-                    metas_out["keyscale"] = params.cot_keyscale
-                elif key_scale:
-                    metas_out["keyscale"] = key_scale
-                    
-                if params.cot_timesignature:
-                    metas_out["timesignature"] = params.cot_timesignature
-                elif time_signature:
-                    metas_out["timesignature"] = time_signature
-
-                # Store original user input in metas (not the final/modified values)
-                metas_out["prompt"] = original_prompt
-                metas_out["lyrics"] = original_lyrics
-
-                # Extract seed values for response (comma-separated for multiple audios)
-                seed_values = []
-                for audio in result.audios:
-                    audio_params = audio.get("params", {})
-                    seed = audio_params.get("seed")
-                    if seed is not None:
-                        seed_values.append(str(seed))
-                seed_value = ",".join(seed_values) if seed_values else ""
-
-                # Build generation_info using the helper function (like gradio_ui)
-                time_costs = result.extra_outputs.get("time_costs", {})
-                generation_info = _build_generation_info(
-                    lm_metadata=lm_metadata,
-                    time_costs=time_costs,
-                    seed_value=seed_value,
-                    inference_steps=req.inference_steps,
-                    num_audios=len(result.audios),
-                )
+                    return result
+                results.append(result)
+                offset += size
+            time_costs: Dict[str, float] = {}
+            for result in results:
+                for name, value in (result.extra_outputs.get("time_costs") or {}).items():
+                    if isinstance(value, (int, float)):
+                        time_costs[name] = time_costs.get(name, 0.0) + value
+            return GenerationResult(
+                audios=[audio for result in results for audio in result.audios],
+                status_message=results[-1].status_message,
+                extra_outputs={**results[0].extra_outputs, "time_costs": time_costs},
+                success=True,
+            )
 
-                def _none_if_na_str(v: Any) -> Optional[str]:
-                    if v is None:
-                        return None
-                    s = str(v).strip()
-                    if s in {"", "N/A"}:
-                        return None
-                    return s
-
-                # Get model information
-                lm_model_name = os.getenv("ACESTEP_LM_MODEL_PATH", "acestep-5Hz-lm-0.6B")
-                # Use selected_model_name (set at the beginning of _run_one_job)
-                dit_model_name = selected_model_name
-                
-                return {
-                    "first_audio_path": _path_to_audio_url(first_audio) if first_audio else None,
-                    "second_audio_path": _path_to_audio_url(second_audio) if second_audio else None,
-                    "audio_paths": [_path_to_audio_url(p) for p in audio_paths],
-                    "generation_info": generation_info,
-                    "status_message": result.status_message,
-                    "seed_value": seed_value,
-                    # Final prompt/lyrics (may be modified by thinking/format)
-                    "prompt": caption or "",
-                    "lyrics": lyrics or "",
-                    # metas contains original user input + other metadata
-                    "metas": metas_out,
-                    "bpm": metas_out.get("bpm") if isinstance(metas_out.get("bpm"), int) else None,
-                    "duration": metas_out.get("duration") if isinstance(metas_out.get("duration"), (int, float)) else None,
-                    "genres": _none_if_na_str(metas_out.get("genres")),
-                    "keyscale": _none_if_na_str(metas_out.get("keyscale")),
-                    "timesignature": _none_if_na_str(metas_out.get("timesignature")),
-                    "lm_model": lm_model_name,
-                    "dit_model": dit_model_name,
-                }
+        async def _record_job_durations(samples: List[Tuple[str, GenerateMusicRequest, float]]) -> None:
+            """Record (job_id, req, seconds) of finished jobs for stats and the cost model."""
+            for job_id, req, dt in samples:
+                app.state.running_jobs.pop(job_id, None)
+                app.state.cancel_tokens.pop(job_id, None)
+                cost_estimator.observe(_job_features(req), dt)
+            await _release_admission([job_id for job_id, _, _ in samples])
+            async with app.state.stats_lock:
+                app.state.recent_durations.extend(dt for _, _, dt in samples)
+                if app.state.recent_durations:
+                    app.state.avg_job_seconds = sum(app.state.recent_durations) / len(app.state.recent_durations)
+
+        async def _run_one_job(job_id: str, req: GenerateMusicRequest) -> None:
+            llm: LLMHandler = app.state.llm_handler
+            executor: ThreadPoolExecutor = app.state.executor
+
+            await _ensure_initialized()
+            decision = await _admit(job_id, req)
+            _mark_running(job_id, req)
+
+            # Use selected handler for generation
+            h, selected_model_name = _select_dit_handler(job_id, req)
+            batch_sizes = decision.batch_sizes if decision is not None else [_request_batch_size(req)]
+            if req.stream and len(batch_sizes) > 1:
+                # The stream carries one generation's decoded chunks; streamed jobs are not split
+                batch_sizes = [_request_batch_size(req)]
+
+            def _blocking_generate() -> Dict[str, Any]:
+                """Generate music using unified inference logic from acestep.inference"""
+                prepared = _prepare_generation(req, h)
+                params = prepared["params"]
+                config = prepared["config"]
+
+                # Check LLM initialization status
+                llm_is_initialized = getattr(app.state, "_llm_initialized", False)
+                llm_to_pass = llm if llm_is_initialized else None
+
+                # Generate music using unified interface
+                with app.state.model_pool.acquire(selected_model_name), PeakMemoryProbe() as probe:
+                    if len(batch_sizes) > 1:
+                        result = _generate_split(h, llm_to_pass, params, config, batch_sizes)
+                    else:
+                        result = generate_music(
+                            dit_handler=h,
+                            llm_handler=llm_to_pass,
+                            params=params,
+                            config=config,
+                            save_dir=app.state.temp_audio_dir,
+                            progress=None,
+                            audio_chunk_callback=_audio_chunk_callback(job_id),
+                        )
+                if result.success and not result.extra_outputs.get("result_cache_hit"):
+                    _observe_memory(req, max(batch_sizes), probe)
+
+                return _build_job_result(req, prepared, result, selected_model_name)
 
             t0 = time.time()
             try:
                 loop = asyncio.get_running_loop()
-                result = await loop.run_in_executor(executor, _blocking_generate)
-                job_store.mark_succeeded(job_id, result)
-
-                # Update local cache
-                _update_local_cache(job_id, result, "succeeded")
+                # Held before prefetching so the prefetch cannot evict this job's DiT while the LM runs
+                with app.state.model_pool.hold(selected_model_name):
+                    _prefetch_next_model()
+                    result = await loop.run_in_executor(executor, run_cancellable, _cancel_token(job_id), _blocking_generate)
+                _record_job_outcomes([job_id], {job_id: (result, None)})
             except Exception:
-                job_store.mark_failed(job_id, traceback.format_exc())
-
-                # Update local cache
-                _update_local_cache(job_id, None, "failed")
+                _record_job_outcomes([job_id], {job_id: (None, traceback.format_exc())})
             finally:
+                _close_audio_stream(job_id)
                 dt = max(0.0, time.time() - t0)
-                async with app.state.stats_lock:
-                    app.state.recent_durations.append(dt)
-                    if app.state.recent_durations:
-                        app.state.avg_job_seconds = sum(app.state.recent_durations) / len(app.state.recent_durations)
+                await _record_job_durations([(job_id, req, dt)])
+
+        async def _run_job_batch(jobs: List[Tuple[str, GenerateMusicRequest]]) -> None:
+            """Run several compatible queued jobs as one DiT batch (see _batch_compat_key)."""
+            await _ensure_initialized()
+            total_items = sum(_request_batch_size(req) for _, req in jobs)
+            # Every job runs padded to the longest one (auto duration counts as the default length)
+            longest = max(
+                (req.audio_duration if req.audio_duration and req.audio_duration > 0 else DEFAULT_DURATION_SECONDS)
+                for _, req in jobs
+            )
+            # One reservation for the merged batch, held until the whole batch has finished
+            batch_key = f"batch:{uuid4()}"
+            batch_token = AllCancelledToken([_cancel_token(job_id) for job_id, _ in jobs])
+            decision = await _admit(batch_key, jobs[0][1], batch_items=total_items, duration=longest, cancel_token=batch_token)
+            if decision is not None and decision.action == ACTION_SPLIT:
+                # The merged batch is predicted not to fit even on an idle GPU: run its jobs one by one
+                await _release_admission([batch_key])
+                print(f"[API Server] Not batching jobs {[job_id for job_id, _ in jobs]}: {decision.reason}")
+                for job_id, req in jobs:
+                    await _run_one_job(job_id, req)
+                return
+            try:
+                await _run_admitted_batch(jobs, total_items, longest, batch_token)
+            finally:
+                await _release_admission([batch_key])
+
+        async def _run_admitted_batch(
+            jobs: List[Tuple[str, GenerateMusicRequest]],
+            total_items: int,
+            longest: float,
+            batch_token: AllCancelledToken,
+        ) -> None:
+            """Generate jobs admitted by _run_job_batch as one batch and record their outcomes."""
+            llm: LLMHandler = app.state.llm_handler
+            executor: ThreadPoolExecutor = app.state.executor
+            for job_id, req in jobs:
+                _mark_running(job_id, req)
+
+            # All jobs share the same model (part of the compatibility key)
+            h, selected_model_name = _select_dit_handler(jobs[0][0], jobs[0][1])
+            print(f"[API Server] Batching {len(jobs)} jobs into one generation: {[job_id for job_id, _ in jobs]}")
+
+            def _blocking_generate_batch() -> Dict[str, Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+                """Returns job_id -> (result, error traceback)"""
+                outcomes: Dict[str, Tuple[Optional[Dict[str, Any]], Optional[str]]] = {}
+                prepared_jobs = []
+                for job_id, req in jobs:
+                    try:
+                        prepared_jobs.append((job_id, req, _prepare_generation(req, h)))
+                    except Exception:
+                        outcomes[job_id] = (None, traceback.format_exc())
+
+                if not prepared_jobs:
+                    return outcomes
+
+                llm_is_initialized = getattr(app.state, "_llm_initialized", False)
+                llm_to_pass = llm if llm_is_initialized else None
+
+                with app.state.model_pool.acquire(selected_model_name), PeakMemoryProbe() as probe:
+                    results = generate_music_batch(
+                        dit_handler=h,
+                        llm_handler=llm_to_pass,
+                        jobs=[(prepared["params"], prepared["config"]) for _, _, prepared in prepared_jobs],
+                        save_dir=app.state.temp_audio_dir,
+                        progress=None,
+                    )
+                if len(prepared_jobs) == len(jobs) and all(r.success for r in results):
+                    _observe_memory(jobs[0][1], total_items, probe, duration=longest)
+                for (job_id, req, prepared), result in zip(prepared_jobs, results):
+                    try:
+                        outcomes[job_id] = (_build_job_result(req, prepared, result, selected_model_name), None)
+                    except Exception:
+                        outcomes[job_id] = (None, traceback.format_exc())
+                return outcomes
+
+            t0 = time.time()
+            try:
+                loop = asyncio.get_running_loop()
+                with app.state.model_pool.hold(selected_model_name):
+                    _prefetch_next_model()
+                    # Stops only once every job of the batch is cancelled
+                    outcomes = await loop.run_in_executor(executor, run_cancellable, batch_token, _blocking_generate_batch)
+            except Exception:
+                error = traceback.format_exc()
+                outcomes = {job_id: (None, error) for job_id, _ in jobs}
+
+            _record_job_outcomes([job_id for job_id, _ in jobs], outcomes)
+
+            # Record the amortized per-job cost so queue ETAs reflect batched throughput
+            dt = max(0.0, time.time() - t0) / len(jobs)
+            await _record_job_durations([(job_id, req, dt) for job_id, req in jobs])
+
+        def _record_job_outcomes(
+            job_ids: List[str],
+            outcomes: Dict[str, Tuple[Optional[Dict[str, Any]], Optional[str]]],
+        ) -> None:
+            """Store job_id -> (result, error traceback) outcomes in the job store and local cache."""
+            job_store: _JobStore = app.state.job_store
+            for job_id in job_ids:
+                result, error = outcomes.get(job_id, (None, "Job missing from batch results"))
+                # A cancelled job fails even if the batch it shared finished
+                error = _cancelled_error(job_id) or error
+                if error is None:
+                    job_store.mark_succeeded(job_id, result)
+                    _update_local_cache(job_id, result, "succeeded")
+                else:
+                    job_store.mark_failed(job_id, error)
+                    _update_local_cache(job_id, None, "failed")
+                _close_audio_stream(job_id)
+
+
+        async def _collect_batch(job_id: str, req: GenerateMusicRequest) -> List[Tuple[str, GenerateMusicRequest]]:
+            """Gather queued jobs that can share a DiT batch with (job_id, req)."""
+            batch = [(job_id, req)]
+            key = _batch_compat_key(req, BATCH_DURATION_BUCKET)
+            if key is None or BATCH_MAX_JOBS <= 1:
+                return batch
+
+            max_items = _max_batch_items(req)
+            items = _request_batch_size(req)
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + BATCH_WINDOW_MS / 1000.0
+            q: PriorityJobQueue = app.state.job_queue
+            while len(batch) < BATCH_MAX_JOBS:
+                if q.empty():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        await asyncio.wait_for(q.wait_for_item(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    continue
+
+                # Only take the job the scheduler would serve next; a misfit stays queued
+                # with its cost, priority and waiting time, so batching never reorders the queue
+                candidate = q.peek(1)[0]
+                cand_items = _request_batch_size(candidate[1])
+                if _batch_compat_key(candidate[1], BATCH_DURATION_BUCKET) != key or items + cand_items > max_items:
+                    break
+                q.take(candidate[0])
+                batch.append(candidate)
+                items += cand_items
+            return batch
 
         async def _queue_worker(worker_idx: int) -> None:
             while True:
                 job_id, req = await app.state.job_queue.get()
+                batch = [(job_id, req)]
+                try:
+                    batch = await _collect_batch(job_id, req)
+                    if len(batch) > 1:
+                        await _run_job_batch(batch)
+                    else:
+                        await _run_one_job(job_id, req)
+                finally:
+                    for batch_job_id, _ in batch:
+                        await _cleanup_job_temp_files(batch_job_id)
+                        app.state.job_queue.task_done()
+
+        async def _lm_stage_worker() -> None:
+            """Pipeline stage 1: request preprocessing and LM phase, handed off to the DiT stage."""
+            job_store: _JobStore = app.state.job_store
+            llm: LLMHandler = app.state.llm_handler
+            while True:
+                job_id, req = await app.state.job_queue.get()
+                handed_off = False
                 try:
-                    async with app.state.pending_lock:
+                    await _ensure_initialized()
+                    # Pipelined jobs are only deferred, never split (the DiT stage runs them whole)
+                    await _admit(job_id, req)
+                    _mark_running(job_id, req)
+                    h, selected_model_name = _select_dit_handler(job_id, req)
+                    # Load this job's DiT while its LM phase runs
+                    app.state.model_pool.prefetch(selected_model_name)
+
+                    def _blocking_lm() -> Tuple[Dict[str, Any], Optional[Dict[str, Any]], Optional[str], Optional[Dict[str, Any]]]:
+                        """Returns (prepared, lm_phase, result cache key, job result on a cache hit)"""
+                        prepared = _prepare_generation(req, h)
+                        llm_to_pass = llm if getattr(app.state, "_llm_initialized", False) else None
+                        cache_key, cached = lookup_cached_result(
+                            h, llm_to_pass, prepared["params"], prepared["config"], save_dir=app.state.temp_audio_dir,
+                        )
+                        if cached is not None:
+                            emit_cached_audio(cached, _audio_chunk_callback(job_id))
+                            return prepared, None, cache_key, _build_job_result(req, prepared, cached, selected_model_name)
+                        lm_phase = run_lm_phase(h, llm_to_pass, prepared["params"], prepared["config"])
+                        return prepared, lm_phase, cache_key, None
+
+                    t0 = time.time()
+                    loop = asyncio.get_running_loop()
+                    prepared, lm_phase, cache_key, cached_job_result = await loop.run_in_executor(
+                        app.state.lm_executor, run_cancellable, _cancel_token(job_id), _blocking_lm
+                    )
+                    if cached_job_result is not None:
+                        # Cache hit: nothing left for the DiT stage
+                        _record_job_outcomes([job_id], {job_id: (cached_job_result, None)})
+                        await _record_job_durations([(job_id, req, max(0.0, time.time() - t0))])
+                        continue
+                    if lm_phase.get("error_result") is not None:
+                        error_result: GenerationResult = lm_phase["error_result"]
+                        raise RuntimeError(f"Music generation failed: {error_result.error or error_result.status_message}")
+
+                    # Blocks while the DiT stage is PIPELINE_DEPTH jobs behind (backpressure)
+                    await app.state.handoff_queue.put(_StageHandoff(
+                        job_id=job_id,
+                        req=req,
+                        handler=h,
+                        model_name=selected_model_name,
+                        prepared=prepared,
+                        lm_phase=lm_phase,
+                        lm_seconds=max(0.0, time.time() - t0),
+                        batch_key=_batch_compat_key(req, BATCH_DURATION_BUCKET),
+                        cache_key=cache_key,
+                    ))
+                    handed_off = True
+                except Exception:
+                    job_store.mark_failed(job_id, _cancelled_error(job_id) or traceback.format_exc())
+                    _update_local_cache(job_id, None, "failed")
+                    app.state.running_jobs.pop(job_id, None)
+                    app.state.cancel_tokens.pop(job_id, None)
+                    _close_audio_stream(job_id)
+                    await _release_admission([job_id])
+                finally:
+                    if not handed_off:
+                        await _cleanup_job_temp_files(job_id)
+                        app.state.job_queue.task_done()
+
+        async def _dit_stage_worker() -> None:
+            """Pipeline stage 2: DiT diffusion + VAE decode for LM-processed jobs (batched when compatible)."""
+            carry: Optional[_StageHandoff] = None
+            while True:
+                first = carry if carry is not None else await app.state.handoff_queue.get()
+                carry = None
+                batch = [first]
+                items = _request_batch_size(first.req)
+                max_items = _max_batch_items(first.req)
+                # Only merge what is already waiting: never delay a job that is ready to run
+                while first.batch_key is not None and len(batch) < BATCH_MAX_JOBS:
+                    try:
+                        nxt = app.state.handoff_queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        break
+                    nxt_items = _request_batch_size(nxt.req)
+                    if nxt.batch_key != first.batch_key or items + nxt_items > max_items:
+                        carry = nxt
+                        break
+                    batch.append(nxt)
+                    items += nxt_items
+
+                h = first.handler
+
+                def _blocking_dit() -> Dict[str, Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+                    with app.state.model_pool.acquire(first.model_name):
+                        if len(batch) == 1:
+                            params = first.prepared["params"]
+                            config = first.prepared["config"]
+                            results = [run_dit_phase(
+                                h, params, config, first.lm_phase,
+                                save_dir=app.state.temp_audio_dir,
+                                audio_chunk_callback=_audio_chunk_callback(first.job_id),
+                            )]
+                        else:
+                            print(f"[API Server] Batching {len(batch)} jobs into one DiT pass: {[s.job_id for s in batch]}")
+                            results = run_dit_phase_batch(
+                                h,
+                                [(s.prepared["params"], s.prepared["config"], s.lm_phase) for s in batch],
+                                save_dir=app.state.temp_audio_dir,
+                            )
+                    outcomes: Dict[str, Tuple[Optional[Dict[str, Any]], Optional[str]]] = {}
+                    for stage, result in zip(batch, results):
+                        store_cached_result(stage.cache_key, stage.prepared["params"], result)
                         try:
-                            app.state.pending_ids.remove(job_id)
-                        except ValueError:
-                            pass
+                            outcomes[stage.job_id] = (_build_job_result(stage.req, stage.prepared, result, stage.model_name), None)
+                        except Exception:
+                            outcomes[stage.job_id] = (None, traceback.format_exc())
+                    return outcomes
 
-                    await _run_one_job(job_id, req)
+                t0 = time.time()
+                try:
+                    loop = asyncio.get_running_loop()
+                    batch_token = AllCancelledToken([_cancel_token(stage.job_id) for stage in batch])
+                    outcomes = await loop.run_in_executor(app.state.executor, run_cancellable, batch_token, _blocking_dit)
+                except Exception:
+                    error = traceback.format_exc()
+                    outcomes = {stage.job_id: (None, error) for stage in batch}
                 finally:
-                    await _cleanup_job_temp_files(job_id)
-                    app.state.job_queue.task_done()
+                    dit_seconds = max(0.0, time.time() - t0) / len(batch)
+                    for stage in batch:
+                        await _cleanup_job_temp_files(stage.job_id)
+                        app.state.job_queue.task_done()
+
+                _record_job_outcomes([stage.job_id for stage in batch], outcomes)
+                # Steady-state throughput of the pipeline is bounded by its slowest stage
+                await _record_job_durations([
+                    (stage.job_id, stage.req, max(dit_seconds, stage.lm_seconds)) for stage in batch
+                ])
+
+        async def _shared_queue_feeder() -> None:
+            """Claim jobs from the shared queue into this process's local queue (shared mode)."""
+            loop = asyncio.get_running_loop()
+            while True:
+                try:
+                    # Only claim when a local worker can start the job soon; everything
+                    # else stays in the shared queue for other processes.
+                    if app.state.job_queue.full():
+                        await asyncio.sleep(JOB_POLL_INTERVAL)
+                        continue
+                    claimed = await loop.run_in_executor(None, store.claim, JOB_LEASE_SECONDS)
+                    if claimed is None:
+                        await asyncio.sleep(JOB_POLL_INTERVAL)
+                        continue
+                    job_id, payload = claimed
+                    temp_files = payload.get("temp_files") or []
+                    if temp_files:
+                        async with app.state.job_temp_files_lock:
+                            app.state.job_temp_files[job_id] = temp_files
+                    req = GenerateMusicRequest(**payload.get("req", {}))
+                    _cancel_token(job_id)  # Watched for cancellation from now on
+                    await app.state.job_queue.put(
+                        (job_id, req),
+                        key=job_id,
+                        cost=_estimate_job_seconds(req),
+                        priority=int(payload.get("priority", SCHED_DEFAULT_PRIORITY)),
+                        enqueued_at=payload.get("enqueued_at"),
+                    )
+                except asyncio.CancelledError:
+                    break
+                except Exception as e:
+                    print(f"[API Server] Shared queue claim error: {e}")
+                    await asyncio.sleep(JOB_POLL_INTERVAL)
+
+        async def _shared_lease_worker() -> None:
+            """Keep leases of running jobs alive and requeue jobs of dead processes (shared mode)."""
+            loop = asyncio.get_running_loop()
+            while True:
+                try:
+                    await asyncio.sleep(max(1.0, JOB_LEASE_SECONDS / 3))
+                    await loop.run_in_executor(None, store.renew_leases)
+                    requeued = await loop.run_in_executor(None, store.requeue_expired)
+                    if requeued:
+                        print(f"[API Server] Requeued {len(requeued)} jobs with expired leases: {requeued}")
+                except asyncio.CancelledError:
+                    break
+                except Exception as e:
+                    print(f"[API Server] Shared queue lease error: {e}")
+
+        async def _shared_cancel_watcher() -> None:
+            """
+            Apply cancellations requested through other processes to the jobs this one holds (shared mode).
+
+            Also drops the tokens of jobs another process finished or cancelled: only the
+            process running a job pops its token when the job ends.
+            """
+            loop = asyncio.get_running_loop()
+            while True:
+                try:
+                    await asyncio.sleep(JOB_POLL_INTERVAL)
+                    for job_id, token in list(app.state.cancel_tokens.items()):
+                        if job_id not in app.state.running_jobs:
+                            rec = await loop.run_in_executor(None, store.get, job_id)
+                            if rec is None or rec.status in ("succeeded", "failed"):
+                                app.state.cancel_tokens.pop(job_id, None)
+                                continue
+                        if not token.cancelled and await loop.run_in_executor(None, store.cancel_requested, job_id):
+                            token.cancel("cancelled by request")
+                except asyncio.CancelledError:
+                    break
+                except Exception as e:
+                    print(f"[API Server] Shared cancel watcher error: {e}")
 
         async def _job_store_cleanup_worker() -> None:
             """Background task to periodically clean up old completed jobs."""
@@ -1506,8 +2636,16 @@ def create_app() -> FastAPI:
                 except Exception as e:
                     print(f"[API Server] Job cleanup error: {e}")
 
-        worker_count = max(1, WORKER_COUNT)
-        workers = [asyncio.create_task(_queue_worker(i)) for i in range(worker_count)]
+        if PIPELINE_LM_DIT:
+            # Two-stage pipeline: the next job's LM phase overlaps the current job's DiT phase
+            workers = [asyncio.create_task(_lm_stage_worker()), asyncio.create_task(_dit_stage_worker())]
+        else:
+            worker_count = max(1, WORKER_COUNT)
+            workers = [asyncio.create_task(_queue_worker(i)) for i in range(worker_count)]
+        if SHARED_JOB_STORE:
+            workers.append(asyncio.create_task(_shared_queue_feeder()))
+            workers.append(asyncio.create_task(_shared_lease_worker()))
+            workers.append(asyncio.create_task(_shared_cancel_watcher()))
         cleanup_task = asyncio.create_task(_job_store_cleanup_worker())
         app.state.worker_tasks = workers
         app.state.cleanup_task = cleanup_task
@@ -1597,63 +2735,58 @@ def create_app() -> FastAPI:
         app.state._initialized = True
         print(f"[API Server] Primary model loaded: {_get_model_name(config_path)}")
 
-        # Initialize secondary model if configured
-        if handler2 and config_path2:
-            model2_name = _get_model_name(config_path2)
-            if model2_name:
-                try:
-                    _ensure_model_downloaded(model2_name, checkpoint_dir)
-                except Exception as e:
-                    print(f"[API Server] Warning: Failed to download secondary model: {e}")
-
-            print(f"[API Server] Loading secondary DiT model: {config_path2}")
-            try:
-                status_msg2, ok2 = handler2.initialize_service(
-                    project_root=project_root,
-                    config_path=config_path2,
-                    device=device,
-                    use_flash_attention=use_flash_attention,
-                    compile_model=False,
-                    offload_to_cpu=offload_to_cpu,
-                    offload_dit_to_cpu=offload_dit_to_cpu,
-                )
-                app.state._initialized2 = ok2
-                if ok2:
-                    print(f"[API Server] Secondary model loaded: {model2_name}")
-                else:
-                    print(f"[API Server] Warning: Secondary model failed: {status_msg2}")
-            except Exception as e:
-                print(f"[API Server] Warning: Failed to initialize secondary model: {e}")
-                app.state._initialized2 = False
-
-        # Initialize third model if configured
-        if handler3 and config_path3:
-            model3_name = _get_model_name(config_path3)
-            if model3_name:
+        # Model pool: the primary model plus ACESTEP_CONFIG_PATH2/3 and ACESTEP_DIT_MODELS
+        model_pool = DiTModelPool(
+            vram_budget_gb=DIT_POOL_VRAM_GB,
+            # With the DiT offloaded after every use there is nothing resident to manage
+            manage_residency=not (offload_to_cpu and offload_dit_to_cpu),
+        )
+        model_pool.register(ModelSpec(_get_model_name(config_path), config_path), handler, default=True)
+        app.state.model_pool = model_pool
+
+        extra_specs = [
+            ModelSpec(_get_model_name(path), path)
+            for path in (os.getenv("ACESTEP_CONFIG_PATH2", "").strip(), os.getenv("ACESTEP_CONFIG_PATH3", "").strip())
+            if path
+        ] + parse_model_specs(DIT_MODELS)
+        for spec in extra_specs:
+            if spec.name in model_pool.names():
+                print(f"[API Server] Warning: Duplicate DiT model name '{spec.name}', skipping {spec.config_path}")
+                continue
+            spec_model_name = _get_model_name(spec.config_path)
+            if spec_model_name:
                 try:
-                    _ensure_model_downloaded(model3_name, checkpoint_dir)
+                    _ensure_model_downloaded(spec_model_name, checkpoint_dir)
                 except Exception as e:
-                    print(f"[API Server] Warning: Failed to download third model: {e}")
+                    print(f"[API Server] Warning: Failed to download DiT model {spec_model_name}: {e}")
 
-            print(f"[API Server] Loading third DiT model: {config_path3}")
+            print(f"[API Server] Loading DiT model {spec.name}: {spec.config_path}")
             try:
-                status_msg3, ok3 = handler3.initialize_service(
+                extra_handler = AceStepHandler()
+                # Load on CPU: the pool decides what becomes resident, VAE/text encoder come from the primary
+                status_msg_extra, ok_extra = extra_handler.initialize_service(
                     project_root=project_root,
-                    config_path=config_path3,
+                    config_path=spec.config_path,
                     device=device,
                     use_flash_attention=use_flash_attention,
                     compile_model=False,
-                    offload_to_cpu=offload_to_cpu,
-                    offload_dit_to_cpu=offload_dit_to_cpu,
+                    offload_to_cpu=True,
+                    offload_dit_to_cpu=True,
                 )
-                app.state._initialized3 = ok3
-                if ok3:
-                    print(f"[API Server] Third model loaded: {model3_name}")
-                else:
-                    print(f"[API Server] Warning: Third model failed: {status_msg3}")
+                if not ok_extra:
+                    print(f"[API Server] Warning: DiT model {spec.name} failed: {status_msg_extra}")
+                    continue
+                extra_handler.share_auxiliary_models(handler)
+                if spec.lora_path:
+                    lora_msg = extra_handler.load_lora(spec.lora_path)
+                    if not extra_handler.lora_loaded:
+                        print(f"[API Server] Warning: LoRA for {spec.name} failed: {lora_msg}")
+                        continue
+                    extra_handler.set_lora_scale(spec.lora_scale)
+                model_pool.register(spec, extra_handler)
+                print(f"[API Server] DiT model loaded: {spec.name}")
             except Exception as e:
-                print(f"[API Server] Warning: Failed to initialize third model: {e}")
-                app.state._initialized3 = False
+                print(f"[API Server] Warning: Failed to initialize DiT model {spec.name}: {e}")
 
         # Initialize LLM model based on GPU configuration
         # Auto-determine whether to initialize LM based on GPU config
@@ -1730,6 +2863,22 @@ def create_app() -> FastAPI:
             print("[API Server] Skipping LLM initialization (disabled or not supported for this GPU)")
             app.state._llm_initialized = False
 
+        if ADMISSION_ENABLED:
+            predictor = MemoryPredictor(
+                offload_to_cpu=offload_to_cpu,
+                offload_dit_to_cpu=offload_dit_to_cpu,
+                lm_offload_to_cpu=bool(getattr(app.state, "_llm_initialized", False) and llm_handler.offload_to_cpu),
+            )
+            admission = AdmissionController(
+                predictor,
+                vram_total_gb=gpu_config.gpu_memory_gb,
+                vram_fraction=ADMISSION_VRAM_FRACTION,
+                min_free_ram_gb=ADMISSION_MIN_FREE_RAM_GB,
+            )
+            app.state.admission = admission
+            _calibrate_admission(admission)
+            print(f"[API Server] Admission control: {admission.vram_budget_gb:.1f}GB VRAM budget for jobs")
+
         print("[API Server] All models initialized successfully!")
 
         try:
@@ -1739,27 +2888,90 @@ def create_app() -> FastAPI:
             for t in workers:
                 t.cancel()
             executor.shutdown(wait=False, cancel_futures=True)
+            lm_executor.shutdown(wait=False, cancel_futures=True)
 
     app = FastAPI(title="ACE-Step API", version="1.0", lifespan=lifespan)
 
     async def _queue_position(job_id: str) -> int:
-        async with app.state.pending_lock:
-            try:
-                return list(app.state.pending_ids).index(job_id) + 1
-            except ValueError:
-                return 0
+        if SHARED_JOB_STORE:
+            # Jobs this process already claimed are no longer in the shared queue
+            return store.queue_position(job_id) or app.state.job_queue.position(job_id)
+        return app.state.job_queue.position(job_id)
+
+    def _running_seconds_left() -> float:
+        """Estimated remaining seconds of the jobs currently running."""
+        now = time.time()
+        return sum(max(0.0, est - (now - started)) for started, est in list(app.state.running_jobs.values()))
+
+    def _admission_stats() -> Dict[str, Any]:
+        admission: Optional[AdmissionController] = getattr(app.state, "admission", None)
+        if admission is None:
+            return {"enabled": False}
+        reserved_vram, reserved_ram = admission.reserved()
+        return {
+            "enabled": True,
+            "vram_budget_gb": admission.vram_budget_gb,
+            "resident_vram_gb": admission.resident_vram_gb,
+            "reserved_vram_gb": reserved_vram,
+            "reserved_ram_gb": reserved_ram,
+            "memory_model": admission.predictor.coefficients(),
+        }
 
-    async def _eta_seconds_for_position(pos: int) -> Optional[float]:
-        if pos <= 0:
+    async def _eta_seconds_for_job(job_id: str) -> Optional[float]:
+        """Estimated seconds until job_id finishes, from the same cost model that orders the queue."""
+        parallel = max(1, WORKER_COUNT)
+        if SHARED_JOB_STORE:
+            pos = store.queue_position(job_id) or app.state.job_queue.position(job_id)
+            if pos <= 0:
+                return None
+            async with app.state.stats_lock:
+                avg = float(getattr(app.state, "avg_job_seconds", INITIAL_AVG_JOB_SECONDS))
+            return pos * avg
+        queued = app.state.job_queue.cost_until(job_id)
+        if queued is None:
             return None
-        async with app.state.stats_lock:
-            avg = float(getattr(app.state, "avg_job_seconds", INITIAL_AVG_JOB_SECONDS))
-        return pos * avg
+        return (_running_seconds_left() + queued) / parallel
+
+    def _job_statuses(job_ids: List[str]) -> Dict[str, Optional[str]]:
+        statuses: Dict[str, Optional[str]] = {}
+        for job_id in job_ids:
+            rec = store.get(job_id)
+            statuses[job_id] = rec.status if rec is not None else None
+        return statuses
+
+    async def _wait_for_job_change(job_ids: List[str], timeout: float) -> None:
+        """
+        Long-poll: return once any unfinished job in job_ids changes status, or after timeout seconds.
+
+        Returns at once if none of them is queued or running. Woken by the job store's
+        notifier; in shared mode (changes made by other processes) the store is also re-read
+        every JOB_POLL_INTERVAL.
+        """
+        if timeout <= 0 or not job_ids:
+            return
+        deadline = time.time() + timeout
+        waiter = store.notifier.register(job_ids)
+        try:
+            initial = _job_statuses(job_ids)
+            if not any(status in ("queued", "running") for status in initial.values()):
+                return
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return
+                step = min(remaining, JOB_POLL_INTERVAL) if SHARED_JOB_STORE else remaining
+                if await store.notifier.wait(waiter, step):
+                    return
+                if SHARED_JOB_STORE and _job_statuses(job_ids) != initial:
+                    return
+        finally:
+            store.notifier.unregister(job_ids, waiter)
 
     @app.post("/release_task")
     async def create_music_generate_job(request: Request, authorization: Optional[str] = Header(None)):
         content_type = (request.headers.get("content-type") or "").lower()
         temp_files: list[str] = []
+        auth_token: Optional[str] = None
 
         def _build_request(p: RequestParser, **kwargs) -> GenerateMusicRequest:
             """Build GenerateMusicRequest from parsed parameters."""
@@ -1794,6 +3006,7 @@ def create_app() -> FastAPI:
                 shift=p.float("shift", 3.0),
                 audio_format=p.str("audio_format", "mp3"),
                 use_tiled_decode=p.bool("use_tiled_decode", True),
+                stream=p.bool("stream"),
                 lm_model_path=p.str("lm_model_path") or None,
                 lm_backend=p.str("lm_backend", "vllm"),
                 lm_temperature=p.float("lm_temperature", LM_DEFAULT_TEMPERATURE),
@@ -1815,20 +3028,20 @@ def create_app() -> FastAPI:
             body = await request.json()
             if not isinstance(body, dict):
                 raise HTTPException(status_code=400, detail="JSON payload must be an object")
-            verify_token_from_request(body, authorization)
+            auth_token = verify_token_from_request(body, authorization)
             req = _build_request(RequestParser(body))
 
         elif content_type.endswith("+json"):
             body = await request.json()
             if not isinstance(body, dict):
                 raise HTTPException(status_code=400, detail="JSON payload must be an object")
-            verify_token_from_request(body, authorization)
+            auth_token = verify_token_from_request(body, authorization)
             req = _build_request(RequestParser(body))
 
         elif content_type.startswith("multipart/form-data"):
             form = await request.form()
             form_dict = {k: v for k, v in form.items() if not hasattr(v, 'read')}
-            verify_token_from_request(form_dict, authorization)
+            auth_token = verify_token_from_request(form_dict, authorization)
 
             # Support both naming conventions: ref_audio/reference_audio, ctx_audio/src_audio
             ref_up = form.get("ref_audio") or form.get("reference_audio")
@@ -1858,7 +3071,7 @@ def create_app() -> FastAPI:
         elif content_type.startswith("application/x-www-form-urlencoded"):
             form = await request.form()
             form_dict = dict(form)
-            verify_token_from_request(form_dict, authorization)
+            auth_token = verify_token_from_request(form_dict, authorization)
             reference_audio_path = str(form.get("ref_audio_path") or form.get("reference_audio_path") or "").strip() or None
             src_audio_path = str(form.get("ctx_audio_path") or form.get("src_audio_path") or "").strip() or None
             req = _build_request(
@@ -1875,7 +3088,7 @@ def create_app() -> FastAPI:
                 try:
                     body = json.loads(raw.decode("utf-8"))
                     if isinstance(body, dict):
-                        verify_token_from_request(body, authorization)
+                        auth_token = verify_token_from_request(body, authorization)
                         req = _build_request(RequestParser(body))
                     else:
                         raise HTTPException(status_code=400, detail="JSON payload must be an object")
@@ -1890,7 +3103,7 @@ def create_app() -> FastAPI:
             elif raw_stripped and b"=" in raw:
                 parsed = urllib.parse.parse_qs(raw.decode("utf-8"), keep_blank_values=True)
                 flat = {k: (v[0] if isinstance(v, list) and v else v) for k, v in parsed.items()}
-                verify_token_from_request(flat, authorization)
+                auth_token = verify_token_from_request(flat, authorization)
                 reference_audio_path = str(flat.get("ref_audio_path") or flat.get("reference_audio_path") or "").strip() or None
                 src_audio_path = str(flat.get("ctx_audio_path") or flat.get("src_audio_path") or "").strip() or None
                 req = _build_request(
@@ -1909,7 +3122,26 @@ def create_app() -> FastAPI:
 
         rec = store.create()
 
-        q: asyncio.Queue = app.state.job_queue
+        if SHARED_JOB_STORE:
+            req_data = req.model_dump() if hasattr(req, "model_dump") else req.dict()
+            payload = {
+                "req": req_data,
+                "temp_files": temp_files,
+                "priority": _api_key_priority(auth_token, SCHED_DEFAULT_PRIORITY),
+                "enqueued_at": rec.created_at,
+            }
+            position = store.enqueue(rec.job_id, payload, QUEUE_MAXSIZE)
+            if position is None:
+                store.delete(rec.job_id)
+                for p in temp_files:
+                    try:
+                        os.remove(p)
+                    except Exception:
+                        pass
+                raise HTTPException(status_code=429, detail="Server busy: queue is full")
+            return _wrap_response({"task_id": rec.job_id, "status": "queued", "queue_position": position})
+
+        q: PriorityJobQueue = app.state.job_queue
         if q.full():
             for p in temp_files:
                 try:
@@ -1922,12 +3154,101 @@ def create_app() -> FastAPI:
             async with app.state.job_temp_files_lock:
                 app.state.job_temp_files[rec.job_id] = temp_files
 
-        async with app.state.pending_lock:
-            app.state.pending_ids.append(rec.job_id)
-            position = len(app.state.pending_ids)
+        if req.stream:
+            app.state.audio_streams[rec.job_id] = _AudioStreamBuffer(app.state.handler.sample_rate)
+
+        q.put_nowait(
+            (rec.job_id, req),
+            key=rec.job_id,
+            cost=_estimate_job_seconds(req),
+            priority=_api_key_priority(auth_token, SCHED_DEFAULT_PRIORITY),
+        )
+        position = await _queue_position(rec.job_id)
+        eta_seconds = await _eta_seconds_for_job(rec.job_id)
+        return _wrap_response({
+            "task_id": rec.job_id,
+            "status": "queued",
+            "queue_position": position,
+            "eta_seconds": eta_seconds,
+        })
+
+    def _query_task_entry(task_id: str, local_cache: Any, current_time: float) -> Dict[str, Any]:
+        """One /query_result entry: local cache record first, job store as fallback."""
+        result_key = f"{RESULT_KEY_PREFIX}{task_id}"
 
-        await q.put((rec.job_id, req))
-        return _wrap_response({"task_id": rec.job_id, "status": "queued", "queue_position": position})
+        # Read from local cache first
+        if local_cache:
+            data = local_cache.get(result_key)
+            if data:
+                try:
+                    data_json = json.loads(data)
+                except Exception:
+                    data_json = []
+
+                if len(data_json) <= 0:
+                    return {"task_id": task_id, "result": data, "status": 2}
+                status = data_json[0].get("status")
+                create_time = data_json[0].get("create_time", 0)
+                if status == 0 and (current_time - create_time) > TASK_TIMEOUT_SECONDS:
+                    return {"task_id": task_id, "result": data, "status": 2}
+                return {
+                    "task_id": task_id,
+                    "result": data,
+                    "status": int(status) if status is not None else 1,
+                }
+
+        # Fallback to job_store query
+        rec = store.get(task_id)
+        if rec:
+            env = getattr(rec, 'env', 'development')
+            create_time = rec.created_at
+            status_int = _map_status(rec.status)
+
+            if rec.result and rec.status == "succeeded":
+                audio_paths = rec.result.get("audio_paths", [])
+                metas = rec.result.get("metas", {}) or {}
+                result_data = [
+                    {
+                        "file": p, "wave": "", "status": status_int,
+                        "create_time": int(create_time), "env": env,
+                        "prompt": metas.get("caption", ""),
+                        "lyrics": metas.get("lyrics", ""),
+                        "metas": {
+                            "bpm": metas.get("bpm"),
+                            "duration": metas.get("duration"),
+                            "genres": metas.get("genres", ""),
+                            "keyscale": metas.get("keyscale", ""),
+                            "timesignature": metas.get("timesignature", ""),
+                        }
+                    }
+                    for p in audio_paths
+                ] if audio_paths else [{
+                    "file": "", "wave": "", "status": status_int,
+                    "create_time": int(create_time), "env": env,
+                    "prompt": metas.get("caption", ""),
+                    "lyrics": metas.get("lyrics", ""),
+                    "metas": {
+                        "bpm": metas.get("bpm"),
+                        "duration": metas.get("duration"),
+                        "genres": metas.get("genres", ""),
+                        "keyscale": metas.get("keyscale", ""),
+                        "timesignature": metas.get("timesignature", ""),
+                    }
+                }]
+            else:
+                result_data = [{
+                    "file": "", "wave": "", "status": status_int,
+                    "create_time": int(create_time), "env": env,
+                    "prompt": "", "lyrics": "",
+                    "metas": {}
+                }]
+
+            return {
+                "task_id": task_id,
+                "result": json.dumps(result_data, ensure_ascii=False),
+                "status": status_int,
+            }
+        return {"task_id": task_id, "result": "[]", "status": 0}
 
     @app.post("/query_result")
     async def query_result(request: Request, authorization: Optional[str] = Header(None)):
@@ -1952,91 +3273,16 @@ def create_app() -> FastAPI:
             except Exception:
                 task_id_list = []
 
+        # Long-poll: hold the response until a listed task changes status (or wait expires)
+        try:
+            wait_seconds = min(float(body.get("wait") or 0), LONG_POLL_MAX_SECONDS)
+        except (TypeError, ValueError):
+            wait_seconds = 0.0
+        await _wait_for_job_change([str(t) for t in task_id_list], wait_seconds)
+
         local_cache = getattr(app.state, 'local_cache', None)
-        data_list = []
         current_time = time.time()
-
-        for task_id in task_id_list:
-            result_key = f"{RESULT_KEY_PREFIX}{task_id}"
-
-            # Read from local cache first
-            if local_cache:
-                data = local_cache.get(result_key)
-                if data:
-                    try:
-                        data_json = json.loads(data)
-                    except Exception:
-                        data_json = []
-
-                    if len(data_json) <= 0:
-                        data_list.append({"task_id": task_id, "result": data, "status": 2})
-                    else:
-                        status = data_json[0].get("status")
-                        create_time = data_json[0].get("create_time", 0)
-                        if status == 0 and (current_time - create_time) > TASK_TIMEOUT_SECONDS:
-                            data_list.append({"task_id": task_id, "result": data, "status": 2})
-                        else:
-                            data_list.append({
-                                "task_id": task_id,
-                                "result": data,
-                                "status": int(status) if status is not None else 1,
-                            })
-                    continue
-
-            # Fallback to job_store query
-            rec = store.get(task_id)
-            if rec:
-                env = getattr(rec, 'env', 'development')
-                create_time = rec.created_at
-                status_int = _map_status(rec.status)
-
-                if rec.result and rec.status == "succeeded":
-                    audio_paths = rec.result.get("audio_paths", [])
-                    metas = rec.result.get("metas", {}) or {}
-                    result_data = [
-                        {
-                            "file": p, "wave": "", "status": status_int,
-                            "create_time": int(create_time), "env": env,
-                            "prompt": metas.get("caption", ""),
-                            "lyrics": metas.get("lyrics", ""),
-                            "metas": {
-                                "bpm": metas.get("bpm"),
-                                "duration": metas.get("duration"),
-                                "genres": metas.get("genres", ""),
-                                "keyscale": metas.get("keyscale", ""),
-                                "timesignature": metas.get("timesignature", ""),
-                            }
-                        }
-                        for p in audio_paths
-                    ] if audio_paths else [{
-                        "file": "", "wave": "", "status": status_int,
-                        "create_time": int(create_time), "env": env,
-                        "prompt": metas.get("caption", ""),
-                        "lyrics": metas.get("lyrics", ""),
-                        "metas": {
-                            "bpm": metas.get("bpm"),
-                            "duration": metas.get("duration"),
-                            "genres": metas.get("genres", ""),
-                            "keyscale": metas.get("keyscale", ""),
-                            "timesignature": metas.get("timesignature", ""),
-                        }
-                    }]
-                else:
-                    result_data = [{
-                        "file": "", "wave": "", "status": status_int,
-                        "create_time": int(create_time), "env": env,
-                        "prompt": "", "lyrics": "",
-                        "metas": {}
-                    }]
-
-                data_list.append({
-                    "task_id": task_id,
-                    "result": json.dumps(result_data, ensure_ascii=False),
-                    "status": status_int,
-                })
-            else:
-                data_list.append({"task_id": task_id, "result": "[]", "status": 0})
-
+        data_list = [_query_task_entry(task_id, local_cache, current_time) for task_id in task_id_list]
         return _wrap_response(data_list)
 
     @app.get("/health")
@@ -2054,45 +3300,46 @@ def create_app() -> FastAPI:
         job_stats = store.get_stats()
         async with app.state.stats_lock:
             avg_job_seconds = getattr(app.state, "avg_job_seconds", INITIAL_AVG_JOB_SECONDS)
+        if SHARED_JOB_STORE:
+            queue_size = store.queue_size()
+            queue_eta_seconds = queue_size * avg_job_seconds
+        else:
+            queue_size = app.state.job_queue.qsize()
+            queue_eta_seconds = (_running_seconds_left() + app.state.job_queue.total_cost()) / max(1, WORKER_COUNT)
         return _wrap_response({
             "jobs": job_stats,
-            "queue_size": app.state.job_queue.qsize(),
+            "queue_size": queue_size,
             "queue_maxsize": QUEUE_MAXSIZE,
             "avg_job_seconds": avg_job_seconds,
+            # Estimated seconds until everything queued now has finished
+            "queue_eta_seconds": queue_eta_seconds,
+            "scheduler": {
+                "policy": SCHED_POLICY,
+                "cost_model": cost_estimator.coefficients,
+            },
+            "result_cache": get_result_cache().stats(),
+            "embedding_cache": get_embedding_cache().stats(),
+            "latent_cache": get_latent_cache().stats(),
+            "residency": get_residency_planner().stats(),
+            "lm_prefix_cache": app.state.llm_handler.prefix_cache_stats() if getattr(app.state, "llm_handler", None) else None,
+            "admission": _admission_stats(),
+            "model_pool": app.state.model_pool.stats() if getattr(app.state, "model_pool", None) else None,
         })
 
     @app.get("/v1/models")
     async def list_models(_: None = Depends(verify_api_key)):
         """List available DiT models."""
         models = []
-        
-        # Primary model (always available if initialized)
-        if getattr(app.state, "_initialized", False):
-            primary_model = _get_model_name(app.state._config_path)
-            if primary_model:
-                models.append({
-                    "name": primary_model,
-                    "is_default": True,
-                })
-        
-        # Secondary model
-        if getattr(app.state, "_initialized2", False) and app.state._config_path2:
-            secondary_model = _get_model_name(app.state._config_path2)
-            if secondary_model:
-                models.append({
-                    "name": secondary_model,
-                    "is_default": False,
-                })
-        
-        # Third model
-        if getattr(app.state, "_initialized3", False) and app.state._config_path3:
-            third_model = _get_model_name(app.state._config_path3)
-            if third_model:
+        pool: Optional[DiTModelPool] = getattr(app.state, "model_pool", None)
+        if getattr(app.state, "_initialized", False) and pool is not None:
+            for entry in pool.stats()["models"]:
                 models.append({
-                    "name": third_model,
-                    "is_default": False,
+                    "name": entry["name"],
+                    "is_default": entry["name"] == pool.default_name,
+                    "resident": entry["resident"],
+                    "lora_path": entry["lora_path"],
                 })
-        
+
         return _wrap_response({
             "models": models,
             "default_model": models[0]["name"] if models else None,
@@ -2254,6 +3501,142 @@ def create_app() -> FastAPI:
         except Exception as e:
             return _wrap_response(None, code=500, error=f"format_sample error: {str(e)}")
 
+    async def _cancel_on_disconnect(task_id: str, body):
+        """Pass a streaming body through; cancel the task if the client leaves before the body ends."""
+        finished = False
+        try:
+            async for part in body:
+                yield part
+            finished = True
+        finally:
+            if not finished:
+                app.state.request_cancel(task_id, "client disconnected")
+
+    @app.post("/v1/jobs/{task_id}/cancel")
+    async def cancel_job(task_id: str, _: None = Depends(verify_api_key)):
+        """
+        Cancel a task.
+
+        A queued task is removed from the queue and fails right away; a running one stops
+        within one LM decode step, diffusion step or VAE decode chunk. Either way it ends
+        as failed with the error "Cancelled: ...".
+        """
+        try:
+            status = await app.state.cancel_job(task_id, "cancelled by request")
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Task not found")
+        return _wrap_response({"task_id": task_id, "status": status})
+
+    @app.get("/v1/jobs/{task_id}/events")
+    async def job_events(task_id: str, cancel_on_disconnect: bool = False, _: None = Depends(verify_api_key)):
+        """
+        Server-Sent Events for one task.
+
+        Sends a `status` event whenever the status or queue position changes, then a
+        `result` event (same entry as /query_result) once the task has finished, and closes.
+        With cancel_on_disconnect=true the task is cancelled if the client goes away first.
+        """
+        from fastapi.responses import StreamingResponse
+
+        if store.get(task_id) is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+
+        async def _events():
+            last_sent: Optional[Tuple[str, int]] = None
+            last_output = time.time()
+            while True:
+                waiter = store.notifier.register([task_id])
+                try:
+                    rec = store.get(task_id)
+                    if rec is None:
+                        yield f"event: error\ndata: {json.dumps({'task_id': task_id, 'error': 'Task not found'})}\n\n"
+                        return
+                    position = await _queue_position(task_id) if rec.status == "queued" else 0
+                    if (rec.status, position) != last_sent:
+                        last_sent = (rec.status, position)
+                        payload = {
+                            "task_id": task_id,
+                            "status": rec.status,
+                            "queue_position": position,
+                            "eta_seconds": await _eta_seconds_for_job(task_id) if rec.status == "queued" else None,
+                        }
+                        yield f"event: status\ndata: {json.dumps(payload)}\n\n"
+                        last_output = time.time()
+                    if rec.status in ("succeeded", "failed"):
+                        entry = _query_task_entry(task_id, getattr(app.state, "local_cache", None), time.time())
+                        yield f"event: result\ndata: {json.dumps(entry, ensure_ascii=False)}\n\n"
+                        return
+                    timeout = JOB_POLL_INTERVAL if SHARED_JOB_STORE else SSE_KEEPALIVE_SECONDS
+                    if not await store.notifier.wait(waiter, timeout) and time.time() - last_output >= SSE_KEEPALIVE_SECONDS:
+                        # Comment line keeps proxies from closing an idle connection
+                        yield ": keep-alive\n\n"
+                        last_output = time.time()
+                finally:
+                    store.notifier.unregister([task_id], waiter)
+
+        body = _cancel_on_disconnect(task_id, _events()) if cancel_on_disconnect else _events()
+        return StreamingResponse(body, media_type="text/event-stream")
+
+    @app.get("/v1/jobs/{task_id}/stream")
+    async def stream_job_audio(
+        task_id: str,
+        format: str = "wav",
+        index: int = 0,
+        sse: bool = False,
+        cancel_on_disconnect: bool = True,
+        _: None = Depends(verify_api_key),
+    ):
+        """
+        Stream the decoded audio of a stream=true job as it is produced.
+
+        Raw mode returns a chunked response of the encoded audio (wav/flac/ogg) for batch item
+        `index`; sse=true wraps the same bytes base64-encoded in Server-Sent Events and ends
+        with a `done` event carrying the job status. Unless cancel_on_disconnect=false, the
+        job is cancelled when the client disconnects before the stream ends.
+        """
+        import base64
+        from fastapi.responses import StreamingResponse
+
+        buf: Optional[_AudioStreamBuffer] = app.state.audio_streams.get(task_id)
+        if buf is None:
+            raise HTTPException(status_code=404, detail="No audio stream for this task (submit it with stream=true)")
+        fmt = format.lower()
+        if fmt not in StreamingAudioEncoder.MEDIA_TYPES:
+            raise HTTPException(status_code=400, detail=f"Unsupported stream format: {format}")
+
+        async def _encoded_chunks():
+            encoder: Optional[StreamingAudioEncoder] = None
+            async for chunk in buf.iter_chunks():
+                if index < 0 or index >= chunk.shape[0]:
+                    break
+                if encoder is None:
+                    encoder = StreamingAudioEncoder(buf.sample_rate, chunk.shape[1], fmt)
+                data = encoder.encode(chunk[index])
+                if data:
+                    yield data
+            if encoder is not None:
+                data = encoder.close()
+                if data:
+                    yield data
+
+        def _body(gen):
+            return _cancel_on_disconnect(task_id, gen) if cancel_on_disconnect else gen
+
+        if not sse:
+            return StreamingResponse(_body(_encoded_chunks()), media_type=StreamingAudioEncoder.MEDIA_TYPES[fmt])
+
+        async def _sse_events():
+            seq = 0
+            async for data in _encoded_chunks():
+                payload = {"seq": seq, "format": fmt, "data": base64.b64encode(data).decode("ascii")}
+                yield f"event: audio\ndata: {json.dumps(payload)}\n\n"
+                seq += 1
+            rec = store.get(task_id)
+            status = rec.status if rec is not None else "unknown"
+            yield f"event: done\ndata: {json.dumps({'status': status, 'chunks': seq})}\n\n"
+
+        return StreamingResponse(_body(_sse_events()), media_type="text/event-stream")
+
     @app.get("/v1/audio")
     async def get_audio(path: str, _: None = Depends(verify_api_key)):
         """Serve audio file by path."""
@@ -2295,6 +3678,12 @@ def main() -> None:
         default=int(os.getenv("ACESTEP_API_PORT", "8001")),
         help="Bind port (default from ACESTEP_API_PORT or 8001)",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("ACESTEP_UVICORN_WORKERS", "1")),
+        help="Number of uvicorn worker processes; >1 requires ACESTEP_JOB_STORE=shared",
+    )
     parser.add_argument(
         "--api-key",
         type=str,
@@ -2308,12 +3697,17 @@ def main() -> None:
         os.environ["ACESTEP_API_KEY"] = args.api_key
 
     # IMPORTANT: in-memory queue/store -> workers MUST be 1
+    workers = max(1, int(args.workers))
+    if workers > 1 and os.getenv("ACESTEP_JOB_STORE", "memory").strip().lower() != "shared":
+        print("[API Server] --workers > 1 requires ACESTEP_JOB_STORE=shared; falling back to 1 worker")
+        workers = 1
+
     uvicorn.run(
         "acestep.api_server:app",
         host=str(args.host),
         port=int(args.port),
         reload=False,
-        workers=1,
+        workers=workers,
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,135 @@
+"""Typed 5Hz audio code sequences
+
+The 5Hz LM emits audio codes as <|audio_code_N|> tokens. They used to travel
+as a string of those tokens, from the LM output through GenerationParams and
+API payloads to the DiT, which regex-parsed it back into ints (3000 codes per
+item for a 10-minute track). AudioCodes keeps them as a uint16 array (the
+codebook has 64000 entries). The token string is only rendered, once, where
+text is needed: prompts, UI text boxes and JSON results.
+
+Wire format: "b64:" followed by the base64 of the little-endian uint16
+values. Fields that accept a code string also accept this form.
+"""
+
+import base64
+import re
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from loguru import logger
+
+MAX_AUDIO_CODE = 63999  # Maximum valid audio code value (codebook size = 64000)
+
+WIRE_PREFIX = "b64:"
+
+_CODE_TOKEN_RE = re.compile(r"<\|audio_code_(\d+)\|>")
+
+
+class AudioCodes:
+    """An immutable sequence of 5Hz audio code indices."""
+
+    __slots__ = ("values", "_text")
+
+    def __init__(self, values: Iterable[int]) -> None:
+        raw = np.asarray(list(values) if not isinstance(values, np.ndarray) else values, dtype=np.int64).reshape(-1)
+        clamped = np.clip(raw, 0, MAX_AUDIO_CODE)
+        clamped_count = int((clamped != raw).sum())
+        if clamped_count:
+            logger.warning(f"[AudioCodes] Clamped {clamped_count} audio code value(s) to valid range [0, {MAX_AUDIO_CODE}]")
+        self.values = clamped.astype("<u2")
+        self.values.setflags(write=False)
+        self._text: Optional[str] = None
+
+    @classmethod
+    def from_token_string(cls, text: str) -> "AudioCodes":
+        """Parse <|audio_code_N|> tokens; anything else in text is ignored."""
+        return cls(np.fromiter((int(x) for x in _CODE_TOKEN_RE.findall(text or "")), dtype=np.int64))
+
+    @classmethod
+    def from_base64(cls, text: str) -> "AudioCodes":
+        if text.startswith(WIRE_PREFIX):
+            text = text[len(WIRE_PREFIX):]
+        return cls(np.frombuffer(base64.b64decode(text), dtype="<u2"))
+
+    @classmethod
+    def from_token_ids(cls, token_ids: Iterable[int], code_of_token: np.ndarray) -> "AudioCodes":
+        """
+        Codes of the audio code tokens among generated token_ids.
+
+        code_of_token maps token id -> code value, -1 for other tokens (see
+        code_token_lookup); no text is decoded.
+        """
+        ids = np.asarray(list(token_ids), dtype=np.int64)
+        ids = ids[(ids >= 0) & (ids < len(code_of_token))]
+        codes = code_of_token[ids]
+        return cls(codes[codes >= 0])
+
+    @classmethod
+    def parse(cls, value: Any) -> Optional["AudioCodes"]:
+        """
+        AudioCodes from a token string, a "b64:" wire string, a sequence of ints
+        or an AudioCodes; None when value holds no codes.
+        """
+        if value is None or isinstance(value, AudioCodes):
+            return value if value else None
+        if isinstance(value, str):
+            value = value.strip()
+            if not value:
+                return None
+            codes = cls.from_base64(value) if value.startswith(WIRE_PREFIX) else cls.from_token_string(value)
+        elif hasattr(value, "detach"):  # torch tensor
+            codes = cls(value.detach().cpu().numpy())
+        else:
+            codes = cls(value)
+        return codes if codes else None
+
+    def to_token_string(self) -> str:
+        if self._text is None:
+            self._text = "".join(f"<|audio_code_{v}|>" for v in self.values.tolist())
+        return self._text
+
+    def to_base64(self) -> str:
+        return WIRE_PREFIX + base64.b64encode(self.values.tobytes()).decode("ascii")
+
+    def tolist(self):
+        return self.values.tolist()
+
+    def key(self) -> bytes:
+        """Hashable identity of the sequence."""
+        return self.values.tobytes()
+
+    def __len__(self) -> int:
+        return int(self.values.shape[0])
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, AudioCodes) and self.key() == other.key()
+
+    def __hash__(self) -> int:
+        return hash(self.key())
+
+    def __str__(self) -> str:
+        return self.to_token_string()
+
+    def __repr__(self) -> str:
+        return f"AudioCodes(len={len(self)})"
+
+
+def code_token_lookup(tokenizer: Any) -> np.ndarray:
+    """Array mapping token id -> audio code value (-1 for other tokens) of tokenizer's vocabulary."""
+    vocab = tokenizer.get_vocab()
+    lookup = np.full(max(len(tokenizer), max(vocab.values(), default=0) + 1), -1, dtype=np.int64)
+    for token, token_id in vocab.items():
+        match = _CODE_TOKEN_RE.fullmatch(token)
+        if match:
+            lookup[token_id] = int(match.group(1))
+    return lookup
+
+
+def audio_codes_text(value: Any) -> str:
+    """The token string of value (AudioCodes, code string or None) for text outputs."""
+    if value is None:
+        return ""
+    return value.to_token_string() if isinstance(value, AudioCodes) else str(value)
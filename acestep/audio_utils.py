@@ -7,9 +7,11 @@ Independent audio file operations outside of handler, supporting:
 - Batch processing
 """
 
+import io
 import os
 import hashlib
 import json
+import struct
 from pathlib import Path
 from typing import Union, Optional, List, Tuple
 import torch
@@ -222,6 +224,86 @@ class AudioSaver:
         return saved_paths
 
 
+class StreamingAudioEncoder:
+    """
+    Incremental audio encoder for streaming responses.
+
+    Each call to encode() takes the next chunk of audio and returns the bytes
+    that can be sent to the client right away, so playback can start before
+    the whole track is decoded.
+
+    Formats:
+        - wav: 16-bit PCM with a streaming header (unknown length, 0xFFFFFFFF sizes)
+        - flac: FLAC frames (STREAMINFO total length left unknown)
+        - ogg: Ogg Vorbis pages
+    """
+
+    MEDIA_TYPES = {"wav": "audio/wav", "flac": "audio/flac", "ogg": "audio/ogg"}
+
+    def __init__(self, sample_rate: int = 48000, channels: int = 2, format: str = "wav"):
+        self.format = format.lower()
+        if self.format not in self.MEDIA_TYPES:
+            raise ValueError(f"Unsupported streaming format {format}, expected one of {list(self.MEDIA_TYPES)}")
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.media_type = self.MEDIA_TYPES[self.format]
+        self._header_sent = False
+        self._buffer = None
+        self._sound_file = None
+        self._sent = 0
+        if self.format != "wav":
+            import soundfile as sf
+            self._buffer = io.BytesIO()
+            self._sound_file = sf.SoundFile(
+                self._buffer,
+                mode="w",
+                samplerate=sample_rate,
+                channels=channels,
+                format=self.format.upper(),
+                subtype="PCM_16" if self.format == "flac" else "VORBIS",
+            )
+
+    def _wav_header(self) -> bytes:
+        block_align = self.channels * 2
+        unknown = 0xFFFFFFFF
+        return (
+            b"RIFF" + struct.pack("<I", unknown) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, self.channels, self.sample_rate,
+                                    self.sample_rate * block_align, block_align, 16)
+            + b"data" + struct.pack("<I", unknown)
+        )
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue()[self._sent:]
+        self._sent += len(data)
+        return data
+
+    def encode(self, audio: Union[torch.Tensor, np.ndarray]) -> bytes:
+        """Encode a [channels, samples] float chunk in [-1, 1], return the new bytes."""
+        if isinstance(audio, torch.Tensor):
+            audio = audio.detach().cpu().float().numpy()
+        frames = np.clip(np.asarray(audio, dtype=np.float32).T, -1.0, 1.0)  # -> [samples, channels]
+        if self.format == "wav":
+            out = b""
+            if not self._header_sent:
+                out += self._wav_header()
+                self._header_sent = True
+            return out + (frames * 32767.0).astype("<i2").tobytes()
+        self._sound_file.write(frames)
+        return self._drain()
+
+    def close(self) -> bytes:
+        """Flush the encoder, return any remaining bytes."""
+        if self.format == "wav":
+            if not self._header_sent:
+                self._header_sent = True
+                return self._wav_header()
+            return b""
+        if self._sound_file is not None:
+            self._sound_file.close()
+            self._sound_file = None
+        return self._drain()
+
 def get_audio_file_hash(audio_file) -> str:
     """
     Get hash identifier for an audio file.
@@ -0,0 +1,101 @@
+"""Cooperative cancellation of running generations
+
+A CancellationToken is made current for the thread running a generation with
+cancellation_scope(); the LM decode loops, the diffusion steps and the VAE
+decode chunks call check_cancelled() between steps, which raises
+GenerationCancelled once the token is cancelled. The work stops within one
+step and the exception unwinds through the usual cleanup (model offload,
+nano-vllm block release).
+
+The current token lives in a thread-local, so code that never enters a scope
+(Gradio UI, CLI) pays only an attribute lookup per step.
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional
+
+
+class GenerationCancelled(RuntimeError):
+    """Raised inside a generation whose CancellationToken was cancelled."""
+
+
+class CancellationToken:
+    """Thread-safe flag set by cancel(); reason says who cancelled and why."""
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise GenerationCancelled(self.reason or "cancelled")
+
+
+class AllCancelledToken(CancellationToken):
+    """
+    Cancelled once every token in tokens is cancelled.
+
+    Used for work shared by several jobs (a merged batch): it only stops when
+    nobody is waiting for it any more.
+    """
+
+    def __init__(self, tokens: List[CancellationToken]) -> None:
+        super().__init__()
+        self._tokens = list(tokens)
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self._tokens and all(t.cancelled for t in self._tokens):
+            self.cancel(self._tokens[0].reason or "cancelled")
+            return True
+        return False
+
+
+_local = threading.local()
+
+
+@contextmanager
+def cancellation_scope(token: Optional[CancellationToken]) -> Iterator[Optional[CancellationToken]]:
+    """Make token the current one for this thread while the block runs."""
+    previous = getattr(_local, "token", None)
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+
+def current_token() -> Optional[CancellationToken]:
+    return getattr(_local, "token", None)
+
+
+def check_cancelled() -> None:
+    """Raise GenerationCancelled if the current thread's token is cancelled."""
+    token = getattr(_local, "token", None)
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def run_cancellable(token: Optional[CancellationToken], fn: Callable[..., Any], *args: Any) -> Any:
+    """
+    Run fn(*args) with token as the current token (for executor threads).
+
+    Raises GenerationCancelled without calling fn if the token is already
+    cancelled, e.g. a job cancelled while it waited in the queue.
+    """
+    with cancellation_scope(token):
+        if token is not None:
+            token.raise_if_cancelled()
+        return fn(*args)
@@ -137,3 +137,23 @@ LM_MODEL_NAMES = {
     "1.7B": "acestep-5Hz-lm-1.7B",
     "4B": "acestep-5Hz-lm-4B",
 }
+
+# ==============================================================================
+# VAE Constants
+# ==============================================================================
+
+# Batched VAE encode (_prepare_batch): waveforms share a padded batch only if the
+# shortest one is padded by at most this fraction of its length
+VAE_ENCODE_BUCKET_PAD_RATIO = 0.1
+
+# Batched tiled VAE decode: estimated decoder activation memory per output audio
+# sample of one batch item (bytes), used to size how many windows share a call
+VAE_DECODE_BYTES_PER_SAMPLE = 1024
+
+# DiT shape bucketing with compile_model (_prepare_batch): latent lengths are padded
+# up to a multiple of this many frames (25 Hz, so 10 s) so the compiled decoder
+# only ever sees a few shapes; 0 keeps the exact lengths
+DIT_LATENT_BUCKET_FRAMES = 250
+
+# Compiled DiT decoder variants (one per batch size and length bucket) kept at once
+DIT_COMPILED_BUCKETS = 4
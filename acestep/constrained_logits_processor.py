@@ -1,6 +1,6 @@
 
 from enum import Enum, auto
-from typing import Optional, Dict, Any, Tuple, List, Callable, Set
+from typing import Optional, Dict, Any, Tuple, List, Callable, Set, Hashable, Sequence, Union
 from loguru import logger
 from transformers import AutoTokenizer
 from transformers.generation.logits_process import LogitsProcessor
@@ -57,6 +57,17 @@ class FSMState(Enum):
     COMPLETED = auto()           # Generation completed
 
 
+def _sequence_field(name: str) -> property:
+    """Attribute stored per sequence: reads/writes the slot of the sequence being processed."""
+    def fget(self):
+        return self._sequence_states[name][self._current_slot]
+
+    def fset(self, value):
+        self._sequence_states[name][self._current_slot] = value
+
+    return property(fget, fset)
+
+
 class MetadataConstrainedLogitsProcessor(LogitsProcessor):
     """
     FSM-driven LogitsProcessor that constrains generation to produce valid metadata.
@@ -76,7 +87,42 @@ class MetadataConstrainedLogitsProcessor(LogitsProcessor):
     For field transitions (e.g., end of numeric value), it compares P(newline) vs P(digit).
     For caption field, it blocks code blocks and newlines, and only transitions when
     the previous token was a period and newline has the highest probability.
+
+    The FSM state is kept per sequence, structure-of-arrays (one list per field,
+    indexed by slot), so a single processor serves a whole batch. Rows are keyed
+    by the seq_ids passed to __call__/update_state (their row index by default).
+    Rows generating audio codes are masked together in one tensor operation;
+    only rows still inside the metadata fields go through the per-row FSM.
     """
+
+    # Per-sequence FSM fields and their initial values (lists are copied per sequence)
+    _SEQUENCE_FIELD_DEFAULTS = {
+        "state": FSMState.THINK_TAG,
+        "position_in_state": 0,  # Position within current state's fixed string
+        "accumulated_value": "",  # For numeric/text value accumulation (legacy, for compatibility)
+        "accumulated_token_ids": [],  # Token ID sequence for keyscale (and other fields)
+        "codes_count": 0,  # Counter for generated codes
+        "target_codes": None,  # Codes count at which EOS is forced (None: no constraint)
+        "caption_after_newline": False,  # Track if we're right after a newline in caption
+        "caption_token_count": 0,  # Track token count for caption (max 512)
+        "caption_ending": False,  # Track if caption is ending (after detecting non-indented line)
+        "pending_field_name": "",  # Accumulate field name tokens when caption is ending
+        "user_field_token_queue": [],  # Token queue for user-provided fields (injected directly)
+        "current_user_field": None,  # Current field being injected
+    }
+
+    state = _sequence_field("state")
+    position_in_state = _sequence_field("position_in_state")
+    accumulated_value = _sequence_field("accumulated_value")
+    accumulated_token_ids = _sequence_field("accumulated_token_ids")
+    codes_count = _sequence_field("codes_count")
+    target_codes = _sequence_field("target_codes")
+    caption_after_newline = _sequence_field("caption_after_newline")
+    caption_token_count = _sequence_field("caption_token_count")
+    caption_ending = _sequence_field("caption_ending")
+    pending_field_name = _sequence_field("pending_field_name")
+    user_field_token_queue = _sequence_field("user_field_token_queue")
+    current_user_field = _sequence_field("current_user_field")
     
     def __init__(
         self,
@@ -100,6 +146,10 @@ class MetadataConstrainedLogitsProcessor(LogitsProcessor):
             skip_genres: Whether to skip genres field generation
             max_duration: Maximum duration in seconds (default: DURATION_MAX from constants)
         """
+        # Per-sequence FSM state (see _SEQUENCE_FIELD_DEFAULTS)
+        self._default_target_codes: Optional[int] = None
+        self._reset_sequences()
+        
         self.tokenizer = tokenizer
         self.enabled = enabled
         self.debug = debug
@@ -133,8 +183,6 @@ class MetadataConstrainedLogitsProcessor(LogitsProcessor):
         # Duration constraint for codes generation
         # 5 codes = 1 second, so target_codes = target_duration * 5
         self.target_duration: Optional[float] = None  # User-specified duration in seconds
-        self.target_codes: Optional[int] = None  # Computed target codes count
-        self.codes_count: int = 0  # Counter for generated codes
         
         # Stop at reasoning flag - if True, stop generation after </think> tag
         self.stop_at_reasoning: bool = False
@@ -143,22 +191,6 @@ class MetadataConstrainedLogitsProcessor(LogitsProcessor):
         # Used to determine FSM behavior when prompt already contains CoT
         self.generation_phase: str = "cot"
         
-        # Current state
-        self.state = FSMState.THINK_TAG
-        self.position_in_state = 0  # Position within current state's fixed string
-        self.accumulated_value = ""  # For numeric/text value accumulation (legacy, for compatibility)
-        self.accumulated_token_ids: List[int] = []  # Token ID sequence for keyscale (and other fields)
-        
-        # Caption generation state tracking
-        self.caption_after_newline = False  # Track if we're right after a newline in caption
-        self.caption_token_count = 0  # Track token count for caption (max 512)
-        self.caption_ending = False  # Track if caption is ending (after detecting non-indented line)
-        self.pending_field_name = ""  # Accumulate field name tokens when caption is ending
-        
-        # Token queue for user-provided fields (injected directly without generation)
-        self.user_field_token_queue: List[int] = []
-        self.current_user_field: Optional[str] = None  # Current field being injected
-        
         # Pre-compute token IDs for efficiency
         self._precompute_tokens()
 
@@ -1248,35 +1280,55 @@ class MetadataConstrainedLogitsProcessor(LogitsProcessor):
         return list(allowed)
     
     def reset(self):
-        """Reset the processor state for a new generation."""
-        self.state = FSMState.THINK_TAG
-        self.position_in_state = 0
-        self.accumulated_value = ""  # Legacy, kept for compatibility
-        self.accumulated_token_ids = []  # Reset token ID sequence
-        self.codes_count = 0  # Reset codes counter
-        self.user_field_token_queue = []  # Reset user field token queue
-        self.current_user_field = None  # Reset current user field
-        self.caption_after_newline = False  # Reset caption newline tracking
-        self.caption_token_count = 0  # Reset caption token count
-        self.caption_ending = False  # Reset caption ending tracking
-        self.pending_field_name = ""  # Reset pending field name
-    
-    def set_target_duration(self, duration: Optional[float]):
+        """Reset the processor state for a new generation (drops all sequence states)."""
+        self._reset_sequences()
+
+    def _reset_sequences(self):
+        """Drop all per-sequence states; the default sequence (row 0) starts fresh."""
+        self._sequence_states: Dict[str, List[Any]] = {name: [] for name in self._SEQUENCE_FIELD_DEFAULTS}
+        self._slots: Dict[Hashable, int] = {}
+        self._current_slot = self._slot_of(0)
+
+    def _slot_of(self, seq_id: Hashable) -> int:
+        """Slot of seq_id in the per-sequence state arrays, created with initial values on first use."""
+        slot = self._slots.get(seq_id)
+        if slot is None:
+            slot = len(self._slots)
+            self._slots[seq_id] = slot
+            for name, default in self._SEQUENCE_FIELD_DEFAULTS.items():
+                value = list(default) if isinstance(default, list) else default
+                if name == "target_codes":
+                    value = self._default_target_codes
+                self._sequence_states[name].append(value)
+        return slot
+
+    def _slots_for(self, seq_ids: Optional[Sequence[Hashable]], batch_size: int) -> List[int]:
+        """Slots of the rows of a batch (rows are keyed by their index when seq_ids is None)."""
+        if seq_ids is None:
+            seq_ids = range(batch_size)
+        return [self._slot_of(seq_id) for seq_id in seq_ids]
+
+    def set_target_duration(self, duration: Optional[float], seq_id: Optional[Hashable] = None):
         """
         Set the target duration for codes generation.
         
         Args:
             duration: Target duration in seconds. If None, no duration constraint is applied.
                      5 codes = 1 second, so target_codes = duration * 5.
+            seq_id: Only set the target codes of this sequence. By default the
+                    duration applies to every sequence.
         """
-        self.target_duration = duration
-        if duration is not None and duration > 0:
-            self.target_codes = int(duration * 5)
-            if self.debug:
-                logger.debug(f"Set target duration: {duration}s -> {self.target_codes} codes")
+        target_codes = int(duration * 5) if duration is not None and duration > 0 else None
+        if seq_id is not None:
+            self._sequence_states["target_codes"][self._slot_of(seq_id)] = target_codes
         else:
-            self.target_codes = None
-            if self.debug:
+            self.target_duration = duration
+            self._default_target_codes = target_codes
+            self._sequence_states["target_codes"] = [target_codes] * len(self._slots)
+        if self.debug:
+            if target_codes is not None:
+                logger.debug(f"Set target duration: {duration}s -> {target_codes} codes")
+            else:
                 logger.debug("Target duration cleared, no duration constraint")
     
     def set_max_duration(self, max_duration: int):
@@ -1546,105 +1598,138 @@ class MetadataConstrainedLogitsProcessor(LogitsProcessor):
     
     def __call__(
         self,
-        input_ids: torch.LongTensor,
+        input_ids: Union[torch.LongTensor, Sequence[Sequence[int]]],
         scores: torch.FloatTensor,
+        seq_ids: Optional[Sequence[Hashable]] = None,
     ) -> torch.FloatTensor:
         """
         Apply constrained decoding by modifying logits.
         
         Args:
-            input_ids: [batch_size, seq_len] input token IDs
+            input_ids: [batch_size, seq_len] input token IDs (or one token ID list per row)
             scores: [batch_size, vocab_size] logits for next token
+            seq_ids: Sequence ID of each row, selecting its FSM state (default: row index)
             
         Returns:
             Modified scores with invalid tokens masked to -inf and temperature scaling applied
         """
+        slots = self._slots_for(seq_ids, scores.shape[0])
         if not self.enabled:
-            return self._apply_temperature_scaling(scores)
+            return self._apply_temperature_scaling(scores, slots)
         
-        if self.state == FSMState.COMPLETED:
-            # In understanding phase, block audio codes during lyrics generation (COMPLETED state)
-            if self.generation_phase == "understand" and self.audio_code_mask is not None:
-                # Move mask to same device/dtype as scores if needed
-                if self.audio_code_mask.device != scores.device or self.audio_code_mask.dtype != scores.dtype:
-                    self.audio_code_mask = self.audio_code_mask.to(device=scores.device, dtype=scores.dtype)
-                scores = scores + self.audio_code_mask
-            return self._apply_temperature_scaling(scores)
+        states = self._sequence_states["state"]
         
         # For codes phase, detect if input already contains </think> and skip to CODES_GENERATION
-        if self.generation_phase == "codes" and self.state == FSMState.THINK_TAG:
-            # Check if input contains </think> token sequence
-            if self._input_contains_think_end_tag(input_ids):
-                # Skip metadata generation, go directly to codes generation
-                self.state = FSMState.CODES_GENERATION
-                self.codes_count = 0
-                if self.debug:
-                    logger.debug("Codes phase: detected </think> in input, skipping to CODES_GENERATION")
-        
-        if self.state == FSMState.CODES_GENERATION:
-            # Block all non-audio-code tokens (only allow audio codes and EOS)
-            # Note: audio_code_token_ids already contains only valid tokens (0-63999 range)
-            # because _precompute_audio_code_tokens() filters out invalid tokens during initialization
-            if self.non_audio_code_mask is not None:
-                # Move mask to same device/dtype as scores if needed
-                if self.non_audio_code_mask.device != scores.device or self.non_audio_code_mask.dtype != scores.dtype:
-                    self.non_audio_code_mask = self.non_audio_code_mask.to(device=scores.device, dtype=scores.dtype)
-                scores = scores + self.non_audio_code_mask
-            
-            # Apply duration constraint in codes generation phase
-            if self.target_codes is not None and self.eos_token_id is not None:
-                if self.codes_count < self.target_codes:
-                    # Block EOS token until target codes count is reached
-                    scores[:, self.eos_token_id] = float('-inf')
+        if self.generation_phase == "codes":
+            for b, slot in enumerate(slots):
+                if states[slot] == FSMState.THINK_TAG and self._input_contains_think_end_tag(input_ids[b]):
+                    # Skip metadata generation, go directly to codes generation
+                    states[slot] = FSMState.CODES_GENERATION
+                    self._sequence_states["codes_count"][slot] = 0
                     if self.debug:
-                        logger.debug(f"Codes generation: {self.codes_count}/{self.target_codes}, blocking EOS")
-                else:
-                    # Force EOS token when target codes count is reached - inplace
-                    eos_scores = scores[:, self.eos_token_id].clone()
-                    scores.fill_(float('-inf'))
-                    scores[:, self.eos_token_id] = eos_scores
-                    if self.debug:
-                        logger.debug(f"Codes generation: {self.codes_count}/{self.target_codes}, forcing EOS")
-            return self._apply_temperature_scaling(scores)
-        
-        batch_size = scores.shape[0]
-        
-        # Process each sequence in batch
-        for b in range(batch_size):
+                        logger.debug("Codes phase: detected </think> in input, skipping to CODES_GENERATION")
+        
+        codes_rows = [b for b, slot in enumerate(slots) if states[slot] == FSMState.CODES_GENERATION]
+        if codes_rows:
+            scores = self._apply_codes_constraints(scores, codes_rows, [slots[b] for b in codes_rows])
+        
+        # In understanding phase, block audio codes during lyrics generation (COMPLETED state)
+        completed_rows = [b for b, slot in enumerate(slots) if states[slot] == FSMState.COMPLETED]
+        if completed_rows and self.generation_phase == "understand" and self.audio_code_mask is not None:
+            # Move mask to same device/dtype as scores if needed
+            if self.audio_code_mask.device != scores.device or self.audio_code_mask.dtype != scores.dtype:
+                self.audio_code_mask = self.audio_code_mask.to(device=scores.device, dtype=scores.dtype)
+            scores = self._add_row_mask(scores, completed_rows, self.audio_code_mask)
+        
+        # Metadata fields: token-level FSM, one row at a time
+        for b, slot in enumerate(slots):
+            if states[slot] == FSMState.CODES_GENERATION or states[slot] == FSMState.COMPLETED:
+                continue
+            self._current_slot = slot
             result = self._process_single_sequence(input_ids[b], scores[b:b+1])
             scores[b] = result[0]  # result is [1, vocab_size], need [vocab_size]
         
         # Apply temperature scaling after constraint masking
-        return self._apply_temperature_scaling(scores)
+        return self._apply_temperature_scaling(scores, slots)
+    
+    @staticmethod
+    def _add_row_mask(scores: torch.FloatTensor, rows: List[int], mask: torch.Tensor) -> torch.FloatTensor:
+        """Add mask ([vocab_size] or [1, vocab_size]) to the given rows of scores."""
+        if len(rows) == scores.shape[0]:
+            return scores + mask
+        index = torch.tensor(rows, device=scores.device)
+        scores[index] = scores[index] + mask
+        return scores
     
-    def _input_contains_think_end_tag(self, input_ids: torch.LongTensor) -> bool:
+    def _apply_codes_constraints(
+        self,
+        scores: torch.FloatTensor,
+        rows: List[int],
+        slots: List[int],
+    ) -> torch.FloatTensor:
+        """Mask the rows generating audio codes: only audio codes and EOS, EOS held until target_codes."""
+        # Block all non-audio-code tokens (only allow audio codes and EOS)
+        # Note: audio_code_token_ids already contains only valid tokens (0-63999 range)
+        # because _precompute_audio_code_tokens() filters out invalid tokens during initialization
+        if self.non_audio_code_mask is not None:
+            # Move mask to same device/dtype as scores if needed
+            if self.non_audio_code_mask.device != scores.device or self.non_audio_code_mask.dtype != scores.dtype:
+                self.non_audio_code_mask = self.non_audio_code_mask.to(device=scores.device, dtype=scores.dtype)
+            scores = self._add_row_mask(scores, rows, self.non_audio_code_mask)
+        
+        # Apply duration constraint in codes generation phase
+        if self.eos_token_id is None:
+            return scores
+        target_codes = self._sequence_states["target_codes"]
+        codes_count = self._sequence_states["codes_count"]
+        block_rows, force_rows = [], []
+        for b, slot in zip(rows, slots):
+            if target_codes[slot] is None:
+                continue
+            if codes_count[slot] < target_codes[slot]:
+                block_rows.append(b)
+            else:
+                force_rows.append(b)
+            if self.debug:
+                action = "blocking" if codes_count[slot] < target_codes[slot] else "forcing"
+                logger.debug(f"Codes generation: {codes_count[slot]}/{target_codes[slot]}, {action} EOS")
+        if block_rows:
+            # Block EOS token until target codes count is reached
+            scores[torch.tensor(block_rows, device=scores.device), self.eos_token_id] = float('-inf')
+        if force_rows:
+            # Force EOS token when target codes count is reached - inplace
+            index = torch.tensor(force_rows, device=scores.device)
+            eos_scores = scores[index, self.eos_token_id].clone()
+            scores[index] = float('-inf')
+            scores[index, self.eos_token_id] = eos_scores
+        return scores
+    
+    def _input_contains_think_end_tag(self, input_ids: Union[torch.LongTensor, Sequence[int]]) -> bool:
         """
         Check if input contains the </think> closing tag.
         
         Args:
-            input_ids: [batch_size, seq_len] input token IDs
+            input_ids: [seq_len] input token IDs of one sequence
             
         Returns:
-            True if </think> is found in the input (any sequence in batch)
+            True if </think> is found in the input
         """
         # Tokenize </think> to get its token sequence
         think_end_tokens = self.tokenizer.encode("</think>", add_special_tokens=False)
         if not think_end_tokens:
             return False
         
-        # Check each sequence in batch
-        for b in range(input_ids.shape[0]):
-            seq = input_ids[b].tolist()
-            # Search for the token sequence in the input
-            for i in range(len(seq) - len(think_end_tokens) + 1):
-                if seq[i:i+len(think_end_tokens)] == think_end_tokens:
-                    return True
+        # Search for the token sequence in the input
+        seq = input_ids.tolist() if hasattr(input_ids, "tolist") else list(input_ids)
+        for i in range(len(seq) - len(think_end_tokens) + 1):
+            if seq[i:i+len(think_end_tokens)] == think_end_tokens:
+                return True
         
         return False
     
-    def _apply_temperature_scaling(self, scores: torch.FloatTensor) -> torch.FloatTensor:
+    def _apply_temperature_scaling(self, scores: torch.FloatTensor, slots: List[int]) -> torch.FloatTensor:
         """
-        Apply temperature scaling based on current generation phase.
+        Apply temperature scaling based on the generation phase of each row.
         
         Temperature scaling: logits = logits / temperature
         - Lower temperature (< 1.0) makes distribution sharper (more deterministic)
@@ -1652,26 +1737,32 @@ class MetadataConstrainedLogitsProcessor(LogitsProcessor):
         
         Args:
             scores: [batch_size, vocab_size] logits
+            slots: Sequence state slot of each row
             
         Returns:
             Temperature-scaled logits
         """
-        # Determine which temperature to use based on current state
-        if self.state == FSMState.CODES_GENERATION or self.state == FSMState.COMPLETED:
-            temperature = self.codes_temperature
-        else:
-            temperature = self.metadata_temperature
-        
-        # If no temperature is set for this phase, return scores unchanged
-        if temperature is None:
+        # If no temperature is set for either phase, return scores unchanged
+        if self.metadata_temperature is None and self.codes_temperature is None:
             return scores
         
-        # Avoid division by zero
-        if temperature <= 0:
-            temperature = 1e-6
+        # Determine which temperature to use based on each row's state
+        states = self._sequence_states["state"]
+        temperatures = []
+        for slot in slots:
+            if states[slot] == FSMState.CODES_GENERATION or states[slot] == FSMState.COMPLETED:
+                temperature = self.codes_temperature
+            else:
+                temperature = self.metadata_temperature
+            if temperature is None:
+                temperature = 1.0
+            # Avoid division by zero
+            temperatures.append(temperature if temperature > 0 else 1e-6)
         
         # Apply temperature scaling
-        return scores / temperature
+        if all(t == temperatures[0] for t in temperatures):
+            return scores / temperatures[0]
+        return scores / torch.tensor(temperatures, device=scores.device, dtype=scores.dtype).unsqueeze(1)
     
     def _get_user_provided_field_tokens(self, field_name: str) -> Optional[List[int]]:
         """
@@ -2115,17 +2206,32 @@ class MetadataConstrainedLogitsProcessor(LogitsProcessor):
             if self.debug:
                 logger.debug(f"FSM transition: {old_state.name} -> {self.state.name}")
     
-    def update_state(self, generated_token_id: int):
+    def update_state(
+        self,
+        generated_token_id: Union[int, Sequence[int]],
+        seq_ids: Optional[Sequence[Hashable]] = None,
+    ):
         """
         Update internal state after a token has been generated.
         This should be called after each token generation.
         
         Args:
-            generated_token_id: The token ID that was just generated
+            generated_token_id: The token ID that was just generated, or one token ID per row
+            seq_ids: Sequence ID of each row (default: row index)
         """
         if not self.enabled:
             return
         
+        token_ids = generated_token_id.tolist() if hasattr(generated_token_id, "tolist") else generated_token_id
+        if not isinstance(token_ids, (list, tuple)):
+            token_ids = [token_ids]
+        for token_id, slot in zip(token_ids, self._slots_for(seq_ids, len(token_ids))):
+            self._current_slot = slot
+            self._update_sequence_state(int(token_id))
+    
+    def _update_sequence_state(self, generated_token_id: int):
+        """Advance the FSM of the current sequence by generated_token_id."""
+        
         if self.state == FSMState.COMPLETED:
             return
         
@@ -0,0 +1,86 @@
+"""LRU cache of text-encoder outputs per prompt
+
+Traffic repeats a small set of captions, SFT prompt templates and lyrics, and
+the Qwen3-Embedding outputs of one sample only depend on its own token ids
+(causal model, right padding). preprocess_batch looks every sample up here
+first and loads the text encoder (an offload round-trip when offloading is on)
+only for the samples it does not find.
+
+Entries are keyed by a hash of the token ids, the kind of embedding ("text"
+or "lyric") and the text encoder that produced them, and bounded by their
+bytes. They stay on the CPU unless ACESTEP_EMBED_CACHE_DEVICE=device keeps
+them where they were computed.
+"""
+
+import hashlib
+import os
+from threading import Lock
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+from acestep.result_cache import ResultCache
+
+# Default memory budget (MB); ACESTEP_EMBED_CACHE_MB=0 disables the cache
+DEFAULT_EMBED_CACHE_MB = 256
+
+EMBED_CACHE_DEVICES = ("cpu", "device")
+
+
+class EmbeddingCache:
+    """Thread-safe LRU of per-sample hidden states ([tokens, dim] tensors) bounded by bytes."""
+
+    def __init__(self, max_bytes: int, device: str = "cpu") -> None:
+        self._lru = ResultCache(max_bytes)
+        self.device = device if device in EMBED_CACHE_DEVICES else "cpu"
+
+    @property
+    def enabled(self) -> bool:
+        return self._lru.enabled
+
+    @staticmethod
+    def key(kind: str, encoder_id: str, token_ids: Any) -> str:
+        """Key of the embeddings of one unpadded token id sequence."""
+        digest = hashlib.sha1(f"{kind}|{encoder_id}|".encode("utf-8"))
+        digest.update(token_ids.detach().to("cpu").long().numpy().tobytes())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        return self._lru.get(key)
+
+    def put(self, key: str, hidden_states: Any) -> None:
+        hidden_states = hidden_states.detach()
+        if self.device == "cpu":
+            hidden_states = hidden_states.to("cpu")
+        # clone() so the entry does not keep the whole batch output alive
+        self._lru.put(key, hidden_states.clone())
+
+    def clear(self) -> None:
+        self._lru.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._lru.stats(), "device": self.device}
+
+
+# Lazily initialized global instance
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Get the process-wide embedding cache (ACESTEP_EMBED_CACHE_MB, ACESTEP_EMBED_CACHE_DEVICE)"""
+    global _embedding_cache
+    if _embedding_cache is None:
+        with _embedding_cache_lock:
+            if _embedding_cache is None:
+                try:
+                    max_mb = float(os.getenv("ACESTEP_EMBED_CACHE_MB", str(DEFAULT_EMBED_CACHE_MB)))
+                except ValueError:
+                    logger.warning("Invalid ACESTEP_EMBED_CACHE_MB, using default")
+                    max_mb = DEFAULT_EMBED_CACHE_MB
+                device = os.getenv("ACESTEP_EMBED_CACHE_DEVICE", "cpu").strip().lower()
+                if device not in EMBED_CACHE_DEVICES:
+                    logger.warning(f"Invalid ACESTEP_EMBED_CACHE_DEVICE={device!r}, using cpu")
+                    device = "cpu"
+                _embedding_cache = EmbeddingCache(int(max_mb * 1024 * 1024), device)
+    return _embedding_cache
@@ -8,6 +8,7 @@ import os
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 import math
+from collections import OrderedDict
 from copy import deepcopy
 import tempfile
 import traceback
@@ -15,10 +16,12 @@ import re
 import random
 import uuid
 import hashlib
+import inspect
 import json
 from contextlib import contextmanager
 from typing import Optional, Dict, Any, Tuple, List, Union
 
+import numpy as np
 import torch
 import torchaudio
 import soundfile as sf
@@ -41,13 +44,55 @@ from acestep.constants import (
     TASK_INSTRUCTIONS,
     SFT_GEN_PROMPT,
     DEFAULT_DIT_INSTRUCTION,
+    VAE_DECODE_BYTES_PER_SAMPLE,
+    VAE_ENCODE_BUCKET_PAD_RATIO,
+    DIT_LATENT_BUCKET_FRAMES,
+    DIT_COMPILED_BUCKETS,
 )
 from acestep.dit_alignment_score import MusicStampsAligner, MusicLyricScorer
+from acestep.audio_codes import AudioCodes
+from acestep.cancellation import check_cancelled, current_token
+from acestep.embedding_cache import get_embedding_cache
+from acestep.latent_cache import CachedReferenceAudio, get_latent_cache
+from acestep.transfer_pipeline import HostTransferPipeline
+from acestep.offload_engine import RESIDENT, STREAM, get_offloader, get_residency_planner, module_bytes
+from acestep.audio_utils import get_audio_file_hash
 from acestep.gpu_config import get_gpu_memory_gb
 
 
 warnings.filterwarnings("ignore")
 
+# Model kinds of the residency planner (acestep.offload_engine) by handler attribute
+_RESIDENCY_KINDS = {"model": "dit", "vae": "vae", "text_encoder": "text_encoder"}
+
+
+class NoReferenceAudio:
+    """
+    Marks a batch item without reference audio (use NO_REFERENCE_AUDIO).
+
+    infer_refer_latent packs the silence latent for it instead of encoding a
+    placeholder waveform.
+    """
+
+    def __repr__(self) -> str:
+        return "NO_REFERENCE_AUDIO"
+
+
+NO_REFERENCE_AUDIO = NoReferenceAudio()
+
+
+def _compile_decoder_variant(decoder, name: str):
+    """torch.compile the forward of decoder for one fixed input shape."""
+    decoder_forward = type(decoder).forward
+
+    def forward(*args, **kwargs):
+        return decoder_forward(decoder, *args, **kwargs)
+
+    # Dynamo keeps compiled graphs on the code object: a code object per variant gives
+    # each one its own cache, freed with the variant when it is evicted
+    forward.__code__ = forward.__code__.replace(co_name=name)
+    return torch.compile(forward, dynamic=False)
+
 
 class AceStepHandler:
     """ACE-Step Business Logic Handler"""
@@ -55,15 +100,18 @@ class AceStepHandler:
     def __init__(self):
         self.model = None
         self.config = None
+        self.model_name = None  # DiT config directory name, e.g. "acestep-v15-turbo"
         self.device = "cpu"
         self.dtype = torch.float32  # Will be set based on device in initialize_service
 
         # VAE for audio encoding/decoding
         self.vae = None
+        self.vae_path = None  # identifies cached latents (see acestep.latent_cache)
         
         # Text encoder and tokenizer
         self.text_encoder = None
         self.text_tokenizer = None
+        self.text_encoder_path = None  # identifies cached embeddings (see acestep.embedding_cache)
         
         # Silence latent for initialization
         self.silence_latent = None
@@ -82,6 +130,14 @@ class AceStepHandler:
         self.offload_to_cpu = False
         self.offload_dit_to_cpu = False
         self.current_offload_cost = 0.0
+        # Most overlapping windows tiled_decode stacks into one VAE decode call (1 = one window per call)
+        self.tiled_decode_max_windows = 8
+        # With compile_model: latent length bucket (frames, 0 = exact lengths) and how many
+        # compiled decoder variants (per batch size and bucket) to keep
+        self.compile_model = False
+        self.latent_bucket_frames = DIT_LATENT_BUCKET_FRAMES
+        self.compiled_decoder_buckets = DIT_COMPILED_BUCKETS
+        self._compiled_decoders = OrderedDict()
         
         # LoRA state
         self.lora_loaded = False
@@ -183,6 +239,7 @@ class AceStepHandler:
             )
             self.model.decoder = self.model.decoder.to(self.device).to(self.dtype)
             self.model.decoder.eval()
+            self._refresh_offloader("model")
             
             self.lora_loaded = True
             self.use_lora = True  # Enable LoRA by default after loading
@@ -212,6 +269,7 @@ class AceStepHandler:
             self.model.decoder = copy.deepcopy(self._base_decoder)
             self.model.decoder = self.model.decoder.to(self.device).to(self.dtype)
             self.model.decoder.eval()
+            self._refresh_offloader("model")
             
             self.lora_loaded = False
             self.use_lora = False
@@ -305,6 +363,19 @@ class AceStepHandler:
             "scale": self.lora_scale,
         }
     
+    def share_auxiliary_models(self, other: "AceStepHandler") -> None:
+        """Use other's VAE, text encoder and offload settings instead of loading separate copies.
+
+        Lets several DiT variants be served side by side: only the DiT weights differ.
+        """
+        self.vae = other.vae
+        self.vae_path = other.vae_path
+        self.text_encoder = other.text_encoder
+        self.text_tokenizer = other.text_tokenizer
+        self.text_encoder_path = other.text_encoder_path
+        self.offload_to_cpu = other.offload_to_cpu
+        self.offload_dit_to_cpu = other.offload_dit_to_cpu
+
     def initialize_service(
         self, 
         project_root: str,
@@ -350,6 +421,8 @@ class AceStepHandler:
             # Set dtype based on device: bfloat16 for cuda, float32 for cpu
             self.dtype = torch.bfloat16 if device in ["cuda","xpu"] else torch.float32
             self.quantization = quantization
+            self.compile_model = compile_model
+            self._compiled_decoders.clear()
             if self.quantization is not None:
                 assert compile_model, "Quantization requires compile_model to be True"
                 try:
@@ -385,6 +458,7 @@ class AceStepHandler:
             # 1. Load main model
             # config_path is relative path (e.g., "acestep-v15-turbo"), concatenate to checkpoints directory
             acestep_v15_checkpoint_path = os.path.join(checkpoint_dir, config_path)
+            self.model_name = config_path
             if os.path.exists(acestep_v15_checkpoint_path):
                 # Determine attention implementation
                 if use_flash_attention and self.is_flash_attention_available():
@@ -473,6 +547,7 @@ class AceStepHandler:
             vae_checkpoint_path = os.path.join(checkpoint_dir, "vae")
             if os.path.exists(vae_checkpoint_path):
                 self.vae = AutoencoderOobleck.from_pretrained(vae_checkpoint_path)
+                self.vae_path = vae_checkpoint_path
                 # Use bfloat16 for VAE on GPU, otherwise use self.dtype (float32 on CPU)
                 vae_dtype = self._get_vae_dtype(device)
                 if not self.offload_to_cpu:
@@ -499,6 +574,7 @@ class AceStepHandler:
             if os.path.exists(text_encoder_path):
                 self.text_tokenizer = AutoTokenizer.from_pretrained(text_encoder_path)
                 self.text_encoder = AutoModel.from_pretrained(text_encoder_path)
+                self.text_encoder_path = text_encoder_path
                 if not self.offload_to_cpu:
                     self.text_encoder = self.text_encoder.to(device).to(self.dtype)
                 else:
@@ -540,104 +616,33 @@ class AceStepHandler:
             if not self._is_on_target_device(self.silence_latent, self.device):
                 self.silence_latent = self.silence_latent.to(self.device).to(self.dtype)
     
-    def _move_module_recursive(self, module, target_device, dtype=None, visited=None):
-        """
-        Recursively move a module and all its submodules to the target device.
-        This handles modules that may not be properly registered.
-        """
-        if visited is None:
-            visited = set()
-        
-        module_id = id(module)
-        if module_id in visited:
-            return
-        visited.add(module_id)
-        
-        # Move the module itself
-        module.to(target_device)
-        if dtype is not None:
-            module.to(dtype)
-        
-        # Move all direct parameters
-        for param_name, param in module._parameters.items():
-            if param is not None and not self._is_on_target_device(param, target_device):
-                module._parameters[param_name] = param.to(target_device)
-                if dtype is not None:
-                    module._parameters[param_name] = module._parameters[param_name].to(dtype)
-        
-        # Move all direct buffers
-        for buf_name, buf in module._buffers.items():
-            if buf is not None and not self._is_on_target_device(buf, target_device):
-                module._buffers[buf_name] = buf.to(target_device)
-        
-        # Recursively process all submodules (registered and unregistered)
-        for name, child in module._modules.items():
-            if child is not None:
-                self._move_module_recursive(child, target_device, dtype, visited)
-        
-        # Also check for any nn.Module attributes that might not be in _modules
-        for attr_name in dir(module):
-            if attr_name.startswith('_'):
-                continue
-            try:
-                attr = getattr(module, attr_name, None)
-                if isinstance(attr, torch.nn.Module) and id(attr) not in visited:
-                    self._move_module_recursive(attr, target_device, dtype, visited)
-            except Exception:
-                pass
-    
-    def _recursive_to_device(self, model, device, dtype=None):
-        """
-        Recursively move all parameters and buffers of a model to the specified device.
-        This is more thorough than model.to() for some custom HuggingFace models.
-        """
-        target_device = torch.device(device) if isinstance(device, str) else device
-        
-        # Method 1: Standard .to() call
-        model.to(target_device)
-        if dtype is not None:
-            model.to(dtype)
-        
-        # Method 2: Use our thorough recursive moving for any missed modules
-        self._move_module_recursive(model, target_device, dtype)
-        
-        # Method 3: Force move via state_dict if there are still parameters on wrong device
-        wrong_device_params = []
-        for name, param in model.named_parameters():
-            if not self._is_on_target_device(param, device):
-                wrong_device_params.append(name)
-        
-        if wrong_device_params and device != "cpu":
-            logger.warning(f"[_recursive_to_device] {len(wrong_device_params)} parameters on wrong device, using state_dict method")
-            # Get current state dict and move all tensors
-            state_dict = model.state_dict()
-            moved_state_dict = {}
-            for key, value in state_dict.items():
-                if isinstance(value, torch.Tensor):
-                    moved_state_dict[key] = value.to(target_device)
-                    if dtype is not None and moved_state_dict[key].is_floating_point():
-                        moved_state_dict[key] = moved_state_dict[key].to(dtype)
-                else:
-                    moved_state_dict[key] = value
-            model.load_state_dict(moved_state_dict)
-        
-        # Synchronize CUDA to ensure all transfers are complete
-        if device != "cpu" and torch.cuda.is_available():
-            torch.cuda.synchronize()
-        
-        # Final verification
-        if device != "cpu":
-            still_wrong = []
-            for name, param in model.named_parameters():
-                if not self._is_on_target_device(param, device):
-                    still_wrong.append(f"{name} on {param.device}")
-            if still_wrong:
-                logger.error(f"[_recursive_to_device] CRITICAL: {len(still_wrong)} parameters still on wrong device: {still_wrong[:10]}")
-    
+    def _offloader(self, model_name: str, model):
+        """Get the offload engine of model and (re)register it with the residency planner."""
+        dtype = self._get_vae_dtype() if model_name == "vae" else self.dtype
+        offloader = get_offloader(model, self.device, dtype)
+        get_residency_planner().register(
+            model,
+            _RESIDENCY_KINDS.get(model_name, model_name),
+            offloader.host_bytes(),
+            # Forward hooks do not mix with torch.compile'd graphs
+            streamable=model_name == "model" and not hasattr(model, "_orig_mod"),
+        )
+        return offloader
+
+    def _refresh_offloader(self, model_name: str) -> None:
+        """Retake the pinned host copies of a model whose module tree changed (LoRA load/unload)."""
+        model = getattr(self, model_name, None)
+        if self.offload_to_cpu and model is not None and not (model_name == "model" and not self.offload_dit_to_cpu):
+            self._offloader(model_name, model).refresh()
+
     @contextmanager
     def _load_model_context(self, model_name: str):
         """
         Context manager to load a model to GPU and offload it back to CPU after use.
+
+        With offload_to_cpu the model goes through the pinned-memory offload engine
+        (acestep.offload_engine): the residency planner decides whether it stays on
+        the device, is loaded for the block or has its decoder layers streamed.
         
         Args:
             model_name: Name of the model to load ("text_encoder", "vae", "model")
@@ -646,62 +651,57 @@ class AceStepHandler:
             yield
             return
 
-        # If model is DiT ("model") and offload_dit_to_cpu is False, do not offload
-        if model_name == "model" and not self.offload_dit_to_cpu:
-            # Ensure it's on device if not already (should be handled by init, but safe to check)
-            model = getattr(self, model_name, None)
-            if model is not None:
-                # Check if model is on CPU, if so move to device (one-time move if it was somehow on CPU)
-                # We check the first parameter's device
-                try:
-                    param = next(model.parameters())
-                    if param.device.type == "cpu":
-                        logger.info(f"[_load_model_context] Moving {model_name} to {self.device} (persistent)")
-                        self._recursive_to_device(model, self.device, self.dtype)
-                        if hasattr(self, "silence_latent"):
-                            self.silence_latent = self.silence_latent.to(self.device).to(self.dtype)
-                except StopIteration:
-                    pass
+        model = getattr(self, model_name, None)
+        if model is None:
             yield
             return
 
-        model = getattr(self, model_name, None)
-        if model is None:
+        # If model is DiT ("model") and offload_dit_to_cpu is False, it stays on the device
+        if model_name == "model" and not self.offload_dit_to_cpu:
+            get_residency_planner().register(model, "dit", module_bytes(model), forced=RESIDENT)
+            try:
+                param = next(model.parameters())
+                if param.device.type == "cpu":
+                    logger.info(f"[_load_model_context] Moving {model_name} to {self.device} (persistent)")
+                    model.to(self.device).to(self.dtype)
+            except StopIteration:
+                pass
+            self._ensure_silence_latent_on_device()
             yield
             return
 
-        # Load to GPU
-        logger.info(f"[_load_model_context] Loading {model_name} to {self.device}")
-        start_time = time.time()
-        if model_name == "vae":
-            vae_dtype = self._get_vae_dtype()
-            self._recursive_to_device(model, self.device, vae_dtype)
-        else:
-            self._recursive_to_device(model, self.device, self.dtype)
-        
-        if model_name == "model" and hasattr(self, "silence_latent"):
-             self.silence_latent = self.silence_latent.to(self.device).to(self.dtype)
-        
-        load_time = time.time() - start_time
-        self.current_offload_cost += load_time
-        logger.info(f"[_load_model_context] Loaded {model_name} to {self.device} in {load_time:.4f}s")
+        offloader = self._offloader(model_name, model)
+        decision = get_residency_planner().decide(model)
+        resident_blocks = 0
+        if decision.mode == STREAM:
+            outside_bytes, block_bytes = offloader.block_bytes()
+            working_set = outside_bytes + (offloader.prefetch_blocks + 1) * block_bytes
+            resident_blocks = max(0, (decision.budget_bytes - working_set) // max(1, block_bytes))
 
+        loading = not offloader.on_device
+        if loading:
+            logger.info(f"[_load_model_context] Loading {model_name} to {self.device} ({decision.mode})")
+        start_time = time.time()
+        offload_start = None
         try:
-            yield
+            with offloader.using(decision.mode, resident_blocks):
+                if model_name == "model":
+                    self._ensure_silence_latent_on_device()
+                if loading:
+                    load_time = time.time() - start_time
+                    self.current_offload_cost += load_time
+                    logger.info(f"[_load_model_context] Loaded {model_name} to {self.device} in {load_time:.4f}s")
+                try:
+                    yield
+                finally:
+                    offload_start = time.time()
         finally:
-            # Offload to CPU
-            logger.info(f"[_load_model_context] Offloading {model_name} to CPU")
-            start_time = time.time()
-            self._recursive_to_device(model, "cpu")
-            
-            # NOTE: Do NOT offload silence_latent to CPU here!
-            # silence_latent is used in many places outside of model context,
-            # so it should stay on GPU to avoid device mismatch errors.
-            
-            torch.cuda.empty_cache()
-            offload_time = time.time() - start_time
-            self.current_offload_cost += offload_time
-            logger.info(f"[_load_model_context] Offloaded {model_name} to CPU in {offload_time:.4f}s")
+            if offload_start is not None and not offloader.on_device:
+                # NOTE: silence_latent stays on the device, it is used outside of model contexts
+                torch.cuda.empty_cache()
+                offload_time = time.time() - offload_start
+                self.current_offload_cost += offload_time
+                logger.info(f"[_load_model_context] Offloaded {model_name} to CPU in {offload_time:.4f}s")
 
     def process_target_audio(self, audio_file) -> Optional[torch.Tensor]:
         """Process target audio"""
@@ -729,61 +729,70 @@ class AceStepHandler:
         """Extract integer audio codes from prompt tokens like <|audio_code_123|>.
         Code values are clamped to valid range [0, 63999] (codebook size = 64000).
         """
-        if not code_str:
-            return []
         try:
-            MAX_AUDIO_CODE = 63999  # Maximum valid audio code value (codebook size = 64000)
-            codes = []
-            clamped_count = 0
-            for x in re.findall(r"<\|audio_code_(\d+)\|>", code_str):
-                code_value = int(x)
-                # Clamp code value to valid range [0, MAX_AUDIO_CODE]
-                clamped_value = max(0, min(code_value, MAX_AUDIO_CODE))
-                if clamped_value != code_value:
-                    clamped_count += 1
-                    logger.warning(f"[_parse_audio_code_string] Clamped audio code value from {code_value} to {clamped_value}")
-                codes.append(clamped_value)
-            if clamped_count > 0:
-                logger.warning(f"[_parse_audio_code_string] Clamped {clamped_count} audio code value(s) to valid range [0, {MAX_AUDIO_CODE}]")
-            return codes
+            codes = AudioCodes.parse(code_str)
         except Exception as e:
             logger.debug(f"[_parse_audio_code_string] Failed to parse audio code string: {e}")
             return []
+        return codes.tolist() if codes else []
     
-    def _decode_audio_codes_to_latents(self, code_str: str) -> Optional[torch.Tensor]:
+    def _decode_audio_codes_to_latents(self, codes: Union[str, AudioCodes]) -> Optional[torch.Tensor]:
         """
-        Convert serialized audio code string into 25Hz latents using model quantizer/detokenizer.
+        Convert audio codes (AudioCodes, a code string or its "b64:" wire form) into
+        25Hz latents using model quantizer/detokenizer.
         
-        Note: Code values are already clamped to valid range [0, 63999] by _parse_audio_code_string(),
-        ensuring indices are within the quantizer's codebook size (64000).
+        Note: AudioCodes values are clamped to the valid range [0, 63999], ensuring
+        indices are within the quantizer's codebook size (64000).
+        """
+        return self._decode_audio_codes_batch_to_latents([codes])[0]
+
+    def _decode_audio_codes_batch_to_latents(self, code_seqs: List[Union[str, AudioCodes, None]]) -> List[Optional[torch.Tensor]]:
         """
+        _decode_audio_codes_to_latents of several code sequences: [1, T_25Hz, dim] each, None when empty.
+
+        Identical sequences are decoded once and sequences of the same length share one
+        quantizer/detokenizer call. Lengths are never mixed, so no padding can leak
+        into the detokenizer.
+        """
+        results: List[Optional[torch.Tensor]] = [None] * len(code_seqs)
         if self.model is None or not hasattr(self.model, 'tokenizer') or not hasattr(self.model, 'detokenizer'):
-            return None
-        
-        code_ids = self._parse_audio_code_string(code_str)
-        if len(code_ids) == 0:
-            return None
-        
+            return results
+
+        by_length: Dict[int, Dict[bytes, List[int]]] = {}  # T_5Hz -> codes key -> items
+        parsed: Dict[bytes, AudioCodes] = {}
+        for idx, code_seq in enumerate(code_seqs):
+            try:
+                codes = AudioCodes.parse(code_seq)
+            except Exception as e:
+                logger.warning(f"[_decode_audio_codes_batch_to_latents] Invalid audio codes for item {idx}: {e}")
+                codes = None
+            if codes:
+                parsed[codes.key()] = codes
+                by_length.setdefault(len(codes), {}).setdefault(codes.key(), []).append(idx)
+        if not by_length:
+            return results
+
         with self._load_model_context("model"):
             quantizer = self.model.tokenizer.quantizer
             detokenizer = self.model.detokenizer
-            
-            num_quantizers = getattr(quantizer, "num_quantizers", 1)
-            # Create indices tensor: [T_5Hz]
-            # Note: code_ids are already clamped to [0, 63999] by _parse_audio_code_string()
-            indices = torch.tensor(code_ids, device=self.device, dtype=torch.long)  # [T_5Hz]
-            
-            indices = indices.unsqueeze(0).unsqueeze(-1)  # [1, T_5Hz, 1]
-            
-            # Get quantized representation from indices
-            # The quantizer expects [batch, T_5Hz] format and handles quantizer dimension internally
-            quantized = quantizer.get_output_from_indices(indices)
-            if quantized.dtype != self.dtype:
-                quantized = quantized.to(self.dtype)
-            
-            # Detokenize to 25Hz: [1, T_5Hz, dim] -> [1, T_25Hz, dim]
-            lm_hints_25hz = detokenizer(quantized)
-            return lm_hints_25hz
+
+            for group in by_length.values():
+                # Note: code values are already clamped to [0, 63999] by AudioCodes
+                indices = torch.from_numpy(np.stack([parsed[key].values for key in group]).astype(np.int64))
+                indices = indices.to(self.device).unsqueeze(-1)  # [B, T_5Hz, 1]
+
+                # Get quantized representation from indices
+                # The quantizer expects [batch, T_5Hz] format and handles quantizer dimension internally
+                quantized = quantizer.get_output_from_indices(indices)
+                if quantized.dtype != self.dtype:
+                    quantized = quantized.to(self.dtype)
+
+                # Detokenize to 25Hz: [B, T_5Hz, dim] -> [B, T_25Hz, dim]
+                lm_hints_25hz = detokenizer(quantized)
+                for row, items in enumerate(group.values()):
+                    for idx in items:
+                        results[idx] = lm_hints_25hz[row:row + 1]
+        return results
     
     def _create_default_meta(self) -> str:
         """Create default metadata string."""
@@ -1067,11 +1076,11 @@ class AceStepHandler:
         
         return audio
     
-    def _normalize_audio_code_hints(self, audio_code_hints: Optional[Union[str, List[str]]], batch_size: int) -> List[Optional[str]]:
-        """Normalize audio_code_hints to list of correct length."""
+    def _normalize_audio_code_hints(self, audio_code_hints: Optional[Union[str, AudioCodes, List[Any]]], batch_size: int) -> List[Optional[AudioCodes]]:
+        """Normalize audio_code_hints to a list of AudioCodes (or None) of correct length."""
         if audio_code_hints is None:
             normalized = [None] * batch_size
-        elif isinstance(audio_code_hints, str):
+        elif isinstance(audio_code_hints, (str, AudioCodes)):
             normalized = [audio_code_hints] * batch_size
         elif len(audio_code_hints) == 1 and batch_size > 1:
             normalized = audio_code_hints * batch_size
@@ -1083,9 +1092,8 @@ class AceStepHandler:
         else:
             normalized = list(audio_code_hints)
         
-        # Clean up: convert empty strings to None
-        normalized = [hint if isinstance(hint, str) and hint.strip() else None for hint in normalized]
-        return normalized
+        # Typed codes from here on; empty hints become None
+        return [AudioCodes.parse(hint) for hint in normalized]
     
     def _normalize_instructions(self, instructions: Optional[Union[str, List[str]]], batch_size: int, default: Optional[str] = None) -> List[str]:
         """Normalize instructions to list of correct length."""
@@ -1248,11 +1256,69 @@ class AceStepHandler:
         else:
             return TASK_INSTRUCTIONS["text2music"]
     
-    def process_reference_audio(self, audio_file) -> Optional[torch.Tensor]:
+    @staticmethod
+    def _reference_segment_starts(num_frames: int, rng) -> Tuple[int, int, int, int]:
+        """
+        (repeat times, front, middle, back start) of the 10-second segments making up a
+        30-second reference from a num_frames (48kHz) track.
+        """
+        target_frames = 30 * 48000
+        segment_frames = 10 * 48000  # 10 seconds per segment
+
+        # If audio is less than 30 seconds, repeat to at least 30 seconds
+        repeat_times = math.ceil(target_frames / num_frames) if num_frames < target_frames else 1
+        total_frames = num_frames * repeat_times
+
+        # Select random 10-second segments from front, middle, and back
+        segment_size = total_frames // 3
+        front_start = rng.randint(0, max(0, segment_size - segment_frames))
+        middle_start = segment_size + rng.randint(0, max(0, segment_size - segment_frames))
+        back_start = 2 * segment_size + rng.randint(0, max(0, (total_frames - 2 * segment_size) - segment_frames))
+        return repeat_times, front_start, middle_start, back_start
+
+    def _reference_cache_key(self, audio_file) -> Optional[Tuple[str, int, Tuple[int, int, int, int]]]:
+        """
+        (latent cache key, 48kHz length, segment selection) of a reference file, None if it cannot be cached.
+
+        Only with the cache's cache_references on: segments are then drawn from a generator
+        seeded by the file content, so a reused track maps to the same latent. The length
+        comes from the file header, which avoids decoding the audio on a hit.
+        """
+        cache = get_latent_cache()
+        if not (cache.enabled and cache.cache_references) or self.vae is None or not isinstance(audio_file, str) or not os.path.isfile(audio_file):
+            return None
+        try:
+            info = torchaudio.info(audio_file)
+        except Exception:
+            return None
+        if info.num_frames <= 0 or info.sample_rate <= 0:
+            return None
+        # Length after _normalize_audio_to_stereo_48k (resampling rounds up)
+        num_frames = math.ceil(info.num_frames * 48000 / info.sample_rate)
+        content_hash = get_audio_file_hash(audio_file)
+        segments = self._reference_segment_starts(num_frames, random.Random(int(content_hash[:16], 16)))
+        key = cache.key("refer", content_hash, num_frames, segments, self.vae_path, self.vae.dtype)
+        return key, num_frames, segments
+
+    def process_reference_audio(self, audio_file) -> Optional[Union[torch.Tensor, CachedReferenceAudio]]:
+        """
+        30-second reference waveform built from three 10-second segments of audio_file.
+
+        Returns a CachedReferenceAudio instead when reference latents are cached: holding the
+        latent itself if it was cached (the file is not even decoded), else the waveform
+        and the key its latent is stored under once encoded (see infer_refer_latent).
+        """
         if audio_file is None:
             return None
-            
+
         try:
+            cached = self._reference_cache_key(audio_file)
+            if cached is not None:
+                entry = get_latent_cache().get(cached[0])
+                if entry is not None:
+                    logger.info("[process_reference_audio] Using cached reference latent")
+                    return CachedReferenceAudio(cache_key=cached[0], latent=entry["latent"])
+
             # Load audio file
             audio, sr = torchaudio.load(audio_file)
             
@@ -1266,37 +1332,26 @@ class AceStepHandler:
             is_silence = self.is_silence(audio)
             if is_silence:
                 return None
-            
-            # Target length: 30 seconds at 48kHz
-            target_frames = 30 * 48000
+
             segment_frames = 10 * 48000  # 10 seconds per segment
-            
-            # If audio is less than 30 seconds, repeat to at least 30 seconds
-            if audio.shape[-1] < target_frames:
-                repeat_times = math.ceil(target_frames / audio.shape[-1])
+            if cached is not None and cached[1] != audio.shape[-1]:
+                # Header length was off: the keyed segments do not match this waveform
+                cached = None
+            repeat_times, front_start, middle_start, back_start = (
+                cached[2] if cached is not None else self._reference_segment_starts(audio.shape[-1], random)
+            )
+            if repeat_times > 1:
                 audio = audio.repeat(1, repeat_times)
-            # If audio is greater than or equal to 30 seconds, no operation needed
-            
-            # For all cases, select random 10-second segments from front, middle, and back
-            # then concatenate them to form 30 seconds
-            total_frames = audio.shape[-1]
-            segment_size = total_frames // 3
-            
-            # Front segment: [0, segment_size]
-            front_start = random.randint(0, max(0, segment_size - segment_frames))
-            front_audio = audio[:, front_start:front_start + segment_frames]
-            
-            # Middle segment: [segment_size, 2*segment_size]
-            middle_start = segment_size + random.randint(0, max(0, segment_size - segment_frames))
-            middle_audio = audio[:, middle_start:middle_start + segment_frames]
-            
-            # Back segment: [2*segment_size, total_frames]
-            back_start = 2 * segment_size + random.randint(0, max(0, (total_frames - 2 * segment_size) - segment_frames))
-            back_audio = audio[:, back_start:back_start + segment_frames]
-            
-            # Concatenate three segments to form 30 seconds
-            audio = torch.cat([front_audio, middle_audio, back_audio], dim=-1)
-            
+
+            # Concatenate the front, middle and back segments to form 30 seconds
+            audio = torch.cat([
+                audio[:, front_start:front_start + segment_frames],
+                audio[:, middle_start:middle_start + segment_frames],
+                audio[:, back_start:back_start + segment_frames],
+            ], dim=-1)
+
+            if cached is not None:
+                return CachedReferenceAudio(cache_key=cached[0], audio=audio)
             return audio
             
         except Exception as e:
@@ -1320,6 +1375,83 @@ class AceStepHandler:
             logger.exception("[process_src_audio] Error processing source audio")
             return None
     
+    def _vae_encode_sample_budget(self) -> int:
+        """Audio samples (summed over the batch) one VAE encode call may process."""
+        gpu_memory = get_gpu_memory_gb()
+        if gpu_memory <= 8:
+            return 48000 * 15  # Same as a single tiled_encode chunk on low VRAM
+        if gpu_memory <= 24:
+            return 48000 * 60
+        return 48000 * 120
+
+    def _encode_audio_batch_to_latents(self, wavs: List[torch.Tensor]) -> List[torch.Tensor]:
+        """
+        _encode_audio_to_latents of several [channels, samples] waveforms in few VAE calls.
+
+        Waveforms are sorted by length and grouped while the shortest needs at most
+        VAE_ENCODE_BUCKET_PAD_RATIO padding and the group fits the encode sample budget
+        with tiles of at least 10 seconds. Each group is zero-padded and tiled-encoded
+        as one batch, then every latent is cut back to the length of its own audio.
+        """
+        budget = self._vae_encode_sample_budget()
+        min_tile = 48000 * 10
+        order = sorted(range(len(wavs)), key=lambda i: wavs[i].shape[-1])
+        groups: List[List[int]] = []
+        for i in order:
+            group = groups[-1] if groups else None
+            if (
+                group is None
+                or wavs[i].shape[-1] > wavs[group[0]].shape[-1] * (1 + VAE_ENCODE_BUCKET_PAD_RATIO)
+                or (len(group) + 1) * min(wavs[i].shape[-1], min_tile) > budget
+            ):
+                groups.append([i])
+            else:
+                group.append(i)
+
+        latents: List[Optional[torch.Tensor]] = [None] * len(wavs)
+        for group in groups:
+            if len(group) == 1:
+                latents[group[0]] = self._encode_audio_to_latents(wavs[group[0]])
+                continue
+            length = max(wavs[i].shape[-1] for i in group)
+            batch = torch.stack([
+                torch.nn.functional.pad(wavs[i], (0, length - wavs[i].shape[-1]))
+                for i in group
+            ])
+            with torch.no_grad():
+                encoded = self.tiled_encode(
+                    batch, chunk_size=max(budget // len(group), min_tile), offload_latent_to_cpu=True
+                )
+            # [B, d, T] -> [B, T, d] on device in model dtype, like _encode_audio_to_latents
+            encoded = encoded.to(self.device).to(self.dtype).transpose(1, 2)
+            for row, i in enumerate(group):
+                frames = int(round(wavs[i].shape[-1] * encoded.shape[1] / length))
+                latents[i] = encoded[row, :frames]
+        return latents
+
+    def _src_latent_key(self, audio: torch.Tensor) -> str:
+        """Latent cache key of a [channels, samples] waveform: its samples and the VAE."""
+        data = audio.detach().to("cpu").contiguous()
+        digest = hashlib.sha1(data.view(torch.uint8).numpy()).hexdigest()
+        return get_latent_cache().key("src", digest, tuple(data.shape), data.dtype, self.vae_path, self.vae.dtype)
+
+    def _encode_src_audio_cached(self, audio: torch.Tensor, cache_key: Optional[str] = None) -> torch.Tensor:
+        """
+        _encode_audio_to_latents of a [channels, samples] waveform through the shared latent cache.
+
+        Several conversions of one upload encode it only once.
+        """
+        cache = get_latent_cache()
+        if not cache.enabled:
+            return self._encode_audio_to_latents(audio)
+        cache_key = cache_key or self._src_latent_key(audio)
+        entry = cache.get(cache_key)
+        if entry is not None:
+            return entry["latent"].to(self.device).to(self.dtype)
+        latents = self._encode_audio_to_latents(audio)
+        cache.put(cache_key, {"latent": latents})
+        return latents
+
     def convert_src_audio_to_codes(self, audio_file) -> str:
         """
         Convert uploaded source audio to audio codes string.
@@ -1337,6 +1469,20 @@ class AceStepHandler:
             return "❌ Model not initialized. Please initialize the service first."
         
         try:
+            # 5Hz codes of a file seen before (e.g. relabeling a dataset) come from the cache
+            cache = get_latent_cache()
+            codes_key = None
+            if cache.enabled and isinstance(audio_file, str) and os.path.isfile(audio_file):
+                codes_key = cache.key(
+                    "codes", get_audio_file_hash(audio_file), self.vae_path, self.vae.dtype,
+                    self.model_name, self.lora_scale if self.use_lora else None,
+                )
+                entry = cache.get(codes_key)
+                if entry is not None:
+                    codes = AudioCodes(entry["codes"].flatten().numpy())
+                    logger.info(f"[convert_src_audio_to_codes] Using {len(codes)} cached audio codes")
+                    return codes.to_token_string()
+
             # Process audio file
             processed_audio = self.process_src_audio(audio_file)
             if processed_audio is None:
@@ -1350,7 +1496,7 @@ class AceStepHandler:
                         return "❌ Audio file appears to be silent"
                     
                     # Encode to latents using helper method
-                    latents = self._encode_audio_to_latents(processed_audio)  # [T, d]
+                    latents = self._encode_src_audio_cached(processed_audio)  # [T, d]
                 
                 # Create attention mask for latents
                 attention_mask = torch.ones(latents.shape[0], dtype=torch.bool, device=self.device)
@@ -1367,11 +1513,12 @@ class AceStepHandler:
                     # Format indices as code string
                     # indices shape: [1, T_5Hz] or [1, T_5Hz, num_quantizers]
                     # Flatten and convert to list
-                    indices_flat = indices.flatten().cpu().tolist()
-                    codes_string = "".join([f"<|audio_code_{idx}|>" for idx in indices_flat])
+                    codes = AudioCodes(indices.flatten().cpu().numpy())
+                    if codes_key is not None:
+                        cache.put(codes_key, {"codes": indices})
                     
-                    logger.info(f"[convert_src_audio_to_codes] Generated {len(indices_flat)} audio codes")
-                    return codes_string
+                    logger.info(f"[convert_src_audio_to_codes] Generated {len(codes)} audio codes")
+                    return codes.to_token_string()
                     
         except Exception as e:
             error_msg = f"❌ Error converting audio to codes: {str(e)}\n{traceback.format_exc()}"
@@ -1420,7 +1567,9 @@ class AceStepHandler:
 
         has_codes = False
         if isinstance(audio_code_string, list):
-            has_codes = any((c or "").strip() for c in audio_code_string)
+            has_codes = any(c if isinstance(c, AudioCodes) else (c or "").strip() for c in audio_code_string)
+        elif isinstance(audio_code_string, AudioCodes):
+            has_codes = bool(audio_code_string)
         else:
             has_codes = bool(audio_code_string and str(audio_code_string).strip())
 
@@ -1603,6 +1752,7 @@ class AceStepHandler:
         instructions: Optional[List[str]] = None,
         audio_code_hints: Optional[List[Optional[str]]] = None,
         audio_cover_strength: float = 1.0,
+        target_wav_lengths: Optional[List[int]] = None,
     ) -> Dict[str, Any]:
         """
         Prepare batch data with fallbacks for missing inputs.
@@ -1612,9 +1762,11 @@ class AceStepHandler:
             lyrics: List of lyrics (optional, can be empty strings)
             keys: List of unique identifiers (optional)
             target_wavs: Target audio tensors (optional, will use silence if not provided)
-            refer_audios: Reference audio tensors (optional, will use silence if not provided)
+            refer_audios: Reference audio tensors (optional; None or NO_REFERENCE_AUDIO items use silence)
             metas: Metadata (optional, will use defaults if not provided)
             vocal_languages: Vocal languages (optional, will default to 'en')
+            target_wav_lengths: Real frame count of each target wav when target_wavs was
+                zero-padded to a common length (optional, defaults to the padded length)
             
         Returns:
             Batch dictionary ready for model input
@@ -1627,9 +1779,13 @@ class AceStepHandler:
         # Normalize audio_code_hints to batch list
         audio_code_hints = self._normalize_audio_code_hints(audio_code_hints, batch_size)
         
+        if refer_audios is None:
+            refer_audios = [[NO_REFERENCE_AUDIO] for _ in range(batch_size)]
         for ii, refer_audio_list in enumerate(refer_audios):
             if isinstance(refer_audio_list, list):
                 for idx, refer_audio in enumerate(refer_audio_list):
+                    if isinstance(refer_audio, (CachedReferenceAudio, NoReferenceAudio)):
+                        continue  # Moved when its latent is used (infer_refer_latent)
                     refer_audio_list[idx] = refer_audio_list[idx].to(self.device).to(torch.bfloat16)
             elif isinstance(refer_audio_list, torch.Tensor):
                 refer_audios[ii] = refer_audios[ii].to(self.device)
@@ -1648,34 +1804,70 @@ class AceStepHandler:
             target_wavs_list = [target_wavs[i].clone() for i in range(batch_size)]
             if target_wavs.device != self.device:
                 target_wavs = target_wavs.to(self.device)
-            
-            with self._load_model_context("vae"):
-                for i in range(batch_size):
-                    code_hint = audio_code_hints[i]
-                    # Prefer decoding from provided audio codes
-                    if code_hint:
-                        logger.info(f"[generate_music] Decoding audio codes for item {i}...")
-                        decoded_latents = self._decode_audio_codes_to_latents(code_hint)
-                        if decoded_latents is not None:
-                            decoded_latents = decoded_latents.squeeze(0)
-                            target_latents_list.append(decoded_latents)
-                            latent_lengths.append(decoded_latents.shape[0])
-                            # Create a silent wav matching the latent length for downstream scaling
-                            frames_from_codes = max(1, int(decoded_latents.shape[0] * 1920))
-                            target_wavs_list[i] = torch.zeros(2, frames_from_codes)
-                            continue
-                    # Fallback to VAE encode from audio
-                    current_wav = target_wavs_list[i].to(self.device).unsqueeze(0)
-                    if self.is_silence(current_wav):
-                        expected_latent_length = current_wav.shape[-1] // 1920
-                        target_latent = self.silence_latent[0, :expected_latent_length, :]
-                    else:
-                        # Encode using helper method
-                        logger.info(f"[generate_music] Encoding target audio to latents for item {i}...")
-                        target_latent = self._encode_audio_to_latents(current_wav.squeeze(0))  # Remove batch dim for helper
-                    target_latents_list.append(target_latent)
-                    latent_lengths.append(target_latent.shape[0])
-             
+
+            # Code hints of the whole batch are detokenized together
+            decoded_hints: Dict[int, torch.Tensor] = {}
+            hint_items = [i for i in range(batch_size) if audio_code_hints[i]]
+            if hint_items:
+                logger.info(f"[generate_music] Decoding audio codes for items {hint_items}...")
+                decoded = self._decode_audio_codes_batch_to_latents([audio_code_hints[i] for i in hint_items])
+                for i, decoded_latents in zip(hint_items, decoded):
+                    if decoded_latents is not None:
+                        decoded_hints[i] = decoded_latents.squeeze(0)
+
+            # Fallback to VAE encode from audio. Latents cached by earlier passes over the same
+            # upload are reused; the rest is encoded once per distinct audio, in batched VAE calls.
+            latent_cache = get_latent_cache()
+            encoded: Dict[int, torch.Tensor] = {}
+            pending: Dict[str, List[int]] = {}  # latent cache key -> items with that audio
+            for i in range(batch_size):
+                if i in decoded_hints or self.is_silence(target_wavs_list[i]):
+                    continue
+                wav = target_wavs_list[i]
+                if latent_cache.enabled:
+                    key = self._src_latent_key(wav)
+                    entry = latent_cache.get(key)
+                    if entry is not None:
+                        encoded[i] = entry["latent"]
+                        continue
+                else:
+                    # No content hash without the cache: items repeating one source still encode once
+                    key = next(
+                        (k for k, items in pending.items() if torch.equal(target_wavs_list[items[0]], wav)),
+                        f"item:{i}",
+                    )
+                pending.setdefault(key, []).append(i)
+            if pending:
+                keys = list(pending)
+                logger.info(f"[generate_music] Encoding target audio to latents for items {sorted(i for items in pending.values() for i in items)}...")
+                with self._load_model_context("vae"):
+                    new_latents = self._encode_audio_batch_to_latents([target_wavs_list[pending[key][0]] for key in keys])
+                for key, target_latent in zip(keys, new_latents):
+                    if latent_cache.enabled:
+                        latent_cache.put(key, {"latent": target_latent})
+                    for i in pending[key]:
+                        encoded[i] = target_latent
+
+            for i in range(batch_size):
+                if i in decoded_hints:
+                    decoded_latents = decoded_hints[i]
+                    target_latents_list.append(decoded_latents)
+                    latent_lengths.append(decoded_latents.shape[0])
+                    # Create a silent wav matching the latent length for downstream scaling
+                    frames_from_codes = max(1, int(decoded_latents.shape[0] * 1920))
+                    target_wavs_list[i] = torch.zeros(2, frames_from_codes)
+                    continue
+                if i in encoded:
+                    target_latent = encoded[i].to(self.device).to(self.dtype)
+                else:
+                    target_frames = target_wavs_list[i].shape[-1]
+                    if target_wav_lengths is not None:
+                        target_frames = min(target_frames, int(target_wav_lengths[i]))
+                    expected_latent_length = target_frames // 1920
+                    target_latent = self.silence_latent[0, :expected_latent_length, :]
+                target_latents_list.append(target_latent)
+                latent_lengths.append(target_latent.shape[0])
+
             # Pad target_wavs to consistent length for outputs
             max_target_frames = max(wav.shape[-1] for wav in target_wavs_list)
             padded_target_wavs = []
@@ -1687,9 +1879,8 @@ class AceStepHandler:
             target_wavs = torch.stack(padded_target_wavs)
             wav_lengths = torch.tensor([target_wavs.shape[-1]] * batch_size, dtype=torch.long)
             
-            # Pad latents to same length
-            max_latent_length = max(latent.shape[0] for latent in target_latents_list)
-            max_latent_length = max(128, max_latent_length)
+            # Pad latents to same length (a length bucket when compiling)
+            max_latent_length = self._bucket_latent_length(max(latent.shape[0] for latent in target_latents_list))
             
             padded_latents = []
             for latent in target_latents_list:
@@ -1997,6 +2188,58 @@ class AceStepHandler:
                     batch[k] = v.to(self.dtype)
         return batch
     
+    def _bucket_latent_length(self, latent_length: int) -> int:
+        """
+        Padded latent length of a batch whose longest item has latent_length frames.
+
+        At least 128 frames; with compile_model rounded up to a multiple of
+        latent_bucket_frames (capped by the silence latent used for padding), so
+        the compiled decoder sees a few shapes instead of one per duration.
+        """
+        padded = max(128, latent_length)
+        bucket = int(self.latent_bucket_frames or 0)
+        if not self.compile_model or bucket <= 0:
+            return padded
+        bucketed = -(-padded // bucket) * bucket
+        return max(padded, min(bucketed, self.silence_latent.shape[1]))
+
+    @contextmanager
+    def _bucketed_decoder(self, batch_size: int, latent_length: int):
+        """
+        Run the DiT decoder through its compiled variant for this batch shape (compile_model only).
+
+        Variants are kept in an LRU of compiled_decoder_buckets entries; evicting
+        one drops its compiled graphs.
+        """
+        if not self.compile_model or self.compiled_decoder_buckets <= 0:
+            yield
+            return
+        decoder = self.model.decoder
+        key = (id(decoder), batch_size, latent_length)
+        forward = self._compiled_decoders.pop(key, None)
+        if forward is None:
+            logger.info(f"[service_generate] Compiling DiT decoder for batch {batch_size}, {latent_length} frames")
+            forward = _compile_decoder_variant(decoder, f"dit_decoder_b{batch_size}_t{latent_length}")
+            while len(self._compiled_decoders) >= self.compiled_decoder_buckets:
+                self._compiled_decoders.popitem(last=False)
+        self._compiled_decoders[key] = forward
+        decoder.forward = forward
+        try:
+            yield
+        finally:
+            del decoder.forward
+
+    def _silence_refer_latent(self) -> torch.Tensor:
+        """The packed [1, 750, D] reference latent of an item without reference audio, built once."""
+        cached = getattr(self, "_silence_refer_latent_cache", None)
+        if cached is None or cached[0] is not self.silence_latent:
+            packed = self.silence_latent[:, :750, :].contiguous()
+            if packed.dim() == 2:
+                packed = packed.unsqueeze(0)
+            cached = (self.silence_latent, packed)
+            self._silence_refer_latent_cache = cached
+        return cached[1]
+
     def infer_refer_latent(self, refer_audioss):
         refer_audio_order_mask = []
         refer_audio_latents = []
@@ -2029,16 +2272,25 @@ class AceStepHandler:
             return z
 
         for batch_idx, refer_audios in enumerate(refer_audioss):
-            if len(refer_audios) == 1 and torch.all(refer_audios[0] == 0.0):
-                refer_audio_latent = _ensure_latent_3d(self.silence_latent[:, :750, :])
-                refer_audio_latents.append(refer_audio_latent)
+            if len(refer_audios) == 1 and isinstance(refer_audios[0], NoReferenceAudio):
+                refer_audio_latents.append(self._silence_refer_latent())
                 refer_audio_order_mask.append(batch_idx)
             else:
                 for refer_audio in refer_audios:
-                    refer_audio = _normalize_audio_2d(refer_audio)
-                    # Use tiled_encode for memory-efficient encoding of long audio
-                    with torch.no_grad():
-                        refer_audio_latent = self.tiled_encode(refer_audio, offload_latent_to_cpu=True)
+                    if isinstance(refer_audio, CachedReferenceAudio) and refer_audio.latent is not None:
+                        refer_audio_latent = refer_audio.latent
+                    else:
+                        cached_ref = refer_audio if isinstance(refer_audio, CachedReferenceAudio) else None
+                        if cached_ref is not None:
+                            refer_audio = cached_ref.audio.to(self.device).to(torch.bfloat16)
+                        refer_audio = _normalize_audio_2d(refer_audio)
+                        # Use tiled_encode for memory-efficient encoding of long audio
+                        with torch.no_grad():
+                            refer_audio_latent = self.tiled_encode(refer_audio, offload_latent_to_cpu=True)
+                        if cached_ref is not None:
+                            get_latent_cache().put(cached_ref.cache_key, {"latent": refer_audio_latent})
+                            # The other batch items share this object: encode it once
+                            cached_ref.latent = refer_audio_latent
                     # Move to device and cast to model dtype
                     refer_audio_latent = refer_audio_latent.to(self.device).to(self.dtype)
                     # Ensure 3D before transpose: [C, T] -> [1, C, T] -> [1, T, C]
@@ -2061,6 +2313,53 @@ class AceStepHandler:
             lyric_embeddings = self.text_encoder.embed_tokens(lyric_token_ids)
         return lyric_embeddings
 
+    def _infer_embeddings_cached(self, requests):
+        """
+        Text encoder outputs for several inputs, reusing per-sample embeddings cached earlier.
+
+        requests: list of (kind, padded token ids [N, L], attention mask [N, L]) with kind
+        "text" (infer_text_embeddings) or "lyric" (infer_lyric_embeddings). Returns the
+        [N, L, D] hidden states of each. The text encoder is loaded only if some sample
+        is not cached, and only those samples are encoded. Positions past a sample's
+        attention mask are zero (the condition encoder masks them out).
+        """
+        cache = get_embedding_cache()
+        encoders = {"text": self.infer_text_embeddings, "lyric": self.infer_lyric_embeddings}
+        if not cache.enabled:
+            with self._load_model_context("text_encoder"):
+                return [encoders[kind](token_ids) for kind, token_ids, _ in requests]
+
+        encoder_id = f"{self.text_encoder_path}|{self.dtype}"
+        lookups = []
+        for kind, token_ids, attention_mask in requests:
+            lengths = [int(n) for n in attention_mask.long().sum(dim=1).tolist()]
+            keys = [cache.key(kind, encoder_id, token_ids[i, :lengths[i]]) for i in range(token_ids.shape[0])]
+            lookups.append((kind, token_ids, lengths, keys, [cache.get(key) for key in keys]))
+
+        if any(hidden is None for *_, found in lookups for hidden in found):
+            with self._load_model_context("text_encoder"):
+                for kind, token_ids, lengths, keys, found in lookups:
+                    missing = [i for i, hidden in enumerate(found) if hidden is None]
+                    if not missing:
+                        continue
+                    encoded = encoders[kind](token_ids[missing, :max(lengths[i] for i in missing)])
+                    for row, i in enumerate(missing):
+                        found[i] = encoded[row, :lengths[i]]
+                        cache.put(keys[i], found[i])
+        else:
+            logger.info("[preprocess_batch] All prompt and lyric embeddings found in cache")
+
+        outputs = []
+        for kind, token_ids, lengths, keys, found in lookups:
+            hidden_states = torch.zeros(
+                token_ids.shape[0], token_ids.shape[1], found[0].shape[-1],
+                device=token_ids.device, dtype=found[0].dtype,
+            )
+            for i, hidden in enumerate(found):
+                hidden_states[i, :lengths[i]] = hidden.to(hidden_states.device)
+            outputs.append(hidden_states)
+        return outputs
+
     def preprocess_batch(self, batch):
 
         # step 1: VAE encode latents, target_latents: N x T x d
@@ -2094,24 +2393,27 @@ class AceStepHandler:
         lyric_attention_mask = batch["lyric_attention_masks"]
         text_inputs = batch["text_inputs"]
 
-        logger.info("[preprocess_batch] Inferring prompt embeddings...")
-        with self._load_model_context("text_encoder"):
-            text_hidden_states = self.infer_text_embeddings(text_token_idss)
-            logger.info("[preprocess_batch] Inferring lyric embeddings...")
-            lyric_hidden_states = self.infer_lyric_embeddings(lyric_token_idss)
+        is_covers = batch["is_covers"]
 
-            is_covers = batch["is_covers"]
-            
-            # Get precomputed hints from batch if available
-            precomputed_lm_hints_25Hz = batch.get("precomputed_lm_hints_25Hz", None)
-            
-            # Get non-cover text input ids and attention masks from batch if available
-            non_cover_text_input_ids = batch.get("non_cover_text_input_ids", None)
-            non_cover_text_attention_masks = batch.get("non_cover_text_attention_masks", None)
-            non_cover_text_hidden_states = None
-            if non_cover_text_input_ids is not None:
-                logger.info("[preprocess_batch] Inferring non-cover text embeddings...")
-                non_cover_text_hidden_states = self.infer_text_embeddings(non_cover_text_input_ids)
+        # Get precomputed hints from batch if available
+        precomputed_lm_hints_25Hz = batch.get("precomputed_lm_hints_25Hz", None)
+
+        # Get non-cover text input ids and attention masks from batch if available
+        non_cover_text_input_ids = batch.get("non_cover_text_input_ids", None)
+        non_cover_text_attention_masks = batch.get("non_cover_text_attention_masks", None)
+        non_cover_text_hidden_states = None
+
+        logger.info("[preprocess_batch] Inferring prompt and lyric embeddings...")
+        embedding_requests = [
+            ("text", text_token_idss, text_attention_mask),
+            ("lyric", lyric_token_idss, lyric_attention_mask),
+        ]
+        if non_cover_text_input_ids is not None:
+            embedding_requests.append(("text", non_cover_text_input_ids, non_cover_text_attention_masks))
+        embeddings = self._infer_embeddings_cached(embedding_requests)
+        text_hidden_states, lyric_hidden_states = embeddings[0], embeddings[1]
+        if non_cover_text_input_ids is not None:
+            non_cover_text_hidden_states = embeddings[2]
 
         return (
             keys,
@@ -2161,6 +2463,7 @@ class AceStepHandler:
         audio_code_hints: Optional[Union[str, List[str]]] = None,
         infer_method: str = "ode",
         timesteps: Optional[List[float]] = None,
+        target_wav_lengths: Optional[List[int]] = None,
     ) -> Dict[str, Any]:
 
         """
@@ -2185,6 +2488,7 @@ class AceStepHandler:
             use_adg: Whether to use ADG (Adaptive Diffusion Guidance) (default: False)
             cfg_interval_start: Start of CFG interval (0.0-1.0, default: 0.0)
             cfg_interval_end: End of CFG interval (0.0-1.0, default: 1.0)
+            target_wav_lengths: Real frame count of each item of a zero-padded target_wavs (optional)
             
         Returns:
             Dictionary containing:
@@ -2265,6 +2569,7 @@ class AceStepHandler:
             instructions=instructions,
             audio_code_hints=audio_code_hints,
             audio_cover_strength=audio_cover_strength,
+            target_wav_lengths=target_wav_lengths,
         )
         
         processed_data = self.preprocess_batch(batch)
@@ -2330,8 +2635,17 @@ class AceStepHandler:
         # Add custom timesteps if provided (convert to tensor)
         if timesteps is not None:
             generate_kwargs["timesteps"] = torch.tensor(timesteps, dtype=torch.float32)
+        # Padded frames (batch and length bucket) are masked out of attention
+        latent_masks = batch.get("latent_masks")
+        if latent_masks is not None:
+            latent_attention_mask = latent_masks.to(src_latents.device, src_latents.dtype)
+        else:
+            latent_attention_mask = torch.ones(src_latents.shape[0], src_latents.shape[1], device=src_latents.device, dtype=src_latents.dtype)
+        if self._generate_audio_accepts("attention_mask"):
+            generate_kwargs["attention_mask"] = latent_attention_mask
         logger.info("[service_generate] Generating audio...")
         with self._load_model_context("model"):
+            check_cancelled()
             # Prepare condition tensors first (for LRC timestamp generation)
             encoder_hidden_states, encoder_attention_mask, context_latents = self.model.prepare_condition(
                 text_hidden_states=text_hidden_states,
@@ -2341,7 +2655,7 @@ class AceStepHandler:
                 refer_audio_acoustic_hidden_states_packed=refer_audio_acoustic_hidden_states_packed,
                 refer_audio_order_mask=refer_audio_order_mask,
                 hidden_states=src_latents,
-                attention_mask=torch.ones(src_latents.shape[0], src_latents.shape[1], device=src_latents.device, dtype=src_latents.dtype),
+                attention_mask=latent_attention_mask,
                 silence_latent=self.silence_latent,
                 src_latents=src_latents,
                 chunk_masks=chunk_mask,
@@ -2349,7 +2663,17 @@ class AceStepHandler:
                 precomputed_lm_hints_25Hz=precomputed_lm_hints_25Hz,
             )
             
-            outputs = self.model.generate_audio(**generate_kwargs)
+            # The diffusion loop lives in the model: check for cancellation before every
+            # decoder forward, i.e. between diffusion steps
+            cancel_hook = None
+            if current_token() is not None:
+                cancel_hook = self.model.decoder.register_forward_pre_hook(lambda module, args: check_cancelled())
+            try:
+                with self._bucketed_decoder(src_latents.shape[0], src_latents.shape[1]):
+                    outputs = self.model.generate_audio(**generate_kwargs)
+            finally:
+                if cancel_hook is not None:
+                    cancel_hook.remove()
         
         # Add intermediate information to outputs for extra_outputs
         outputs["src_latents"] = src_latents
@@ -2363,10 +2687,27 @@ class AceStepHandler:
         outputs["encoder_attention_mask"] = encoder_attention_mask
         outputs["context_latents"] = context_latents
         outputs["lyric_token_idss"] = lyric_token_idss
+
+        # Drop the length-bucket padding: outputs keep the shapes of an unbucketed batch
+        if latent_masks is not None:
+            valid_length = max(128, int(latent_masks.sum(dim=1).max().item()))
+            if valid_length < src_latents.shape[1]:
+                for name in ("target_latents", "src_latents", "target_latents_input", "chunk_masks", "latent_masks", "context_latents"):
+                    value = outputs.get(name)
+                    if isinstance(value, torch.Tensor) and value.dim() >= 2 and value.shape[1] == src_latents.shape[1]:
+                        outputs[name] = value[:, :valid_length]
         
         return outputs
 
-    def tiled_decode(self, latents, chunk_size=512, overlap=64, offload_wav_to_cpu=True):
+    def _generate_audio_accepts(self, name: str) -> bool:
+        """Whether the (remote-code) generate_audio of the DiT takes keyword argument name."""
+        model = getattr(self.model, "_orig_mod", self.model)
+        try:
+            return name in inspect.signature(type(model).generate_audio).parameters
+        except (AttributeError, TypeError, ValueError):
+            return False
+
+    def tiled_decode(self, latents, chunk_size=512, overlap=64, offload_wav_to_cpu=True, chunk_callback=None):
         """
         Decode latents using tiling to reduce VRAM usage.
         Uses overlap-discard strategy to avoid boundary artifacts.
@@ -2376,15 +2717,20 @@ class AceStepHandler:
             chunk_size: Size of latent chunk to process at once
             overlap: Overlap size in latent frames
             offload_wav_to_cpu: If True, offload decoded wav audio to CPU immediately to save VRAM
+            chunk_callback: Optional callable receiving each trimmed core chunk
+                ([Batch, Channels, Samples] float32 on CPU) in order, as soon as it is decoded.
+                Used for streaming audio out while the rest is still decoding.
         """
         B, C, T = latents.shape
         
+        check_cancelled()
         # If short enough, decode directly
         if T <= chunk_size:
             # Decode and immediately extract .sample to avoid keeping DecoderOutput object
             decoder_output = self.vae.decode(latents)
             result = decoder_output.sample
             del decoder_output
+            self._emit_decoded_chunk(chunk_callback, result)
             return result
 
         # Calculate stride (core size)
@@ -2396,37 +2742,98 @@ class AceStepHandler:
         
         if offload_wav_to_cpu:
             # Optimized path: offload wav to CPU immediately to save VRAM
-            return self._tiled_decode_offload_cpu(latents, B, T, stride, overlap, num_steps)
+            return self._tiled_decode_offload_cpu(latents, B, T, stride, overlap, num_steps, chunk_callback)
         else:
             # Default path: keep everything on GPU
-            return self._tiled_decode_gpu(latents, B, T, stride, overlap, num_steps)
+            return self._tiled_decode_gpu(latents, B, T, stride, overlap, num_steps, chunk_callback)
     
-    def _tiled_decode_gpu(self, latents, B, T, stride, overlap, num_steps):
-        """Standard tiled decode keeping all data on GPU."""
-        decoded_audio_list = []
-        upsample_factor = None
-        
-        for i in tqdm(range(num_steps), desc="Decoding audio chunks"):
+    @staticmethod
+    def _emit_decoded_chunk(chunk_callback, audio_core):
+        """Hand a decoded core chunk to the streaming callback; callback errors never break decoding."""
+        if chunk_callback is None or audio_core.shape[-1] == 0:
+            return
+        try:
+            chunk_callback(audio_core.detach().float().cpu())
+        except Exception as e:
+            logger.warning(f"[tiled_decode] chunk callback failed: {e}")
+
+    def _decode_windows_per_call(self, latents, window_frames: int) -> int:
+        """
+        How many [Batch, Channels, window_frames] windows to stack into one VAE decode call.
+
+        Sized so the decoder activations (estimated at VAE_DECODE_BYTES_PER_SAMPLE per
+        output sample and batch item) fit in half the free device memory; capped by
+        tiled_decode_max_windows. Devices without a memory query decode one at a time.
+        """
+        max_windows = max(1, int(self.tiled_decode_max_windows))
+        if max_windows == 1 or latents.device.type != "cuda":
+            return 1
+        try:
+            free_bytes, _ = torch.cuda.mem_get_info(latents.device)
+        except Exception:
+            return 1
+        per_window = latents.shape[0] * window_frames * 1920 * VAE_DECODE_BYTES_PER_SAMPLE
+        return max(1, min(max_windows, int(free_bytes * 0.5 // per_window)))
+
+    def _iter_decoded_windows(self, latents, T, stride, overlap, num_steps):
+        """
+        Decode the overlapping windows of tiled_decode in order.
+
+        Yields (audio_chunk, core_start, core_end, win_start, win_end) per window. Runs
+        of consecutive windows with the same length (all interior windows) are stacked
+        along the batch dimension and decoded in one call; the VAE treats batch items
+        independently, so each window decodes exactly as it would on its own.
+        """
+        windows = []
+        for i in range(num_steps):
             # Core range in latents
             core_start = i * stride
             core_end = min(core_start + stride, T)
-            
             # Window range (with overlap)
             win_start = max(0, core_start - overlap)
             win_end = min(T, core_end + overlap)
-            
-            # Extract chunk
-            latent_chunk = latents[:, :, win_start:win_end]
-            
+            windows.append((core_start, core_end, win_start, win_end))
+
+        B = latents.shape[0]
+        per_call = self._decode_windows_per_call(latents, stride + 2 * overlap)
+        i = 0
+        while i < num_steps:
+            check_cancelled()
+            length = windows[i][3] - windows[i][2]
+            group = [windows[i]]
+            # The first window is decoded alone: streaming gets its first chunk right away
+            while (
+                i > 0
+                and i + len(group) < num_steps
+                and len(group) < per_call
+                and windows[i + len(group)][3] - windows[i + len(group)][2] == length
+            ):
+                group.append(windows[i + len(group)])
+
+            # Extract chunks; [len(group) * Batch, Channels, length]
+            latent_chunk = torch.cat([latents[:, :, w[2]:w[3]] for w in group], dim=0) if len(group) > 1 \
+                else latents[:, :, group[0][2]:group[0][3]]
             # Decode
             # [Batch, Channels, AudioSamples]
             decoder_output = self.vae.decode(latent_chunk)
-            audio_chunk = decoder_output.sample
-            del decoder_output
-            
+            audio_chunks = decoder_output.sample
+            del decoder_output, latent_chunk
+
+            for j, (core_start, core_end, win_start, win_end) in enumerate(group):
+                yield audio_chunks[j * B:(j + 1) * B], core_start, core_end, win_start, win_end
+            del audio_chunks
+            i += len(group)
+
+    def _tiled_decode_gpu(self, latents, B, T, stride, overlap, num_steps, chunk_callback=None):
+        """Standard tiled decode keeping all data on GPU."""
+        decoded_audio_list = []
+        upsample_factor = None
+        
+        windows = self._iter_decoded_windows(latents, T, stride, overlap, num_steps)
+        for audio_chunk, core_start, core_end, win_start, win_end in tqdm(windows, total=num_steps, desc="Decoding audio chunks"):
             # Determine upsample factor from the first chunk
             if upsample_factor is None:
-                upsample_factor = audio_chunk.shape[-1] / latent_chunk.shape[-1]
+                upsample_factor = audio_chunk.shape[-1] / (win_end - win_start)
             
             # Calculate trim amounts in audio samples
             # How much overlap was added at the start?
@@ -2443,88 +2850,66 @@ class AceStepHandler:
             
             audio_core = audio_chunk[:, :, trim_start:end_idx]
             decoded_audio_list.append(audio_core)
+            self._emit_decoded_chunk(chunk_callback, audio_core)
             
         # Concatenate
         final_audio = torch.cat(decoded_audio_list, dim=-1)
         return final_audio
     
-    def _tiled_decode_offload_cpu(self, latents, B, T, stride, overlap, num_steps):
-        """Optimized tiled decode that offloads to CPU immediately to save VRAM."""
-        # First pass: decode first chunk to get upsample_factor and audio channels
-        first_core_start = 0
-        first_core_end = min(stride, T)
-        first_win_start = 0
-        first_win_end = min(T, first_core_end + overlap)
-        
-        first_latent_chunk = latents[:, :, first_win_start:first_win_end]
-        first_decoder_output = self.vae.decode(first_latent_chunk)
-        first_audio_chunk = first_decoder_output.sample
-        del first_decoder_output
-        
-        upsample_factor = first_audio_chunk.shape[-1] / first_latent_chunk.shape[-1]
-        audio_channels = first_audio_chunk.shape[1]
-        
-        # Calculate total audio length and pre-allocate CPU tensor
-        total_audio_length = int(round(T * upsample_factor))
-        final_audio = torch.zeros(B, audio_channels, total_audio_length, 
-                                  dtype=first_audio_chunk.dtype, device='cpu')
-        
-        # Process first chunk: trim and copy to CPU
-        first_added_end = first_win_end - first_core_end
-        first_trim_end = int(round(first_added_end * upsample_factor))
-        first_audio_len = first_audio_chunk.shape[-1]
-        first_end_idx = first_audio_len - first_trim_end if first_trim_end > 0 else first_audio_len
-        
-        first_audio_core = first_audio_chunk[:, :, :first_end_idx]
-        audio_write_pos = first_audio_core.shape[-1]
-        final_audio[:, :, :audio_write_pos] = first_audio_core.cpu()
-        
-        # Free GPU memory
-        del first_audio_chunk, first_audio_core, first_latent_chunk
-        
-        # Process remaining chunks
-        for i in tqdm(range(1, num_steps), desc="Decoding audio chunks"):
-            # Core range in latents
-            core_start = i * stride
-            core_end = min(core_start + stride, T)
-            
-            # Window range (with overlap)
-            win_start = max(0, core_start - overlap)
-            win_end = min(T, core_end + overlap)
-            
-            # Extract chunk
-            latent_chunk = latents[:, :, win_start:win_end]
-            
-            # Decode on GPU
-            # [Batch, Channels, AudioSamples]
-            decoder_output = self.vae.decode(latent_chunk)
-            audio_chunk = decoder_output.sample
-            del decoder_output
-            
-            # Calculate trim amounts in audio samples
-            added_start = core_start - win_start  # latent frames
-            trim_start = int(round(added_start * upsample_factor))
-            
-            added_end = win_end - core_end  # latent frames
-            trim_end = int(round(added_end * upsample_factor))
-            
-            # Trim audio
-            audio_len = audio_chunk.shape[-1]
-            end_idx = audio_len - trim_end if trim_end > 0 else audio_len
-            
-            audio_core = audio_chunk[:, :, trim_start:end_idx]
-            
-            # Copy to pre-allocated CPU tensor
-            core_len = audio_core.shape[-1]
-            final_audio[:, :, audio_write_pos:audio_write_pos + core_len] = audio_core.cpu()
-            audio_write_pos += core_len
-            
-            # Free GPU memory immediately
-            del audio_chunk, audio_core, latent_chunk
-        
+    def _tiled_decode_offload_cpu(self, latents, B, T, stride, overlap, num_steps, chunk_callback=None):
+        """
+        Optimized tiled decode that offloads to CPU immediately to save VRAM.
+
+        Decoded cores go through a HostTransferPipeline: the next window decodes
+        while the previous core is copied to pinned memory, written into
+        final_audio and streamed by the copy worker.
+        """
+        final_audio = None
+        upsample_factor = None
+        audio_write_pos = 0
+
+        def _write_core(host_core, pos):
+            end = pos + host_core.shape[-1]
+            final_audio[:, :, pos:end] = host_core
+            self._emit_decoded_chunk(chunk_callback, final_audio[:, :, pos:end])
+
+        windows = self._iter_decoded_windows(latents, T, stride, overlap, num_steps)
+        with HostTransferPipeline(latents.device) as transfer:
+            for audio_chunk, core_start, core_end, win_start, win_end in tqdm(windows, total=num_steps, desc="Decoding audio chunks"):
+                if final_audio is None:
+                    # First chunk: get upsample_factor and audio channels
+                    upsample_factor = audio_chunk.shape[-1] / (win_end - win_start)
+                    audio_channels = audio_chunk.shape[1]
+
+                    # Calculate total audio length and pre-allocate CPU tensor
+                    total_audio_length = int(round(T * upsample_factor))
+                    final_audio = torch.zeros(B, audio_channels, total_audio_length,
+                                              dtype=audio_chunk.dtype, device='cpu')
+
+                # Calculate trim amounts in audio samples
+                added_start = core_start - win_start  # latent frames
+                trim_start = int(round(added_start * upsample_factor))
+
+                added_end = win_end - core_end  # latent frames
+                trim_end = int(round(added_end * upsample_factor))
+
+                # Trim audio
+                audio_len = audio_chunk.shape[-1]
+                end_idx = audio_len - trim_end if trim_end > 0 else audio_len
+
+                audio_core = audio_chunk[:, :, trim_start:end_idx]
+
+                # Queue the copy into the pre-allocated CPU tensor
+                core_len = audio_core.shape[-1]
+                transfer.submit(audio_core, lambda host_core, pos=audio_write_pos: _write_core(host_core, pos))
+                audio_write_pos += core_len
+
+                # The copy stream keeps the GPU memory alive until the copy is done
+                del audio_chunk, audio_core
+
         # Trim to actual length (in case of rounding differences)
         final_audio = final_audio[:, :, :audio_write_pos]
-        
+
         return final_audio
     
     def tiled_encode(self, audio, chunk_size=None, overlap=None, offload_latent_to_cpu=True):
@@ -2591,6 +2976,7 @@ class AceStepHandler:
         downsample_factor = None
         
         for i in tqdm(range(num_steps), desc="Encoding audio chunks"):
+            check_cancelled()
             # Core range in audio samples
             core_start = i * stride
             core_end = min(core_start + stride, S)
@@ -2631,7 +3017,12 @@ class AceStepHandler:
         return final_latents
     
     def _tiled_encode_offload_cpu(self, audio, B, S, stride, overlap, num_steps, chunk_size):
-        """Optimized tiled encode that offloads latents to CPU immediately to save VRAM."""
+        """
+        Optimized tiled encode that offloads latents to CPU immediately to save VRAM.
+
+        Like _tiled_decode_offload_cpu, latent cores are copied back through a
+        HostTransferPipeline while the next chunk encodes.
+        """
         # First pass: encode first chunk to get downsample_factor and latent channels
         first_core_start = 0
         first_core_end = min(stride, S)
@@ -2649,57 +3040,62 @@ class AceStepHandler:
         total_latent_length = int(round(S / downsample_factor))
         final_latents = torch.zeros(B, latent_channels, total_latent_length, 
                                    dtype=first_latent_chunk.dtype, device='cpu')
-        
-        # Process first chunk: trim and copy to CPU
-        first_added_end = first_win_end - first_core_end
-        first_trim_end = int(round(first_added_end / downsample_factor))
-        first_latent_len = first_latent_chunk.shape[-1]
-        first_end_idx = first_latent_len - first_trim_end if first_trim_end > 0 else first_latent_len
-        
-        first_latent_core = first_latent_chunk[:, :, :first_end_idx]
-        latent_write_pos = first_latent_core.shape[-1]
-        final_latents[:, :, :latent_write_pos] = first_latent_core.cpu()
-        
-        # Free GPU memory
-        del first_audio_chunk, first_latent_chunk, first_latent_core
-        
-        # Process remaining chunks
-        for i in tqdm(range(1, num_steps), desc="Encoding audio chunks"):
-            # Core range in audio samples
-            core_start = i * stride
-            core_end = min(core_start + stride, S)
-            
-            # Window range (with overlap)
-            win_start = max(0, core_start - overlap)
-            win_end = min(S, core_end + overlap)
-            
-            # Extract chunk and move to GPU
-            audio_chunk = audio[:, :, win_start:win_end].to(self.device).to(self.vae.dtype)
-            
-            # Encode on GPU
-            with torch.no_grad():
-                latent_chunk = self.vae.encode(audio_chunk).latent_dist.sample()
-            
-            # Calculate trim amounts in latent frames
-            added_start = core_start - win_start  # audio samples
-            trim_start = int(round(added_start / downsample_factor))
-            
-            added_end = win_end - core_end  # audio samples
-            trim_end = int(round(added_end / downsample_factor))
-            
-            # Trim latent
-            latent_len = latent_chunk.shape[-1]
-            end_idx = latent_len - trim_end if trim_end > 0 else latent_len
-            
-            latent_core = latent_chunk[:, :, trim_start:end_idx]
-            
-            # Copy to pre-allocated CPU tensor
-            core_len = latent_core.shape[-1]
-            final_latents[:, :, latent_write_pos:latent_write_pos + core_len] = latent_core.cpu()
-            latent_write_pos += core_len
-            
-            # Free GPU memory immediately
-            del audio_chunk, latent_chunk, latent_core
+
+        def _write_core(host_core, pos):
+            final_latents[:, :, pos:pos + host_core.shape[-1]] = host_core
+
+        with HostTransferPipeline(first_latent_chunk.device) as transfer:
+            # Process first chunk: trim and copy to CPU
+            first_added_end = first_win_end - first_core_end
+            first_trim_end = int(round(first_added_end / downsample_factor))
+            first_latent_len = first_latent_chunk.shape[-1]
+            first_end_idx = first_latent_len - first_trim_end if first_trim_end > 0 else first_latent_len
+
+            first_latent_core = first_latent_chunk[:, :, :first_end_idx]
+            transfer.submit(first_latent_core, lambda host_core: _write_core(host_core, 0))
+            latent_write_pos = first_latent_core.shape[-1]
+
+            # Free GPU memory (once the copy is done)
+            del first_audio_chunk, first_latent_chunk, first_latent_core
+
+            # Process remaining chunks
+            for i in tqdm(range(1, num_steps), desc="Encoding audio chunks"):
+                check_cancelled()
+                # Core range in audio samples
+                core_start = i * stride
+                core_end = min(core_start + stride, S)
+
+                # Window range (with overlap)
+                win_start = max(0, core_start - overlap)
+                win_end = min(S, core_end + overlap)
+
+                # Extract chunk and move to GPU
+                audio_chunk = audio[:, :, win_start:win_end].to(self.device).to(self.vae.dtype)
+
+                # Encode on GPU
+                with torch.no_grad():
+                    latent_chunk = self.vae.encode(audio_chunk).latent_dist.sample()
+
+                # Calculate trim amounts in latent frames
+                added_start = core_start - win_start  # audio samples
+                trim_start = int(round(added_start / downsample_factor))
+
+                added_end = win_end - core_end  # audio samples
+                trim_end = int(round(added_end / downsample_factor))
+
+                # Trim latent
+                latent_len = latent_chunk.shape[-1]
+                end_idx = latent_len - trim_end if trim_end > 0 else latent_len
+
+                latent_core = latent_chunk[:, :, trim_start:end_idx]
+
+                # Queue the copy into the pre-allocated CPU tensor
+                core_len = latent_core.shape[-1]
+                transfer.submit(latent_core, lambda host_core, pos=latent_write_pos: _write_core(host_core, pos))
+                latent_write_pos += core_len
+
+                # Free GPU memory (once the copy is done)
+                del audio_chunk, latent_chunk, latent_core
         
         # Trim to actual length (in case of rounding differences)
         final_latents = final_latents[:, :, :latent_write_pos]
@@ -2735,10 +3131,15 @@ class AceStepHandler:
         infer_method: str = "ode",
         use_tiled_decode: bool = True,
         timesteps: Optional[List[float]] = None,
-        progress=None
+        progress=None,
+        audio_chunk_callback=None,
     ) -> Dict[str, Any]:
         """
         Main interface for music generation
+
+        audio_chunk_callback, if given, receives each decoded audio chunk
+        ([batch, channels, samples] float32 on CPU) while the VAE decode runs;
+        it forces tiled decode.
         
         Returns:
             Dictionary containing:
@@ -2762,21 +3163,6 @@ class AceStepHandler:
                 "error": "Model not fully initialized",
             }
 
-        def _has_audio_codes(v: Union[str, List[str]]) -> bool:
-            if isinstance(v, list):
-                return any((x or "").strip() for x in v)
-            return bool(v and str(v).strip())
-
-        # Auto-detect task type based on audio_code_string
-        # If audio_code_string is provided and not empty, use cover task
-        # Otherwise, use text2music task (or keep current task_type if not text2music)
-        if task_type == "text2music":
-            if _has_audio_codes(audio_code_string):
-                # User has provided audio codes, switch to cover task
-                task_type = "cover"
-                # Update instruction for cover task
-                instruction = TASK_INSTRUCTIONS["cover"]
-
         logger.info("[generate_music] Starting generation...")
         if progress:
             progress(0.51, desc="Preparing inputs...")
@@ -2791,156 +3177,56 @@ class AceStepHandler:
         actual_batch_size = max(1, actual_batch_size)  # Ensure at least 1
 
         actual_seed_list, seed_value_for_ui = self.prepare_seeds(actual_batch_size, seed, use_random_seed)
-        
-        # Convert special values to None
-        if audio_duration is not None and float(audio_duration) <= 0:
-            audio_duration = None
-        # if seed is not None and seed < 0:
-        #     seed = None
-        if repainting_end is not None and float(repainting_end) < 0:
-            repainting_end = None
             
         try:
-            # 1. Process reference audio
-            refer_audios = None
-            if reference_audio is not None:
-                logger.info("[generate_music] Processing reference audio...")
-                processed_ref_audio = self.process_reference_audio(reference_audio)
-                if processed_ref_audio is not None:
-                    # Convert to the format expected by the service: List[List[torch.Tensor]]
-                    # Each batch item has a list of reference audios
-                    refer_audios = [[processed_ref_audio] for _ in range(actual_batch_size)]
-            else:
-                refer_audios = [[torch.zeros(2, 30*self.sample_rate)] for _ in range(actual_batch_size)]
-            
-            # 2. Process source audio
-            # If audio_code_string is provided, ignore src_audio and use codes instead
-            processed_src_audio = None
-            if src_audio is not None:
-                # Check if audio codes are provided - if so, ignore src_audio
-                if _has_audio_codes(audio_code_string):
-                    logger.info("[generate_music] Audio codes provided, ignoring src_audio and using codes instead")
-                else:
-                    logger.info("[generate_music] Processing source audio...")
-                    processed_src_audio = self.process_src_audio(src_audio)
-                
-            # 3. Prepare batch data
-            captions_batch, instructions_batch, lyrics_batch, vocal_languages_batch, metas_batch = self.prepare_batch_data(
-                actual_batch_size,
-                processed_src_audio,
-                audio_duration,
-                captions,
-                lyrics,
-                vocal_language,
-                instruction,
-                bpm,
-                key_scale,
-                time_signature
-            )
-            
-            is_repaint_task, is_lego_task, is_cover_task, can_use_repainting = self.determine_task_type(task_type, audio_code_string)
-            
-            repainting_start_batch, repainting_end_batch, target_wavs_tensor = self.prepare_padding_info(
-                actual_batch_size,
-                processed_src_audio,
-                audio_duration,
-                repainting_start,
-                repainting_end,
-                is_repaint_task,
-                is_lego_task,
-                is_cover_task,
-                can_use_repainting
+            inputs = self._prepare_generation_inputs(
+                captions=captions,
+                lyrics=lyrics,
+                bpm=bpm,
+                key_scale=key_scale,
+                time_signature=time_signature,
+                vocal_language=vocal_language,
+                reference_audio=reference_audio,
+                audio_duration=audio_duration,
+                actual_batch_size=actual_batch_size,
+                src_audio=src_audio,
+                audio_code_string=audio_code_string,
+                repainting_start=repainting_start,
+                repainting_end=repainting_end,
+                instruction=instruction,
+                task_type=task_type,
             )
             
             progress(0.52, desc=f"Generating music (batch size: {actual_batch_size})...")
-            
-            # Prepare audio_code_hints - use if audio_code_string is provided
-            # This works for both text2music (auto-switched to cover) and cover tasks
-            audio_code_hints_batch = None
-            if _has_audio_codes(audio_code_string):
-                if isinstance(audio_code_string, list):
-                    audio_code_hints_batch = audio_code_string
-                else:
-                    audio_code_hints_batch = [audio_code_string] * actual_batch_size
-
-            should_return_intermediate = (task_type == "text2music")
-            outputs = self.service_generate(
-                captions=captions_batch,
-                lyrics=lyrics_batch,
-                metas=metas_batch,  # Pass as dict, service will convert to string
-                vocal_languages=vocal_languages_batch,
-                refer_audios=refer_audios,  # Already in List[List[torch.Tensor]] format
-                target_wavs=target_wavs_tensor,  # Shape: [batch_size, 2, frames]
+
+            should_return_intermediate = (inputs["task_type"] == "text2music")
+            pred_wavs, outputs, time_costs, pred_latents_cpu = self._service_generate_and_decode(
+                use_tiled_decode=use_tiled_decode,
+                progress=progress,
+                chunk_callback=audio_chunk_callback,
+                captions=inputs["captions"],
+                lyrics=inputs["lyrics"],
+                metas=inputs["metas"],  # Pass as dict, service will convert to string
+                vocal_languages=inputs["vocal_languages"],
+                refer_audios=inputs["refer_audios"],  # Already in List[List[torch.Tensor]] format
+                target_wavs=inputs["target_wavs"],  # Shape: [batch_size, 2, frames]
                 infer_steps=inference_steps,
                 guidance_scale=guidance_scale,
                 seed=actual_seed_list,  # Pass list of seeds, one per batch item
-                repainting_start=repainting_start_batch,
-                repainting_end=repainting_end_batch,
-                instructions=instructions_batch,  # Pass instructions to service
+                repainting_start=inputs["repainting_start"],
+                repainting_end=inputs["repainting_end"],
+                instructions=inputs["instructions"],  # Pass instructions to service
                 audio_cover_strength=audio_cover_strength,  # Pass audio cover strength
                 use_adg=use_adg,  # Pass use_adg parameter
                 cfg_interval_start=cfg_interval_start,  # Pass CFG interval start
                 cfg_interval_end=cfg_interval_end,  # Pass CFG interval end
                 shift=shift,  # Pass shift parameter
                 infer_method=infer_method,  # Pass infer method (ode or sde)
-                audio_code_hints=audio_code_hints_batch,  # Pass audio code hints as list
+                audio_code_hints=inputs["audio_code_hints"],  # Pass audio code hints as list
                 return_intermediate=should_return_intermediate,
                 timesteps=timesteps,  # Pass custom timesteps if provided
             )
             
-            logger.info("[generate_music] Model generation completed. Decoding latents...")
-            pred_latents = outputs["target_latents"]  # [batch, latent_length, latent_dim]
-            time_costs = outputs["time_costs"]
-            time_costs["offload_time_cost"] = self.current_offload_cost
-            logger.debug(f"[generate_music] pred_latents: {pred_latents.shape}, dtype={pred_latents.dtype} {pred_latents.min()=}, {pred_latents.max()=}, {pred_latents.mean()=} {pred_latents.std()=}")
-            logger.debug(f"[generate_music] time_costs: {time_costs}")
-            if progress:
-                progress(0.8, desc="Decoding audio...")
-            logger.info("[generate_music] Decoding latents with VAE...")
-            
-            # Decode latents to audio
-            start_time = time.time()
-            with torch.no_grad():
-                with self._load_model_context("vae"):
-                    # Move pred_latents to CPU early to save VRAM (will be used in extra_outputs later)
-                    pred_latents_cpu = pred_latents.detach().cpu()
-                    
-                    # Transpose for VAE decode: [batch, latent_length, latent_dim] -> [batch, latent_dim, latent_length]
-                    pred_latents_for_decode = pred_latents.transpose(1, 2).contiguous()
-                    # Ensure input is in VAE's dtype
-                    pred_latents_for_decode = pred_latents_for_decode.to(self.vae.dtype)
-                    
-                    # Release original pred_latents to free VRAM before VAE decode
-                    del pred_latents
-                    torch.cuda.empty_cache()
-                    
-                    logger.debug(f"[generate_music] Before VAE decode: allocated={torch.cuda.memory_allocated()/1024**3:.2f}GB, max={torch.cuda.max_memory_allocated()/1024**3:.2f}GB")
-                    
-                    if use_tiled_decode:
-                        logger.info("[generate_music] Using tiled VAE decode to reduce VRAM usage...")
-                        pred_wavs = self.tiled_decode(pred_latents_for_decode)  # [batch, channels, samples]
-                    else:
-                        decoder_output = self.vae.decode(pred_latents_for_decode)
-                        pred_wavs = decoder_output.sample
-                        del decoder_output
-                    
-                    logger.debug(f"[generate_music] After VAE decode: allocated={torch.cuda.memory_allocated()/1024**3:.2f}GB, max={torch.cuda.max_memory_allocated()/1024**3:.2f}GB")
-                    
-                    # Release pred_latents_for_decode after decode
-                    del pred_latents_for_decode
-                    
-                    # Cast output to float32 for audio processing/saving (in-place if possible)
-                    if pred_wavs.dtype != torch.float32:
-                        pred_wavs = pred_wavs.float()
-                    
-                    torch.cuda.empty_cache()
-            end_time = time.time()
-            time_costs["vae_decode_time_cost"] = end_time - start_time
-            time_costs["total_time_cost"] = time_costs["total_time_cost"] + time_costs["vae_decode_time_cost"]
-            
-            # Update offload cost one last time to include VAE offloading
-            time_costs["offload_time_cost"] = self.current_offload_cost
-            
             logger.info("[generate_music] VAE decode completed. Preparing audio tensors...")
             if progress:
                 progress(0.99, desc="Preparing audio data...")
@@ -2958,35 +3244,7 @@ class AceStepHandler:
             status_message = f"✅ Generation completed successfully!"
             logger.info(f"[generate_music] Done! Generated {len(audio_tensors)} audio tensors.")
             
-            # Extract intermediate information from outputs
-            src_latents = outputs.get("src_latents")  # [batch, T, D]
-            target_latents_input = outputs.get("target_latents_input")  # [batch, T, D]
-            chunk_masks = outputs.get("chunk_masks")  # [batch, T]
-            spans = outputs.get("spans", [])  # List of tuples
-            latent_masks = outputs.get("latent_masks")  # [batch, T]
-            
-            # Extract condition tensors for LRC timestamp generation
-            encoder_hidden_states = outputs.get("encoder_hidden_states")
-            encoder_attention_mask = outputs.get("encoder_attention_mask")
-            context_latents = outputs.get("context_latents")
-            lyric_token_idss = outputs.get("lyric_token_idss")
-            
-            # Move all tensors to CPU to save VRAM (detach to release computation graph)
-            extra_outputs = {
-                "pred_latents": pred_latents_cpu,  # Already moved to CPU earlier to save VRAM during VAE decode
-                "target_latents": target_latents_input.detach().cpu() if target_latents_input is not None else None,
-                "src_latents": src_latents.detach().cpu() if src_latents is not None else None,
-                "chunk_masks": chunk_masks.detach().cpu() if chunk_masks is not None else None,
-                "latent_masks": latent_masks.detach().cpu() if latent_masks is not None else None,
-                "spans": spans,
-                "time_costs": time_costs,
-                "seed_value": seed_value_for_ui,
-                # Condition tensors for LRC timestamp generation
-                "encoder_hidden_states": encoder_hidden_states.detach().cpu() if encoder_hidden_states is not None else None,
-                "encoder_attention_mask": encoder_attention_mask.detach().cpu() if encoder_attention_mask is not None else None,
-                "context_latents": context_latents.detach().cpu() if context_latents is not None else None,
-                "lyric_token_idss": lyric_token_idss.detach().cpu() if lyric_token_idss is not None else None,
-            }
+            extra_outputs = self._build_extra_outputs(outputs, pred_latents_cpu, time_costs, seed_value_for_ui)
             
             # Build audios list with tensor data (no file paths, no UUIDs, handled outside)
             audios = []
@@ -3016,6 +3274,387 @@ class AceStepHandler:
                 "error": str(e),
             }
 
+    def generate_music_batch(
+        self,
+        items: List[Dict[str, Any]],
+        inference_steps: int = 8,
+        guidance_scale: float = 7.0,
+        audio_cover_strength: float = 1.0,
+        use_adg: bool = False,
+        cfg_interval_start: float = 0.0,
+        cfg_interval_end: float = 1.0,
+        shift: float = 1.0,
+        infer_method: str = "ode",
+        use_tiled_decode: bool = True,
+        timesteps: Optional[List[float]] = None,
+        progress=None
+    ) -> List[Dict[str, Any]]:
+        """
+        Generate several independent requests in a single DiT batch.
+
+        Each item is a dict holding the per-request arguments of generate_music:
+        captions, lyrics, bpm, key_scale, time_signature, vocal_language,
+        reference_audio, audio_duration, batch_size, seeds (list of ints),
+        audio_code_string, instruction and task_type. Sampler settings are shared
+        by the whole batch. Requests with source audio (cover/repaint/lego on an
+        uploaded track) are not supported here and should use generate_music.
+
+        Returns:
+            One result dict per item, in the same format as generate_music.
+        """
+        if progress is None:
+            def progress(*args, **kwargs):
+                pass
+
+        def _error_results(msg: str, error: str) -> List[Dict[str, Any]]:
+            return [{
+                "audios": [],
+                "status_message": msg,
+                "extra_outputs": {},
+                "success": False,
+                "error": error,
+            } for _ in items]
+
+        if self.model is None or self.vae is None or self.text_tokenizer is None or self.text_encoder is None:
+            return _error_results(
+                "❌ Model not fully initialized. Please initialize all components first.",
+                "Model not fully initialized",
+            )
+        if not items:
+            return []
+
+        logger.info(f"[generate_music_batch] Starting batched generation for {len(items)} requests...")
+        self.current_offload_cost = 0.0
+
+        try:
+            captions_all, lyrics_all, metas_all, languages_all, instructions_all = [], [], [], [], []
+            refer_audios_all, target_wavs_all, seeds_all, code_hints_all = [], [], [], []
+            segments = []  # (start, end, seed_value_for_ui)
+            any_text2music = False
+            for item in items:
+                item_batch_size = max(1, int(item.get("batch_size") or 1))
+                item_seeds = item.get("seeds")
+                if item_seeds:
+                    item_seed_list, item_seed_ui = self.prepare_seeds(
+                        item_batch_size, ",".join(str(s) for s in item_seeds), use_random_seed=False)
+                else:
+                    item_seed_list, item_seed_ui = self.prepare_seeds(item_batch_size, -1, use_random_seed=True)
+
+                inputs = self._prepare_generation_inputs(
+                    captions=item.get("captions", ""),
+                    lyrics=item.get("lyrics", ""),
+                    bpm=item.get("bpm"),
+                    key_scale=item.get("key_scale", ""),
+                    time_signature=item.get("time_signature", ""),
+                    vocal_language=item.get("vocal_language", "en"),
+                    reference_audio=item.get("reference_audio"),
+                    audio_duration=item.get("audio_duration"),
+                    actual_batch_size=item_batch_size,
+                    src_audio=None,
+                    audio_code_string=item.get("audio_code_string", ""),
+                    repainting_start=0.0,
+                    repainting_end=None,
+                    instruction=item.get("instruction", DEFAULT_DIT_INSTRUCTION),
+                    task_type=item.get("task_type", "text2music"),
+                )
+                any_text2music = any_text2music or inputs["task_type"] == "text2music"
+
+                start = len(captions_all)
+                captions_all.extend(inputs["captions"])
+                lyrics_all.extend(inputs["lyrics"])
+                metas_all.extend(inputs["metas"])
+                languages_all.extend(inputs["vocal_languages"])
+                instructions_all.extend(inputs["instructions"])
+                refer_audios_all.extend(inputs["refer_audios"])
+                target_wavs_all.append(inputs["target_wavs"])
+                seeds_all.extend(item_seed_list)
+                code_hints_all.extend(inputs["audio_code_hints"] or [None] * item_batch_size)
+                segments.append((start, len(captions_all), item_seed_ui))
+
+            # Requests may ask for different durations: pad every target to the longest one.
+            # The real lengths go to _prepare_batch so the latent masks (and the trim below)
+            # follow each request's own duration rather than the padded one.
+            target_wav_lengths = [wavs.shape[-1] for wavs in target_wavs_all for _ in range(wavs.shape[0])]
+            max_frames = max(wavs.shape[-1] for wavs in target_wavs_all)
+            target_wavs_tensor = torch.cat([
+                torch.nn.functional.pad(wavs, (0, max_frames - wavs.shape[-1]), "constant", 0)
+                for wavs in target_wavs_all
+            ], dim=0)
+            audio_code_hints = code_hints_all if any(code_hints_all) else None
+
+            progress(0.52, desc=f"Generating music (batch size: {len(captions_all)})...")
+            pred_wavs, outputs, time_costs, pred_latents_cpu = self._service_generate_and_decode(
+                use_tiled_decode=use_tiled_decode,
+                progress=progress,
+                captions=captions_all,
+                lyrics=lyrics_all,
+                metas=metas_all,
+                vocal_languages=languages_all,
+                refer_audios=refer_audios_all,
+                target_wavs=target_wavs_tensor,
+                infer_steps=inference_steps,
+                guidance_scale=guidance_scale,
+                seed=seeds_all,
+                repainting_start=None,
+                repainting_end=None,
+                instructions=instructions_all,
+                audio_cover_strength=audio_cover_strength,
+                use_adg=use_adg,
+                cfg_interval_start=cfg_interval_start,
+                cfg_interval_end=cfg_interval_end,
+                shift=shift,
+                infer_method=infer_method,
+                audio_code_hints=audio_code_hints,
+                return_intermediate=any_text2music,
+                timesteps=timesteps,
+                target_wav_lengths=target_wav_lengths,
+            )
+
+            latent_masks = outputs.get("latent_masks")
+            upsample_factor = pred_wavs.shape[-1] // latent_masks.shape[1] if latent_masks is not None else None
+
+            results = []
+            for start, end, seed_value_for_ui in segments:
+                audio_len = pred_wavs.shape[-1]
+                if upsample_factor:
+                    valid_latent_length = int(latent_masks[start:end].sum(dim=1).max().item())
+                    audio_len = min(audio_len, valid_latent_length * upsample_factor)
+                audios = [
+                    {
+                        "tensor": pred_wavs[i, :, :audio_len].cpu().float(),
+                        "sample_rate": self.sample_rate,
+                    }
+                    for i in range(start, end)
+                ]
+                extra_outputs = self._build_extra_outputs(
+                    outputs, pred_latents_cpu, dict(time_costs), seed_value_for_ui, batch_slice=slice(start, end))
+                results.append({
+                    "audios": audios,
+                    "status_message": f"✅ Generation completed successfully! (batched with {len(items) - 1} other request(s))",
+                    "extra_outputs": extra_outputs,
+                    "success": True,
+                    "error": None,
+                })
+            logger.info(f"[generate_music_batch] Done! Generated {len(captions_all)} audio tensors for {len(items)} requests.")
+            return results
+
+        except Exception as e:
+            logger.exception("[generate_music_batch] Batched generation failed")
+            return _error_results(f"❌ Error: {str(e)}\n{traceback.format_exc()}", str(e))
+
+    def _prepare_generation_inputs(
+        self,
+        captions: str,
+        lyrics: str,
+        bpm: Optional[int],
+        key_scale: str,
+        time_signature: str,
+        vocal_language: str,
+        reference_audio,
+        audio_duration: Optional[float],
+        actual_batch_size: int,
+        src_audio,
+        audio_code_string: Union[str, List[str]],
+        repainting_start: float,
+        repainting_end: Optional[float],
+        instruction: str,
+        task_type: str,
+    ) -> Dict[str, Any]:
+        """
+        Turn the user-facing arguments of generate_music into per-item batch inputs
+        for service_generate (reference audio, source audio, metas, target wavs, code hints).
+        """
+        def _has_audio_codes(v: Union[str, AudioCodes, List[Any]]) -> bool:
+            if isinstance(v, list):
+                return any(x if isinstance(x, AudioCodes) else (x or "").strip() for x in v)
+            return bool(v) if isinstance(v, AudioCodes) else bool(v and str(v).strip())
+
+        # Auto-detect task type based on audio_code_string
+        # If audio_code_string is provided and not empty, use cover task
+        # Otherwise, use text2music task (or keep current task_type if not text2music)
+        if task_type == "text2music":
+            if _has_audio_codes(audio_code_string):
+                # User has provided audio codes, switch to cover task
+                task_type = "cover"
+                # Update instruction for cover task
+                instruction = TASK_INSTRUCTIONS["cover"]
+
+        # Convert special values to None
+        if audio_duration is not None and float(audio_duration) <= 0:
+            audio_duration = None
+        if repainting_end is not None and float(repainting_end) < 0:
+            repainting_end = None
+
+        # 1. Process reference audio
+        refer_audios = None
+        if reference_audio is not None:
+            logger.info("[generate_music] Processing reference audio...")
+            processed_ref_audio = self.process_reference_audio(reference_audio)
+            if processed_ref_audio is not None:
+                # Convert to the format expected by the service: List[List[torch.Tensor]]
+                # Each batch item has a list of reference audios
+                refer_audios = [[processed_ref_audio] for _ in range(actual_batch_size)]
+        else:
+            refer_audios = [[NO_REFERENCE_AUDIO] for _ in range(actual_batch_size)]
+        
+        # 2. Process source audio
+        # If audio_code_string is provided, ignore src_audio and use codes instead
+        processed_src_audio = None
+        if src_audio is not None:
+            # Check if audio codes are provided - if so, ignore src_audio
+            if _has_audio_codes(audio_code_string):
+                logger.info("[generate_music] Audio codes provided, ignoring src_audio and using codes instead")
+            else:
+                logger.info("[generate_music] Processing source audio...")
+                processed_src_audio = self.process_src_audio(src_audio)
+            
+        # 3. Prepare batch data
+        captions_batch, instructions_batch, lyrics_batch, vocal_languages_batch, metas_batch = self.prepare_batch_data(
+            actual_batch_size,
+            processed_src_audio,
+            audio_duration,
+            captions,
+            lyrics,
+            vocal_language,
+            instruction,
+            bpm,
+            key_scale,
+            time_signature
+        )
+        
+        is_repaint_task, is_lego_task, is_cover_task, can_use_repainting = self.determine_task_type(task_type, audio_code_string)
+        
+        repainting_start_batch, repainting_end_batch, target_wavs_tensor = self.prepare_padding_info(
+            actual_batch_size,
+            processed_src_audio,
+            audio_duration,
+            repainting_start,
+            repainting_end,
+            is_repaint_task,
+            is_lego_task,
+            is_cover_task,
+            can_use_repainting
+        )
+        
+        # Prepare audio_code_hints - use if audio_code_string is provided
+        # This works for both text2music (auto-switched to cover) and cover tasks
+        audio_code_hints_batch = None
+        if _has_audio_codes(audio_code_string):
+            if isinstance(audio_code_string, list):
+                audio_code_hints_batch = audio_code_string
+            else:
+                audio_code_hints_batch = [audio_code_string] * actual_batch_size
+
+        return {
+            "task_type": task_type,
+            "captions": captions_batch,
+            "instructions": instructions_batch,
+            "lyrics": lyrics_batch,
+            "vocal_languages": vocal_languages_batch,
+            "metas": metas_batch,
+            "refer_audios": refer_audios,
+            "target_wavs": target_wavs_tensor,
+            "repainting_start": repainting_start_batch,
+            "repainting_end": repainting_end_batch,
+            "audio_code_hints": audio_code_hints_batch,
+        }
+
+    def _service_generate_and_decode(self, use_tiled_decode: bool = True, progress=None, chunk_callback=None, **service_kwargs):
+        """
+        Run service_generate and decode the predicted latents with the VAE.
+
+        chunk_callback is forwarded to tiled_decode (and forces it) to stream decoded audio.
+
+        Returns:
+            (pred_wavs [batch, channels, samples] float32, service outputs, time_costs, pred_latents on CPU)
+        """
+        outputs = self.service_generate(**service_kwargs)
+        
+        logger.info("[generate_music] Model generation completed. Decoding latents...")
+        pred_latents = outputs["target_latents"]  # [batch, latent_length, latent_dim]
+        time_costs = outputs["time_costs"]
+        time_costs["offload_time_cost"] = self.current_offload_cost
+        logger.debug(f"[generate_music] pred_latents: {pred_latents.shape}, dtype={pred_latents.dtype} {pred_latents.min()=}, {pred_latents.max()=}, {pred_latents.mean()=} {pred_latents.std()=}")
+        logger.debug(f"[generate_music] time_costs: {time_costs}")
+        if progress:
+            progress(0.8, desc="Decoding audio...")
+        logger.info("[generate_music] Decoding latents with VAE...")
+        
+        # Decode latents to audio
+        start_time = time.time()
+        with torch.no_grad():
+            with self._load_model_context("vae"):
+                # Move pred_latents to CPU early to save VRAM (will be used in extra_outputs later)
+                pred_latents_cpu = pred_latents.detach().cpu()
+                
+                # Transpose for VAE decode: [batch, latent_length, latent_dim] -> [batch, latent_dim, latent_length]
+                pred_latents_for_decode = pred_latents.transpose(1, 2).contiguous()
+                # Ensure input is in VAE's dtype
+                pred_latents_for_decode = pred_latents_for_decode.to(self.vae.dtype)
+                
+                # Release original pred_latents to free VRAM before VAE decode
+                del pred_latents
+                torch.cuda.empty_cache()
+                
+                logger.debug(f"[generate_music] Before VAE decode: allocated={torch.cuda.memory_allocated()/1024**3:.2f}GB, max={torch.cuda.max_memory_allocated()/1024**3:.2f}GB")
+                
+                if use_tiled_decode or chunk_callback is not None:
+                    logger.info("[generate_music] Using tiled VAE decode to reduce VRAM usage...")
+                    pred_wavs = self.tiled_decode(pred_latents_for_decode, chunk_callback=chunk_callback)  # [batch, channels, samples]
+                else:
+                    decoder_output = self.vae.decode(pred_latents_for_decode)
+                    pred_wavs = decoder_output.sample
+                    del decoder_output
+                
+                logger.debug(f"[generate_music] After VAE decode: allocated={torch.cuda.memory_allocated()/1024**3:.2f}GB, max={torch.cuda.max_memory_allocated()/1024**3:.2f}GB")
+                
+                # Release pred_latents_for_decode after decode
+                del pred_latents_for_decode
+                
+                # Cast output to float32 for audio processing/saving (in-place if possible)
+                if pred_wavs.dtype != torch.float32:
+                    pred_wavs = pred_wavs.float()
+                
+                torch.cuda.empty_cache()
+        end_time = time.time()
+        time_costs["vae_decode_time_cost"] = end_time - start_time
+        time_costs["total_time_cost"] = time_costs["total_time_cost"] + time_costs["vae_decode_time_cost"]
+        
+        # Update offload cost one last time to include VAE offloading
+        time_costs["offload_time_cost"] = self.current_offload_cost
+        return pred_wavs, outputs, time_costs, pred_latents_cpu
+
+    def _build_extra_outputs(self, outputs, pred_latents_cpu, time_costs, seed_value_for_ui, batch_slice: Optional[slice] = None) -> Dict[str, Any]:
+        """Collect intermediate tensors from service outputs on CPU, optionally for a slice of the batch."""
+        def _to_cpu(t):
+            if t is None:
+                return None
+            if batch_slice is not None:
+                # A slice of a CPU tensor is a view: copy it so the rest of the batch can be freed
+                return t[batch_slice].detach().cpu().clone()
+            # Detach to release computation graph
+            return t.detach().cpu()
+
+        spans = outputs.get("spans", [])  # List of tuples
+        if batch_slice is not None:
+            spans = spans[batch_slice]
+
+        return {
+            "pred_latents": _to_cpu(pred_latents_cpu),  # Already moved to CPU earlier to save VRAM during VAE decode
+            "target_latents": _to_cpu(outputs.get("target_latents_input")),  # [batch, T, D]
+            "src_latents": _to_cpu(outputs.get("src_latents")),  # [batch, T, D]
+            "chunk_masks": _to_cpu(outputs.get("chunk_masks")),  # [batch, T]
+            "latent_masks": _to_cpu(outputs.get("latent_masks")),  # [batch, T]
+            "spans": spans,
+            "time_costs": time_costs,
+            "seed_value": seed_value_for_ui,
+            # Condition tensors for LRC timestamp generation
+            "encoder_hidden_states": _to_cpu(outputs.get("encoder_hidden_states")),
+            "encoder_attention_mask": _to_cpu(outputs.get("encoder_attention_mask")),
+            "context_latents": _to_cpu(outputs.get("context_latents")),
+            "lyric_token_idss": _to_cpu(outputs.get("lyric_token_idss")),
+        }
+
     @torch.no_grad()
     def get_lyric_timestamp(
         self,
@@ -9,11 +9,15 @@ backward-compatible Gradio UI support.
 import math
 import os
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Union, List, Dict, Any, Tuple
 from dataclasses import dataclass, field, asdict
 from loguru import logger
 
+from acestep.audio_codes import audio_codes_text
 from acestep.audio_utils import AudioSaver, generate_uuid_from_params
+from acestep.result_cache import get_result_cache, result_cache_key
 
 # HuggingFace Space environment detection
 IS_HUGGINGFACE_SPACE = os.environ.get("SPACE_ID") is not None
@@ -289,6 +293,603 @@ def _update_metadata_from_lm(
     return bpm, key_scale, time_signature, audio_duration, vocal_language, caption, lyrics
 
 
+def lookup_cached_result(
+    dit_handler,
+    llm_handler,
+    params: GenerationParams,
+    config: GenerationConfig,
+    save_dir: Optional[str] = None,
+) -> Tuple[Optional[str], Optional[GenerationResult]]:
+    """Return (cache key, cached GenerationResult or None) for a generate_music call.
+
+    The key is None when the request is not reproducible (random seeds) or the cache is
+    disabled. On a hit, the LM-filled cot_* fields are restored on params and audio files
+    missing from disk are re-saved from the cached tensors; no model is touched.
+    """
+    cache = get_result_cache()
+    if not cache.enabled:
+        return None, None
+    start_time = time.time()
+    key = result_cache_key(dit_handler, llm_handler, params, config)
+    if key is None:
+        return None, None
+    entry = cache.get(key)
+    if entry is None:
+        return key, None
+
+    cached: GenerationResult = entry["result"]
+    for name, value in entry["cot"].items():
+        setattr(params, name, value)
+
+    audio_saver = AudioSaver(default_format=config.audio_format or "flac")
+    audios = []
+    for audio in cached.audios:
+        audio = dict(audio)
+        path = audio.get("path")
+        if (not path or not os.path.exists(path)) and audio.get("tensor") is not None and save_dir is not None:
+            try:
+                os.makedirs(save_dir, exist_ok=True)
+                audio_format = config.audio_format or "flac"
+                audio["path"] = audio_saver.save_audio(
+                    audio["tensor"],
+                    os.path.join(save_dir, f"{audio['key']}.{audio_format}"),
+                    sample_rate=audio.get("sample_rate", 48000),
+                    format=audio_format,
+                    channels_first=True,
+                )
+            except Exception as e:
+                logger.error(f"[generate_music] Failed to restore cached audio file: {e}")
+        audios.append(audio)
+
+    extra_outputs = dict(cached.extra_outputs)
+    extra_outputs["result_cache_hit"] = True
+    extra_outputs["time_costs"] = {"pipeline_total_time": time.time() - start_time}
+    logger.info(f"[generate_music] Result cache hit: {key}")
+    return key, GenerationResult(
+        audios=audios,
+        status_message="✅ Served from result cache",
+        extra_outputs=extra_outputs,
+        success=True,
+        error=None,
+    )
+
+
+def store_cached_result(key: Optional[str], params: GenerationParams, result: GenerationResult) -> None:
+    """Remember a successful result under key (from lookup_cached_result)."""
+    if key is None or not result.success:
+        return
+    get_result_cache().put(key, {
+        "result": GenerationResult(
+            audios=[dict(audio) for audio in result.audios],
+            status_message=result.status_message,
+            extra_outputs=dict(result.extra_outputs),
+            success=True,
+            error=None,
+        ),
+        "cot": {name: value for name, value in params.to_dict().items() if name.startswith("cot_")},
+    })
+
+
+def emit_cached_audio(result: GenerationResult, audio_chunk_callback) -> None:
+    """Send the audio of a cached result to a streaming callback as one chunk."""
+    tensors = [audio.get("tensor") for audio in result.audios]
+    if audio_chunk_callback is None or not tensors or any(t is None for t in tensors):
+        return
+    import torch
+    audio_chunk_callback(torch.stack(tensors, dim=0))
+
+def run_lm_phase(dit_handler, llm_handler, params: GenerationParams, config: GenerationConfig, progress=None) -> Dict[str, Any]:
+    """Phase 1 of generate_music: seeds plus LM-based metadata and code generation.
+
+    Together with run_dit_phase this lets callers run the two stages on different
+    jobs concurrently (e.g. the API server's LM -> DiT pipeline).
+
+    Returns a dict with the DiT inputs resolved for this request (seeds, metadata,
+    caption/lyrics, audio codes) and the LM bookkeeping used to build the result.
+    If the LM fails, the dict only holds an "error_result" GenerationResult.
+    """
+    audio_code_string_to_use = params.audio_codes
+    lm_generated_metadata = None
+    lm_generated_audio_codes_list = []
+    lm_total_time_costs = {
+        "phase1_time": 0.0,
+        "phase2_time": 0.0,
+        "total_time": 0.0,
+    }
+
+    # Extract mutable copies of metadata (will be updated by LM if needed)
+    bpm = params.bpm
+    key_scale = params.keyscale
+    time_signature = params.timesignature
+    audio_duration = params.duration
+    dit_input_caption = params.caption
+    dit_input_vocal_language = params.vocal_language
+    dit_input_lyrics = params.lyrics
+    # Determine if we need to generate audio codes
+    # If user has provided audio_codes, we don't need to generate them
+    # Otherwise, check if we need audio codes (lm_dit mode) or just metas (dit mode)
+    user_provided_audio_codes = bool(params.audio_codes and str(params.audio_codes).strip())
+
+    # Determine infer_type: use "llm_dit" if we need audio codes, "dit" if only metas needed
+    # For now, we use "llm_dit" if batch mode or if user hasn't provided codes
+    # Use "dit" if user has provided codes (only need metas) or if explicitly only need metas
+    # Note: This logic can be refined based on specific requirements
+    need_audio_codes = not user_provided_audio_codes
+
+    # Determine if we should use chunk-based LM generation (always use chunks for consistency)
+    # Determine actual batch size for chunk processing
+    actual_batch_size = config.batch_size if config.batch_size is not None else 1
+
+    # Prepare seeds for batch generation
+    # Use config.seed if provided, otherwise fallback to params.seed
+    # Convert config.seed (None, int, or List[int]) to format that prepare_seeds accepts
+    seed_for_generation = ""
+    # Original code (commented out because it crashes on int seeds):
+    # if config.seeds is not None and len(config.seeds) > 0:
+    #     if isinstance(config.seeds, list):
+    #         # Convert List[int] to comma-separated string
+    #         seed_for_generation = ",".join(str(s) for s in config.seeds)
+
+    if config.seeds is not None:
+        if isinstance(config.seeds, list) and len(config.seeds) > 0:
+            # Convert List[int] to comma-separated string
+            seed_for_generation = ",".join(str(s) for s in config.seeds)
+        elif isinstance(config.seeds, int):
+            # Fix: Explicitly handle single integer seeds by converting to string.
+            # Previously, this would crash because 'len()' was called on an int.
+            seed_for_generation = str(config.seeds)
+
+    # Use dit_handler.prepare_seeds to handle seed list generation and padding
+    # This will handle all the logic: padding with random seeds if needed, etc.
+    actual_seed_list, _ = dit_handler.prepare_seeds(actual_batch_size, seed_for_generation, config.use_random_seed)
+
+    # LM-based Chain-of-Thought reasoning
+    # Skip LM for cover/repaint tasks - these tasks use reference/src audio directly
+    # and don't need LM to generate audio codes
+    skip_lm_tasks = {"cover", "repaint"}
+
+    # Determine if we should use LLM
+    # LLM is needed for:
+    # 1. thinking=True: generate audio codes via LM
+    # 2. use_cot_caption=True: enhance/generate caption via CoT
+    # 3. use_cot_language=True: detect vocal language via CoT
+    # 4. use_cot_metas=True: fill missing metadata via CoT
+    need_lm_for_cot = params.use_cot_caption or params.use_cot_language or params.use_cot_metas
+    use_lm = (params.thinking or need_lm_for_cot) and llm_handler.llm_initialized and params.task_type not in skip_lm_tasks
+    lm_status = []
+
+    if params.task_type in skip_lm_tasks:
+        logger.info(f"Skipping LM for task_type='{params.task_type}' - using DiT directly")
+
+    logger.info(f"[generate_music] LLM usage decision: thinking={params.thinking}, "
+               f"use_cot_caption={params.use_cot_caption}, use_cot_language={params.use_cot_language}, "
+               f"use_cot_metas={params.use_cot_metas}, need_lm_for_cot={need_lm_for_cot}, "
+               f"llm_initialized={llm_handler.llm_initialized if llm_handler else False}, use_lm={use_lm}")
+
+    if use_lm:
+        # Convert sampling parameters - handle None values safely
+        top_k_value = None if not params.lm_top_k or params.lm_top_k == 0 else int(params.lm_top_k)
+        top_p_value = None if not params.lm_top_p or params.lm_top_p >= 1.0 else params.lm_top_p
+
+        # Build user_metadata from user-provided values
+        user_metadata = {}
+        if bpm is not None:
+            try:
+                bpm_value = float(bpm)
+                if bpm_value > 0:
+                    user_metadata['bpm'] = int(bpm_value)
+            except (ValueError, TypeError):
+                pass
+
+        if key_scale and key_scale.strip():
+            key_scale_clean = key_scale.strip()
+            if key_scale_clean.lower() not in ["n/a", ""]:
+                user_metadata['keyscale'] = key_scale_clean
+
+        if time_signature and time_signature.strip():
+            time_sig_clean = time_signature.strip()
+            if time_sig_clean.lower() not in ["n/a", ""]:
+                user_metadata['timesignature'] = time_sig_clean
+
+        if audio_duration is not None:
+            try:
+                duration_value = float(audio_duration)
+                if duration_value > 0:
+                    user_metadata['duration'] = int(duration_value)
+            except (ValueError, TypeError):
+                pass
+
+        user_metadata_to_pass = user_metadata if user_metadata else None
+
+        # Determine infer_type based on whether we need audio codes
+        # - "llm_dit": generates both metas and audio codes (two-phase internally)
+        # - "dit": generates only metas (single phase)
+        infer_type = "llm_dit" if need_audio_codes and params.thinking else "dit"
+
+        # Use chunk size from config, or default to batch_size if not set
+        max_inference_batch_size = int(config.lm_batch_chunk_size) if config.lm_batch_chunk_size > 0 else actual_batch_size
+        num_chunks = math.ceil(actual_batch_size / max_inference_batch_size)
+
+        all_metadata_list = []
+        all_audio_codes_list = []
+
+        for chunk_idx in range(num_chunks):
+            chunk_start = chunk_idx * max_inference_batch_size
+            chunk_end = min(chunk_start + max_inference_batch_size, actual_batch_size)
+            chunk_size = chunk_end - chunk_start
+            chunk_seeds = actual_seed_list[chunk_start:chunk_end] if chunk_start < len(actual_seed_list) else None
+
+            logger.info(f"LM chunk {chunk_idx+1}/{num_chunks} (infer_type={infer_type}) "
+                        f"(size: {chunk_size}, seeds: {chunk_seeds})")
+
+            # Use the determined infer_type
+            # - "llm_dit" will internally run two phases (metas + codes)
+            # - "dit" will only run phase 1 (metas only)
+            result = llm_handler.generate_with_stop_condition(
+                caption=params.caption or "",
+                lyrics=params.lyrics or "",
+                infer_type=infer_type,
+                temperature=params.lm_temperature,
+                cfg_scale=params.lm_cfg_scale,
+                negative_prompt=params.lm_negative_prompt,
+                top_k=top_k_value,
+                top_p=top_p_value,
+                target_duration=audio_duration,  # Pass duration to limit audio codes generation
+                user_metadata=user_metadata_to_pass,
+                use_cot_caption=params.use_cot_caption,
+                use_cot_language=params.use_cot_language,
+                use_cot_metas=params.use_cot_metas,
+                use_constrained_decoding=params.use_constrained_decoding,
+                constrained_decoding_debug=config.constrained_decoding_debug,
+                batch_size=chunk_size,
+                seeds=chunk_seeds,
+                progress=progress,
+            )
+
+            # Check if LM generation failed
+            if not result.get("success", False):
+                error_msg = result.get("error", "Unknown LM error")
+                lm_status.append(f"❌ LM Error: {error_msg}")
+                # Return early with error
+                return {
+                    "error_result": GenerationResult(
+                        audios=[],
+                        status_message=f"❌ LM generation failed: {error_msg}",
+                        extra_outputs={},
+                        success=False,
+                        error=error_msg,
+                    )
+                }
+
+            # Extract metadata and audio_codes from result dict
+            if chunk_size > 1:
+                metadata_list = result.get("metadata", [])
+                audio_codes_list = result.get("audio_codes", [])
+                all_metadata_list.extend(metadata_list)
+                all_audio_codes_list.extend(audio_codes_list)
+            else:
+                metadata = result.get("metadata", {})
+                audio_codes = result.get("audio_codes", "")
+                all_metadata_list.append(metadata)
+                all_audio_codes_list.append(audio_codes)
+
+            # Collect time costs from LM extra_outputs
+            lm_extra = result.get("extra_outputs", {})
+            lm_chunk_time_costs = lm_extra.get("time_costs", {})
+            if lm_chunk_time_costs:
+                # Accumulate time costs from all chunks
+                for key in ["phase1_time", "phase2_time", "total_time"]:
+                    if key in lm_chunk_time_costs:
+                        lm_total_time_costs[key] += lm_chunk_time_costs[key]
+
+                time_str = ", ".join([f"{k}: {v:.2f}s" for k, v in lm_chunk_time_costs.items()])
+                lm_status.append(f"✅ LM chunk {chunk_idx+1}: {time_str}")
+
+        lm_generated_metadata = all_metadata_list[0] if all_metadata_list else None
+        lm_generated_audio_codes_list = all_audio_codes_list
+
+        # Set audio_code_string_to_use based on infer_type
+        if infer_type == "llm_dit":
+            # If batch mode, use list; otherwise use single string
+            if actual_batch_size > 1:
+                audio_code_string_to_use = all_audio_codes_list
+            else:
+                audio_code_string_to_use = all_audio_codes_list[0] if all_audio_codes_list else ""
+        else:
+            # For "dit" mode, keep user-provided codes or empty
+            audio_code_string_to_use = params.audio_codes
+
+        # Update metadata from LM if not provided by user
+        if lm_generated_metadata:
+            bpm, key_scale, time_signature, audio_duration, vocal_language, caption, lyrics = _update_metadata_from_lm(
+                metadata=lm_generated_metadata,
+                bpm=bpm,
+                key_scale=key_scale,
+                time_signature=time_signature,
+                audio_duration=audio_duration,
+                vocal_language=dit_input_vocal_language,
+                caption=dit_input_caption,
+                lyrics=dit_input_lyrics)
+            if not params.bpm:
+                params.cot_bpm = bpm
+            if not params.keyscale:
+                params.cot_keyscale = key_scale
+            if not params.timesignature:
+                params.cot_timesignature = time_signature
+            if not params.duration:
+                params.cot_duration = audio_duration
+            if not params.vocal_language:
+                params.cot_vocal_language = vocal_language
+            if not params.caption:
+                params.cot_caption = caption
+            if not params.lyrics:
+                params.cot_lyrics = lyrics
+
+        # set cot caption and language if needed
+        if params.use_cot_caption:
+            dit_input_caption = lm_generated_metadata.get("caption", dit_input_caption)
+        if params.use_cot_language:
+            dit_input_vocal_language = lm_generated_metadata.get("vocal_language", dit_input_vocal_language)
+
+    return {
+        "seed_for_generation": seed_for_generation,
+        "actual_seed_list": actual_seed_list,
+        "bpm": bpm,
+        "key_scale": key_scale,
+        "time_signature": time_signature,
+        "audio_duration": audio_duration,
+        "caption": dit_input_caption,
+        "lyrics": dit_input_lyrics,
+        "vocal_language": dit_input_vocal_language,
+        "audio_codes": audio_code_string_to_use,
+        "lm_metadata": lm_generated_metadata,
+        "lm_audio_codes_list": lm_generated_audio_codes_list,
+        "lm_time_costs": lm_total_time_costs,
+        "lm_status": lm_status,
+        "use_lm": use_lm,
+    }
+
+
+def _build_generation_result(
+    params: GenerationParams,
+    config: GenerationConfig,
+    lm_phase: Dict[str, Any],
+    result: Dict[str, Any],
+    save_dir: Optional[str] = None,
+) -> GenerationResult:
+    """Save the DiT output of one request and merge it with its LM phase into a GenerationResult."""
+    actual_seed_list = lm_phase["actual_seed_list"]
+    audio_code_string_to_use = lm_phase["audio_codes"]
+    lm_generated_metadata = lm_phase["lm_metadata"]
+    lm_generated_audio_codes_list = lm_phase["lm_audio_codes_list"]
+    lm_total_time_costs = lm_phase["lm_time_costs"]
+    lm_status = lm_phase["lm_status"]
+    use_lm = lm_phase["use_lm"]
+
+    # Check if generation failed
+    if not result.get("success", False):
+        return GenerationResult(
+            audios=[],
+            status_message=result.get("status_message", ""),
+            extra_outputs={},
+            success=False,
+            error=result.get("error"),
+        )
+
+    # Extract results from dit_handler.generate_music dict
+    dit_audios = result.get("audios", [])
+    status_message = result.get("status_message", "")
+    dit_extra_outputs = result.get("extra_outputs", {})
+
+    # Use the seed list already prepared above (from config.seed or params.seed fallback)
+    # actual_seed_list was computed earlier using dit_handler.prepare_seeds
+    seed_list = actual_seed_list
+
+    # Get base params dictionary
+    base_params_dict = params.to_dict()
+
+    # Save audio files using AudioSaver (format from config)
+    audio_format = config.audio_format if config.audio_format else "flac"
+    audio_saver = AudioSaver(default_format=audio_format)
+
+    # Use handler's temp_dir for saving files
+    if save_dir is not None:
+        os.makedirs(save_dir, exist_ok=True)
+
+    # Build audios list for GenerationResult with params and save files
+    # Audio saving and UUID generation handled here, outside of handler
+    # Files are encoded and written by worker threads while the loop goes on
+    file_writer = ThreadPoolExecutor(max_workers=min(4, max(1, len(dit_audios))), thread_name_prefix="audio-save")
+    save_futures = {}
+    audios = []
+    for idx, dit_audio in enumerate(dit_audios):
+        # Create a copy of params dict for this audio
+        audio_params = base_params_dict.copy()
+
+        # Update audio-specific values
+        audio_params["seed"] = seed_list[idx] if idx < len(seed_list) else None
+
+        # Add audio codes if batch mode
+        if lm_generated_audio_codes_list and idx < len(lm_generated_audio_codes_list):
+            # Results carry the token string (JSON, UI); the DiT got the typed codes
+            audio_params["audio_codes"] = audio_codes_text(lm_generated_audio_codes_list[idx])
+
+        # Get audio tensor and metadata
+        audio_tensor = dit_audio.get("tensor")
+        sample_rate = dit_audio.get("sample_rate", 48000)
+
+        # Generate UUID for this audio (moved from handler)
+        batch_seed = seed_list[idx] if idx < len(seed_list) else seed_list[0] if seed_list else -1
+        audio_code_str = lm_generated_audio_codes_list[idx] if (
+            lm_generated_audio_codes_list and idx < len(lm_generated_audio_codes_list)) else audio_code_string_to_use
+        if isinstance(audio_code_str, list):
+            audio_code_str = audio_code_str[idx] if idx < len(audio_code_str) else ""
+
+        audio_key = generate_uuid_from_params(audio_params)
+
+        # Save audio file (handled outside handler)
+        if audio_tensor is not None and save_dir is not None:
+            audio_file = os.path.join(save_dir, f"{audio_key}.{audio_format}")
+            save_futures[idx] = file_writer.submit(audio_saver.save_audio, audio_tensor, audio_file,
+                                                   sample_rate, audio_format, True)
+
+        audio_dict = {
+            "path": "",  # File path (saved here, not in handler), set below
+            "tensor": audio_tensor,  # Audio tensor [channels, samples], CPU, float32
+            "key": audio_key,
+            "sample_rate": sample_rate,
+            "params": audio_params,
+        }
+
+        audios.append(audio_dict)
+
+    for idx, future in save_futures.items():
+        try:
+            audios[idx]["path"] = future.result() or ""
+        except Exception as e:
+            logger.error(f"[generate_music] Failed to save audio file: {e}")
+            audios[idx]["path"] = ""  # Fallback to empty path
+    file_writer.shutdown(wait=True)
+
+    # Merge extra_outputs: include dit_extra_outputs (latents, masks) and add LM metadata
+    extra_outputs = dit_extra_outputs.copy()
+    extra_outputs["lm_metadata"] = lm_generated_metadata
+
+    # Merge time_costs from both LM and DiT into a unified dictionary
+    unified_time_costs = {}
+
+    # Add LM time costs (if LM was used)
+    if use_lm and lm_total_time_costs:
+        for key, value in lm_total_time_costs.items():
+            unified_time_costs[f"lm_{key}"] = value
+
+    # Add DiT time costs (if available)
+    dit_time_costs = dit_extra_outputs.get("time_costs", {})
+    if dit_time_costs:
+        for key, value in dit_time_costs.items():
+            unified_time_costs[f"dit_{key}"] = value
+
+    # Calculate total pipeline time
+    if unified_time_costs:
+        lm_total = unified_time_costs.get("lm_total_time", 0.0)
+        dit_total = unified_time_costs.get("dit_total_time_cost", 0.0)
+        unified_time_costs["pipeline_total_time"] = lm_total + dit_total
+
+    # Update extra_outputs with unified time_costs
+    extra_outputs["time_costs"] = unified_time_costs
+
+    if lm_status:
+        status_message = "\n".join(lm_status) + "\n" + status_message
+    else:
+        status_message = status_message
+    # Create and return GenerationResult
+    return GenerationResult(
+        audios=audios,
+        status_message=status_message,
+        extra_outputs=extra_outputs,
+        success=True,
+        error=None,
+    )
+
+
+def run_dit_phase(
+    dit_handler,
+    params: GenerationParams,
+    config: GenerationConfig,
+    lm_phase: Dict[str, Any],
+    save_dir: Optional[str] = None,
+    progress=None,
+    audio_chunk_callback=None,
+) -> GenerationResult:
+    """Phase 2 of generate_music: DiT generation from the output of run_lm_phase, then saving.
+
+    audio_chunk_callback receives each decoded audio chunk ([batch, channels, samples] CPU tensor)
+    as the VAE decode produces it, before the files are saved.
+    """
+    # Use seed_for_generation (from config.seed or params.seed) instead of params.seed for actual generation
+    result = dit_handler.generate_music(
+        captions=lm_phase["caption"],
+        lyrics=lm_phase["lyrics"],
+        bpm=lm_phase["bpm"],
+        key_scale=lm_phase["key_scale"],
+        time_signature=lm_phase["time_signature"],
+        vocal_language=lm_phase["vocal_language"],
+        inference_steps=params.inference_steps,
+        guidance_scale=params.guidance_scale,
+        use_random_seed=config.use_random_seed,
+        seed=lm_phase["seed_for_generation"],  # Use config.seed (or params.seed fallback) instead of params.seed directly
+        reference_audio=params.reference_audio,
+        audio_duration=lm_phase["audio_duration"],
+        batch_size=config.batch_size if config.batch_size is not None else 1,
+        src_audio=params.src_audio,
+        audio_code_string=lm_phase["audio_codes"],
+        repainting_start=params.repainting_start,
+        repainting_end=params.repainting_end,
+        instruction=params.instruction,
+        audio_cover_strength=params.audio_cover_strength,
+        task_type=params.task_type,
+        use_adg=params.use_adg,
+        cfg_interval_start=params.cfg_interval_start,
+        cfg_interval_end=params.cfg_interval_end,
+        shift=params.shift,
+        infer_method=params.infer_method,
+        timesteps=params.timesteps,
+        progress=progress,
+        audio_chunk_callback=audio_chunk_callback,
+    )
+
+    return _build_generation_result(params, config, lm_phase, result, save_dir)
+
+
+def run_dit_phase_batch(
+    dit_handler,
+    jobs: List[Tuple[GenerationParams, GenerationConfig, Dict[str, Any]]],
+    save_dir: Optional[str] = None,
+    progress=None,
+) -> List[GenerationResult]:
+    """Batched run_dit_phase: one DiT forward pass for several (params, config, lm_phase) jobs.
+
+    All jobs must share the DiT sampler settings; those are taken from the first job.
+    """
+    items = []
+    for params, config, lm_phase in jobs:
+        items.append({
+            "captions": lm_phase["caption"],
+            "lyrics": lm_phase["lyrics"],
+            "bpm": lm_phase["bpm"],
+            "key_scale": lm_phase["key_scale"],
+            "time_signature": lm_phase["time_signature"],
+            "vocal_language": lm_phase["vocal_language"],
+            "reference_audio": params.reference_audio,
+            "audio_duration": lm_phase["audio_duration"],
+            "batch_size": config.batch_size if config.batch_size is not None else 1,
+            # Explicit seeds so the saved params match what was generated
+            "seeds": lm_phase["actual_seed_list"],
+            "audio_code_string": lm_phase["audio_codes"],
+            "instruction": params.instruction,
+            "task_type": params.task_type,
+        })
+
+    shared = jobs[0][0]
+    dit_results = dit_handler.generate_music_batch(
+        items=items,
+        inference_steps=shared.inference_steps,
+        guidance_scale=shared.guidance_scale,
+        audio_cover_strength=shared.audio_cover_strength,
+        use_adg=shared.use_adg,
+        cfg_interval_start=shared.cfg_interval_start,
+        cfg_interval_end=shared.cfg_interval_end,
+        shift=shared.shift,
+        infer_method=shared.infer_method,
+        timesteps=shared.timesteps,
+        progress=progress,
+    )
+    return [
+        _build_generation_result(params, config, lm_phase, dit_result, save_dir)
+        for (params, config, lm_phase), dit_result in zip(jobs, dit_results)
+    ]
+
+
 @_get_spaces_gpu_decorator(duration=180)
 def generate_music(
     dit_handler,
@@ -297,6 +898,7 @@ def generate_music(
     config: GenerationConfig,
     save_dir: Optional[str] = None,
     progress=None,
+    audio_chunk_callback=None,
 ) -> GenerationResult:
     """Generate music using ACE-Step model with optional LM reasoning.
     
@@ -305,405 +907,30 @@ def generate_music(
         llm_handler: Initialized LLM handler (LLMHandler instance)
         params: Generation parameters (GenerationParams instance)
         config: Generation configuration (GenerationConfig instance)
+        audio_chunk_callback: Optional callable receiving decoded audio chunks for streaming
         
     Returns:
         GenerationResult with generated audio files and metadata
     """
     try:
-        # Phase 1: LM-based metadata and code generation (if enabled)
-        audio_code_string_to_use = params.audio_codes
-        lm_generated_metadata = None
-        lm_generated_audio_codes_list = []
-        lm_total_time_costs = {
-            "phase1_time": 0.0,
-            "phase2_time": 0.0,
-            "total_time": 0.0,
-        }
-
-        # Extract mutable copies of metadata (will be updated by LM if needed)
-        bpm = params.bpm
-        key_scale = params.keyscale
-        time_signature = params.timesignature
-        audio_duration = params.duration
-        dit_input_caption = params.caption
-        dit_input_vocal_language = params.vocal_language
-        dit_input_lyrics = params.lyrics
-        # Determine if we need to generate audio codes
-        # If user has provided audio_codes, we don't need to generate them
-        # Otherwise, check if we need audio codes (lm_dit mode) or just metas (dit mode)
-        user_provided_audio_codes = bool(params.audio_codes and str(params.audio_codes).strip())
-
-        # Determine infer_type: use "llm_dit" if we need audio codes, "dit" if only metas needed
-        # For now, we use "llm_dit" if batch mode or if user hasn't provided codes
-        # Use "dit" if user has provided codes (only need metas) or if explicitly only need metas
-        # Note: This logic can be refined based on specific requirements
-        need_audio_codes = not user_provided_audio_codes
-
-        # Determine if we should use chunk-based LM generation (always use chunks for consistency)
-        # Determine actual batch size for chunk processing
-        actual_batch_size = config.batch_size if config.batch_size is not None else 1
-
-        # Prepare seeds for batch generation
-        # Use config.seed if provided, otherwise fallback to params.seed
-        # Convert config.seed (None, int, or List[int]) to format that prepare_seeds accepts
-        seed_for_generation = ""
-        # Original code (commented out because it crashes on int seeds):
-        # if config.seeds is not None and len(config.seeds) > 0:
-        #     if isinstance(config.seeds, list):
-        #         # Convert List[int] to comma-separated string
-        #         seed_for_generation = ",".join(str(s) for s in config.seeds)
-
-        if config.seeds is not None:
-            if isinstance(config.seeds, list) and len(config.seeds) > 0:
-                # Convert List[int] to comma-separated string
-                seed_for_generation = ",".join(str(s) for s in config.seeds)
-            elif isinstance(config.seeds, int):
-                # Fix: Explicitly handle single integer seeds by converting to string.
-                # Previously, this would crash because 'len()' was called on an int.
-                seed_for_generation = str(config.seeds)
-
-        # Use dit_handler.prepare_seeds to handle seed list generation and padding
-        # This will handle all the logic: padding with random seeds if needed, etc.
-        actual_seed_list, _ = dit_handler.prepare_seeds(actual_batch_size, seed_for_generation, config.use_random_seed)
-
-        # LM-based Chain-of-Thought reasoning
-        # Skip LM for cover/repaint tasks - these tasks use reference/src audio directly
-        # and don't need LM to generate audio codes
-        skip_lm_tasks = {"cover", "repaint"}
-        
-        # Determine if we should use LLM
-        # LLM is needed for:
-        # 1. thinking=True: generate audio codes via LM
-        # 2. use_cot_caption=True: enhance/generate caption via CoT
-        # 3. use_cot_language=True: detect vocal language via CoT
-        # 4. use_cot_metas=True: fill missing metadata via CoT
-        need_lm_for_cot = params.use_cot_caption or params.use_cot_language or params.use_cot_metas
-        use_lm = (params.thinking or need_lm_for_cot) and llm_handler.llm_initialized and params.task_type not in skip_lm_tasks
-        lm_status = []
-        
-        if params.task_type in skip_lm_tasks:
-            logger.info(f"Skipping LM for task_type='{params.task_type}' - using DiT directly")
-        
-        logger.info(f"[generate_music] LLM usage decision: thinking={params.thinking}, "
-                   f"use_cot_caption={params.use_cot_caption}, use_cot_language={params.use_cot_language}, "
-                   f"use_cot_metas={params.use_cot_metas}, need_lm_for_cot={need_lm_for_cot}, "
-                   f"llm_initialized={llm_handler.llm_initialized if llm_handler else False}, use_lm={use_lm}")
-        
-        if use_lm:
-            # Convert sampling parameters - handle None values safely
-            top_k_value = None if not params.lm_top_k or params.lm_top_k == 0 else int(params.lm_top_k)
-            top_p_value = None if not params.lm_top_p or params.lm_top_p >= 1.0 else params.lm_top_p
-
-            # Build user_metadata from user-provided values
-            user_metadata = {}
-            if bpm is not None:
-                try:
-                    bpm_value = float(bpm)
-                    if bpm_value > 0:
-                        user_metadata['bpm'] = int(bpm_value)
-                except (ValueError, TypeError):
-                    pass
-
-            if key_scale and key_scale.strip():
-                key_scale_clean = key_scale.strip()
-                if key_scale_clean.lower() not in ["n/a", ""]:
-                    user_metadata['keyscale'] = key_scale_clean
-
-            if time_signature and time_signature.strip():
-                time_sig_clean = time_signature.strip()
-                if time_sig_clean.lower() not in ["n/a", ""]:
-                    user_metadata['timesignature'] = time_sig_clean
-
-            if audio_duration is not None:
-                try:
-                    duration_value = float(audio_duration)
-                    if duration_value > 0:
-                        user_metadata['duration'] = int(duration_value)
-                except (ValueError, TypeError):
-                    pass
-
-            user_metadata_to_pass = user_metadata if user_metadata else None
-
-            # Determine infer_type based on whether we need audio codes
-            # - "llm_dit": generates both metas and audio codes (two-phase internally)
-            # - "dit": generates only metas (single phase)
-            infer_type = "llm_dit" if need_audio_codes and params.thinking else "dit"
-
-            # Use chunk size from config, or default to batch_size if not set
-            max_inference_batch_size = int(config.lm_batch_chunk_size) if config.lm_batch_chunk_size > 0 else actual_batch_size
-            num_chunks = math.ceil(actual_batch_size / max_inference_batch_size)
-
-            all_metadata_list = []
-            all_audio_codes_list = []
-
-            for chunk_idx in range(num_chunks):
-                chunk_start = chunk_idx * max_inference_batch_size
-                chunk_end = min(chunk_start + max_inference_batch_size, actual_batch_size)
-                chunk_size = chunk_end - chunk_start
-                chunk_seeds = actual_seed_list[chunk_start:chunk_end] if chunk_start < len(actual_seed_list) else None
-
-                logger.info(f"LM chunk {chunk_idx+1}/{num_chunks} (infer_type={infer_type}) "
-                            f"(size: {chunk_size}, seeds: {chunk_seeds})")
-
-                # Use the determined infer_type
-                # - "llm_dit" will internally run two phases (metas + codes)
-                # - "dit" will only run phase 1 (metas only)
-                result = llm_handler.generate_with_stop_condition(
-                    caption=params.caption or "",
-                    lyrics=params.lyrics or "",
-                    infer_type=infer_type,
-                    temperature=params.lm_temperature,
-                    cfg_scale=params.lm_cfg_scale,
-                    negative_prompt=params.lm_negative_prompt,
-                    top_k=top_k_value,
-                    top_p=top_p_value,
-                    target_duration=audio_duration,  # Pass duration to limit audio codes generation
-                    user_metadata=user_metadata_to_pass,
-                    use_cot_caption=params.use_cot_caption,
-                    use_cot_language=params.use_cot_language,
-                    use_cot_metas=params.use_cot_metas,
-                    use_constrained_decoding=params.use_constrained_decoding,
-                    constrained_decoding_debug=config.constrained_decoding_debug,
-                    batch_size=chunk_size,
-                    seeds=chunk_seeds,
-                    progress=progress,
-                )
+        # Identical reproducible requests are answered without any GPU work
+        cache_key, cached = lookup_cached_result(dit_handler, llm_handler, params, config, save_dir)
+        if cached is not None:
+            emit_cached_audio(cached, audio_chunk_callback)
+            return cached
 
-                # Check if LM generation failed
-                if not result.get("success", False):
-                    error_msg = result.get("error", "Unknown LM error")
-                    lm_status.append(f"❌ LM Error: {error_msg}")
-                    # Return early with error
-                    return GenerationResult(
-                        audios=[],
-                        status_message=f"❌ LM generation failed: {error_msg}",
-                        extra_outputs={},
-                        success=False,
-                        error=error_msg,
-                    )
-
-                # Extract metadata and audio_codes from result dict
-                if chunk_size > 1:
-                    metadata_list = result.get("metadata", [])
-                    audio_codes_list = result.get("audio_codes", [])
-                    all_metadata_list.extend(metadata_list)
-                    all_audio_codes_list.extend(audio_codes_list)
-                else:
-                    metadata = result.get("metadata", {})
-                    audio_codes = result.get("audio_codes", "")
-                    all_metadata_list.append(metadata)
-                    all_audio_codes_list.append(audio_codes)
-
-                # Collect time costs from LM extra_outputs
-                lm_extra = result.get("extra_outputs", {})
-                lm_chunk_time_costs = lm_extra.get("time_costs", {})
-                if lm_chunk_time_costs:
-                    # Accumulate time costs from all chunks
-                    for key in ["phase1_time", "phase2_time", "total_time"]:
-                        if key in lm_chunk_time_costs:
-                            lm_total_time_costs[key] += lm_chunk_time_costs[key]
-
-                    time_str = ", ".join([f"{k}: {v:.2f}s" for k, v in lm_chunk_time_costs.items()])
-                    lm_status.append(f"✅ LM chunk {chunk_idx+1}: {time_str}")
-
-            lm_generated_metadata = all_metadata_list[0] if all_metadata_list else None
-            lm_generated_audio_codes_list = all_audio_codes_list
-
-            # Set audio_code_string_to_use based on infer_type
-            if infer_type == "llm_dit":
-                # If batch mode, use list; otherwise use single string
-                if actual_batch_size > 1:
-                    audio_code_string_to_use = all_audio_codes_list
-                else:
-                    audio_code_string_to_use = all_audio_codes_list[0] if all_audio_codes_list else ""
-            else:
-                # For "dit" mode, keep user-provided codes or empty
-                audio_code_string_to_use = params.audio_codes
-
-            # Update metadata from LM if not provided by user
-            if lm_generated_metadata:
-                bpm, key_scale, time_signature, audio_duration, vocal_language, caption, lyrics = _update_metadata_from_lm(
-                    metadata=lm_generated_metadata,
-                    bpm=bpm,
-                    key_scale=key_scale,
-                    time_signature=time_signature,
-                    audio_duration=audio_duration,
-                    vocal_language=dit_input_vocal_language,
-                    caption=dit_input_caption,
-                    lyrics=dit_input_lyrics)
-                if not params.bpm:
-                    params.cot_bpm = bpm
-                if not params.keyscale:
-                    params.cot_keyscale = key_scale
-                if not params.timesignature:
-                    params.cot_timesignature = time_signature
-                if not params.duration:
-                    params.cot_duration = audio_duration
-                if not params.vocal_language:
-                    params.cot_vocal_language = vocal_language
-                if not params.caption:
-                    params.cot_caption = caption
-                if not params.lyrics:
-                    params.cot_lyrics = lyrics
-
-            # set cot caption and language if needed
-            if params.use_cot_caption:
-                dit_input_caption = lm_generated_metadata.get("caption", dit_input_caption)
-            if params.use_cot_language:
-                dit_input_vocal_language = lm_generated_metadata.get("vocal_language", dit_input_vocal_language)
+        # Phase 1: LM-based metadata and code generation (if enabled)
+        lm_phase = run_lm_phase(dit_handler, llm_handler, params, config, progress)
+        if lm_phase.get("error_result") is not None:
+            return lm_phase["error_result"]
 
         # Phase 2: DiT music generation
-        # Use seed_for_generation (from config.seed or params.seed) instead of params.seed for actual generation
-        result = dit_handler.generate_music(
-            captions=dit_input_caption,
-            lyrics=dit_input_lyrics,
-            bpm=bpm,
-            key_scale=key_scale,
-            time_signature=time_signature,
-            vocal_language=dit_input_vocal_language,
-            inference_steps=params.inference_steps,
-            guidance_scale=params.guidance_scale,
-            use_random_seed=config.use_random_seed,
-            seed=seed_for_generation,  # Use config.seed (or params.seed fallback) instead of params.seed directly
-            reference_audio=params.reference_audio,
-            audio_duration=audio_duration,
-            batch_size=config.batch_size if config.batch_size is not None else 1,
-            src_audio=params.src_audio,
-            audio_code_string=audio_code_string_to_use,
-            repainting_start=params.repainting_start,
-            repainting_end=params.repainting_end,
-            instruction=params.instruction,
-            audio_cover_strength=params.audio_cover_strength,
-            task_type=params.task_type,
-            use_adg=params.use_adg,
-            cfg_interval_start=params.cfg_interval_start,
-            cfg_interval_end=params.cfg_interval_end,
-            shift=params.shift,
-            infer_method=params.infer_method,
-            timesteps=params.timesteps,
-            progress=progress,
-        )
-
-        # Check if generation failed
-        if not result.get("success", False):
-            return GenerationResult(
-                audios=[],
-                status_message=result.get("status_message", ""),
-                extra_outputs={},
-                success=False,
-                error=result.get("error"),
-            )
-
-        # Extract results from dit_handler.generate_music dict
-        dit_audios = result.get("audios", [])
-        status_message = result.get("status_message", "")
-        dit_extra_outputs = result.get("extra_outputs", {})
-
-        # Use the seed list already prepared above (from config.seed or params.seed fallback)
-        # actual_seed_list was computed earlier using dit_handler.prepare_seeds
-        seed_list = actual_seed_list
-
-        # Get base params dictionary
-        base_params_dict = params.to_dict()
-
-        # Save audio files using AudioSaver (format from config)
-        audio_format = config.audio_format if config.audio_format else "flac"
-        audio_saver = AudioSaver(default_format=audio_format)
-
-        # Use handler's temp_dir for saving files
-        if save_dir is not None:
-            os.makedirs(save_dir, exist_ok=True)
-
-        # Build audios list for GenerationResult with params and save files
-        # Audio saving and UUID generation handled here, outside of handler
-        audios = []
-        for idx, dit_audio in enumerate(dit_audios):
-            # Create a copy of params dict for this audio
-            audio_params = base_params_dict.copy()
-
-            # Update audio-specific values
-            audio_params["seed"] = seed_list[idx] if idx < len(seed_list) else None
-
-            # Add audio codes if batch mode
-            if lm_generated_audio_codes_list and idx < len(lm_generated_audio_codes_list):
-                audio_params["audio_codes"] = lm_generated_audio_codes_list[idx]
-
-            # Get audio tensor and metadata
-            audio_tensor = dit_audio.get("tensor")
-            sample_rate = dit_audio.get("sample_rate", 48000)
-
-            # Generate UUID for this audio (moved from handler)
-            batch_seed = seed_list[idx] if idx < len(seed_list) else seed_list[0] if seed_list else -1
-            audio_code_str = lm_generated_audio_codes_list[idx] if (
-                lm_generated_audio_codes_list and idx < len(lm_generated_audio_codes_list)) else audio_code_string_to_use
-            if isinstance(audio_code_str, list):
-                audio_code_str = audio_code_str[idx] if idx < len(audio_code_str) else ""
-
-            audio_key = generate_uuid_from_params(audio_params)
-
-            # Save audio file (handled outside handler)
-            audio_path = None
-            if audio_tensor is not None and save_dir is not None:
-                try:
-                    audio_file = os.path.join(save_dir, f"{audio_key}.{audio_format}")
-                    audio_path = audio_saver.save_audio(audio_tensor,
-                                                        audio_file,
-                                                        sample_rate=sample_rate,
-                                                        format=audio_format,
-                                                        channels_first=True)
-                except Exception as e:
-                    logger.error(f"[generate_music] Failed to save audio file: {e}")
-                    audio_path = ""  # Fallback to empty path
-
-            audio_dict = {
-                "path": audio_path or "",  # File path (saved here, not in handler)
-                "tensor": audio_tensor,  # Audio tensor [channels, samples], CPU, float32
-                "key": audio_key,
-                "sample_rate": sample_rate,
-                "params": audio_params,
-            }
-
-            audios.append(audio_dict)
-
-        # Merge extra_outputs: include dit_extra_outputs (latents, masks) and add LM metadata
-        extra_outputs = dit_extra_outputs.copy()
-        extra_outputs["lm_metadata"] = lm_generated_metadata
-
-        # Merge time_costs from both LM and DiT into a unified dictionary
-        unified_time_costs = {}
-
-        # Add LM time costs (if LM was used)
-        if use_lm and lm_total_time_costs:
-            for key, value in lm_total_time_costs.items():
-                unified_time_costs[f"lm_{key}"] = value
-
-        # Add DiT time costs (if available)
-        dit_time_costs = dit_extra_outputs.get("time_costs", {})
-        if dit_time_costs:
-            for key, value in dit_time_costs.items():
-                unified_time_costs[f"dit_{key}"] = value
-
-        # Calculate total pipeline time
-        if unified_time_costs:
-            lm_total = unified_time_costs.get("lm_total_time", 0.0)
-            dit_total = unified_time_costs.get("dit_total_time_cost", 0.0)
-            unified_time_costs["pipeline_total_time"] = lm_total + dit_total
-
-        # Update extra_outputs with unified time_costs
-        extra_outputs["time_costs"] = unified_time_costs
-
-        if lm_status:
-            status_message = "\n".join(lm_status) + "\n" + status_message
-        else:
-            status_message = status_message
-        # Create and return GenerationResult
-        return GenerationResult(
-            audios=audios,
-            status_message=status_message,
-            extra_outputs=extra_outputs,
-            success=True,
-            error=None,
+        result = run_dit_phase(
+            dit_handler, params, config, lm_phase,
+            save_dir=save_dir, progress=progress, audio_chunk_callback=audio_chunk_callback,
         )
+        store_cached_result(cache_key, params, result)
+        return result
 
     except Exception as e:
         logger.exception("Music generation failed")
@@ -715,6 +942,72 @@ def generate_music(
             error=str(e),
         )
 
+@_get_spaces_gpu_decorator(duration=180)
+def generate_music_batch(
+    dit_handler,
+    llm_handler,
+    jobs: List[Tuple[GenerationParams, GenerationConfig]],
+    save_dir: Optional[str] = None,
+    progress=None,
+) -> List[GenerationResult]:
+    """Generate several independent requests with a single DiT forward pass.
+
+    The LM phase runs per request; the DiT phase runs once for every request
+    that passed it, via dit_handler.generate_music_batch. All jobs must share
+    the DiT sampler settings (inference_steps, guidance_scale, shift,
+    infer_method, cfg interval, ...), which are taken from the first job.
+    Jobs with source audio are not supported and must use generate_music.
+
+    Args:
+        dit_handler: Initialized DiT model handler (AceStepHandler instance)
+        llm_handler: Initialized LLM handler (LLMHandler instance)
+        jobs: List of (GenerationParams, GenerationConfig) pairs, one per request
+
+    Returns:
+        One GenerationResult per job, in the same order
+    """
+    results: List[Optional[GenerationResult]] = [None] * len(jobs)
+    try:
+        cache_keys = {}
+        for idx, (params, config) in enumerate(jobs):
+            cache_keys[idx], results[idx] = lookup_cached_result(dit_handler, llm_handler, params, config, save_dir)
+
+        lm_phases = {}
+        for idx, (params, config) in enumerate(jobs):
+            if results[idx] is not None:
+                continue
+            lm_phase = run_lm_phase(dit_handler, llm_handler, params, config, progress)
+            if lm_phase.get("error_result") is not None:
+                results[idx] = lm_phase["error_result"]
+            else:
+                lm_phases[idx] = lm_phase
+
+        if lm_phases:
+            dit_results = run_dit_phase_batch(
+                dit_handler,
+                [(jobs[idx][0], jobs[idx][1], lm_phase) for idx, lm_phase in lm_phases.items()],
+                save_dir=save_dir,
+                progress=progress,
+            )
+            for idx, result in zip(lm_phases.keys(), dit_results):
+                results[idx] = result
+                store_cached_result(cache_keys[idx], jobs[idx][0], result)
+
+        return results
+
+    except Exception as e:
+        logger.exception("Batched music generation failed")
+        return [
+            r if r is not None else GenerationResult(
+                audios=[],
+                status_message=f"Error: {str(e)}",
+                extra_outputs={},
+                success=False,
+                error=str(e),
+            )
+            for r in results
+        ]
+
 
 def understand_music(
     llm_handler,
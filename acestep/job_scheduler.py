@@ -0,0 +1,347 @@
+"""Cost-aware scheduling for the API server job queue
+
+JobCostEstimator predicts how long a generation job takes from the shape of
+its request (duration, steps, batch size, LM thinking, LM size) and refits
+itself from the job durations the server measures.
+
+PriorityJobQueue is a drop-in replacement for the asyncio.Queue of
+(job_id, request) pairs: it hands out the job with the lowest score
+    priority_class * class_seconds + estimated_cost - aging_rate * waited_seconds
+so short jobs go first, long jobs cannot starve (their score keeps dropping
+while they wait), and higher priority classes (smaller class number) win
+unless a lower class job has waited about class_seconds longer.
+"""
+
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+# Relative 5Hz LM decode cost per generated audio-code, by model size
+LM_SIZE_FACTORS = {"0.6B": 1.0, "1.7B": 2.0, "4B": 4.5}
+
+# Duration assumed when the request leaves it to the LM (auto duration)
+DEFAULT_DURATION_SECONDS = 120.0
+
+# Reference job: 1 minute of audio, 8 steps, 1 audio
+_REF_DURATION = 60.0
+_REF_STEPS = 8.0
+
+
+def lm_size_factor(lm_model: Optional[str]) -> float:
+    """Relative LM cost of lm_model (LM_SIZE_FACTORS by the size in its name, 1.0 if unknown)."""
+    name = (lm_model or "").lower()
+    for size, factor in LM_SIZE_FACTORS.items():
+        if size.lower() in name:
+            return factor
+    return 1.0
+
+
+def job_features(
+    duration: Optional[float],
+    inference_steps: int,
+    batch_size: int,
+    thinking: bool,
+    lm_model: Optional[str] = None,
+) -> Tuple[float, float, float]:
+    """
+    Feature vector (fixed, DiT work, LM work) of a job.
+
+    DiT work scales with audio length x diffusion steps x batch size; LM work
+    (audio-code generation, only with thinking) with audio length x batch size x LM size.
+    Both are expressed in units of the reference job (1 min, 8 steps, 1 audio).
+    """
+    seconds = float(duration) if duration and float(duration) > 0 else DEFAULT_DURATION_SECONDS
+    batch = max(1, int(batch_size or 1))
+    steps = max(1, int(inference_steps or 1))
+    dit_work = (seconds / _REF_DURATION) * (steps / _REF_STEPS) * batch
+    lm_work = (seconds / _REF_DURATION) * batch * lm_size_factor(lm_model) if thinking else 0.0
+    return (1.0, dit_work, lm_work)
+
+
+def _solve(a: List[List[float]], b: List[float]) -> Optional[List[float]]:
+    """Solve a small dense linear system by Gaussian elimination with partial pivoting."""
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        if abs(m[pivot][col]) < 1e-12:
+            return None
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(n):
+            if r != col:
+                f = m[r][col] / m[col][col]
+                for c in range(col, n + 1):
+                    m[r][c] -= f * m[col][c]
+    return [m[i][n] / m[i][i] for i in range(n)]
+
+
+def ridge_fit(
+    samples: Sequence[Tuple[Sequence[float], float]],
+    prior: Sequence[float],
+    prior_weight: float,
+) -> Optional[List[float]]:
+    """
+    Non-negative coefficients of a linear model fitted on (features, value) samples.
+
+    Ridge regression pulled towards prior with strength prior_weight, so a handful
+    of samples nudges the model instead of overfitting it. Negative weights are
+    clamped to zero (they would let bigger jobs look cheaper). None if singular.
+    """
+    n = len(prior)
+    a = [[prior_weight if i == j else 0.0 for j in range(n)] for i in range(n)]
+    b = [prior_weight * p for p in prior]
+    for x, y in samples:
+        for i in range(n):
+            b[i] += x[i] * y
+            for j in range(n):
+                a[i][j] += x[i] * x[j]
+    coef = _solve(a, b)
+    if coef is None:
+        return None
+    return [max(0.0, c) for c in coef]
+
+
+class JobCostEstimator:
+    """
+    Linear job-duration model, seconds = w . job_features(...), fitted on recent jobs.
+
+    The fit is a ridge regression pulled towards a prior derived from
+    initial_seconds (the expected duration of a default 2-audio job), so a
+    handful of samples nudges the model instead of overfitting it.
+    """
+
+    def __init__(self, initial_seconds: float = 5.0, window: int = 50, prior_weight: float = 2.0) -> None:
+        default_job = job_features(None, 8, 2, False)
+        fixed = min(0.5, 0.1 * initial_seconds)
+        per_unit = max(0.01, (initial_seconds - fixed) / default_job[1])
+        # LM code generation takes about as long as the DiT pass it feeds
+        self._prior = [fixed, per_unit, per_unit]
+        self._coef = list(self._prior)
+        self._prior_weight = prior_weight
+        self._samples: Deque[Tuple[Tuple[float, float, float], float]] = deque(maxlen=max(1, window))
+        self._lock = Lock()
+
+    @property
+    def coefficients(self) -> Dict[str, float]:
+        with self._lock:
+            fixed, dit, lm = self._coef
+        return {"fixed_seconds": fixed, "dit_seconds_per_unit": dit, "lm_seconds_per_unit": lm}
+
+    def estimate(self, features: Sequence[float]) -> float:
+        """Predicted seconds for a job with the given job_features()."""
+        with self._lock:
+            coef = list(self._coef)
+        return max(0.1, sum(w * x for w, x in zip(coef, features)))
+
+    def observe(self, features: Sequence[float], seconds: float) -> None:
+        """Record a measured job duration and refit."""
+        if seconds <= 0:
+            return
+        with self._lock:
+            self._samples.append((tuple(features), float(seconds)))
+            self._refit()
+
+    def _refit(self) -> None:
+        coef = ridge_fit(self._samples, self._prior, self._prior_weight)
+        if coef is not None:
+            self._coef = coef
+
+
+@dataclass
+class _QueueEntry:
+    item: Any
+    key: str
+    cost: float
+    priority: int
+    enqueued_at: float
+    seq: int
+
+
+class PriorityJobQueue:
+    """
+    asyncio.Queue-compatible queue ordered by estimated cost with aging.
+
+    put/put_nowait take the job key, its estimated cost (seconds) and its
+    priority class in addition to the item, and optionally the time the job
+    was first queued (aging counts from it; defaults to now). With
+    use_cost=False the queue is FIFO within each priority class.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 0,
+        aging_rate: float = 1.0,
+        class_seconds: float = 300.0,
+        use_cost: bool = True,
+    ) -> None:
+        self.maxsize = maxsize
+        self._aging_rate = aging_rate
+        self._class_seconds = class_seconds
+        self._use_cost = use_cost
+        self._entries: Dict[str, _QueueEntry] = {}
+        self._seq = 0
+        self._getters: Deque[asyncio.Future] = deque()
+        self._putters: Deque[asyncio.Future] = deque()
+        self._unfinished_tasks = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def _score(self, entry: _QueueEntry, now: float) -> Tuple[float, int]:
+        cost = entry.cost if self._use_cost else 0.0
+        score = entry.priority * self._class_seconds + cost - self._aging_rate * (now - entry.enqueued_at)
+        return (score, entry.seq)
+
+    @staticmethod
+    def _wakeup_next(waiters: Deque[asyncio.Future]) -> None:
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    def qsize(self) -> int:
+        return len(self._entries)
+
+    def empty(self) -> bool:
+        return not self._entries
+
+    def full(self) -> bool:
+        return 0 < self.maxsize <= len(self._entries)
+
+    def put_nowait(
+        self, item: Any, key: str, cost: float = 0.0, priority: int = 0, enqueued_at: Optional[float] = None,
+    ) -> None:
+        if self.full():
+            raise asyncio.QueueFull
+        self._seq += 1
+        enqueued_at = time.time() if enqueued_at is None else float(enqueued_at)
+        self._entries[key] = _QueueEntry(item, key, float(cost), int(priority), enqueued_at, self._seq)
+        self._unfinished_tasks += 1
+        self._finished.clear()
+        self._wakeup_next(self._getters)
+
+    async def put(
+        self, item: Any, key: str, cost: float = 0.0, priority: int = 0, enqueued_at: Optional[float] = None,
+    ) -> None:
+        while self.full():
+            putter = asyncio.get_running_loop().create_future()
+            self._putters.append(putter)
+            try:
+                await putter
+            except BaseException:
+                putter.cancel()
+                try:
+                    self._putters.remove(putter)
+                except ValueError:
+                    pass
+                if not self.full() and not putter.cancelled():
+                    self._wakeup_next(self._putters)
+                raise
+        self.put_nowait(item, key, cost, priority, enqueued_at)
+
+    def get_nowait(self) -> Any:
+        if not self._entries:
+            raise asyncio.QueueEmpty
+        now = time.time()
+        entry = min(self._entries.values(), key=lambda e: self._score(e, now))
+        del self._entries[entry.key]
+        self._wakeup_next(self._putters)
+        return entry.item
+
+    async def get(self) -> Any:
+        while not self._entries:
+            getter = asyncio.get_running_loop().create_future()
+            self._getters.append(getter)
+            try:
+                await getter
+            except BaseException:
+                getter.cancel()
+                try:
+                    self._getters.remove(getter)
+                except ValueError:
+                    pass
+                if self._entries and not getter.cancelled():
+                    self._wakeup_next(self._getters)
+                raise
+        return self.get_nowait()
+
+    async def wait_for_item(self) -> None:
+        """Wait until the queue holds a job, without taking it (see peek/take)."""
+        while not self._entries:
+            getter = asyncio.get_running_loop().create_future()
+            self._getters.append(getter)
+            try:
+                await getter
+            except BaseException:
+                getter.cancel()
+                try:
+                    self._getters.remove(getter)
+                except ValueError:
+                    pass
+                if self._entries and not getter.cancelled():
+                    self._wakeup_next(self._getters)
+                raise
+        # This waiter may not take the job: let a get() waiting behind it see it too
+        self._wakeup_next(self._getters)
+
+    def take(self, key: str) -> Optional[Any]:
+        """Take a specific queued job (e.g. one found with peek) as get() would. None if not queued."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._wakeup_next(self._putters)
+        return entry.item
+
+    def remove(self, key: str) -> Optional[Any]:
+        """Drop a queued job (e.g. cancelled) as if it was served. Returns its item, None if not queued."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._wakeup_next(self._putters)
+        self.task_done()
+        return entry.item
+
+    def task_done(self) -> None:
+        if self._unfinished_tasks <= 0:
+            raise ValueError("task_done() called too many times")
+        self._unfinished_tasks -= 1
+        if self._unfinished_tasks == 0:
+            self._finished.set()
+
+    async def join(self) -> None:
+        if self._unfinished_tasks > 0:
+            await self._finished.wait()
+
+    def ordered(self) -> List[Tuple[str, float]]:
+        """(key, estimated cost) of queued jobs in the order they would be served now."""
+        now = time.time()
+        entries = sorted(self._entries.values(), key=lambda e: self._score(e, now))
+        return [(e.key, e.cost) for e in entries]
+
+    def peek(self, n: int = 1) -> List[Any]:
+        """The next n items in the order they would be served now, without removing them."""
+        now = time.time()
+        entries = sorted(self._entries.values(), key=lambda e: self._score(e, now))
+        return [e.item for e in entries[:n]]
+
+    def position(self, key: str) -> int:
+        """1-based position of key in the current service order, 0 if not queued."""
+        for idx, (k, _) in enumerate(self.ordered()):
+            if k == key:
+                return idx + 1
+        return 0
+
+    def cost_until(self, key: str) -> Optional[float]:
+        """Estimated seconds of queued work up to and including key, None if not queued."""
+        total = 0.0
+        for k, cost in self.ordered():
+            total += cost
+            if k == key:
+                return total
+        return None
+
+    def total_cost(self) -> float:
+        return sum(e.cost for e in self._entries.values())
@@ -0,0 +1,196 @@
+"""Content-addressed cache of VAE latents and 5Hz codes of input audio
+
+Users keep reusing the same reference tracks and edit one upload in several
+passes (repaint, lego, cover), and decoding, resampling and VAE-encoding the
+audio again on every request is pure overhead. Entries are keyed by the audio
+content (file hash or waveform samples), whatever selects the encoded part of
+it (segment offsets) and the models that produced them:
+
+- reference latents (AceStepHandler.process_reference_audio), only with
+  ACESTEP_LATENT_CACHE_REFERENCES: a reference is made of randomly placed
+  segments, which have to be fixed per track for its latent to be reusable
+- 25Hz source latents (AceStepHandler._encode_src_audio_cached)
+- 5Hz code indices of a source file (AceStepHandler.convert_src_audio_to_codes,
+  which DatasetBuilder uses for labeling)
+
+Entries live in an in-memory LRU, optionally in front of safetensors files on
+disk, which are memory-mapped when read back and survive restarts. Both tiers
+are bounded by bytes; the disk tier drops the least recently used files.
+"""
+
+import hashlib
+import os
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+from acestep.result_cache import ResultCache
+
+# Default budgets (MB); 0 disables a tier
+DEFAULT_LATENT_CACHE_MB = 512
+DEFAULT_LATENT_CACHE_DISK_MB = 0
+
+
+@dataclass
+class CachedReferenceAudio:
+    """
+    A processed reference track with the cache key of its latent.
+
+    latent ([D, T], as tiled_encode returns it) is set on a cache hit; otherwise
+    audio holds the [2, samples] waveform still to be encoded.
+    """
+
+    cache_key: str
+    latent: Optional[Any] = None
+    audio: Optional[Any] = None
+
+
+class LatentCache:
+    """
+    Thread-safe two-tier (memory LRU, safetensors files) cache of dicts of CPU tensors.
+
+    cache_references also caches reference latents, at the price of drawing the
+    segments of a reference track from its content instead of at random.
+    """
+
+    def __init__(self, directory: Optional[str], max_memory_bytes: int, max_disk_bytes: int,
+                 cache_references: bool = False) -> None:
+        self._memory = ResultCache(max_memory_bytes)
+        self.cache_references = cache_references
+        self.directory = directory if directory and max_disk_bytes > 0 else None
+        self.max_disk_bytes = max(0, int(max_disk_bytes))
+        self._disk_lock = Lock()
+        self.disk_hits = 0
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"[LatentCache] Disk tier disabled, cannot create {self.directory}: {e}")
+                self.directory = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._memory.enabled or self.directory is not None
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        return hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.safetensors")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._memory.get(key)
+        if entry is not None or self.directory is None:
+            return entry
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            from safetensors.torch import load_file
+
+            entry = load_file(path)  # memory-mapped
+            os.utime(path)  # recency for disk eviction
+        except Exception as e:
+            logger.warning(f"[LatentCache] Dropping unreadable entry {path}: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        with self._disk_lock:
+            self.disk_hits += 1
+        self._memory.put(key, entry)
+        return entry
+
+    def put(self, key: str, tensors: Dict[str, Any]) -> None:
+        tensors = {name: t.detach().to("cpu").contiguous() for name, t in tensors.items()}
+        self._memory.put(key, tensors)
+        if self.directory is None:
+            return
+        try:
+            from safetensors.torch import save_file
+
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            save_file(tensors, tmp_path)
+            os.replace(tmp_path, path)  # readers never see a partial file
+            self._prune_disk()
+        except Exception as e:
+            logger.warning(f"[LatentCache] Could not write entry {key}: {e}")
+
+    def _prune_disk(self) -> None:
+        with self._disk_lock:
+            files = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".safetensors"):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+    def clear(self) -> None:
+        self._memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._memory.stats()
+        with self._disk_lock:
+            stats["disk_hits"] = self.disk_hits
+        stats["directory"] = self.directory
+        stats["max_disk_bytes"] = self.max_disk_bytes if self.directory else 0
+        return stats
+
+
+# Lazily initialized global instance
+_latent_cache: Optional[LatentCache] = None
+_latent_cache_lock = Lock()
+
+
+def _env_mb(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        logger.warning(f"Invalid {name}, using default")
+        return default
+
+
+def get_latent_cache() -> LatentCache:
+    """
+    Get the process-wide latent cache.
+
+    ACESTEP_LATENT_CACHE_MB sizes the memory tier, ACESTEP_LATENT_CACHE_DISK_MB
+    the disk tier (off by default) in ACESTEP_LATENT_CACHE_DIR (default
+    ~/.cache/acestep/latents). ACESTEP_LATENT_CACHE_REFERENCES=1 caches
+    reference latents too.
+    """
+    global _latent_cache
+    if _latent_cache is None:
+        with _latent_cache_lock:
+            if _latent_cache is None:
+                user_cache = os.getenv("XDG_CACHE_HOME", "").strip() or os.path.join(os.path.expanduser("~"), ".cache")
+                default_dir = os.path.join(user_cache, "acestep", "latents")
+                directory = os.getenv("ACESTEP_LATENT_CACHE_DIR", "").strip() or default_dir
+                cache_references = os.getenv("ACESTEP_LATENT_CACHE_REFERENCES", "").strip().lower() in {
+                    "1", "true", "yes", "y", "on"
+                }
+                _latent_cache = LatentCache(
+                    directory,
+                    int(_env_mb("ACESTEP_LATENT_CACHE_MB", DEFAULT_LATENT_CACHE_MB) * 1024 * 1024),
+                    int(_env_mb("ACESTEP_LATENT_CACHE_DISK_MB", DEFAULT_LATENT_CACHE_DISK_MB) * 1024 * 1024),
+                    cache_references=cache_references,
+                )
+    return _latent_cache
@@ -3,6 +3,7 @@
 Handles all LM-related operations including initialization and generation
 """
 import os
+import inspect
 import traceback
 import time
 import random
@@ -13,15 +14,117 @@ import yaml
 import torch
 from loguru import logger
 from tqdm import tqdm
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, StaticCache
 from transformers.generation.streamers import BaseStreamer
 from transformers.generation.logits_process import (
     LogitsProcessorList,
     RepetitionPenaltyLogitsProcessor,
 )
+from transformers.generation.stopping_criteria import StoppingCriteria, StoppingCriteriaList
+from acestep.audio_codes import WIRE_PREFIX, AudioCodes, audio_codes_text, code_token_lookup
+from acestep.cancellation import check_cancelled
 from acestep.constrained_logits_processor import MetadataConstrainedLogitsProcessor
 from acestep.constants import DEFAULT_LM_INSTRUCTION, DEFAULT_LM_UNDERSTAND_INSTRUCTION, DEFAULT_LM_INSPIRED_INSTRUCTION, DEFAULT_LM_REWRITE_INSTRUCTION
 from acestep.gpu_config import get_lm_gpu_memory_ratio, get_gpu_memory_gb, get_lm_model_size, get_global_gpu_config
+from acestep.offload_engine import OFFLOAD, RESIDENT, STREAM, get_offloader, get_residency_planner
+
+
+class GeneratedText(str):
+    """LM output text that also carries the generated token ids (codes are read from those)."""
+
+    token_ids: Optional[List[int]] = None
+
+    def __new__(cls, text: str, token_ids: Optional[List[int]] = None) -> "GeneratedText":
+        obj = super().__new__(cls, text)
+        obj.token_ids = token_ids
+        return obj
+
+
+class _CancellationCriteria(StoppingCriteria):
+    """Checks the current cancellation token after every token of a native HF generate() call."""
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        check_cancelled()
+        return False
+
+
+class _DecodeBuffers:
+    """
+    Token ids, attention mask and KV cache of a custom decode loop.
+
+    The id and mask buffers are preallocated for max_new_tokens and written in
+    place, so a step appends a column instead of torch.cat-ing the whole
+    sequence. With a StaticCache the KV states are written in place as well and
+    every decode step has the same input shapes, which is what lets forward_fn
+    be a torch.compile'd (CUDA graph) forward. Without one the model's own
+    (dynamic) cache is used.
+    """
+
+    def __init__(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: Optional[torch.Tensor],
+        capacity: int,
+        use_cache: bool,
+        static_cache: Optional[Any] = None,
+        forward_fn: Optional[Any] = None,
+        positions_from_mask: bool = False,
+        logits_to_keep: bool = False,
+    ):
+        rows, self.length = input_ids.shape
+        self.ids = input_ids.new_zeros((rows, capacity))
+        self.ids[:, :self.length] = input_ids
+        self.mask = (attention_mask if attention_mask is not None else input_ids).new_zeros((rows, capacity))
+        self.mask[:, :self.length] = attention_mask if attention_mask is not None else 1
+        self.use_cache = use_cache or static_cache is not None
+        self.past_key_values = static_cache
+        self.static = static_cache is not None
+        self.forward_fn = forward_fn
+        self.positions_from_mask = positions_from_mask
+        self.logits_to_keep = logits_to_keep
+        self.cached = 0  # Tokens already in the KV cache
+
+    @property
+    def input_ids(self) -> torch.Tensor:
+        return self.ids[:, :self.length]
+
+    @property
+    def attention_mask(self) -> torch.Tensor:
+        return self.mask[:, :self.length]
+
+    def append(self, tokens: torch.Tensor, mask: Optional[torch.Tensor] = None) -> None:
+        """Write the next token of every row (mask: its attention mask value, default 1)."""
+        self.ids[:, self.length] = tokens
+        self.mask[:, self.length] = 1 if mask is None else mask
+        self.length += 1
+
+    def forward(self, model: Any) -> torch.Tensor:
+        """Run the model on the tokens not yet in the KV cache; returns the last position's logits."""
+        start = self.cached if self.use_cache else 0
+        kwargs: Dict[str, Any] = {"use_cache": self.use_cache}
+        if self.static:
+            # Full-width mask: positions not written yet are 0, so decode shapes never change
+            kwargs["attention_mask"] = self.mask
+            kwargs["cache_position"] = torch.arange(start, self.length, device=self.ids.device)
+        else:
+            kwargs["attention_mask"] = self.attention_mask
+        if self.past_key_values is not None:
+            kwargs["past_key_values"] = self.past_key_values
+        if self.positions_from_mask:
+            # Left padding: positions count only the real tokens of each row
+            positions = (self.attention_mask.long().cumsum(-1) - 1).clamp(min=0)
+            kwargs["position_ids"] = positions[:, start:]
+        if self.logits_to_keep:
+            kwargs["logits_to_keep"] = 1
+        fn = model if self.forward_fn is None or start == 0 else self.forward_fn
+        outputs = fn(input_ids=self.ids[:, start:self.length], **kwargs)
+        if self.use_cache:
+            if not self.static and getattr(outputs, "past_key_values", None) is not None:
+                self.past_key_values = outputs.past_key_values
+            self.cached = self.length
+        logits = outputs.logits[:, -1, :]
+        # CUDA graph outputs are overwritten by the next replay
+        return logits.clone() if fn is not model else logits
 
 
 class LLMHandler:
@@ -38,10 +141,20 @@ class LLMHandler:
         self.llm_tokenizer = None
         self.llm_initialized = False
         self.llm_backend = None
+        self.lm_model_name = None  # e.g. "acestep-5Hz-lm-0.6B"
         self.max_model_len = 4096
         self.device = "cpu"
         self.dtype = torch.float32
         self.offload_to_cpu = False
+        # PyTorch backend decode loops: static (preallocated) KV cache, optionally
+        # with the per-token forward compiled into CUDA graphs. None uses the static
+        # cache on CUDA only: on CPU it is slower than the dynamic one
+        self.use_static_kv_cache: Optional[bool] = None
+        self.compile_decode_step = False
+        self._static_kv_cache = None
+        self._static_kv_cache_key = None
+        self._compiled_decode_forward = None
+        self._compiled_decode_model = None
 
         # HuggingFace Space persistent storage support
         if persistent_storage_path is None and self.IS_HUGGINGFACE_SPACE:
@@ -153,7 +266,7 @@ class LLMHandler:
         codes_temperature: Optional[float] = None,
     ) -> Optional[MetadataConstrainedLogitsProcessor]:
         """Setup and configure constrained processor for generation"""
-        use_phase_temperatures = not is_batch and (metadata_temperature is not None or codes_temperature is not None)
+        use_phase_temperatures = metadata_temperature is not None or codes_temperature is not None
         
         if not use_constrained_decoding and not use_phase_temperatures:
             return None
@@ -165,7 +278,7 @@ class LLMHandler:
         self.constrained_processor.enabled = use_constrained_decoding
         self.constrained_processor.debug = constrained_decoding_debug
         
-        # Phase temperatures only supported in single mode
+        # Phase temperatures follow each sequence's own FSM state, so batches support them too
         if use_phase_temperatures:
             self.constrained_processor.metadata_temperature = metadata_temperature
             self.constrained_processor.codes_temperature = codes_temperature
@@ -253,11 +366,16 @@ class LLMHandler:
             logits[indices_to_remove] = float('-inf')
         return logits
     
-    def _sample_tokens(self, logits: torch.Tensor, temperature: float) -> torch.Tensor:
-        """Sample tokens from logits with temperature"""
+    def _sample_tokens(self, logits: torch.Tensor, temperature: float, generators: Optional[List[torch.Generator]] = None) -> torch.Tensor:
+        """Sample tokens from logits with temperature (row i drawn from generators[i] when given)"""
         if temperature > 0:
             logits = logits / temperature
             probs = torch.softmax(logits, dim=-1)
+            if generators is not None:
+                return torch.cat([
+                    torch.multinomial(probs[i:i+1], num_samples=1, generator=generators[i])
+                    for i in range(probs.shape[0])
+                ]).squeeze(1)
             return torch.multinomial(probs, num_samples=1).squeeze(1)
         else:
             return torch.argmax(logits, dim=-1)
@@ -274,32 +392,76 @@ class LLMHandler:
     def _update_constrained_processor_state(self, constrained_processor: Optional[MetadataConstrainedLogitsProcessor], tokens: torch.Tensor):
         """Update constrained processor state with generated tokens"""
         if constrained_processor is not None:
-            for b in range(tokens.shape[0]):
-                constrained_processor.update_state(tokens[b].item())
+            constrained_processor.update_state(tokens.tolist())
     
-    def _forward_pass(
+    def _new_decode_buffers(
         self,
         model: Any,
-        generated_ids: torch.Tensor,
-        model_kwargs: Dict[str, Any],
-        past_key_values: Optional[Any],
-        use_cache: bool,
-    ) -> Any:
-        """Perform forward pass with KV cache support"""
-        if past_key_values is None:
-            outputs = model(
-                input_ids=generated_ids,
-                **model_kwargs,
-                use_cache=use_cache,
-            )
-        else:
-            outputs = model(
-                input_ids=generated_ids[:, -1:],
-                past_key_values=past_key_values,
-                **model_kwargs,
-                use_cache=use_cache,
+        input_ids: torch.Tensor,
+        attention_mask: Optional[torch.Tensor],
+        max_new_tokens: int,
+        positions_from_mask: bool = False,
+    ) -> _DecodeBuffers:
+        """Decode buffers for a custom generation loop, with a static KV cache when the model supports one."""
+        rows, prompt_length = input_ids.shape
+        capacity = prompt_length + max_new_tokens
+        use_cache = hasattr(model, 'generation_config') and getattr(model.generation_config, 'use_cache', True)
+        compile_step = self.compile_decode_step and torch.cuda.is_available() and str(self.device).startswith("cuda")
+        if compile_step:
+            # Round up so that prompts of similar length reuse the compiled graphs
+            capacity = -(-capacity // 256) * 256
+        static_cache = self._static_kv_cache_for(model, rows, capacity) if use_cache else None
+        forward_fn = None
+        if compile_step and static_cache is not None:
+            if self._compiled_decode_model is not model:
+                self._compiled_decode_forward = torch.compile(model.forward, mode="reduce-overhead", dynamic=False)
+                self._compiled_decode_model = model
+            forward_fn = self._compiled_decode_forward
+        return _DecodeBuffers(
+            input_ids,
+            attention_mask,
+            capacity,
+            use_cache=use_cache,
+            static_cache=static_cache,
+            forward_fn=forward_fn,
+            positions_from_mask=positions_from_mask,
+            logits_to_keep="logits_to_keep" in inspect.signature(model.forward).parameters,
+        )
+
+    def _static_kv_cache_for(self, model: Any, batch_size: int, max_cache_len: int) -> Optional[Any]:
+        """An empty StaticCache for batch_size rows of max_cache_len tokens (reused across calls), or None."""
+        use_static = self.use_static_kv_cache
+        if use_static is None:
+            use_static = str(self.device).startswith("cuda")
+        if not use_static:
+            return None
+        if not (getattr(model, "_supports_static_cache", False) or getattr(model, "_can_compile_fullgraph", False)):
+            return None
+        key = (batch_size, max_cache_len, model.dtype, str(self.device))
+        if self._static_kv_cache is not None and self._static_kv_cache_key == key:
+            self._static_kv_cache.reset()
+            return self._static_kv_cache
+        # Free the previous cache before allocating one of a different shape
+        self._release_static_kv_cache()
+        try:
+            cache = StaticCache(
+                config=model.config,
+                max_batch_size=batch_size,
+                max_cache_len=max_cache_len,
+                device=self.device,
+                dtype=model.dtype,
             )
-        return outputs
+        except Exception as e:
+            logger.warning(f"Static KV cache unavailable, using the dynamic cache: {e}")
+            return None
+        self._static_kv_cache = cache
+        self._static_kv_cache_key = key
+        return cache
+
+    def _release_static_kv_cache(self):
+        """Drop the reusable static KV cache (e.g. before the LM is offloaded)."""
+        self._static_kv_cache = None
+        self._static_kv_cache_key = None
     
     def _normalize_batch_input(self, formatted_prompts: Union[str, List[str]]) -> Tuple[List[str], bool]:
         """Normalize batch input: convert single string to list and return (list, is_batch)"""
@@ -355,6 +517,7 @@ class LLMHandler:
                 logger.info(f"[initialize] lm_model_path is None, using default: {lm_model_path}")
 
             full_lm_model_path = os.path.join(checkpoint_dir, lm_model_path)
+            self.lm_model_name = lm_model_path
             if not os.path.exists(full_lm_model_path):
                 return f"❌ 5Hz LM model not found at {full_lm_model_path}", False
             
@@ -454,6 +617,10 @@ class LLMHandler:
             logger.info(f"5Hz LM initialized successfully in {time.time() - start_time:.2f} seconds")
             self.llm_initialized = True
             self.llm_backend = "vllm"
+            # nano-vllm keeps its weights and KV cache on the GPU; the DiT side plans around it
+            get_residency_planner().register(
+                self.llm, "lm", int(gpu_memory_utilization * get_gpu_memory_gb() * 1024 ** 3), forced=RESIDENT
+            )
             return f"✅ 5Hz LM initialized successfully\nModel: {model_path}\nDevice: {device_name}\nGPU Memory Utilization: {gpu_memory_utilization:.3f}\nLow GPU Memory Mode: {low_gpu_memory_mode}"
         except Exception as e:
             self.llm_initialized = False
@@ -496,9 +663,8 @@ class LLMHandler:
         batch_size = len(formatted_prompt_list)
 
         # Determine effective temperature for sampler
-        # Batch mode doesn't support phase temperatures, so use simple temperature
-        # Single mode supports phase temperatures
-        use_phase_temperatures = not is_batch and (metadata_temperature is not None or codes_temperature is not None)
+        # With phase temperatures the processor scales each sequence's logits, so the sampler uses 1.0
+        use_phase_temperatures = metadata_temperature is not None or codes_temperature is not None
         effective_sampler_temp = 1.0 if use_phase_temperatures else temperature
 
         # Setup constrained processor
@@ -556,9 +722,10 @@ class LLMHandler:
                 formatted_prompt_list,
                 sampling_params,
                 unconditional_prompts=unconditional_prompts,
+                abort_check=check_cancelled,
             )
         else:
-            outputs = self.llm.generate(formatted_prompt_list, sampling_params)
+            outputs = self.llm.generate(formatted_prompt_list, sampling_params, abort_check=check_cancelled)
 
         # Extract text from outputs
         output_texts = []
@@ -568,13 +735,29 @@ class LLMHandler:
             elif hasattr(output, "text"):
                 output_texts.append(output.text)
             elif isinstance(output, dict) and "text" in output:
-                output_texts.append(output["text"])
+                output_texts.append(GeneratedText(output["text"], output.get("token_ids")))
             else:
                 output_texts.append(str(output))
 
         # Return single string for single mode, list for batch mode
         return output_texts[0] if not is_batch else output_texts
 
+    def _max_new_tokens_for(self, target_duration: Optional[float]) -> int:
+        """Token budget of a PyTorch generation for target_duration"""
+        # Calculate max_new_tokens based on target_duration if specified
+        # 5 audio codes = 1 second, plus ~500 tokens for CoT metadata and safety margin
+        if target_duration is not None and target_duration > 0:
+            # Ensure duration is within valid range (10-600 seconds)
+            effective_duration = max(10, min(600, target_duration))
+            max_new_tokens = int(effective_duration * 5) + 500
+        else:
+            max_new_tokens = getattr(self.llm.config, "max_new_tokens", 4096)
+        
+        # Cap at model's max length
+        if hasattr(self, "max_model_len"):
+            max_new_tokens = min(max_new_tokens, self.max_model_len - 64)
+        return max_new_tokens
+
     def _run_pt_single(
         self,
         formatted_prompt: str,
@@ -622,18 +805,7 @@ class LLMHandler:
         with self._load_model_context():
             inputs = {k: v.to(self.device) for k, v in inputs.items()}
             
-            # Calculate max_new_tokens based on target_duration if specified
-            # 5 audio codes = 1 second, plus ~500 tokens for CoT metadata and safety margin
-            if target_duration is not None and target_duration > 0:
-                # Ensure duration is within valid range (10-600 seconds)
-                effective_duration = max(10, min(600, target_duration))
-                max_new_tokens = int(effective_duration * 5) + 500
-            else:
-                max_new_tokens = getattr(self.llm.config, "max_new_tokens", 4096)
-            
-            # Cap at model's max length
-            if hasattr(self, "max_model_len"):
-                max_new_tokens = min(max_new_tokens, self.max_model_len - 64)
+            max_new_tokens = self._max_new_tokens_for(target_duration)
 
             # Build logits processor list (only for CFG and repetition penalty)
             logits_processor = self._build_logits_processor(repetition_penalty)
@@ -711,6 +883,7 @@ class LLMHandler:
                         logits_processor=logits_processor if len(logits_processor) > 0 else None,
                         pad_token_id=self.llm_tokenizer.pad_token_id or self.llm_tokenizer.eos_token_id,
                         streamer=None,
+                        stopping_criteria=StoppingCriteriaList([_CancellationCriteria()]),
                     )
 
         # Decode the generated tokens
@@ -739,7 +912,111 @@ class LLMHandler:
             generated_ids = generated_ids.cpu()
         
         output_text = self.llm_tokenizer.decode(generated_ids, skip_special_tokens=False)
-        return output_text
+        return GeneratedText(output_text, generated_ids.tolist())
+
+    def _run_pt_batch(
+        self,
+        formatted_prompts: List[str],
+        temperature: float,
+        cfg_scale: float,
+        negative_prompt: str,
+        top_k: Optional[int],
+        top_p: Optional[float],
+        repetition_penalty: float,
+        use_constrained_decoding: bool,
+        constrained_decoding_debug: bool,
+        target_duration: Optional[float],
+        generation_phase: str,
+        caption: str,
+        lyrics: str,
+        cot_text: str,
+        seeds: Optional[List[int]] = None,
+    ) -> List[str]:
+        """
+        Internal helper function for batched PyTorch generation.
+
+        All prompts (plus one unconditional prompt per item with CFG) are
+        left-padded into a single batch that _generate_batch_padded decodes with
+        one forward per step. Items use the batch-mode constrained decoding
+        defaults; item i samples from its own generator seeded with seeds[i].
+        """
+        batch_size = len(formatted_prompts)
+
+        # Setup constrained processor (batch-mode settings; one FSM state per item)
+        constrained_processor = self._setup_constrained_processor(
+            use_constrained_decoding=use_constrained_decoding,
+            constrained_decoding_debug=constrained_decoding_debug,
+            target_duration=target_duration,
+            user_metadata=None,
+            stop_at_reasoning=False,
+            skip_genres=True,
+            skip_caption=True,
+            skip_language=True,
+            generation_phase=generation_phase,
+            is_batch=True,
+        )
+
+        batch_texts = list(formatted_prompts)
+        if cfg_scale > 1.0:
+            formatted_unconditional_prompt = self._build_unconditional_prompt(
+                caption=caption,
+                lyrics=lyrics,
+                cot_text=cot_text,
+                negative_prompt=negative_prompt,
+                generation_phase=generation_phase,
+                is_batch=True,
+            )
+            batch_texts.extend([formatted_unconditional_prompt] * batch_size)
+
+        # Left padding keeps the last position of every row aligned for decoding
+        original_padding_side = self.llm_tokenizer.padding_side
+        self.llm_tokenizer.padding_side = 'left'
+        batch_inputs_tokenized = self.llm_tokenizer(
+            batch_texts,
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+        )
+        self.llm_tokenizer.padding_side = original_padding_side
+
+        with self._load_model_context():
+            batch_inputs_tokenized = {k: v.to(self.device) for k, v in batch_inputs_tokenized.items()}
+
+            generators = None
+            if seeds and temperature > 0:
+                generators = []
+                for i in range(batch_size):
+                    generator = torch.Generator(device=self.device)
+                    if i < len(seeds):
+                        generator.manual_seed(seeds[i])
+                    else:
+                        generator.seed()
+                    generators.append(generator)
+
+            outputs, new_token_counts = self._generate_batch_padded(
+                batch_input_ids=batch_inputs_tokenized['input_ids'],
+                batch_attention_mask=batch_inputs_tokenized.get('attention_mask', None),
+                batch_size=batch_size,
+                max_new_tokens=self._max_new_tokens_for(target_duration),
+                temperature=temperature,
+                cfg_scale=cfg_scale,
+                top_k=top_k,
+                top_p=top_p,
+                repetition_penalty=repetition_penalty,
+                pad_token_id=self.llm_tokenizer.pad_token_id or self.llm_tokenizer.eos_token_id,
+                constrained_processor=constrained_processor,
+                generators=generators,
+            )
+
+        # Decode each item's new tokens (up to and including its EOS)
+        input_length = batch_inputs_tokenized['input_ids'].shape[1]
+        outputs = outputs[:batch_size, input_length:].cpu()
+        output_texts = []
+        for i in range(batch_size):
+            generated_ids = outputs[i, :new_token_counts[i]]
+            output_text = self.llm_tokenizer.decode(generated_ids, skip_special_tokens=False)
+            output_texts.append(GeneratedText(output_text, generated_ids.tolist()))
+        return output_texts
 
     def _run_pt(
         self,
@@ -768,47 +1045,30 @@ class LLMHandler:
         Unified PyTorch generation function supporting both single and batch modes.
         Accepts either a single formatted prompt (str) or a list of formatted prompts (List[str]).
         Returns a single string for single mode, or a list of strings for batch mode.
-        Note: PyTorch backend processes batch items sequentially (doesn't support true batching efficiently).
+        Batch items are decoded together as one left-padded batch (see _run_pt_batch).
         """
         # Determine if batch mode
         formatted_prompt_list, is_batch = self._normalize_batch_input(formatted_prompts)
 
-        # For batch mode, process each item sequentially with different seeds
+        # Batch mode: decode all items together in one padded batch
         if is_batch:
-            output_texts = []
-            for i, formatted_prompt in enumerate(formatted_prompt_list):
-                # Set seed for this item if provided
-                if seeds and i < len(seeds):
-                    torch.manual_seed(seeds[i])
-                    if torch.cuda.is_available():
-                        torch.cuda.manual_seed_all(seeds[i])
-                
-                # Generate using single-item method with batch-mode defaults
-                output_text = self._run_pt_single(
-                    formatted_prompt=formatted_prompt,
-                    temperature=temperature,
-                    cfg_scale=cfg_scale,
-                    negative_prompt=negative_prompt,
-                    top_k=top_k,
-                    top_p=top_p,
-                    repetition_penalty=repetition_penalty,
-                    use_constrained_decoding=use_constrained_decoding,
-                    constrained_decoding_debug=constrained_decoding_debug,
-                    target_duration=target_duration,
-                    user_metadata=None,
-                    stop_at_reasoning=False,
-                    skip_genres=True,
-                    skip_caption=True,
-                    skip_language=True,
-                    generation_phase=generation_phase,
-                    caption=caption,
-                    lyrics=lyrics,
-                    cot_text=cot_text,
-                )
-                
-                output_texts.append(output_text)
-            
-            return output_texts
+            return self._run_pt_batch(
+                formatted_prompts=formatted_prompt_list,
+                temperature=temperature,
+                cfg_scale=cfg_scale,
+                negative_prompt=negative_prompt,
+                top_k=top_k,
+                top_p=top_p,
+                repetition_penalty=repetition_penalty,
+                use_constrained_decoding=use_constrained_decoding,
+                constrained_decoding_debug=constrained_decoding_debug,
+                target_duration=target_duration,
+                generation_phase=generation_phase,
+                caption=caption,
+                lyrics=lyrics,
+                cot_text=cot_text,
+                seeds=seeds,
+            )
 
         # Single mode: process the formatted prompt
         formatted_prompt = formatted_prompt_list[0]
@@ -914,7 +1174,8 @@ class LLMHandler:
         Returns:
             Dictionary containing:
                 - metadata: Dict or List[Dict] - Generated metadata
-                - audio_codes: str or List[str] - Generated audio codes
+                - audio_codes: AudioCodes or List[AudioCodes] - Generated audio codes, read
+                  from the token ids (str() gives the <|audio_code_N|> string)
                 - success: bool - Whether generation succeeded
                 - error: Optional[str] - Error message if failed
                 - extra_outputs: Dict with time_costs and other info
@@ -1126,14 +1387,13 @@ class LLMHandler:
             audio_codes_list = []
             metadata_list = []
             for output_text in codes_outputs:
-                _, audio_codes_item = self.parse_lm_output(output_text)
-                audio_codes_list.append(audio_codes_item)
+                audio_codes_list.append(self._audio_codes_of(output_text))
                 metadata_list.append(metadata.copy())  # Same metadata for all
             
             phase2_time = time.time() - phase2_start
             
             # Log results
-            codes_counts = [len(codes.split('<|audio_code_')) - 1 if codes else 0 for codes in audio_codes_list]
+            codes_counts = [len(codes) for codes in audio_codes_list]
             logger.info(f"Batch Phase 2 completed in {phase2_time:.2f}s. Generated codes: {codes_counts}")
             
             total_time = phase1_time + phase2_time
@@ -1197,9 +1457,9 @@ class LLMHandler:
             phase2_time = time.time() - phase2_start
             
             # Parse audio codes from output (metadata should be same as Phase 1)
-            _, audio_codes = self.parse_lm_output(codes_output_text)
+            audio_codes = self._audio_codes_of(codes_output_text)
             
-            codes_count = len(audio_codes.split('<|audio_code_')) - 1 if audio_codes else 0
+            codes_count = len(audio_codes)
             logger.info(f"Phase 2 completed in {phase2_time:.2f}s. Generated {codes_count} audio codes")
             
             total_time = phase1_time + phase2_time
@@ -1424,6 +1684,9 @@ class LLMHandler:
         if not getattr(self, "llm_initialized", False):
             return {}, "❌ 5Hz LM not initialized. Please initialize it first."
         
+        if isinstance(audio_codes, AudioCodes) or (audio_codes or "").strip().startswith(WIRE_PREFIX):
+            # The prompt needs the token string
+            audio_codes = audio_codes_text(AudioCodes.parse(audio_codes))
         if not audio_codes or not audio_codes.strip():
             return {}, "❌ No audio codes provided. Please paste audio codes first."
         
@@ -2034,21 +2297,9 @@ class LLMHandler:
         This allows us to call update_state() after each token generation.
         """
         model = self.llm
-        device = self.device
         
-        # Initialize generated sequences
-        generated_ids = input_ids.clone()
-        if attention_mask is not None:
-            attn_mask = attention_mask.clone()
-        else:
-            attn_mask = torch.ones_like(input_ids)
-        
-        # Prepare model inputs
-        model_kwargs = {'attention_mask': attn_mask}
-        
-        # Past key values for KV cache
-        past_key_values = None
-        use_cache = hasattr(model, 'generation_config') and getattr(model.generation_config, 'use_cache', True)
+        # Preallocated token/mask buffers and KV cache
+        buffers = self._new_decode_buffers(model, input_ids, attention_mask, max_new_tokens)
         
         # Get EOS token ID
         eos_token_id = self.llm_tokenizer.eos_token_id
@@ -2060,11 +2311,10 @@ class LLMHandler:
         
         with torch.no_grad():
             for step in tqdm(range(max_new_tokens), desc="LLM Constrained Decoding", unit="token"):
-                # Forward pass
-                outputs = self._forward_pass(model, generated_ids, model_kwargs, past_key_values, use_cache)
-                
-                # Get logits for the last position
-                next_token_logits = outputs.logits[:, -1, :]  # [batch_size, vocab_size]
+                check_cancelled()
+                # Forward pass; logits for the last position
+                next_token_logits = buffers.forward(model)  # [batch_size, vocab_size]
+                generated_ids = buffers.input_ids
                 
                 # Apply constrained processor FIRST (modifies logits based on FSM state)
                 if constrained_processor is not None:
@@ -2088,18 +2338,11 @@ class LLMHandler:
                 should_stop = self._check_eos_token(next_tokens, eos_token_id, pad_token_id)
                 
                 # Append token to sequence
-                next_tokens_unsqueezed = next_tokens.unsqueeze(1)
-                generated_ids = torch.cat([generated_ids, next_tokens_unsqueezed], dim=1)
-                attn_mask = torch.cat([attn_mask, torch.ones((input_ids.shape[0], 1), device=device, dtype=attn_mask.dtype)], dim=1)
-                model_kwargs['attention_mask'] = attn_mask
-                
-                # Update KV cache
-                if use_cache and hasattr(outputs, 'past_key_values'):
-                    past_key_values = outputs.past_key_values
+                buffers.append(next_tokens)
                 
                 # Update streamer
                 if streamer is not None:
-                    streamer.put(next_tokens_unsqueezed)
+                    streamer.put(next_tokens.unsqueeze(1))
                 
                 if should_stop:
                     break
@@ -2107,7 +2350,7 @@ class LLMHandler:
         if streamer is not None:
             streamer.end()
         
-        return generated_ids
+        return buffers.input_ids
     
     def _generate_with_cfg_custom(
         self,
@@ -2134,26 +2377,12 @@ class LLMHandler:
         Batch format: [cond_input, uncond_input]
         """
         model = self.llm
-        device = self.device
         batch_size = batch_input_ids.shape[0] // 2  # Half are conditional, half are unconditional
         cond_start_idx = 0
         uncond_start_idx = batch_size
         
-        # Initialize generated sequences
-        generated_ids = batch_input_ids.clone()
-        if batch_attention_mask is not None:
-            attention_mask = batch_attention_mask.clone()
-        else:
-            attention_mask = torch.ones_like(batch_input_ids)
-        
-        # Prepare model inputs
-        model_kwargs = {}
-        if batch_attention_mask is not None:
-            model_kwargs['attention_mask'] = attention_mask
-        
-        # Past key values for KV cache (if model supports it)
-        past_key_values = None
-        use_cache = hasattr(model, 'generation_config') and getattr(model.generation_config, 'use_cache', True)
+        # Preallocated token/mask buffers and KV cache
+        buffers = self._new_decode_buffers(model, batch_input_ids, batch_attention_mask, max_new_tokens)
         
         # Get EOS token ID for stopping condition
         eos_token_id = self.llm_tokenizer.eos_token_id
@@ -2165,11 +2394,10 @@ class LLMHandler:
         
         with torch.no_grad():
             for step in tqdm(range(max_new_tokens), desc="LLM CFG Generation", unit="token"):
-                # Forward pass for the entire batch (conditional + unconditional)
-                outputs = self._forward_pass(model, generated_ids, model_kwargs, past_key_values, use_cache)
-                
-                # Get logits for the last position
-                next_token_logits = outputs.logits[:, -1, :]  # [batch_size*2, vocab_size]
+                check_cancelled()
+                # Forward pass for the entire batch (conditional + unconditional); logits for the last position
+                next_token_logits = buffers.forward(model)  # [batch_size*2, vocab_size]
+                generated_ids = buffers.input_ids
                 
                 # Split conditional and unconditional logits
                 cond_logits = next_token_logits[cond_start_idx:cond_start_idx+batch_size]
@@ -2205,18 +2433,11 @@ class LLMHandler:
                 should_stop = self._check_eos_token(next_tokens, eos_token_id, pad_token_id)
                 
                 # Apply the same sampled tokens to both conditional and unconditional sequences
-                next_tokens_unsqueezed = next_tokens.unsqueeze(1)
-                generated_ids = torch.cat([generated_ids, next_tokens_unsqueezed.repeat(2, 1)], dim=1)
-                attention_mask = torch.cat([attention_mask, torch.ones((batch_size*2, 1), device=device, dtype=attention_mask.dtype)], dim=1)
-                model_kwargs['attention_mask'] = attention_mask
-                
-                # Update past_key_values for next iteration
-                if use_cache and hasattr(outputs, 'past_key_values'):
-                    past_key_values = outputs.past_key_values
+                buffers.append(next_tokens.repeat(2))
                 
                 # Update streamer
                 if streamer is not None:
-                    streamer.put(next_tokens_unsqueezed)  # Stream conditional tokens
+                    streamer.put(next_tokens.unsqueeze(1))  # Stream conditional tokens
                 
                 # Stop generation if EOS token detected
                 if should_stop:
@@ -2227,8 +2448,123 @@ class LLMHandler:
         
         # Return the full batch (both conditional and unconditional)
         # The caller will extract only the conditional output
-        return generated_ids
+        return buffers.input_ids
     
+    def _generate_batch_padded(
+        self,
+        batch_input_ids: torch.Tensor,
+        batch_attention_mask: Optional[torch.Tensor],
+        batch_size: int,
+        max_new_tokens: int,
+        temperature: float,
+        cfg_scale: float,
+        top_k: Optional[int],
+        top_p: Optional[float],
+        repetition_penalty: float,
+        pad_token_id: int,
+        constrained_processor: Optional[MetadataConstrainedLogitsProcessor] = None,
+        generators: Optional[List[torch.Generator]] = None,
+    ) -> Tuple[torch.Tensor, List[int]]:
+        """
+        Decoding loop for a left-padded batch of batch_size items:
+        1. One forward pass per step over all rows
+        2. With cfg_scale > 1, rows batch_size.. are the unconditional rows and
+           get the same sampled tokens as their conditional row
+        3. Each item has its own constrained FSM state (keyed by its row index)
+        4. Each item stops at its own EOS; finished items are fed pad tokens,
+           masked out of attention, until every item is done
+
+        Batch format: [cond_0..cond_{B-1}] or [cond_0..cond_{B-1}, uncond_0..uncond_{B-1}]
+        Returns (generated_ids, number of new tokens of each item including its EOS).
+        """
+        model = self.llm
+        num_copies = 2 if cfg_scale > 1.0 else 1
+        
+        # Preallocated token/mask buffers and KV cache; left padding needs explicit positions
+        buffers = self._new_decode_buffers(
+            model, batch_input_ids, batch_attention_mask, max_new_tokens, positions_from_mask=True
+        )
+        
+        # Get EOS token ID for stopping condition
+        eos_token_id = self.llm_tokenizer.eos_token_id
+        if eos_token_id is None:
+            eos_token_id = pad_token_id
+        stop_token_ids = {eos_token_id, pad_token_id}
+        
+        # Build logits processor for repetition penalty
+        logits_processor = self._build_logits_processor(repetition_penalty)
+        
+        done = [False] * batch_size
+        new_token_counts = [max_new_tokens] * batch_size
+        
+        with torch.no_grad():
+            for step in tqdm(range(max_new_tokens), desc="LLM Batch Decoding", unit="token"):
+                check_cancelled()
+                # Forward pass for all rows; logits for the last position
+                next_token_logits = buffers.forward(model)  # [batch_size*num_copies, vocab_size]
+                generated_ids = buffers.input_ids
+                if num_copies == 2:
+                    cond_logits = next_token_logits[:batch_size]
+                    uncond_logits = next_token_logits[batch_size:]
+                    next_token_logits = uncond_logits + cfg_scale * (cond_logits - uncond_logits)
+                
+                current_input_ids = generated_ids[:batch_size]
+                
+                # Apply constrained processor FIRST to the unfinished items
+                active_rows = [b for b in range(batch_size) if not done[b]]
+                if constrained_processor is not None:
+                    if len(active_rows) == batch_size:
+                        next_token_logits = constrained_processor(current_input_ids, next_token_logits)
+                    else:
+                        rows = torch.tensor(active_rows, device=next_token_logits.device)
+                        next_token_logits[rows] = constrained_processor(
+                            current_input_ids[rows], next_token_logits[rows], seq_ids=active_rows
+                        )
+                
+                # Apply other logits processors (repetition penalty)
+                for processor in logits_processor:
+                    next_token_logits = processor(current_input_ids, next_token_logits)
+                
+                # Apply top-k and top-p filtering
+                next_token_logits = self._apply_top_k_filter(next_token_logits, top_k)
+                next_token_logits = self._apply_top_p_filter(next_token_logits, top_p)
+                
+                # Apply temperature and sample
+                next_tokens = self._sample_tokens(next_token_logits, temperature, generators)
+                
+                # Finished items keep emitting pad tokens that nothing attends to
+                active = torch.tensor([not d for d in done], device=next_tokens.device)
+                next_tokens = torch.where(active, next_tokens, torch.full_like(next_tokens, pad_token_id))
+                
+                # Update each unfinished item's FSM state and stopping condition
+                token_list = next_tokens.tolist()
+                if constrained_processor is not None:
+                    constrained_processor.update_state([token_list[b] for b in active_rows], seq_ids=active_rows)
+                for b in active_rows:
+                    if token_list[b] in stop_token_ids:
+                        done[b] = True
+                        new_token_counts[b] = step + 1
+                
+                # Append the sampled tokens to the conditional (and unconditional) rows
+                buffers.append(next_tokens.repeat(num_copies), active.repeat(num_copies))
+                
+                if all(done):
+                    break
+        
+        return buffers.input_ids, new_token_counts
+    
+    def _audio_codes_of(self, output_text: str) -> AudioCodes:
+        """Audio codes of a codes-phase output, from its token ids when the backend returned them."""
+        token_ids = getattr(output_text, "token_ids", None)
+        if token_ids is None:
+            return AudioCodes.from_token_string(output_text)
+        lookup = getattr(self, "_code_token_lookup", None)
+        if lookup is None or getattr(self, "_code_token_lookup_tokenizer", None) is not self.llm_tokenizer:
+            lookup = code_token_lookup(self.llm_tokenizer)
+            self._code_token_lookup = lookup
+            self._code_token_lookup_tokenizer = self.llm_tokenizer
+        return AudioCodes.from_token_ids(token_ids, lookup)
+
     def parse_lm_output(self, output_text: str) -> Tuple[Dict[str, Any], str]:
         """
         Parse LM output to extract metadata and audio codes.
@@ -2353,7 +2689,9 @@ class LLMHandler:
     def _load_model_context(self):
         """
         Context manager to load a model to GPU and offload it back to CPU after use.
-        Only used for PyTorch backend when offload_to_cpu is True.
+        Only used for PyTorch backend when offload_to_cpu is True; the model goes
+        through the pinned-memory offload engine, and stays on the GPU when the
+        residency planner finds room for it.
         """
         if not self.offload_to_cpu:
             yield
@@ -2365,30 +2703,45 @@ class LLMHandler:
             return
         
         model = self.llm
-        if model is None:
+        if model is None or not isinstance(model, torch.nn.Module):
             yield
             return
         
+        offloader = get_offloader(model, self.device, self.dtype)
+        planner = get_residency_planner()
+        planner.register(model, "lm", offloader.host_bytes())
+        mode = planner.decide(model).mode
+        if mode == STREAM:
+            mode = OFFLOAD  # The generate() loop runs the LM once per token, streaming would copy it per token
+
         # Load to GPU
-        logger.info(f"Loading LLM to {self.device}")
+        loading = not offloader.on_device
+        if loading:
+            logger.info(f"Loading LLM to {self.device} ({mode})")
         start_time = time.time()
-        if hasattr(model, "to"):
-            model.to(self.device).to(self.dtype)
-        load_time = time.time() - start_time
-        logger.info(f"Loaded LLM to {self.device} in {load_time:.4f}s")
-
+        offload_start = None
         try:
-            yield
+            with offloader.using(mode):
+                if loading:
+                    logger.info(f"Loaded LLM to {self.device} in {time.time() - start_time:.4f}s")
+                try:
+                    yield
+                finally:
+                    offload_start = time.time()
         finally:
-            # Offload to CPU
-            logger.info(f"Offloading LLM to CPU")
-            start_time = time.time()
-            if hasattr(model, "to"):
-                model.to("cpu")
-            torch.cuda.empty_cache()
-            offload_time = time.time() - start_time
-            logger.info(f"Offloaded LLM to CPU in {offload_time:.4f}s")
+            if offload_start is not None and not offloader.on_device:
+                # The static KV cache would hold its VRAM while the LM is offloaded
+                self._release_static_kv_cache()
+                torch.cuda.empty_cache()
+                logger.info(f"Offloaded LLM to CPU in {time.time() - offload_start:.4f}s")
     
+    def prefix_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """KV prefix cache counters of the vllm backend (None for the PyTorch backend)."""
+        if self.llm_backend != "vllm" or self.llm is None:
+            return None
+        scheduler = getattr(self.llm, "scheduler", None)
+        return scheduler.block_manager.stats() if scheduler is not None else None
+
     def get_hf_model_for_scoring(self):
         """
         Get HuggingFace model for perplexity scoring.
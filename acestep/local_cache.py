@@ -6,7 +6,8 @@ Supports persistent storage and TTL expiration.
 
 import json
 import os
-from typing import Any, Optional
+from contextlib import contextmanager
+from typing import Any, List, Optional
 from threading import Lock
 
 try:
@@ -111,6 +112,76 @@ class LocalCache:
             return -1  # Exists but TTL unknown
         return -2  # Key does not exist
 
+    @contextmanager
+    def transact(self):
+        """
+        Run the enclosed operations atomically.
+
+        Backed by a diskcache (SQLite) transaction, so it is atomic across
+        processes sharing the same cache directory, not only across threads.
+        """
+        with self._cache.transact(retry=True):
+            yield self
+
+    def rpush(self, name: str, *values: Any) -> int:
+        """Append values to the list at name, returns the new length"""
+        with self._cache.transact(retry=True):
+            items = self._cache.get(name) or []
+            items.extend(values)
+            self._cache.set(name, items)
+            return len(items)
+
+    def lpush(self, name: str, *values: Any) -> int:
+        """Prepend values to the list at name (last value ends up first), returns the new length"""
+        with self._cache.transact(retry=True):
+            items = self._cache.get(name) or []
+            items[:0] = reversed(values)
+            self._cache.set(name, items)
+            return len(items)
+
+    def lpop(self, name: str) -> Optional[Any]:
+        """Remove and return the first element of the list at name"""
+        with self._cache.transact(retry=True):
+            items = self._cache.get(name) or []
+            if not items:
+                return None
+            value = items.pop(0)
+            self._cache.set(name, items)
+            return value
+
+    def lrem(self, name: str, count: int, value: Any) -> int:
+        """
+        Remove occurrences of value like Redis LREM, returns the number removed.
+
+        count > 0 removes the first count, count < 0 the last -count, 0 all of them.
+        """
+        with self._cache.transact(retry=True):
+            items = self._cache.get(name) or []
+            from_tail = count < 0
+            limit = abs(count)
+            kept, removed = [], 0
+            for item in reversed(items) if from_tail else items:
+                if item == value and (limit == 0 or removed < limit):
+                    removed += 1
+                else:
+                    kept.append(item)
+            if removed:
+                self._cache.set(name, kept[::-1] if from_tail else kept)
+            return removed
+
+    def llen(self, name: str) -> int:
+        """Length of the list at name"""
+        return len(self._cache.get(name) or [])
+
+    def lrange(self, name: str, start: int, end: int) -> List[Any]:
+        """Elements start..end (inclusive, negative indexes allowed) of the list at name"""
+        items = self._cache.get(name) or []
+        if start < 0:
+            start = max(0, len(items) + start)
+        if end < 0:
+            end = len(items) + end
+        return items[start:end + 1]
+
     def close(self):
         """Close cache connection"""
         if hasattr(self, '_cache'):
@@ -0,0 +1,304 @@
+"""Pool of DiT model variants sharing one GPU
+
+Every variant (turbo, base, sft, shift3, LoRA variants of any of them) gets its
+own AceStepHandler; the VAE and text encoder are shared with the primary
+handler. With a VRAM budget only some DiT weights are resident on the GPU at a
+time: the others wait as standby copies in pinned CPU memory, are loaded on
+demand (evicting the least recently used idle model) and can be prefetched in
+the background when a queued request is going to need them.
+
+The standby copies are the ones of the model's PinnedOffloader
+(acestep.offload_engine), so a model is never pinned twice: eviction points
+the parameters back at them and only loading copies data.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from threading import Lock, RLock
+from typing import Any, Dict, Iterator, List, Optional
+
+from loguru import logger
+
+
+@dataclass
+class ModelSpec:
+    name: str  # what requests select with `model`
+    config_path: str  # DiT checkpoint directory, e.g. "acestep-v15-turbo"
+    lora_path: Optional[str] = None
+    lora_scale: float = 1.0
+
+
+def parse_model_specs(value: str) -> List[ModelSpec]:
+    """
+    Parse ACESTEP_DIT_MODELS: comma-separated `[name=]config_path[+lora_path[@scale]]`.
+
+    Examples: "acestep-v15-base", "anime=acestep-v15-turbo+/loras/anime@0.8".
+    """
+    specs = []
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, rest = item.partition("=") if "=" in item else ("", "", item)
+        config_path, _, lora_path = rest.partition("+")
+        lora_scale = 1.0
+        if lora_path and "@" in lora_path:
+            path, _, scale = lora_path.rpartition("@")
+            try:
+                lora_scale = float(scale)
+                lora_path = path
+            except ValueError:
+                pass
+        config_path = config_path.strip()
+        name = name.strip() or config_path.rstrip("/\\").replace("\\", "/").split("/")[-1]
+        specs.append(ModelSpec(name, config_path, lora_path.strip() or None, lora_scale))
+    return specs
+
+
+@dataclass
+class _PoolEntry:
+    spec: ModelSpec
+    handler: Any  # AceStepHandler
+    size_bytes: int = 0
+    resident: bool = True
+    in_use: int = 0
+    last_used: float = field(default_factory=time.time)
+    loads: int = 0
+    offloader: Any = None  # PinnedOffloader, unless residency is not managed
+
+
+class DiTModelPool:
+    """
+    Registry of DiT handlers with LRU residency under a VRAM budget.
+
+    vram_budget_gb <= 0 keeps every model resident (no standby copies). With
+    manage_residency=False (DiT offloaded to CPU between uses anyway) the pool
+    is just a registry.
+    """
+
+    def __init__(self, vram_budget_gb: float = 0.0, manage_residency: bool = True) -> None:
+        self.vram_budget_bytes = int(max(0.0, vram_budget_gb) * 1024 ** 3)
+        self.manage_residency = manage_residency and self.vram_budget_bytes > 0
+        self._entries: Dict[str, _PoolEntry] = {}
+        self._default: Optional[str] = None
+        self._lock = Lock()  # entry bookkeeping
+        self._load_lock = RLock()  # one eviction/load at a time
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=1) if self.manage_residency else None
+        self._prefetching: set = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ---------------------------------------------------------------- registry
+
+    def register(self, spec: ModelSpec, handler: Any, default: bool = False) -> None:
+        """Add an initialized handler; the first one (or default=True) serves requests without `model`."""
+        model = handler.model
+        size = sum(t.numel() * t.element_size() for t in _module_tensors(model))
+        entry = _PoolEntry(spec, handler, size_bytes=size)
+        if self.manage_residency:
+            from acestep.offload_engine import get_offloader
+
+            entry.offloader = get_offloader(model, handler.device, handler.dtype)
+            on_device = any(t.device.type != "cpu" for t in _module_tensors(model))
+            with self._lock:
+                fits = self._resident_bytes() + size <= self.vram_budget_bytes
+            if on_device and fits:
+                entry.offloader.load()
+            else:
+                entry.offloader.pin()
+                _empty_device_cache()
+            entry.resident = on_device and fits
+        elif any(t.device.type == "cpu" for t in _module_tensors(model)) and handler.device != "cpu" and not (
+            handler.offload_to_cpu and handler.offload_dit_to_cpu
+        ):
+            model.to(handler.device)
+        with self._lock:
+            self._entries[spec.name] = entry
+            if default or self._default is None:
+                self._default = spec.name
+        logger.info(f"[DiTModelPool] Registered {spec.name} ({size / 1024 ** 3:.2f}GB)")
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._entries)
+
+    @property
+    def default_name(self) -> Optional[str]:
+        return self._default
+
+    def resolve(self, name: Optional[str]) -> Optional[str]:
+        """Registered model name for a request's `model` (None or unknown -> default)."""
+        with self._lock:
+            if name and name in self._entries:
+                return name
+            return self._default
+
+    def get(self, name: str) -> Any:
+        """The handler of a registered model (not necessarily resident, see acquire())."""
+        with self._lock:
+            return self._entries[name].handler
+
+    # --------------------------------------------------------------- residency
+
+    @contextmanager
+    def hold(self, name: str) -> Iterator[None]:
+        """Keep the model from being evicted while the block runs, without loading it."""
+        with self._lock:
+            entry = self._entries[name]
+            entry.in_use += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+
+    @contextmanager
+    def acquire(self, name: str) -> Iterator[Any]:
+        """Make the model resident and keep it from being evicted while the block runs."""
+        with self._lock:
+            entry = self._entries[name]
+            entry.in_use += 1
+            entry.last_used = time.time()
+            if entry.resident:
+                self.hits += 1
+            else:
+                self.misses += 1
+        try:
+            if not entry.resident:
+                with self._load_lock:
+                    if not entry.resident:
+                        self._make_room(entry)
+                        self._load(entry)
+            yield entry.handler
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.time()
+
+    def prefetch(self, name: Optional[str]) -> None:
+        """Load a model in the background if it fits by evicting only idle models."""
+        if self._prefetch_executor is None or not name:
+            return
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry.resident or name in self._prefetching:
+                return
+            self._prefetching.add(name)
+        self._prefetch_executor.submit(self._prefetch, entry)
+
+    def _prefetch(self, entry: _PoolEntry) -> None:
+        try:
+            with self._load_lock:
+                if entry.resident:
+                    return
+                if not self._make_room(entry, required=True):
+                    return
+                t0 = time.time()
+                self._load(entry)
+                logger.info(f"[DiTModelPool] Prefetched {entry.spec.name} in {time.time() - t0:.2f}s")
+        except Exception as e:
+            logger.warning(f"[DiTModelPool] Prefetch of {entry.spec.name} failed: {e}")
+        finally:
+            with self._lock:
+                self._prefetching.discard(entry.spec.name)
+
+    def _resident_bytes(self) -> int:
+        return sum(e.size_bytes for e in self._entries.values() if e.resident)
+
+    def _make_room(self, entry: _PoolEntry, required: bool = False) -> bool:
+        """
+        Evict least recently used idle models until entry fits the budget.
+
+        Returns whether it fits; with required=False a model that does not fit is
+        loaded anyway (over budget) rather than failing the job.
+        """
+        with self._lock:
+            candidates = sorted(
+                (e for e in self._entries.values() if e.resident and e is not entry and e.in_use == 0),
+                key=lambda e: e.last_used,
+            )
+            free = self.vram_budget_bytes - self._resident_bytes()
+            victims = []
+            for victim in candidates:
+                if free >= entry.size_bytes:
+                    break
+                victims.append(victim)
+                free += victim.size_bytes
+            if free < entry.size_bytes and required:
+                return False
+            for victim in victims:
+                victim.offloader.offload()
+                victim.resident = False
+                self.evictions += 1
+                logger.info(f"[DiTModelPool] Evicted {victim.spec.name} to pinned CPU memory")
+        if victims:
+            _empty_device_cache()
+        if free < entry.size_bytes:
+            logger.warning(
+                f"[DiTModelPool] {entry.spec.name} ({entry.size_bytes / 1024 ** 3:.2f}GB) exceeds the free "
+                f"VRAM budget ({max(0, free) / 1024 ** 3:.2f}GB), loading anyway"
+            )
+        return free >= entry.size_bytes
+
+    def _load(self, entry: _PoolEntry) -> None:
+        t0 = time.time()
+        entry.offloader.load()
+        _synchronize_device()
+        with self._lock:
+            entry.resident = True
+            entry.loads += 1
+        entry.handler.current_offload_cost += time.time() - t0
+        logger.info(f"[DiTModelPool] Loaded {entry.spec.name} to {entry.handler.device} in {time.time() - t0:.2f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "managed": self.manage_residency,
+                "vram_budget_gb": self.vram_budget_bytes / 1024 ** 3,
+                "resident_gb": self._resident_bytes() / 1024 ** 3,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "models": [
+                    {
+                        "name": e.spec.name,
+                        "config_path": e.spec.config_path,
+                        "lora_path": e.spec.lora_path,
+                        "size_gb": e.size_bytes / 1024 ** 3,
+                        "resident": e.resident,
+                        "in_use": e.in_use,
+                        "loads": e.loads,
+                    }
+                    for e in self._entries.values()
+                ],
+            }
+
+
+def _module_tensors(model) -> List[Any]:
+    """Parameters and buffers of model, each storage once."""
+    seen = set()
+    tensors = []
+    for t in list(model.parameters()) + list(model.buffers()):
+        if id(t) not in seen:
+            seen.add(id(t))
+            tensors.append(t)
+    return tensors
+
+
+def _synchronize_device() -> None:
+    import torch
+
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+def _empty_device_cache() -> None:
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except Exception:
+        pass
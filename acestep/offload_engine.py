@@ -0,0 +1,441 @@
+"""Pinned-memory model offloading with layer streaming and a residency planner
+
+With offload_to_cpu the handlers used to move whole models with repeated
+.to() calls (plus a walk over every attribute) on every request, in both
+directions. PinnedOffloader keeps one pinned host copy of every parameter and
+buffer instead:
+
+- loading is an asynchronous copy from pinned memory, queued on the compute
+  stream;
+- offloading just points the parameters back at their host copies, since
+  inference never changes the weights, so it copies nothing.
+
+A model that does not fit next to the others can be streamed: only its
+largest block list (the DiT decoder layers) stays on the host, and each block
+is copied in on a side stream a couple of blocks ahead of use and dropped
+again right after its forward.
+
+ResidencyPlanner decides, for every registered model (DiT, VAE, text encoder,
+5Hz LM), whether it stays resident, is loaded per use or is streamed, from a
+VRAM budget (ACESTEP_VRAM_BUDGET_GB, default 90% of the GPU minus an
+activation reserve).
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import torch
+from loguru import logger
+
+RESIDENT = "resident"
+OFFLOAD = "offload"
+STREAM = "stream"
+
+# Models planned first stay resident first: the DiT runs every diffusion step
+MODEL_PRIORITY = ("dit", "vae", "text_encoder", "lm")
+
+# VRAM kept free for activations when the budget is derived from the GPU size
+DEFAULT_ACTIVATION_RESERVE_GB = 2.0
+
+# Blocks copied ahead of the one running when streaming
+DEFAULT_PREFETCH_BLOCKS = 2
+
+
+def module_bytes(module: torch.nn.Module) -> int:
+    """Bytes of the parameters and buffers of module."""
+    total = sum(p.numel() * p.element_size() for p in module.parameters())
+    return total + sum(b.numel() * b.element_size() for b in module.buffers())
+
+
+def _find_block_list(module: torch.nn.Module) -> Optional[torch.nn.ModuleList]:
+    """The ModuleList holding the most weights (the transformer layers), if any."""
+    best, best_bytes = None, 0
+    for child in module.modules():
+        if isinstance(child, torch.nn.ModuleList) and len(child) > 1:
+            size = module_bytes(child)
+            if size > best_bytes:
+                best, best_bytes = child, size
+    return best
+
+
+class _TensorSlot:
+    """A parameter or buffer of owner and its host copy."""
+
+    __slots__ = ("owner", "name", "is_param", "host")
+
+    def __init__(self, owner: torch.nn.Module, name: str, is_param: bool, host: torch.Tensor) -> None:
+        self.owner = owner
+        self.name = name
+        self.is_param = is_param
+        self.host = host
+
+    def bind(self, tensor: torch.Tensor) -> None:
+        if self.is_param:
+            self.owner._parameters[self.name].data = tensor
+        else:
+            self.owner._buffers[self.name] = tensor
+
+
+class PinnedOffloader:
+    """
+    Moves one model between pinned host memory and device.
+
+    The host copies are taken on first use (and again after refresh(), e.g.
+    when a LoRA replaced part of the module tree). load(stream=True) keeps the
+    block list on the host and streams it through forward hooks;
+    resident_blocks leading blocks are loaded anyway when the budget allows.
+    using() counts users, so a model shared by several handlers is only
+    offloaded when the last of them is done.
+    """
+
+    def __init__(self, module: torch.nn.Module, device: Any, dtype: Optional[torch.dtype] = None,
+                 prefetch_blocks: int = DEFAULT_PREFETCH_BLOCKS) -> None:
+        self.module = module
+        self.device = torch.device(device)
+        self.dtype = dtype
+        self.prefetch_blocks = max(1, prefetch_blocks)
+        self.on_device = False
+        self._slots: Optional[List[_TensorSlot]] = None
+        self._block_slots: List[List[_TensorSlot]] = []
+        self._blocks: Optional[torch.nn.ModuleList] = None
+        self._hooks: List[Any] = []
+        self._streaming = False
+        self._resident_blocks = 0
+        self._block_events: Dict[int, Any] = {}
+        self._users = 0
+        self._lock = Lock()
+        self._cuda = self.device.type == "cuda" and torch.cuda.is_available()
+        self._copy_stream = torch.cuda.Stream(self.device) if self._cuda else None
+
+    # ---- host copies ----
+
+    def _walk_modules(self) -> List[torch.nn.Module]:
+        """Registered submodules plus modules only held as plain attributes."""
+        found: List[torch.nn.Module] = []
+        seen = set()
+        pending = [self.module]
+        while pending:
+            mod = pending.pop()
+            if id(mod) in seen:
+                continue
+            seen.add(id(mod))
+            found.append(mod)
+            pending.extend(child for child in mod._modules.values() if child is not None)
+            pending.extend(attr for attr in vars(mod).values() if isinstance(attr, torch.nn.Module))
+        return found
+
+    def _to_host(self, tensor: torch.Tensor) -> torch.Tensor:
+        host = tensor.detach().to("cpu")
+        if self.dtype is not None and host.is_floating_point():
+            host = host.to(self.dtype)
+        if self._cuda:
+            host = host.pin_memory()
+        return host
+
+    def _snapshot(self) -> None:
+        start = time.time()
+        slots: List[_TensorSlot] = []
+        by_tensor: Dict[int, _TensorSlot] = {}
+        for owner in self._walk_modules():
+            for table, is_param in ((owner._parameters, True), (owner._buffers, False)):
+                for name, tensor in table.items():
+                    if tensor is None:
+                        continue
+                    shared = by_tensor.get(id(tensor))
+                    if shared is not None and is_param:
+                        continue  # tied weight, rebinding the Parameter once is enough
+                    host = shared.host if shared is not None else self._to_host(tensor)
+                    slot = _TensorSlot(owner, name, is_param, host)
+                    slot.bind(host)
+                    by_tensor[id(tensor)] = slot
+                    slots.append(slot)
+        self._slots = slots
+        self._index_blocks()
+        logger.info(f"[offload_engine] Pinned {type(self.module).__name__} on host "
+                    f"({sum(s.host.numel() * s.host.element_size() for s in slots) / 2**20:.0f}MB, "
+                    f"{time.time() - start:.2f}s)")
+
+    def _index_blocks(self) -> None:
+        for hook in self._hooks:
+            hook.remove()
+        self._hooks = []
+        self._blocks = _find_block_list(self.module)
+        self._block_slots = []
+        if self._blocks is None:
+            return
+        owner_block = {}
+        for i, block in enumerate(self._blocks):
+            for mod in block.modules():
+                owner_block[id(mod)] = i
+            self._hooks.append(block.register_forward_pre_hook(self._make_pre_hook(i)))
+            self._hooks.append(block.register_forward_hook(self._make_post_hook(i)))
+        self._block_slots = [[] for _ in self._blocks]
+        for slot in self._slots:
+            i = owner_block.get(id(slot.owner))
+            if i is not None:
+                self._block_slots[i].append(slot)
+
+    def pin(self) -> None:
+        """Take the host copies now instead of on first load(); the model is left on the host."""
+        if self._slots is None:
+            self._snapshot()
+        else:
+            self.offload()
+        self.on_device = False
+
+    def refresh(self) -> None:
+        """Retake the host copies after the module tree changed."""
+        was_on_device = self.on_device
+        if self._slots is not None:
+            self.offload()
+        self._slots = None
+        if was_on_device:
+            self.load()
+
+    def host_bytes(self) -> int:
+        if self._slots is None:
+            return module_bytes(self.module)
+        return sum(s.host.numel() * s.host.element_size() for s in self._slots)
+
+    def block_bytes(self) -> Tuple[int, int]:
+        """(bytes outside the block list, bytes of the largest block)."""
+        if self._slots is None:
+            self._snapshot()
+        blocks = [sum(s.host.numel() * s.host.element_size() for s in b) for b in self._block_slots]
+        return self.host_bytes() - sum(blocks), max(blocks, default=0)
+
+    # ---- whole-model moves ----
+
+    def load(self, stream: bool = False, resident_blocks: int = 0) -> None:
+        """Copy the model to the device; with stream, the block list follows in forward."""
+        if self._slots is None:
+            self._snapshot()
+        stream = stream and self._blocks is not None
+        streamed = set()
+        if stream:
+            self._resident_blocks = max(0, resident_blocks)
+            for block in self._block_slots[self._resident_blocks:]:
+                streamed.update(id(s) for s in block)
+        for slot in self._slots:
+            if id(slot) in streamed:
+                slot.bind(slot.host)
+            else:
+                slot.bind(slot.host.to(self.device, non_blocking=True))
+        self._streaming = stream
+        self._block_events = {}
+        self.on_device = True
+
+    def offload(self) -> None:
+        """Point every tensor back at its host copy; nothing is copied."""
+        if self._slots is None:
+            return
+        if self._cuda:
+            # Blocks prefetched but never used may still be in flight
+            torch.cuda.current_stream(self.device).wait_stream(self._copy_stream)
+        for slot in self._slots:
+            slot.bind(slot.host)
+        self._streaming = False
+        self._block_events = {}
+        self.on_device = False
+
+    @contextmanager
+    def using(self, mode: str = OFFLOAD, resident_blocks: int = 0) -> Iterator[None]:
+        """Keep the model on the device while the block runs; RESIDENT leaves it there."""
+        with self._lock:
+            if not self.on_device:
+                self.load(stream=mode == STREAM, resident_blocks=resident_blocks)
+            self._users += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._users -= 1
+                if self._users == 0 and mode != RESIDENT:
+                    self.offload()
+
+    # ---- block streaming ----
+
+    def _prefetch(self, i: int) -> None:
+        if i >= len(self._block_slots) or i < self._resident_blocks or i in self._block_events:
+            return
+        slots = self._block_slots[i]
+        if not self._cuda:
+            for slot in slots:
+                slot.bind(slot.host.to(self.device))
+            self._block_events[i] = None
+            return
+        compute = torch.cuda.current_stream(self.device)
+        targets = [torch.empty_like(slot.host, device=self.device) for slot in slots]
+        self._copy_stream.wait_stream(compute)  # targets may reuse memory still read by compute
+        with torch.cuda.stream(self._copy_stream):
+            for slot, target in zip(slots, targets):
+                target.copy_(slot.host, non_blocking=True)
+                target.record_stream(self._copy_stream)
+            done = torch.cuda.Event()
+            done.record(self._copy_stream)
+        for slot, target in zip(slots, targets):
+            slot.bind(target)
+        self._block_events[i] = done
+
+    def _make_pre_hook(self, i: int):
+        def _pre_hook(module, args):
+            if not self._streaming or i < self._resident_blocks:
+                return None
+            self._prefetch(i)
+            done = self._block_events.get(i)
+            if done is not None:
+                torch.cuda.current_stream(self.device).wait_event(done)
+            for ahead in range(i + 1, i + 1 + self.prefetch_blocks):
+                self._prefetch(ahead)
+            return None
+        return _pre_hook
+
+    def _make_post_hook(self, i: int):
+        def _post_hook(module, args, output):
+            if not self._streaming or i < self._resident_blocks:
+                return None
+            for slot in self._block_slots[i]:
+                slot.bind(slot.host)
+            self._block_events.pop(i, None)
+            return None
+        return _post_hook
+
+
+@dataclass
+class ResidencyDecision:
+    """How a model is kept: mode is RESIDENT, OFFLOAD or STREAM; budget_bytes is what it may use."""
+
+    mode: str
+    budget_bytes: int
+
+
+@dataclass
+class _Registration:
+    kind: str
+    size_bytes: int
+    streamable: bool
+    forced: Optional[str]
+
+
+class ResidencyPlanner:
+    """
+    Thread-safe per-model residency decisions for one VRAM budget.
+
+    Models are planned in MODEL_PRIORITY order. A model stays resident if it
+    fits next to the models already resident while leaving room to load the
+    largest one still to plan; otherwise it is loaded per use if it fits the
+    rest of the budget, else streamed. Forced decisions (offload_dit_to_cpu=False,
+    a nano-vllm LM that never leaves the GPU) only take their share of the budget.
+    """
+
+    def __init__(self, budget_bytes: int) -> None:
+        self.budget_bytes = max(0, int(budget_bytes))
+        self._models: Dict[int, _Registration] = {}
+        self._plan: Optional[Dict[int, ResidencyDecision]] = None
+        self._lock = Lock()
+
+    def register(self, model: Any, kind: str, size_bytes: int, streamable: bool = False,
+                 forced: Optional[str] = None) -> None:
+        registration = _Registration(kind, int(size_bytes), streamable, forced)
+        with self._lock:
+            if self._models.get(id(model)) != registration:
+                self._models[id(model)] = registration
+                self._plan = None
+
+    def unregister(self, model: Any) -> None:
+        with self._lock:
+            if self._models.pop(id(model), None) is not None:
+                self._plan = None
+
+    def _priority(self, reg: _Registration) -> int:
+        return MODEL_PRIORITY.index(reg.kind) if reg.kind in MODEL_PRIORITY else len(MODEL_PRIORITY)
+
+    def _compute(self) -> Dict[int, ResidencyDecision]:
+        plan: Dict[int, ResidencyDecision] = {}
+        remaining = self.budget_bytes
+        for key, reg in self._models.items():
+            if reg.forced == RESIDENT:
+                remaining -= reg.size_bytes
+                plan[key] = ResidencyDecision(RESIDENT, reg.size_bytes)
+        remaining = max(0, remaining)
+        pending = sorted(((k, r) for k, r in self._models.items() if k not in plan),
+                         key=lambda kr: self._priority(kr[1]))
+        for i, (key, reg) in enumerate(pending):
+            swap_room = max((r.size_bytes for _, r in pending[i + 1:]), default=0)
+            if reg.forced is None and reg.size_bytes + swap_room <= remaining:
+                plan[key] = ResidencyDecision(RESIDENT, reg.size_bytes)
+                remaining -= reg.size_bytes
+            elif reg.forced != STREAM and (reg.size_bytes <= remaining or not reg.streamable):
+                plan[key] = ResidencyDecision(OFFLOAD, remaining)
+            else:
+                plan[key] = ResidencyDecision(STREAM, remaining)
+        return plan
+
+    def decide(self, model: Any) -> ResidencyDecision:
+        with self._lock:
+            if self._plan is None:
+                self._plan = self._compute()
+                summary = ", ".join(f"{self._models[k].kind}={d.mode}" for k, d in self._plan.items())
+                logger.info(f"[offload_engine] Residency plan ({self.budget_bytes / 2**30:.1f}GB budget): {summary}")
+            return self._plan.get(id(model), ResidencyDecision(OFFLOAD, self.budget_bytes))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            plan = self._plan or {}
+            return {
+                "budget_bytes": self.budget_bytes,
+                "models": [
+                    {"kind": r.kind, "bytes": r.size_bytes, "mode": plan[k].mode if k in plan else None}
+                    for k, r in self._models.items()
+                ],
+            }
+
+
+# One offloader per model, shared by all handlers using it
+_offloaders: Dict[int, PinnedOffloader] = {}
+_offloaders_lock = Lock()
+
+
+def get_offloader(module: torch.nn.Module, device: Any, dtype: Optional[torch.dtype] = None) -> PinnedOffloader:
+    """Get the PinnedOffloader of module, creating it on first use."""
+    with _offloaders_lock:
+        offloader = _offloaders.get(id(module))
+        if offloader is None or offloader.module is not module:
+            offloader = PinnedOffloader(module, device, dtype)
+            _offloaders[id(module)] = offloader
+        return offloader
+
+
+# Lazily initialized global instance
+_planner: Optional[ResidencyPlanner] = None
+_planner_lock = Lock()
+
+
+def get_residency_planner() -> ResidencyPlanner:
+    """
+    Get the process-wide residency planner.
+
+    ACESTEP_VRAM_BUDGET_GB sets the budget; by default it is 90% of the GPU
+    memory minus DEFAULT_ACTIVATION_RESERVE_GB.
+    """
+    global _planner
+    if _planner is None:
+        with _planner_lock:
+            if _planner is None:
+                from acestep.gpu_config import get_gpu_memory_gb
+
+                budget_gb = None
+                raw = os.getenv("ACESTEP_VRAM_BUDGET_GB", "").strip()
+                if raw:
+                    try:
+                        budget_gb = float(raw)
+                    except ValueError:
+                        logger.warning("Invalid ACESTEP_VRAM_BUDGET_GB, using default")
+                if budget_gb is None:
+                    budget_gb = max(0.0, get_gpu_memory_gb() * 0.9 - DEFAULT_ACTIVATION_RESERVE_GB)
+                _planner = ResidencyPlanner(int(budget_gb * 1024 ** 3))
+    return _planner
@@ -0,0 +1,174 @@
+"""Content-addressed cache of finished generation results
+
+Generation is deterministic once every seed is fixed, so a request whose
+parameters, seeds, input audio and loaded models match an earlier one can be
+answered with the earlier result (audio tensors and files, LM metadata and
+codes) without touching the GPU.
+
+Keys come from acestep.audio_utils.generate_uuid_from_params. Entries are kept
+in an LRU bounded by the bytes of the tensors they hold.
+"""
+
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from acestep.audio_utils import generate_uuid_from_params, get_audio_file_hash
+
+# Default memory budget (MB): off, set ACESTEP_RESULT_CACHE_MB to enable the cache
+DEFAULT_RESULT_CACHE_MB = 0
+
+
+def _tensor_nbytes(value: Any, seen: Optional[set] = None) -> int:
+    """Bytes kept alive by the tensors in value: a view counts its whole storage, once."""
+    if seen is None:
+        seen = set()
+    if hasattr(value, "untyped_storage"):
+        storage = value.untyped_storage()
+        if storage.data_ptr() in seen:
+            return 0
+        seen.add(storage.data_ptr())
+        return storage.nbytes()
+    if isinstance(value, dict):
+        return sum(_tensor_nbytes(v, seen) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_tensor_nbytes(v, seen) for v in value)
+    return 0
+
+
+def deterministic_seeds(config) -> Optional[List[int]]:
+    """
+    The seed of every batch item if the config pins them all, else None.
+
+    Mirrors dit_handler.prepare_seeds: random seeds, -1 and missing entries
+    (padded with random seeds) make the run non-reproducible.
+    """
+    if config.use_random_seed or config.seeds is None:
+        return None
+    seeds = config.seeds if isinstance(config.seeds, list) else [config.seeds]
+    batch_size = config.batch_size if config.batch_size is not None else 1
+    try:
+        seeds = [int(s) for s in seeds[:batch_size]]
+    except (TypeError, ValueError):
+        return None
+    if len(seeds) < batch_size or any(s < 0 for s in seeds):
+        return None
+    return seeds
+
+
+def result_cache_key(dit_handler, llm_handler, params, config) -> Optional[str]:
+    """
+    Cache key of a generate_music call, or None if its output is not reproducible.
+
+    Covers the generation params (minus the cot_* fields the LM fills in), the
+    seeds and batch layout, the content of reference/source audio and the
+    identity of the loaded DiT (incl. LoRA) and LM.
+    """
+    seeds = deterministic_seeds(config)
+    if seeds is None:
+        return None
+    params_dict = {k: v for k, v in params.to_dict().items() if not k.startswith("cot_")}
+    for audio_field in ("reference_audio", "src_audio"):
+        if params_dict.get(audio_field):
+            params_dict[audio_field] = get_audio_file_hash(params_dict[audio_field])
+    lm_initialized = bool(llm_handler is not None and llm_handler.llm_initialized)
+    key_dict = {
+        "params": params_dict,
+        "seeds": seeds,
+        "batch_size": config.batch_size,
+        "allow_lm_batch": config.allow_lm_batch,
+        "lm_batch_chunk_size": config.lm_batch_chunk_size,
+        "audio_format": config.audio_format,
+        "dit_model": getattr(dit_handler, "model_name", None),
+        "lora_scale": dit_handler.lora_scale if getattr(dit_handler, "use_lora", False) else None,
+        "lm_model": getattr(llm_handler, "lm_model_name", None) if lm_initialized else None,
+        "lm_backend": llm_handler.llm_backend if lm_initialized else None,
+    }
+    try:
+        return generate_uuid_from_params(key_dict)
+    except (TypeError, ValueError):
+        # Params that are not JSON serializable (e.g. in-memory audio) are never cached
+        return None
+
+
+class ResultCache:
+    """Thread-safe LRU of generation results bounded by tensor bytes."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max(0, int(max_bytes))
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, entry: Any) -> bool:
+        """Store entry under key; returns False if it alone exceeds the budget."""
+        size = _tensor_nbytes(entry)
+        if not self.enabled or size > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._sizes.pop(key)
+                del self._entries[key]
+            self._entries[key] = entry
+            self._sizes[key] = size
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old_key, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(old_key)
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# Lazily initialized global instance
+_result_cache: Optional[ResultCache] = None
+_result_cache_lock = Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Get the process-wide result cache (size from ACESTEP_RESULT_CACHE_MB)"""
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                try:
+                    max_mb = float(os.getenv("ACESTEP_RESULT_CACHE_MB", str(DEFAULT_RESULT_CACHE_MB)))
+                except ValueError:
+                    logger.warning("Invalid ACESTEP_RESULT_CACHE_MB, using default")
+                    max_mb = DEFAULT_RESULT_CACHE_MB
+                _result_cache = ResultCache(int(max_mb * 1024 * 1024))
+    return _result_cache
@@ -1,2 +1,10 @@
-from nanovllm.llm import LLM
 from nanovllm.sampling_params import SamplingParams
+
+
+def __getattr__(name):
+    # LLM pulls in the model runner (flash_attn, triton); import it on first use
+    # so the engine modules (scheduler, block manager) import without them
+    if name == "LLM":
+        from nanovllm.llm import LLM
+        return LLM
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
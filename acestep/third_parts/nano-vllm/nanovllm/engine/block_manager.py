@@ -1,4 +1,4 @@
-from collections import deque
+from collections import OrderedDict, deque
 import xxhash
 import numpy as np
 
@@ -24,13 +24,49 @@ class Block:
 
 
 class BlockManager:
+    """
+    KV cache block allocator with prefix caching.
+
+    A freed block that holds a full, hashed block of tokens is not forgotten:
+    it goes to the cached-free pool (LRU order) with its hash mapping intact,
+    so a later sequence with the same prefix reuses its KV instead of
+    prefilling it again. Cached-free blocks count as free; allocation takes
+    blank blocks first and then evicts the least recently freed cached block.
+
+    Every bookkeeping operation is O(1): blank blocks are a deque popped from
+    the front, cached-free blocks an ordered dict indexed by block id, used
+    blocks a set.
+    """
 
     def __init__(self, num_blocks: int, block_size: int):
         self.block_size = block_size
         self.blocks: list[Block] = [Block(i) for i in range(num_blocks)]
         self.hash_to_block_id: dict[int, int] = dict()
         self.free_block_ids: deque[int] = deque(range(num_blocks))
+        self.cached_free_block_ids: OrderedDict[int, None] = OrderedDict()
         self.used_block_ids: set[int] = set()
+        # Prefix cache counters, in full blocks looked up
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_evictions = 0
+
+    @property
+    def num_free_blocks(self) -> int:
+        """Blocks available to allocate: blank ones plus evictable cached ones."""
+        return len(self.free_block_ids) + len(self.cached_free_block_ids)
+
+    def stats(self) -> dict:
+        lookups = self.num_hits + self.num_misses
+        return {
+            "num_blocks": len(self.blocks),
+            "block_size": self.block_size,
+            "used_blocks": len(self.used_block_ids),
+            "cached_free_blocks": len(self.cached_free_block_ids),
+            "hits": self.num_hits,
+            "misses": self.num_misses,
+            "hit_rate": self.num_hits / lookups if lookups else 0.0,
+            "evictions": self.num_evictions,
+        }
 
     @classmethod
     def compute_hash(cls, token_ids: list[int], prefix: int = -1):
@@ -40,21 +76,39 @@ class BlockManager:
         h.update(np.array(token_ids).tobytes())
         return h.intdigest()
 
+    def _take_free_block_id(self) -> int:
+        """Take a blank block, or else evict the least recently freed cached block (dropping its hash)."""
+        if self.free_block_ids:
+            return self.free_block_ids.popleft()
+        block_id, _ = self.cached_free_block_ids.popitem(last=False)
+        block = self.blocks[block_id]
+        if self.hash_to_block_id.get(block.hash) == block_id:
+            del self.hash_to_block_id[block.hash]
+        self.num_evictions += 1
+        return block_id
+
     def _allocate_block(self, block_id: int) -> Block:
+        """Mark block_id used: a block just taken by _take_free_block_id, or a cached-free prefix hit."""
         block = self.blocks[block_id]
         assert block.ref_count == 0
         block.reset()
-        self.free_block_ids.remove(block_id)
+        self.cached_free_block_ids.pop(block_id, None)
         self.used_block_ids.add(block_id)
         return self.blocks[block_id]
 
     def _deallocate_block(self, block_id: int) -> Block:
-        assert self.blocks[block_id].ref_count == 0
+        block = self.blocks[block_id]
+        assert block.ref_count == 0
         self.used_block_ids.remove(block_id)
-        self.free_block_ids.append(block_id)
+        if block.hash != -1 and self.hash_to_block_id.get(block.hash) == block_id:
+            # Keep the KV of a full block reachable through its hash until evicted
+            self.cached_free_block_ids[block_id] = None
+        else:
+            block.hash = -1
+            self.free_block_ids.append(block_id)
 
     def can_allocate(self, seq: Sequence) -> bool:
-        return len(self.free_block_ids) >= seq.num_blocks
+        return self.num_free_blocks >= seq.num_blocks
 
     def allocate(self, seq: Sequence):
         assert not seq.block_table
@@ -66,8 +120,16 @@ class BlockManager:
             block_id = self.hash_to_block_id.get(h, -1)
             if block_id == -1 or self.blocks[block_id].token_ids != token_ids:
                 cache_miss = True
+            elif i == seq.num_blocks - 1 and seq.num_cached_tokens + self.block_size == len(seq):
+                # Keep at least the last block uncached: prefill needs a token to compute logits from
+                cache_miss = True
+            if h != -1:
+                if cache_miss:
+                    self.num_misses += 1
+                else:
+                    self.num_hits += 1
             if cache_miss:
-                block_id = self.free_block_ids[0]
+                block_id = self._take_free_block_id()
                 block = self._allocate_block(block_id)
             else:
                 seq.num_cached_tokens += self.block_size
@@ -86,26 +148,22 @@ class BlockManager:
             block = self.blocks[block_id]
             block.ref_count -= 1
             if block.ref_count == 0:
-                # Fix: Clean up hash_to_block_id mapping to prevent stale references
-                # This prevents CUDA illegal memory access when prefix cache tries to
-                # reuse a block_id that has already been freed
-                if block.hash != -1:
-                    cached_id = self.hash_to_block_id.get(block.hash)
-                    if cached_id == block_id:
-                        del self.hash_to_block_id[block.hash]
+                # A hashed block moves to the cached-free pool; its hash_to_block_id entry
+                # is only dropped when the block is evicted for reuse, so a stale mapping
+                # never points at a block that holds other tokens
                 self._deallocate_block(block_id)
         seq.num_cached_tokens = 0
         seq.block_table.clear()
 
     def can_append(self, seq: Sequence) -> bool:
-        return len(self.free_block_ids) >= (len(seq) % self.block_size == 1)
+        return self.num_free_blocks >= (len(seq) % self.block_size == 1)
 
     def may_append(self, seq: Sequence):
         block_table = seq.block_table
         last_block = self.blocks[block_table[-1]]
         if len(seq) % self.block_size == 1:
             assert last_block.hash != -1
-            block_id = self.free_block_ids[0]
+            block_id = self._take_free_block_id()
             self._allocate_block(block_id)
             block_table.append(block_id)
         elif len(seq) % self.block_size == 0:
@@ -1,4 +1,5 @@
 import atexit
+from typing import Callable
 from dataclasses import fields
 from time import perf_counter
 from tqdm.auto import tqdm
@@ -108,7 +109,12 @@ class LLMEngine:
         sampling_params: SamplingParams | list[SamplingParams],
         use_tqdm: bool = True,
         unconditional_prompts: list[str] | list[list[int]] | None = None,
+        abort_check: Callable[[], None] | None = None,
     ) -> list[str]:
+        """
+        abort_check is called before every step; an exception it raises aborts the
+        generation (all sequences are freed) and propagates to the caller.
+        """
         # Clean up any residual state from previous interrupted generations
         # This prevents 'deque index out of range' errors from accumulated block leaks
         if not self.is_finished():
@@ -126,6 +132,8 @@ class LLMEngine:
         prefill_throughput = decode_throughput = 0.
         try:
             while not self.is_finished():
+                if abort_check is not None:
+                    abort_check()
                 t = perf_counter()
                 output, num_tokens = self.step()
                 if use_tqdm:
@@ -427,12 +427,7 @@ class ModelRunner:
                 logits_cfg = logits_uncond + cfg_scales_tensor * (logits_cond - logits_uncond)
                 
                 # Apply logits processor for constrained decoding (if any sequence has one)
-                for i, seq in enumerate(cond_seqs):
-                    if seq.logits_processor is not None:
-                        # Create input_ids tensor for this sequence
-                        seq_input_ids = torch.tensor([seq.token_ids], device=logits_cfg.device)
-                        # Apply processor to this sequence's logits
-                        logits_cfg[i:i+1] = seq.logits_processor(seq_input_ids, logits_cfg[i:i+1])
+                logits_cfg = self.apply_logits_processors(cond_seqs, logits_cfg)
                 
                 # Prepare input_ids for sampler (for repetition penalty, though we already applied it)
                 # cond_input_ids = torch.tensor([seq.token_ids for seq in cond_seqs], device=logits_cfg.device)
@@ -448,10 +443,7 @@ class ModelRunner:
                 ).tolist()
                 
                 # Update logits processor state after sampling
-                # NOTE: Only update for the first sequence since all sequences share the same processor
-                # Updating multiple times would cause duplicate state updates (e.g., codes_count += N instead of += 1)
-                if cond_seqs and cond_seqs[0].logits_processor_update_state is not None:
-                    cond_seqs[0].logits_processor_update_state(token_ids_cfg[0])
+                self.update_logits_processor_states(cond_seqs, token_ids_cfg)
                 
                 # Return token_ids (will be applied to both conditional and unconditional sequences)
                 return token_ids_cfg
@@ -494,14 +486,7 @@ class ModelRunner:
                 
                 # Apply logits processor for constrained decoding (if any sequence has one)
                 # Clone logits to avoid in-place update issues in inference mode
-                logits = logits.clone()
-                for i, seq in enumerate(seqs):
-                    if seq.logits_processor is not None:
-                        # Create input_ids tensor for this sequence
-                        seq_input_ids = torch.tensor([seq.token_ids], device=logits.device)
-                        # Apply processor to this sequence's logits (clone to avoid inference mode issues)
-                        processed = seq.logits_processor(seq_input_ids, logits[i:i+1].clone())
-                        logits[i] = processed[0]
+                logits = self.apply_logits_processors(seqs, logits.clone())
                 
                 # Prepare input_ids for sampler
                 # seq_input_ids = torch.tensor([seq.token_ids for seq in seqs], device=logits.device)
@@ -516,16 +501,44 @@ class ModelRunner:
                 ).tolist()
                 
                 # Update logits processor state after sampling
-                # NOTE: Only update for the first sequence since all sequences may share the same processor
-                # (when using a single SamplingParams for batch generation)
-                # Updating multiple times would cause duplicate state updates (e.g., codes_count += N instead of += 1)
-                if seqs and seqs[0].logits_processor_update_state is not None:
-                    seqs[0].logits_processor_update_state(token_ids[0])
+                self.update_logits_processor_states(seqs, token_ids)
                 
                 return token_ids
             else:
                 return None
 
+    def apply_logits_processors(self, seqs: list[Sequence], logits: torch.Tensor) -> torch.Tensor:
+        """
+        Run each logits processor once over all rows that share it.
+
+        Processors keep per-sequence state keyed by seq_id, so one batched call
+        replaces a call per row.
+        """
+        groups = {}
+        for i, seq in enumerate(seqs):
+            if seq.logits_processor is not None:
+                groups.setdefault(id(seq.logits_processor), (seq.logits_processor, []))[1].append(i)
+        for processor, rows in groups.values():
+            input_ids = [seqs[i].token_ids for i in rows]
+            seq_ids = [seqs[i].seq_id for i in rows]
+            if len(rows) == len(seqs):
+                logits = processor(input_ids, logits, seq_ids=seq_ids)
+            else:
+                index = torch.tensor(rows, device=logits.device)
+                logits[index] = processor(input_ids, logits[index], seq_ids=seq_ids)
+        return logits
+
+    def update_logits_processor_states(self, seqs: list[Sequence], token_ids: list[int]):
+        """Advance the processor state of every sequence by its sampled token."""
+        groups = {}
+        for seq, token_id in zip(seqs, token_ids):
+            if seq.logits_processor_update_state is not None:
+                tokens, seq_ids = groups.setdefault(seq.logits_processor_update_state, ([], []))
+                tokens.append(token_id)
+                seq_ids.append(seq.seq_id)
+        for update_state, (tokens, seq_ids) in groups.items():
+            update_state(tokens, seq_ids=seq_ids)
+
     @torch.inference_mode()
     def capture_cudagraph(self):
         config = self.config
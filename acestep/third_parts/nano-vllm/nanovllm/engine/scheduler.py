@@ -1,10 +1,61 @@
-from collections import deque
+from collections import OrderedDict
+from typing import Iterable, Iterator
 
 from nanovllm.config import Config
 from nanovllm.engine.sequence import Sequence, SequenceStatus
 from nanovllm.engine.block_manager import BlockManager
 
 
+class SequenceQueue:
+    """
+    FIFO of sequences with O(1) membership test and removal of any member.
+
+    An insertion-ordered dict keyed by seq_id stands in for a deque, so taking a
+    CFG pair's partner out of the middle of the queue does not scan it.
+    """
+
+    def __init__(self, seqs: Iterable[Sequence] = ()):
+        self._seqs: OrderedDict[int, Sequence] = OrderedDict((seq.seq_id, seq) for seq in seqs)
+
+    def __len__(self) -> int:
+        return len(self._seqs)
+
+    def __bool__(self) -> bool:
+        return bool(self._seqs)
+
+    def __iter__(self) -> Iterator[Sequence]:
+        return iter(self._seqs.values())
+
+    def __contains__(self, seq: Sequence) -> bool:
+        return self._seqs.get(seq.seq_id) is seq
+
+    def peek(self) -> Sequence:
+        return next(iter(self._seqs.values()))
+
+    def append(self, seq: Sequence):
+        self._seqs[seq.seq_id] = seq
+
+    def appendleft(self, seq: Sequence):
+        self._seqs[seq.seq_id] = seq
+        self._seqs.move_to_end(seq.seq_id, last=False)
+
+    def extendleft(self, seqs: Iterable[Sequence]):
+        for seq in seqs:
+            self.appendleft(seq)
+
+    def popleft(self) -> Sequence:
+        return self._seqs.popitem(last=False)[1]
+
+    def remove(self, seq: Sequence):
+        if seq not in self:
+            raise ValueError(f"sequence {seq.seq_id} not in queue")
+        del self._seqs[seq.seq_id]
+
+    def discard(self, seq: Sequence):
+        if seq in self:
+            del self._seqs[seq.seq_id]
+
+
 class Scheduler:
 
     def __init__(self, config: Config):
@@ -12,15 +63,30 @@ class Scheduler:
         self.max_num_batched_tokens = config.max_num_batched_tokens
         self.eos = config.eos
         self.block_manager = BlockManager(config.num_kvcache_blocks, config.kvcache_block_size)
-        self.waiting: deque[Sequence] = deque()
-        self.running: deque[Sequence] = deque()
+        self.waiting = SequenceQueue()
+        self.running = SequenceQueue()
 
     def is_finished(self):
         return not self.waiting and not self.running
 
     def add(self, seq: Sequence):
+        # A sequence (with its CFG partner) that outgrows the whole KV cache could
+        # never be scheduled again once preempted: reject it up front
+        seqs = [seq] if seq.paired_seq is None else [seq, seq.paired_seq]
+        num_blocks = sum(self._max_num_blocks(s) for s in seqs)
+        capacity = len(self.block_manager.blocks)
+        if num_blocks > capacity:
+            what = "CFG pair" if len(seqs) > 1 else "sequence"
+            raise ValueError(
+                f"{what} needs up to {num_blocks} KV cache blocks (prompt + max_tokens) but the cache only has "
+                f"{capacity} blocks of {self.block_manager.block_size} tokens; lower max_tokens or give the KV cache more memory"
+            )
         self.waiting.append(seq)
 
+    def _max_num_blocks(self, seq: Sequence) -> int:
+        block_size = self.block_manager.block_size
+        return (seq.num_prompt_tokens + seq.max_tokens + block_size - 1) // block_size
+
     def schedule(self) -> tuple[list[Sequence], bool]:
         # prefill
         scheduled_seqs = []
@@ -29,7 +95,7 @@ class Scheduler:
         processed_seqs = set()  # Track processed sequences to handle CFG pairs
         
         while self.waiting and num_seqs < self.max_num_seqs:
-            seq = self.waiting[0]
+            seq = self.waiting.peek()
             
             # For CFG sequences, ensure conditional and unconditional are scheduled together
             if seq.cfg_scale > 1.0 and seq.paired_seq is not None and not seq.is_unconditional:
@@ -46,7 +112,7 @@ class Scheduler:
                 # The old check was wrong: it checked each sequence independently,
                 # but didn't account for the total blocks needed by both
                 total_blocks_needed = seq.num_blocks + paired_seq.num_blocks
-                can_allocate_both = len(self.block_manager.free_block_ids) >= total_blocks_needed
+                can_allocate_both = self.block_manager.num_free_blocks >= total_blocks_needed
                 
                 if num_batched_tokens + total_tokens > self.max_num_batched_tokens or not can_allocate_both:
                     break
@@ -90,10 +156,10 @@ class Scheduler:
 
         # decode
         processed_seqs = set()
-        temp_running = list(self.running)  # Work with a copy
+        temp_running = SequenceQueue(self.running)  # Work with a copy
         
         while temp_running and num_seqs < self.max_num_seqs:
-            seq = temp_running.pop(0)
+            seq = temp_running.popleft()
             
             # For CFG sequences, ensure conditional and unconditional are scheduled together
             if seq.cfg_scale > 1.0 and seq.paired_seq is not None and not seq.is_unconditional:
@@ -111,26 +177,27 @@ class Scheduler:
                 blocks_needed_seq = 1 if len(seq) % block_size == 1 else 0
                 blocks_needed_paired = 1 if len(paired_seq) % block_size == 1 else 0
                 total_blocks_needed = blocks_needed_seq + blocks_needed_paired
-                can_append_both = len(self.block_manager.free_block_ids) >= total_blocks_needed
+                can_append_both = self.block_manager.num_free_blocks >= total_blocks_needed
                 
                 if not can_append_both:
                     # Try preempting other sequences
                     preempted = False
                     while not can_append_both and temp_running:
-                        other_seq = temp_running.pop(0)
+                        other_seq = temp_running.popleft()
                         if other_seq != seq and other_seq != paired_seq:
-                            self.preempt(other_seq)
+                            for s in self.preempt(other_seq):
+                                temp_running.discard(s)
                             # Recalculate with the same correct logic
-                            can_append_both = len(self.block_manager.free_block_ids) >= total_blocks_needed
+                            can_append_both = self.block_manager.num_free_blocks >= total_blocks_needed
                             preempted = True
                         else:
                             temp_running.append(other_seq)
                             break
                     
                     if not can_append_both:
-                        # Can't schedule this pair right now
-                        temp_running.append(seq)
-                        temp_running.append(paired_seq)
+                        # Can't schedule this pair right now: back to waiting (re-queuing it
+                        # in temp_running would spin forever)
+                        self.preempt(seq)
                         continue
                 
                 # Schedule both sequences
@@ -140,8 +207,7 @@ class Scheduler:
                     scheduled_seqs.append(s)
                     processed_seqs.add(s.seq_id)
                     # Remove from actual running list if scheduled
-                    if s in self.running:
-                        self.running.remove(s)
+                    self.running.discard(s)
             else:
                 # Normal sequence or unconditional (already processed)
                 if seq.seq_id in processed_seqs:
@@ -149,23 +215,21 @@ class Scheduler:
                     
                 while not self.block_manager.can_append(seq):
                     if temp_running:
-                        other_seq = temp_running.pop(0)
+                        other_seq = temp_running.popleft()
                         if other_seq != seq:
-                            self.preempt(other_seq)
+                            for s in self.preempt(other_seq):
+                                temp_running.discard(s)
                         else:
                             temp_running.append(other_seq)
                             break
                     else:
                         self.preempt(seq)
-                        if seq in self.running:
-                            self.running.remove(seq)
                         break
                 else:
                     num_seqs += 1
                     self.block_manager.may_append(seq)
                     scheduled_seqs.append(seq)
-                    if seq in self.running:
-                        self.running.remove(seq)
+                    self.running.discard(seq)
                     
         assert scheduled_seqs
         
@@ -178,10 +242,22 @@ class Scheduler:
         self.running.extendleft(reversed(scheduled_seqs))
         return scheduled_seqs, False
 
-    def preempt(self, seq: Sequence):
-        seq.status = SequenceStatus.WAITING
-        self.block_manager.deallocate(seq)
-        self.waiting.appendleft(seq)
+    def preempt(self, seq: Sequence) -> list[Sequence]:
+        """
+        Free seq's blocks and put it back at the front of waiting. A running CFG
+        partner is preempted with it (conditional first), so the pair stays in
+        lockstep. Returns the preempted sequences.
+        """
+        seqs = [seq]
+        paired_seq = seq.paired_seq
+        if paired_seq is not None and paired_seq.status == SequenceStatus.RUNNING:
+            seqs = [paired_seq, seq] if seq.is_unconditional else [seq, paired_seq]
+        for s in reversed(seqs):
+            s.status = SequenceStatus.WAITING
+            self.block_manager.deallocate(s)
+            self.running.discard(s)
+            self.waiting.appendleft(s)
+        return seqs
 
     def postprocess(self, seqs: list[Sequence], token_ids: list[int]) -> list[bool]:
         # Check if this is a CFG batch
@@ -216,10 +292,8 @@ class Scheduler:
                     uncond_seq.status = SequenceStatus.FINISHED
                     self.block_manager.deallocate(cond_seq)
                     self.block_manager.deallocate(uncond_seq)
-                    if cond_seq in self.running:
-                        self.running.remove(cond_seq)
-                    if uncond_seq in self.running:
-                        self.running.remove(uncond_seq)
+                    self.running.discard(cond_seq)
+                    self.running.discard(uncond_seq)
         else:
             # Normal batch
             for seq, token_id in zip(seqs, token_ids):
@@ -39,7 +39,7 @@ class Sequence:
         self.paired_seq = conditional_seq  # For conditional seq, points to uncond; for uncond seq, points to cond
         # For constrained decoding: logits processor and state update callback
         self.logits_processor: Optional[Any] = sampling_params.logits_processor
-        self.logits_processor_update_state: Optional[Callable[[int], None]] = sampling_params.logits_processor_update_state
+        self.logits_processor_update_state: Optional[Callable[..., None]] = sampling_params.logits_processor_update_state
 
     def __len__(self):
         return self.num_tokens
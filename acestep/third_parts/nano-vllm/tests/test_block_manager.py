@@ -0,0 +1,56 @@
+from nanovllm.engine.block_manager import BlockManager
+from nanovllm.engine.sequence import Sequence
+
+BLOCK_SIZE = 256
+
+
+def _seq(first_token: int, num_tokens: int) -> Sequence:
+    return Sequence([first_token] + list(range(1000, 1000 + num_tokens - 1)))
+
+
+def test_prefix_cache_hits_after_free():
+    manager = BlockManager(num_blocks=6, block_size=BLOCK_SIZE)
+    first = _seq(1, 600)  # two full (hashed) blocks and a partial one
+    manager.allocate(first)
+    first_blocks = list(first.block_table)
+    manager.deallocate(first)
+    assert manager.stats()["cached_free_blocks"] == 2
+
+    again = _seq(1, 600)
+    manager.allocate(again)
+
+    assert again.num_cached_tokens == 2 * BLOCK_SIZE
+    assert again.block_table[:2] == first_blocks[:2]
+    stats = manager.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (2, 2, 0)
+    assert stats["hit_rate"] == 0.5
+    assert stats["used_blocks"] == 3 and stats["cached_free_blocks"] == 0
+
+
+def test_cached_free_blocks_are_evicted_least_recently_freed_first():
+    manager = BlockManager(num_blocks=6, block_size=BLOCK_SIZE)
+    a, b = _seq(1, 513), _seq(2, 513)
+    manager.allocate(a)
+    manager.allocate(b)
+    a_blocks, b_blocks = list(a.block_table), list(b.block_table)
+    manager.deallocate(a)
+    manager.deallocate(b)
+    # Full blocks of a were freed before those of b; the partial last blocks went blank
+    assert list(manager.cached_free_block_ids) == [a_blocks[1], a_blocks[0], b_blocks[1], b_blocks[0]]
+    assert list(manager.free_block_ids) == [a_blocks[2], b_blocks[2]]
+
+    b_again = _seq(2, 513)
+    manager.allocate(b_again)  # reuses b's cached blocks by id and one blank block
+    assert b_again.block_table == [b_blocks[0], b_blocks[1], a_blocks[2]]
+
+    new = _seq(3, 513)
+    manager.allocate(new)  # the last blank block, then the oldest cached ones (a's)
+    assert new.block_table == [b_blocks[2], a_blocks[1], a_blocks[0]]
+    assert manager.stats()["evictions"] == 2
+    assert not manager.cached_free_block_ids
+
+    # a's prefix was evicted: allocating it again misses
+    misses = manager.num_misses
+    manager.deallocate(new)
+    manager.allocate(_seq(1, 513))
+    assert manager.num_misses == misses + 2
@@ -0,0 +1,112 @@
+import pytest
+
+from nanovllm.engine.scheduler import Scheduler, SequenceQueue
+from nanovllm.engine.sequence import Sequence, SequenceStatus
+from nanovllm.sampling_params import SamplingParams
+
+BLOCK_SIZE = 256
+EOS = -1
+
+
+class _Config:
+
+    def __init__(self, num_blocks: int, max_num_seqs: int = 16, max_num_batched_tokens: int = 16384):
+        self.max_num_seqs = max_num_seqs
+        self.max_num_batched_tokens = max_num_batched_tokens
+        self.eos = EOS
+        self.num_kvcache_blocks = num_blocks
+        self.kvcache_block_size = BLOCK_SIZE
+
+
+def _params(max_tokens: int, cfg_scale: float = 1.0) -> SamplingParams:
+    return SamplingParams(max_tokens=max_tokens, ignore_eos=True, cfg_scale=cfg_scale)
+
+
+def _cfg_pair(prompt: list[int], max_tokens: int) -> tuple[Sequence, Sequence]:
+    # Same construction as LLMEngine.add_request
+    params = _params(max_tokens, cfg_scale=2.0)
+    uncond = Sequence(prompt, params, is_unconditional=True)
+    cond = Sequence(prompt, params, conditional_seq=uncond)
+    uncond.paired_seq = cond
+    return cond, uncond
+
+
+def _add_pair(scheduler: Scheduler, prompt: list[int], max_tokens: int) -> tuple[Sequence, Sequence]:
+    cond, uncond = _cfg_pair(prompt, max_tokens)
+    scheduler.add(cond)
+    scheduler.add(uncond)
+    return cond, uncond
+
+
+def _run(scheduler: Scheduler, max_steps: int = 10000) -> int:
+    """Drive the scheduler like LLMEngine.step with a model that always emits token 7."""
+    for step in range(max_steps):
+        if scheduler.is_finished():
+            return step
+        seqs, _ = scheduler.schedule()
+        num_cfg_uncond = sum(s.is_unconditional for s in seqs)
+        scheduler.postprocess(seqs, [7] * (len(seqs) - num_cfg_uncond))
+    raise AssertionError("scheduler did not finish")
+
+
+def test_sequence_queue_keeps_fifo_order():
+    a, b, c, d = (Sequence([i]) for i in range(4))
+    queue = SequenceQueue([a, b])
+    queue.append(c)
+    queue.appendleft(d)
+    assert list(queue) == [d, a, b, c]
+
+    queue.remove(b)
+    assert b not in queue and list(queue) == [d, a, c]
+    with pytest.raises(ValueError):
+        queue.remove(b)
+    queue.discard(b)
+
+    queue.extendleft([a, b])  # re-queuing a member moves it to the front
+    assert list(queue) == [b, a, d, c]
+    assert queue.peek() is b
+    assert [queue.popleft() for _ in range(len(queue))] == [b, a, d, c]
+    assert not queue
+
+
+def test_add_rejects_cfg_pair_larger_than_kv_cache():
+    scheduler = Scheduler(_Config(num_blocks=8))
+    with pytest.raises(ValueError, match="CFG pair needs up to 10 KV cache blocks"):
+        _add_pair(scheduler, list(range(1000)), max_tokens=200)
+    assert scheduler.is_finished()
+
+
+def test_cfg_pair_filling_the_kv_cache_runs_to_completion():
+    scheduler = Scheduler(_Config(num_blocks=8))
+    cond, uncond = _add_pair(scheduler, list(range(700)), max_tokens=300)
+    _run(scheduler)
+    assert cond.num_completion_tokens == uncond.num_completion_tokens == 300
+    assert scheduler.block_manager.num_free_blocks == 8
+
+
+def test_preempt_takes_the_cfg_partner_along():
+    scheduler = Scheduler(_Config(num_blocks=8))
+    other = Sequence(list(range(10, 20)), _params(4))
+    scheduler.add(other)
+    cond, uncond = _add_pair(scheduler, list(range(300)), max_tokens=4)
+    seqs, is_prefill = scheduler.schedule()
+    assert is_prefill and set(seqs) == {other, cond, uncond}
+
+    preempted = scheduler.preempt(uncond)
+
+    assert preempted == [cond, uncond]
+    assert list(scheduler.waiting) == [cond, uncond]
+    assert list(scheduler.running) == [other]
+    assert all(s.status == SequenceStatus.WAITING and not s.block_table for s in preempted)
+    assert scheduler.block_manager.num_free_blocks == 8 - len(other.block_table)
+
+
+def test_contending_cfg_pairs_all_finish():
+    # Two pairs that each fill the cache on their own: they must take turns via preemption
+    scheduler = Scheduler(_Config(num_blocks=8))
+    pairs = [_add_pair(scheduler, [p] * 700, max_tokens=300) for p in (1, 2)]
+    _run(scheduler)
+    for cond, uncond in pairs:
+        assert cond.is_finished and uncond.is_finished
+        assert cond.completion_token_ids == uncond.completion_token_ids == [7] * 300
+    assert scheduler.block_manager.num_free_blocks == 8
@@ -658,6 +658,10 @@ class DatasetBuilder:
     
     def _get_audio_codes(self, audio_path: str, dit_handler) -> Optional[str]:
         """Encode audio to get semantic codes for LLM understanding.
+
+        The handler caches the codes by file content (acestep.latent_cache), so
+        relabeling a dataset, or labeling files already used for generation,
+        does not encode them again.
         
         Args:
             audio_path: Path to audio file
@@ -0,0 +1,112 @@
+"""Overlap device compute with device-to-host copies
+
+The offloaded tiled VAE decode/encode used to run each chunk as compute ->
+blocking .cpu() copy -> write, so the GPU idled during every transfer. With
+HostTransferPipeline the producer only queues a chunk: a copy stream moves it
+into a reused pinned host buffer while the next chunk computes, and a worker
+thread writes it to its destination (and hands it to streaming consumers)
+once the copy has landed. Without CUDA the copy itself runs on the worker.
+"""
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+import torch
+
+from acestep.cancellation import cancellation_scope, current_token
+
+
+class HostTransferPipeline:
+    """
+    Double-buffered device -> host transfer with an in-order consumer thread.
+
+    submit(chunk, consumer) runs consumer(host_chunk) on the copy worker, in
+    submission order; host_chunk is only valid during the call (its pinned
+    buffer is reused). At most num_buffers chunks are in flight, so the producer
+    never runs further ahead than that. Use as a context manager: leaving the
+    block waits for all queued work and re-raises the first worker error.
+    """
+
+    def __init__(self, device: Any = None, num_buffers: int = 2) -> None:
+        device = torch.device(device) if device is not None else None
+        self._cuda = device is not None and device.type == "cuda" and torch.cuda.is_available()
+        self._device = device
+        self._copy_stream = torch.cuda.Stream(device) if self._cuda else None
+        self._num_buffers = max(1, num_buffers)
+        self._slots = threading.Semaphore(self._num_buffers)
+        self._buffers: List[Optional[torch.Tensor]] = [None] * self._num_buffers
+        self._next_slot = 0
+        # Workers see the cancellation token of the thread that created the pipeline
+        self._token = current_token()
+        self._copy_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="host-copy")
+        self._futures: List[Future] = []
+
+    def __enter__(self) -> "HostTransferPipeline":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close(raise_errors=exc_type is None)
+
+    def _pinned_buffer(self, slot: int, like: torch.Tensor) -> torch.Tensor:
+        buf = self._buffers[slot]
+        if buf is None or buf.dtype != like.dtype or buf.numel() < like.numel():
+            buf = torch.empty(like.numel(), dtype=like.dtype, pin_memory=True)
+            self._buffers[slot] = buf
+        return buf[:like.numel()].view(like.shape)
+
+    def _raise_worker_error(self) -> None:
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+        self._futures = [f for f in self._futures if not f.done()]
+
+    def submit(self, chunk: torch.Tensor, consumer: Callable[[torch.Tensor], None]) -> None:
+        """Queue chunk (a device tensor) for transfer; consumer receives its host copy."""
+        self._raise_worker_error()
+        self._slots.acquire()  # A buffer is free once the chunk submitted num_buffers ago is consumed
+        try:
+            if self._cuda:
+                slot = self._next_slot
+                self._next_slot = (slot + 1) % self._num_buffers
+                host = self._pinned_buffer(slot, chunk)
+                computed = torch.cuda.Event()
+                computed.record(torch.cuda.current_stream(self._device))
+                with torch.cuda.stream(self._copy_stream):
+                    self._copy_stream.wait_event(computed)
+                    host.copy_(chunk, non_blocking=True)
+                    # Keep the allocator from reusing chunk's memory before the copy ran
+                    chunk.record_stream(self._copy_stream)
+                    copied = torch.cuda.Event()
+                    copied.record(self._copy_stream)
+                future = self._copy_executor.submit(self._consume, consumer, host, copied)
+            else:
+                future = self._copy_executor.submit(self._consume, consumer, chunk, None)
+        except BaseException:
+            self._slots.release()
+            raise
+        self._futures.append(future)
+
+    def _consume(self, consumer: Callable[[torch.Tensor], None], host: torch.Tensor, copied: Any) -> None:
+        try:
+            with cancellation_scope(self._token):
+                if copied is not None:
+                    copied.synchronize()
+                else:
+                    host = host.cpu()
+                consumer(host)
+        finally:
+            self._slots.release()
+
+    def close(self, raise_errors: bool = True) -> None:
+        """Wait for all queued work; re-raise the first worker error if raise_errors."""
+        error = None
+        for future in self._futures:
+            try:
+                future.result()
+            except BaseException as e:
+                error = error or e
+        self._futures = []
+        self._copy_executor.shutdown(wait=True)
+        if error is not None and raise_errors:
+            raise error
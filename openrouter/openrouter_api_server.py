@@ -38,6 +38,7 @@ from fastapi import FastAPI, HTTPException, Depends, Header, Request
 from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
+from acestep.cancellation import CancellationToken, run_cancellable
 from acestep.handler import AceStepHandler
 from acestep.llm_inference import LLMHandler
 from acestep.inference import (
@@ -561,6 +562,7 @@ def create_app() -> FastAPI:
     @app.post("/v1/chat/completions")
     async def chat_completions(
         request: ChatCompletionRequest,
+        http_request: Request,
         _: None = Depends(verify_api_key),
     ):
         """
@@ -571,6 +573,7 @@ def create_app() -> FastAPI:
         - Without tags: heuristic detection (lyrics vs sample_query for LLM)
 
         Supports streaming mode when request.stream=True.
+        The generation is cancelled when the client disconnects before it finishes.
         """
         # Check if model is initialized
         if not app.state._initialized:
@@ -590,6 +593,7 @@ def create_app() -> FastAPI:
         # Generate unique IDs
         completion_id = f"chatcmpl-{os.urandom(8).hex()}"
         created_timestamp = int(time.time())
+        cancel_token = CancellationToken()
 
         def _run_lm_sample() -> Dict[str, Any]:
             """Run LLM sample generation or format_sample (blocking)."""
@@ -778,7 +782,17 @@ def create_app() -> FastAPI:
         # Handle streaming mode
         if request.stream:
             async def stream_generator():
-                """Generate SSE stream."""
+                """Generate SSE stream, cancelling the generation if the client leaves early."""
+                finished = False
+                try:
+                    async for chunk in _stream_chunks():
+                        yield chunk
+                    finished = True
+                finally:
+                    if not finished:
+                        cancel_token.cancel("client disconnected")
+
+            async def _stream_chunks():
                 loop = asyncio.get_running_loop()
                 executor = app.state.executor
 
@@ -792,7 +806,7 @@ def create_app() -> FastAPI:
                 # Step 1: Run LM sample generation
                 print("[OpenRouter API] Stream: Running LM sample...")
                 try:
-                    lm_result = await loop.run_in_executor(executor, _run_lm_sample)
+                    lm_result = await loop.run_in_executor(executor, run_cancellable, cancel_token, _run_lm_sample)
                 except Exception as e:
                     print(f"[OpenRouter API] Stream: LM error: {e}")
                     lm_result = {
@@ -822,7 +836,7 @@ def create_app() -> FastAPI:
                 print("[OpenRouter API] Stream: Starting audio generation...")
                 audio_future = loop.run_in_executor(
                     executor,
-                    functools.partial(_run_audio_generation, lm_result)
+                    functools.partial(run_cancellable, cancel_token, _run_audio_generation, lm_result)
                 )
 
                 # Send heartbeat while waiting
@@ -907,7 +921,15 @@ def create_app() -> FastAPI:
 
         try:
             loop = asyncio.get_running_loop()
-            result = await loop.run_in_executor(app.state.executor, _blocking_generate)
+            future = loop.run_in_executor(app.state.executor, run_cancellable, cancel_token, _blocking_generate)
+            while not future.done():
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), timeout=1.0)
+                except asyncio.TimeoutError:
+                    if not cancel_token.cancelled and await http_request.is_disconnected():
+                        print("[OpenRouter API] Client disconnected, cancelling generation")
+                        cancel_token.cancel("client disconnected")
+            result = await future
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
 
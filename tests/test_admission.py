@@ -0,0 +1,73 @@
+"""Accept / split / defer decisions of the memory admission controller."""
+import pytest
+
+from acestep.admission import (
+    ACTION_ACCEPT,
+    ACTION_DEFER,
+    ACTION_SPLIT,
+    AdmissionController,
+    MemoryPredictor,
+    memory_features,
+)
+
+
+@pytest.fixture
+def controller():
+    # Prior model, 1 min of audio with tiled decode: 0.5 + 1.4 GB per audio, so 6 fit in 10 GB
+    return AdmissionController(MemoryPredictor(), vram_total_gb=10.0, vram_fraction=1.0, min_free_ram_gb=2.0)
+
+
+def test_prior_prediction_grows_with_batch():
+    predictor = MemoryPredictor()
+    vram_1, _ = predictor.predict(memory_features(60.0, 1))
+    vram_4, _ = predictor.predict(memory_features(60.0, 4))
+    assert vram_1 == pytest.approx(1.9)
+    assert vram_4 == pytest.approx(6.1)
+
+
+def test_batch_that_fits_is_accepted(controller):
+    decision = controller.decide(60.0, 4)
+    assert decision.action == ACTION_ACCEPT
+    assert decision.batch_sizes == [4]
+    assert decision.predicted_vram_gb == pytest.approx(6.1)
+
+
+def test_oversized_batch_is_split(controller):
+    decision = controller.decide(60.0, 8)
+    assert decision.action == ACTION_SPLIT
+    assert decision.batch_sizes == [6, 2]
+
+
+def test_job_waits_for_reservations_of_running_jobs(controller):
+    controller.reserve("running", 5.0, 0.0)
+    decision = controller.decide(60.0, 4)
+    assert decision.action == ACTION_DEFER
+    assert decision.batch_sizes == [4]
+
+    controller.release("running")
+    assert controller.decide(60.0, 4).action == ACTION_ACCEPT
+
+
+def test_low_host_ram_shrinks_the_batch(controller):
+    # RAM prior: 0.5 + 0.1 GB per audio-minute, 0.85 GB usable above the 2 GB floor
+    decision = controller.decide(60.0, 4, ram_available_gb=2.85)
+    assert decision.action == ACTION_SPLIT
+    assert decision.batch_sizes == [3, 1]
+
+
+def test_single_audio_over_budget_runs_alone():
+    controller = AdmissionController(MemoryPredictor(), vram_total_gb=1.0, vram_fraction=1.0)
+    decision = controller.decide(60.0, 3)
+    assert decision.action == ACTION_SPLIT
+    assert decision.batch_sizes == [1, 1, 1]
+    assert controller.decide(60.0, 1).action == ACTION_ACCEPT
+
+
+def test_max_batch_items(controller):
+    assert controller.max_batch_items(60.0) == 6
+    assert controller.max_batch_items(60.0, limit=4) == 4
+
+    controller.resident_vram_gb = 9.0
+    assert controller.max_batch_items(60.0) == 1
+    unknown_gpu = AdmissionController(MemoryPredictor(), vram_total_gb=0.0)
+    assert unknown_gpu.max_batch_items(60.0, limit=16) == 16
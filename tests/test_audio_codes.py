@@ -0,0 +1,76 @@
+"""Typed 5Hz audio code sequences and their text / wire encodings."""
+import base64
+
+import numpy as np
+import torch
+
+from acestep.audio_codes import MAX_AUDIO_CODE, WIRE_PREFIX, AudioCodes, audio_codes_text, code_token_lookup
+
+
+def test_values_are_stored_as_read_only_uint16():
+    codes = AudioCodes([0, 17, MAX_AUDIO_CODE])
+    assert codes.values.dtype == np.dtype("<u2")
+    assert not codes.values.flags.writeable
+    assert codes.tolist() == [0, 17, MAX_AUDIO_CODE]
+
+
+def test_out_of_range_values_are_clamped():
+    assert AudioCodes([-5, 70000]).tolist() == [0, MAX_AUDIO_CODE]
+
+
+def test_base64_round_trip():
+    codes = AudioCodes([0, 1, 255, 256, 40000, MAX_AUDIO_CODE])
+    wire = codes.to_base64()
+    assert wire.startswith(WIRE_PREFIX)
+    # Two little-endian bytes per code
+    assert base64.b64decode(wire[len(WIRE_PREFIX):])[6:8] == (256).to_bytes(2, "little")
+
+    assert AudioCodes.from_base64(wire) == codes
+    assert AudioCodes.from_base64(wire[len(WIRE_PREFIX):]) == codes
+    assert AudioCodes.parse(wire) == codes
+
+
+def test_token_string_round_trip():
+    text = "<|audio_code_3|> noise <|audio_code_63999|><|audio_code_12|>"
+    codes = AudioCodes.from_token_string(text)
+    assert codes.tolist() == [3, 63999, 12]
+    assert AudioCodes.from_token_string(codes.to_token_string()) == codes
+    assert str(codes) == "<|audio_code_3|><|audio_code_63999|><|audio_code_12|>"
+
+
+def test_parse_accepts_every_input_form():
+    codes = AudioCodes([4, 5])
+    assert AudioCodes.parse(codes) is codes
+    assert AudioCodes.parse([4, 5]) == codes
+    assert AudioCodes.parse(torch.tensor([4, 5])) == codes
+    assert AudioCodes.parse("  <|audio_code_4|><|audio_code_5|>\n") == codes
+    for empty in (None, "", "   ", "no codes here", [], AudioCodes([])):
+        assert AudioCodes.parse(empty) is None
+
+
+def test_equal_sequences_hash_alike():
+    assert len({AudioCodes([1, 2]), AudioCodes(np.array([1, 2])), AudioCodes([2, 1])}) == 2
+
+
+class _FakeTokenizer:
+    def __init__(self):
+        self._vocab = {"<pad>": 0, "hello": 1, "<|audio_code_7|>": 2, "<|audio_code_900|>": 5}
+
+    def get_vocab(self):
+        return dict(self._vocab)
+
+    def __len__(self):
+        return len(self._vocab)
+
+
+def test_codes_from_generated_token_ids():
+    lookup = code_token_lookup(_FakeTokenizer())
+    assert lookup.tolist() == [-1, -1, 7, -1, -1, 900]
+    codes = AudioCodes.from_token_ids([1, 2, 0, 5, 99, -1, 2], lookup)
+    assert codes.tolist() == [7, 900, 7]
+
+
+def test_audio_codes_text():
+    assert audio_codes_text(None) == ""
+    assert audio_codes_text("<|audio_code_1|>") == "<|audio_code_1|>"
+    assert audio_codes_text(AudioCodes([1])) == "<|audio_code_1|>"
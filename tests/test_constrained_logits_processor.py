@@ -0,0 +1,122 @@
+"""Per-sequence FSM state of MetadataConstrainedLogitsProcessor in batched decoding."""
+import math
+import string
+
+import pytest
+import torch
+
+from acestep.constrained_logits_processor import FSMState, MetadataConstrainedLogitsProcessor
+
+
+class _CharTokenizer:
+    """One token per character, plus the special tokens the FSM looks for."""
+
+    eos_token_id = 0
+
+    def __init__(self):
+        special = ["<|endoftext|>", "<think>", "</think>"] + [f"<|audio_code_{i}|>" for i in range(8)]
+        chars = [c for c in string.printable if c not in "\t\r\x0b\x0c"] + ["♯", "♭"]
+        self._tokens = special + chars
+        self._ids = {token: i for i, token in enumerate(self._tokens)}
+        self._special = sorted(special, key=len, reverse=True)
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def encode(self, text, add_special_tokens=False):
+        ids, i = [], 0
+        while i < len(text):
+            token = next((s for s in self._special if text.startswith(s, i)), text[i])
+            if token in self._ids:
+                ids.append(self._ids[token])
+            i += len(token)
+        return ids
+
+    def decode(self, ids, **kwargs):
+        return "".join(self._tokens[i] for i in ids)
+
+    def token_id(self, token):
+        return self._ids[token]
+
+
+@pytest.fixture
+def tokenizer():
+    return _CharTokenizer()
+
+
+@pytest.fixture
+def processor(tokenizer):
+    return MetadataConstrainedLogitsProcessor(tokenizer)
+
+
+def _allowed(scores_row):
+    return {i for i, v in enumerate(scores_row.tolist()) if v != -math.inf}
+
+
+def _state(processor, seq_id):
+    return processor._sequence_states["state"][processor._slot_of(seq_id)]
+
+
+def test_metadata_fields_advance_per_sequence(processor, tokenizer):
+    think, newline = tokenizer.token_id("<think>"), tokenizer.token_id("\n")
+    processor.update_state([think], seq_ids=["a"])
+    assert _state(processor, "a") == FSMState.NEWLINE_AFTER_THINK
+    assert _state(processor, "b") == FSMState.THINK_TAG
+
+    scores = processor([[think], []], torch.zeros(2, len(tokenizer)), seq_ids=["a", "b"])
+    assert _allowed(scores[0]) == {newline}
+    assert _allowed(scores[1]) == {think}
+
+    # Rows follow their sequence, not their position in the batch
+    scores = processor([[], [think]], torch.zeros(2, len(tokenizer)), seq_ids=["b", "a"])
+    assert _allowed(scores[0]) == {think}
+    assert _allowed(scores[1]) == {newline}
+
+
+def test_codes_duration_constraint_per_sequence(processor, tokenizer):
+    processor.set_generation_phase("codes")
+    processor.set_target_duration(1.0)  # 5 codes
+    code = tokenizer.token_id("<|audio_code_3|>")
+    codes = {tokenizer.token_id(f"<|audio_code_{i}|>") for i in range(8)}
+    prompt = tokenizer.encode("<think>\nbpm: 120\n</think>\n")
+
+    processor([prompt, prompt, []], torch.zeros(3, len(tokenizer)), seq_ids=["a", "b", "c"])
+    assert [_state(processor, s) for s in "abc"] == [
+        FSMState.CODES_GENERATION, FSMState.CODES_GENERATION, FSMState.THINK_TAG,
+    ]
+    for _ in range(5):
+        processor.update_state([code], seq_ids=["a"])
+    processor.update_state([code, code], seq_ids=["b", "b"])
+
+    scores = processor([prompt, prompt, []], torch.zeros(3, len(tokenizer)), seq_ids=["a", "b", "c"])
+    assert _allowed(scores[0]) == {tokenizer.eos_token_id}
+    assert _allowed(scores[1]) == codes
+    assert _allowed(scores[2]) == {tokenizer.token_id("<think>")}
+
+    # A target set for one sequence leaves the others alone
+    processor.set_target_duration(0.4, seq_id="b")  # 2 codes
+    scores = processor([prompt, prompt], torch.zeros(2, len(tokenizer)), seq_ids=["b", "c"])
+    assert _allowed(scores[0]) == {tokenizer.eos_token_id}
+    assert processor._sequence_states["target_codes"][processor._slot_of("c")] == 5
+
+
+def test_temperature_follows_each_row_phase(processor, tokenizer):
+    processor.set_generation_phase("codes")
+    processor.metadata_temperature = 0.5
+    processor.codes_temperature = 2.0
+    prompt = tokenizer.encode("</think>")
+
+    scores = processor([prompt, []], torch.ones(2, len(tokenizer)), seq_ids=["codes", "meta"])
+    assert scores[0, tokenizer.token_id("<|audio_code_0|>")] == pytest.approx(0.5)
+    assert scores[1, tokenizer.token_id("<think>")] == pytest.approx(2.0)
+
+
+def test_rows_default_to_their_index_and_reset_drops_states(processor, tokenizer):
+    processor.update_state([tokenizer.token_id("<think>"), tokenizer.token_id("<")])
+    assert _state(processor, 0) == FSMState.NEWLINE_AFTER_THINK
+    assert _state(processor, 1) == FSMState.THINK_TAG
+    assert processor._sequence_states["position_in_state"][processor._slot_of(1)] == 1
+
+    processor.reset()
+    assert _state(processor, 0) == FSMState.THINK_TAG
+    assert processor._slots == {0: 0}
@@ -0,0 +1,76 @@
+"""Per-sample text encoder output cache and its use by AceStepHandler."""
+import pytest
+import torch
+
+import acestep.handler as handler_module
+from acestep.embedding_cache import EmbeddingCache
+from acestep.handler import AceStepHandler
+
+HIDDEN = 4
+
+
+def test_key_depends_on_kind_encoder_and_tokens():
+    ids = torch.tensor([5, 6, 7])
+    key = EmbeddingCache.key("text", "enc", ids)
+    assert EmbeddingCache.key("text", "enc", ids.clone().int()) == key
+    assert EmbeddingCache.key("lyric", "enc", ids) != key
+    assert EmbeddingCache.key("text", "other", ids) != key
+    assert EmbeddingCache.key("text", "enc", ids[:2]) != key
+
+
+def test_put_stores_a_cpu_copy_not_a_view():
+    cache = EmbeddingCache(max_bytes=1 << 20)
+    batch = torch.randn(2, 3, HIDDEN)
+    cache.put("k", batch[0])
+
+    stored = cache.get("k")
+    assert torch.equal(stored, batch[0])
+    assert stored.untyped_storage().nbytes() == 3 * HIDDEN * 4
+    assert cache.stats()["device"] == "cpu"
+    assert EmbeddingCache(1, device="gpu").device == "cpu"
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    cache = EmbeddingCache(max_bytes=1 << 20)
+    monkeypatch.setattr(handler_module, "get_embedding_cache", lambda: cache)
+    handler = AceStepHandler()
+    handler.text_encoder_path = "text-encoder"
+    handler.encoded_rows = []
+
+    def infer_text_embeddings(token_ids):
+        handler.encoded_rows.append(token_ids.shape[0])
+        return token_ids.float().unsqueeze(-1).repeat(1, 1, HIDDEN)
+
+    handler.infer_text_embeddings = infer_text_embeddings
+    return handler
+
+
+def _padded(*rows):
+    length = max(len(r) for r in rows)
+    ids = torch.tensor([r + [0] * (length - len(r)) for r in rows])
+    mask = torch.tensor([[1] * len(r) + [0] * (length - len(r)) for r in rows])
+    return ids, mask
+
+
+def test_only_uncached_samples_are_encoded(handler):
+    ids, mask = _padded([1, 2, 3], [4, 5])
+    first = handler._infer_embeddings_cached([("text", ids, mask)])[0]
+    assert handler.encoded_rows == [2]
+
+    # [4, 5] is cached even though it now sits in a batch padded to another length
+    ids, mask = _padded([4, 5], [6, 7, 8, 9])
+    second = handler._infer_embeddings_cached([("text", ids, mask)])[0]
+    assert handler.encoded_rows == [2, 1]
+    assert torch.equal(second[0, :2], first[1, :2])
+    assert torch.equal(second[1], torch.tensor([6.0, 7.0, 8.0, 9.0]).unsqueeze(-1).repeat(1, HIDDEN))
+
+    handler._infer_embeddings_cached([("text", ids, mask)])
+    assert handler.encoded_rows == [2, 1]
+
+
+def test_padding_positions_are_zero(handler):
+    ids, mask = _padded([1, 2, 3], [4])
+    hidden = handler._infer_embeddings_cached([("text", ids, mask)])[0]
+    assert hidden.shape == (2, 3, HIDDEN)
+    assert torch.count_nonzero(hidden[1, 1:]) == 0
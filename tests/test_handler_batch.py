@@ -0,0 +1,118 @@
+"""Cross-request batching in AceStepHandler.generate_music_batch (no model weights needed)."""
+import torch
+
+from acestep.handler import NO_REFERENCE_AUDIO, AceStepHandler
+
+SAMPLE_RATE = 48000
+FRAMES_PER_LATENT = 1920
+
+
+class _FakeTokenizer:
+    pad_token_id = 0
+
+    def __call__(self, text, **kwargs):
+        ids = torch.arange(1, min(len(text), 16) + 1).unsqueeze(0)
+        return type("Encoded", (), {"input_ids": ids, "attention_mask": torch.ones_like(ids)})()
+
+
+def _make_handler() -> AceStepHandler:
+    handler = AceStepHandler()
+    handler.model = handler.vae = handler.text_encoder = object()
+    handler.text_tokenizer = _FakeTokenizer()
+    handler.silence_latent = torch.zeros(1, 3000, 8)
+
+    def prepare_inputs(**kwargs):
+        batch_size = kwargs["actual_batch_size"]
+        frames = int(kwargs["audio_duration"] * SAMPLE_RATE)
+        return {
+            "captions": [kwargs["captions"]] * batch_size,
+            "lyrics": [kwargs["lyrics"]] * batch_size,
+            "metas": [{"duration": kwargs["audio_duration"]}] * batch_size,
+            "vocal_languages": ["en"] * batch_size,
+            "instructions": [kwargs["instruction"]] * batch_size,
+            "refer_audios": [[NO_REFERENCE_AUDIO] for _ in range(batch_size)],
+            "target_wavs": torch.zeros(batch_size, 2, frames),
+            "audio_code_hints": None,
+            "task_type": "text2music",
+        }
+
+    def generate_and_decode(use_tiled_decode=True, progress=None, **service_kwargs):
+        # Stands in for the DiT + VAE: one output sample block per latent frame of the real batch
+        batch = handler._prepare_batch(
+            captions=service_kwargs["captions"],
+            lyrics=service_kwargs["lyrics"],
+            target_wavs=service_kwargs["target_wavs"],
+            refer_audios=service_kwargs["refer_audios"],
+            metas=service_kwargs["metas"],
+            vocal_languages=service_kwargs["vocal_languages"],
+            instructions=service_kwargs["instructions"],
+            audio_code_hints=service_kwargs["audio_code_hints"],
+            target_wav_lengths=service_kwargs.get("target_wav_lengths"),
+        )
+        latent_masks = batch["latent_masks"]
+        pred_wavs = torch.ones(latent_masks.shape[0], 2, latent_masks.shape[1] * FRAMES_PER_LATENT)
+        return pred_wavs, {"latent_masks": latent_masks}, {}, None
+
+    handler._prepare_generation_inputs = prepare_inputs
+    handler._service_generate_and_decode = generate_and_decode
+    handler._build_extra_outputs = lambda *args, **kwargs: {}
+    return handler
+
+
+def test_batched_requests_keep_their_own_durations():
+    handler = _make_handler()
+    items = [
+        {"captions": "short", "lyrics": "", "audio_duration": 31.0, "batch_size": 1, "seeds": [1]},
+        {"captions": "long", "lyrics": "", "audio_duration": 60.0, "batch_size": 2, "seeds": [2, 3]},
+    ]
+
+    results = handler.generate_music_batch(items)
+
+    assert all(r["success"] for r in results), results
+    short_lengths = [a["tensor"].shape[-1] for a in results[0]["audios"]]
+    long_lengths = [a["tensor"].shape[-1] for a in results[1]["audios"]]
+    assert short_lengths == [int(31.0 * SAMPLE_RATE) // FRAMES_PER_LATENT * FRAMES_PER_LATENT]
+    assert long_lengths == [60 * SAMPLE_RATE] * 2
+
+
+def test_prepare_batch_masks_follow_real_lengths():
+    handler = _make_handler()
+    lengths = [10 * SAMPLE_RATE, 20 * SAMPLE_RATE]
+    batch = handler._prepare_batch(
+        captions=["a", "b"],
+        lyrics=["", ""],
+        metas=[{"duration": 10}, {"duration": 20}],
+        vocal_languages=["en", "en"],
+        target_wavs=torch.zeros(2, 2, max(lengths)),
+        target_wav_lengths=lengths,
+    )
+
+    assert batch["latent_masks"].sum(dim=1).tolist() == [n // FRAMES_PER_LATENT for n in lengths]
+
+
+def test_uncached_source_audio_is_not_hashed_and_encodes_once(monkeypatch):
+    import acestep.latent_cache as latent_cache
+
+    monkeypatch.setattr(latent_cache, "_latent_cache", latent_cache.LatentCache(None, 0, 0))
+    handler = _make_handler()
+    encoded_batches = []
+
+    def encode(wavs):
+        encoded_batches.append(len(wavs))
+        return [torch.zeros(wav.shape[-1] // FRAMES_PER_LATENT, 8) for wav in wavs]
+
+    def no_hash(audio):
+        raise AssertionError("hashed with the latent cache off")
+
+    handler._encode_audio_batch_to_latents = encode
+    handler._src_latent_key = no_hash
+    source = torch.rand(2, 10 * SAMPLE_RATE)
+    handler._prepare_batch(
+        captions=["a", "b", "c"],
+        lyrics=["", "", ""],
+        metas=[{"duration": 10}] * 3,
+        vocal_languages=["en"] * 3,
+        target_wavs=torch.stack([source, source, torch.rand(2, 10 * SAMPLE_RATE)]),
+    )
+
+    assert encoded_batches == [2]
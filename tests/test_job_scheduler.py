@@ -0,0 +1,117 @@
+"""Cost model and priority queue of the API server scheduler."""
+import asyncio
+import time
+
+import pytest
+
+from acestep.job_scheduler import JobCostEstimator, PriorityJobQueue, job_features, ridge_fit
+
+
+def test_estimator_refits_towards_measured_durations():
+    estimator = JobCostEstimator(initial_seconds=5.0)
+    long_job = job_features(240.0, 8, 1, False)
+    before = estimator.estimate(long_job)
+
+    for _ in range(20):
+        estimator.observe(long_job, 60.0)
+
+    assert estimator.estimate(long_job) == pytest.approx(60.0, rel=0.1)
+    assert estimator.estimate(long_job) > before
+    assert all(w >= 0.0 for w in estimator.coefficients.values())
+
+
+def test_estimator_ignores_non_positive_samples():
+    estimator = JobCostEstimator(initial_seconds=5.0)
+    coefficients = estimator.coefficients
+    estimator.observe(job_features(60.0, 8, 1, False), 0.0)
+    assert estimator.coefficients == coefficients
+
+
+def test_shortest_job_first_within_a_class():
+    q = PriorityJobQueue(aging_rate=0.0)
+    q.put_nowait("long", key="long", cost=50.0)
+    q.put_nowait("short", key="short", cost=5.0)
+    q.put_nowait("urgent", key="urgent", cost=100.0, priority=-1)
+
+    assert [key for key, _ in q.ordered()] == ["urgent", "short", "long"]
+    assert q.position("long") == 3
+    assert q.position("missing") == 0
+    assert q.cost_until("short") == pytest.approx(105.0)
+
+
+def test_aging_lets_a_long_job_overtake():
+    q = PriorityJobQueue(aging_rate=1.0)
+    q.put_nowait("short", key="short", cost=5.0)
+    q.put_nowait("long", key="long", cost=50.0, enqueued_at=time.time() - 100.0)
+
+    assert q.position("long") == 1
+
+
+def test_enqueued_at_carries_waiting_time_over():
+    # A job claimed from the shared queue keeps the aging credit it earned there
+    q = PriorityJobQueue(aging_rate=1.0, class_seconds=300.0)
+    q.put_nowait("fresh", key="fresh", cost=10.0, priority=1)
+    q.put_nowait("waited", key="waited", cost=30.0, priority=1, enqueued_at=time.time() - 60.0)
+
+    assert q.get_nowait() == "waited"
+    assert q.get_nowait() == "fresh"
+
+
+def test_fifo_policy_ignores_cost():
+    q = PriorityJobQueue(aging_rate=0.0, use_cost=False)
+    q.put_nowait("long", key="long", cost=50.0)
+    q.put_nowait("short", key="short", cost=5.0)
+
+    assert q.get_nowait() == "long"
+
+
+def test_remove_counts_as_served_but_take_does_not():
+    async def scenario():
+        q = PriorityJobQueue()
+        q.put_nowait("a", key="a")
+        q.put_nowait("b", key="b")
+
+        assert q.remove("a") == "a"
+        assert q.remove("a") is None
+        assert q.take("b") == "b"
+        assert q.empty()
+        # "b" was taken like get(): the queue joins only once it is marked done
+        await asyncio.sleep(0)
+        join = asyncio.ensure_future(q.join())
+        await asyncio.sleep(0)
+        assert not join.done()
+        q.task_done()
+        await asyncio.wait_for(join, timeout=1.0)
+
+    asyncio.run(scenario())
+
+
+def test_wait_for_item_leaves_the_job_for_get():
+    async def scenario():
+        q = PriorityJobQueue()
+        waiter = asyncio.ensure_future(q.wait_for_item())
+        getter = asyncio.ensure_future(q.get())
+        await asyncio.sleep(0)
+        q.put_nowait("job", key="job")
+
+        await asyncio.wait_for(waiter, timeout=1.0)
+        assert await asyncio.wait_for(getter, timeout=1.0) == "job"
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_rejects_put_nowait():
+    q = PriorityJobQueue(maxsize=1)
+    q.put_nowait("a", key="a")
+    with pytest.raises(asyncio.QueueFull):
+        q.put_nowait("b", key="b")
+
+
+def test_ridge_fit_follows_samples_and_clamps_negative_weights():
+    samples = [((1.0, float(x)), 2.0 + 3.0 * x) for x in range(20)] * 5
+    fixed, slope = ridge_fit(samples, prior=[0.0, 0.0], prior_weight=0.01)
+    assert abs(fixed - 2.0) < 0.05 and abs(slope - 3.0) < 0.01
+
+    falling = [((1.0, float(x)), 10.0 - x) for x in range(10)] * 5
+    assert ridge_fit(falling, prior=[1.0, 1.0], prior_weight=0.01)[1] == 0.0
+    assert ridge_fit([], prior=[1.0, 2.0], prior_weight=2.0) == [1.0, 2.0]
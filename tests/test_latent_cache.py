@@ -0,0 +1,83 @@
+"""Memory and disk tiers of the input audio latent cache."""
+import os
+
+import torch
+
+from acestep.latent_cache import LatentCache
+
+ENTRY_BYTES = 1024 * 4  # one [1024] float32 latent
+
+
+def _entry(value: float):
+    return {"latent": torch.full((1024,), value)}
+
+
+def _files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".safetensors"))
+
+
+def test_key_covers_every_part():
+    assert LatentCache.key("src", "abc", (2, 48000)) == LatentCache.key("src", "abc", (2, 48000))
+    assert LatentCache.key("src", "abc", (2, 48000)) != LatentCache.key("ref", "abc", (2, 48000))
+
+
+def test_memory_only_cache(tmp_path):
+    cache = LatentCache(None, max_memory_bytes=1 << 20, max_disk_bytes=1 << 20)
+    assert cache.enabled and cache.directory is None
+    cache.put("k", {"latent": torch.arange(6.0).reshape(2, 3).t()})
+
+    latent = cache.get("k")["latent"]
+    assert latent.is_contiguous()
+    assert torch.equal(latent, torch.arange(6.0).reshape(2, 3).t())
+    assert not LatentCache(str(tmp_path), 0, 0).enabled
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    directory = str(tmp_path / "latents")
+    LatentCache(directory, 1 << 20, 1 << 20).put("k", _entry(1.0))
+
+    restarted = LatentCache(directory, 1 << 20, 1 << 20)
+    assert torch.equal(restarted.get("k")["latent"], _entry(1.0)["latent"])
+    assert restarted.get("k") is not None
+    assert restarted.stats()["disk_hits"] == 1
+    assert restarted.get("missing") is None
+
+
+def test_disk_tier_drops_least_recently_used_files(tmp_path):
+    directory = str(tmp_path / "latents")
+    cache = LatentCache(directory, 0, int(ENTRY_BYTES * 2.5))
+    cache.put("a", _entry(1.0))
+    cache.put("b", _entry(2.0))
+    for age, name in ((200, "a"), (100, "b")):
+        path = cache._path(name)
+        os.utime(path, (os.path.getmtime(path) - age,) * 2)
+    assert cache.get("a") is not None  # reading refreshes "a"
+
+    cache.put("c", _entry(3.0))
+    assert _files(directory) == ["a.safetensors", "c.safetensors"]
+    assert cache.get("b") is None
+
+
+def test_unreadable_file_is_dropped(tmp_path):
+    directory = str(tmp_path / "latents")
+    cache = LatentCache(directory, 0, 1 << 20)
+    with open(cache._path("k"), "wb") as f:
+        f.write(b"not a safetensors file")
+
+    assert cache.get("k") is None
+    assert _files(directory) == []
+
+
+def test_defaults_keep_disk_tier_and_reference_latents_off(monkeypatch):
+    import acestep.latent_cache as latent_cache
+
+    for name in ("ACESTEP_LATENT_CACHE_MB", "ACESTEP_LATENT_CACHE_DISK_MB", "ACESTEP_LATENT_CACHE_REFERENCES"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(latent_cache, "_latent_cache", None)
+    cache = latent_cache.get_latent_cache()
+    assert cache.enabled and cache.directory is None
+    assert not cache.cache_references
+
+    monkeypatch.setenv("ACESTEP_LATENT_CACHE_REFERENCES", "1")
+    monkeypatch.setattr(latent_cache, "_latent_cache", None)
+    assert latent_cache.get_latent_cache().cache_references
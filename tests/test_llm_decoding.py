@@ -0,0 +1,102 @@
+"""Custom PyTorch decode loops of LLMHandler on a tiny random Qwen3 model (CPU)."""
+from types import SimpleNamespace
+
+import pytest
+import torch
+from transformers import Qwen3Config, Qwen3ForCausalLM
+
+from acestep.llm_inference import LLMHandler
+
+VOCAB = 64
+PAD = 0
+EOS = VOCAB - 1
+MAX_NEW_TOKENS = 12
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    config = Qwen3Config(
+        vocab_size=VOCAB,
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        head_dim=8,
+        max_position_embeddings=128,
+        pad_token_id=PAD,
+        eos_token_id=EOS,
+    )
+    return Qwen3ForCausalLM(config).eval()
+
+
+def _handler(model, static: bool) -> LLMHandler:
+    handler = LLMHandler()
+    handler.llm = model
+    handler.llm_tokenizer = SimpleNamespace(eos_token_id=EOS)
+    handler.use_static_kv_cache = static
+    return handler
+
+
+def _greedy(handler, prompt):
+    ids = torch.tensor([prompt])
+    out = handler._generate_with_constrained_decoding(
+        ids, torch.ones_like(ids), MAX_NEW_TOKENS, temperature=0.0, top_k=None, top_p=None,
+        repetition_penalty=1.0, pad_token_id=PAD, streamer=None,
+    )
+    return out[0, len(prompt):].tolist()
+
+
+def _left_padded(prompts):
+    width = max(len(p) for p in prompts)
+    ids = torch.tensor([[PAD] * (width - len(p)) + p for p in prompts])
+    mask = torch.tensor([[0] * (width - len(p)) + [1] * len(p) for p in prompts])
+    return ids, mask
+
+
+PROMPTS = [[5, 9, 17, 3, 22, 8, 41], [12, 7], [30, 31, 2, 19]]
+
+
+@pytest.mark.parametrize("static", [False, True])
+def test_left_padded_batch_matches_per_item_greedy(model, static):
+    handler = _handler(model, static)
+    ids, mask = _left_padded(PROMPTS)
+    out, counts = handler._generate_batch_padded(
+        ids, mask, len(PROMPTS), MAX_NEW_TOKENS, temperature=0.0, cfg_scale=1.0, top_k=None, top_p=None,
+        repetition_penalty=1.0, pad_token_id=PAD,
+    )
+    assert (handler._static_kv_cache is not None) == static
+
+    reference = _handler(model, static=False)
+    for row, prompt in enumerate(PROMPTS):
+        expected = _greedy(reference, prompt)
+        assert out[row, ids.shape[1]:ids.shape[1] + counts[row]].tolist() == expected[:counts[row]]
+
+
+def test_static_cache_matches_dynamic_cache(model):
+    static, dynamic = _handler(model, static=True), _handler(model, static=False)
+    for prompt in PROMPTS:
+        assert _greedy(static, prompt) == _greedy(dynamic, prompt)
+    assert static._static_kv_cache is not None
+    assert dynamic._static_kv_cache is None
+
+    # CFG rows share one static cache of twice the batch
+    ids, mask = _left_padded([PROMPTS[0], PROMPTS[0][:3]])
+    outputs = [
+        handler._generate_with_cfg_custom(
+            ids, mask, MAX_NEW_TOKENS, temperature=0.0, cfg_scale=2.0, top_k=None, top_p=None,
+            repetition_penalty=1.0, pad_token_id=PAD, streamer=None,
+        )
+        for handler in (static, dynamic)
+    ]
+    assert torch.equal(outputs[0], outputs[1])
+
+
+def test_static_cache_defaults_to_cuda_only(model):
+    handler = LLMHandler()
+    assert handler.use_static_kv_cache is None
+    handler.device = "cpu"
+    assert handler._static_kv_cache_for(model, 1, 32) is None
+    handler.use_static_kv_cache = True
+    assert handler._static_kv_cache_for(model, 1, 32) is not None
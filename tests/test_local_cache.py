@@ -0,0 +1,70 @@
+"""Redis-style list operations and transactions of LocalCache."""
+import pytest
+
+from acestep.local_cache import LocalCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(LocalCache, "_instance", None)
+    cache = LocalCache(str(tmp_path / "local_redis"))
+    yield cache
+    cache.close()
+
+
+def test_push_and_pop(cache):
+    assert cache.rpush("q", "a", "b") == 2
+    assert cache.lpush("q", "y", "x") == 4  # last value ends up first
+    assert cache.lrange("q", 0, -1) == ["x", "y", "a", "b"]
+    assert cache.lpop("q") == "x"
+    assert cache.llen("q") == 3
+    assert cache.lpop("missing") is None
+    assert cache.llen("missing") == 0
+
+
+@pytest.mark.parametrize(
+    "start, end, expected",
+    [
+        (0, -1, ["a", "b", "c", "d"]),
+        (0, -2, ["a", "b", "c"]),
+        (1, 2, ["b", "c"]),
+        (-2, -1, ["c", "d"]),
+        (-10, 1, ["a", "b"]),
+        (0, 10, ["a", "b", "c", "d"]),
+        (0, -5, []),
+        (3, 1, []),
+    ],
+)
+def test_lrange_follows_redis_indexes(cache, start, end, expected):
+    cache.rpush("q", "a", "b", "c", "d")
+    assert cache.lrange("q", start, end) == expected
+
+
+def test_lrem(cache):
+    cache.rpush("q", "a", "b", "a", "a")
+    assert cache.lrem("q", 1, "a") == 1
+    assert cache.lrange("q", 0, -1) == ["b", "a", "a"]
+    assert cache.lrem("q", 0, "a") == 2
+    assert cache.lrange("q", 0, -1) == ["b"]
+    assert cache.lrem("q", 0, "zzz") == 0
+
+    cache.rpush("q", "a", "c", "a")
+    assert cache.lrem("q", -1, "a") == 1  # negative count removes from the tail, as in Redis
+    assert cache.lrange("q", 0, -1) == ["b", "a", "c"]
+
+
+def test_transact_rolls_back_on_error(cache):
+    cache.rpush("q", "a")
+    with pytest.raises(RuntimeError):
+        with cache.transact():
+            cache.rpush("q", "b")
+            cache.set("k", {"v": 1})
+            raise RuntimeError("boom")
+    assert cache.lrange("q", 0, -1) == ["a"]
+    assert cache.get("k") is None
+
+    with cache.transact():
+        assert cache.lpop("q") == "a"
+        cache.set("k", {"v": 2})
+    assert cache.llen("q") == 0
+    assert cache.get("k") == '{"v": 2}'
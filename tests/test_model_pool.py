@@ -0,0 +1,41 @@
+"""Tests for DiTModelPool residency (on CPU, the budget fits one model)."""
+
+from types import SimpleNamespace
+
+import torch
+
+from acestep.model_pool import DiTModelPool, ModelSpec
+
+
+def _pool(*names):
+    # Two 8x8 linear layers take 576 bytes; the budget fits one model
+    pool = DiTModelPool(vram_budget_gb=1000 / 1024 ** 3)
+    for name in names:
+        model = torch.nn.Sequential(torch.nn.Linear(8, 8), torch.nn.Linear(8, 8))
+        handler = SimpleNamespace(model=model, device="cpu", dtype=torch.float32, current_offload_cost=0.0)
+        pool.register(ModelSpec(name, name), handler)
+    return pool
+
+
+def _resident(pool):
+    return {m["name"]: m["resident"] for m in pool.stats()["models"]}
+
+
+def test_acquire_evicts_least_recently_used_idle_model():
+    pool = _pool("a", "b")
+    with pool.acquire("a") as handler:
+        assert handler.model(torch.zeros(1, 8)).shape == (1, 8)
+    with pool.acquire("b"):
+        pass
+    assert _resident(pool) == {"a": False, "b": True}
+    assert pool.stats()["evictions"] == 1
+
+
+def test_prefetch_does_not_evict_a_held_model():
+    pool = _pool("a", "b")
+    with pool.acquire("a"):
+        pass
+    with pool.hold("a"):
+        pool.prefetch("b")
+        pool._prefetch_executor.shutdown(wait=True)
+        assert _resident(pool) == {"a": True, "b": False}
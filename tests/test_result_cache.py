@@ -0,0 +1,71 @@
+"""Reproducibility checks and byte-bounded LRU of the generation result cache."""
+from types import SimpleNamespace
+
+import torch
+
+from acestep.inference import GenerationConfig, GenerationParams
+from acestep.result_cache import ResultCache, deterministic_seeds, result_cache_key
+
+
+def _dit():
+    return SimpleNamespace(model_name="acestep-v15-turbo", use_lora=False, lora_scale=1.0)
+
+
+def test_only_fully_pinned_seeds_are_deterministic():
+    assert deterministic_seeds(GenerationConfig(batch_size=2, use_random_seed=False, seeds=[1, 2])) == [1, 2]
+    assert deterministic_seeds(GenerationConfig(batch_size=1, use_random_seed=False, seeds=7)) == [7]
+
+    assert deterministic_seeds(GenerationConfig(batch_size=2, use_random_seed=True, seeds=[1, 2])) is None
+    assert deterministic_seeds(GenerationConfig(batch_size=2, use_random_seed=False, seeds=None)) is None
+    assert deterministic_seeds(GenerationConfig(batch_size=2, use_random_seed=False, seeds=[1])) is None
+    assert deterministic_seeds(GenerationConfig(batch_size=2, use_random_seed=False, seeds=[1, -1])) is None
+    assert deterministic_seeds(GenerationConfig(batch_size=1, use_random_seed=False, seeds=["x"])) is None
+
+
+def test_random_seeds_have_no_cache_key():
+    params = GenerationParams(caption="lofi piano")
+    config = GenerationConfig(batch_size=1, use_random_seed=True)
+    assert result_cache_key(_dit(), None, params, config) is None
+
+
+def test_cache_key_follows_seeds_and_ignores_lm_filled_fields():
+    params = GenerationParams(caption="lofi piano")
+    config = GenerationConfig(batch_size=1, use_random_seed=False, seeds=[42])
+    key = result_cache_key(_dit(), None, params, config)
+    assert key is not None
+
+    params.cot_bpm = 90
+    assert result_cache_key(_dit(), None, params, config) == key
+    other_seed = GenerationConfig(batch_size=1, use_random_seed=False, seeds=[43])
+    assert result_cache_key(_dit(), None, params, other_seed) != key
+
+
+def test_eviction_keeps_tensor_bytes_within_budget():
+    entry = {"audio": torch.zeros(256, dtype=torch.float32)}  # 1 KiB
+    cache = ResultCache(max_bytes=2048)
+    assert cache.put("a", entry)
+    assert cache.put("b", entry)
+    assert cache.get("a") is entry  # "b" becomes least recently used
+
+    assert cache.put("c", entry)
+    assert cache.get("b") is None
+    assert cache.get("a") is entry and cache.get("c") is entry
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"]) == (2, 2048)
+    assert (stats["hits"], stats["misses"]) == (3, 1)
+
+
+def test_entry_larger_than_budget_is_rejected():
+    cache = ResultCache(max_bytes=1024)
+    assert not cache.put("big", [torch.zeros(512, dtype=torch.float32)])
+    assert cache.stats()["entries"] == 0
+    assert not ResultCache(max_bytes=0).put("any", {})
+
+
+def test_views_count_the_storage_they_keep_alive():
+    batch = torch.zeros(4, 256, dtype=torch.float32)  # 4 KiB
+    cache = ResultCache(max_bytes=3072)
+    assert not cache.put("view", {"latents": batch[:1]})
+    item = batch[:1].clone()
+    assert cache.put("copy", {"latents": item, "first_row": item[0]})
+    assert cache.stats()["bytes"] == 1024  # both tensors share one storage
@@ -0,0 +1,84 @@
+"""Claim/lease semantics of the LocalCache-backed job store shared by API processes."""
+import time
+
+import pytest
+
+from acestep.api_server import SHARED_KEY_PREFIX, _SharedJobStore
+from acestep.local_cache import LocalCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(LocalCache, "_instance", None)
+    cache = LocalCache(str(tmp_path / "local_redis"))
+    yield cache
+    cache.close()
+
+
+def _store(cache, worker_id: str) -> _SharedJobStore:
+    store = _SharedJobStore(cache)
+    store._worker_id = worker_id
+    return store
+
+
+def _expire_leases(cache) -> None:
+    for key in cache.keys(f"{SHARED_KEY_PREFIX}lease:*"):
+        cache.set(key, {"worker": "gone", "expires_at": 0})
+
+
+def test_claim_runs_jobs_in_fifo_order(cache):
+    store = _store(cache, "a")
+    for job_id in ("j1", "j2"):
+        store.create_with_id(job_id)
+        store.enqueue(job_id, {"job": job_id}, maxsize=0)
+
+    assert store.queue_position("j2") == 2
+    assert store.claim(lease_seconds=60) == ("j1", {"job": "j1"})
+    assert store.claim(lease_seconds=60) == ("j2", {"job": "j2"})
+    assert store.claim(lease_seconds=60) is None
+
+
+def test_stale_owner_cannot_finish_a_requeued_job(cache):
+    slow, fresh = _store(cache, "slow"), _store(cache, "fresh")
+    slow.create_with_id("j1")
+    slow.enqueue("j1", {"prompt": "x"}, maxsize=0)
+    assert slow.claim(lease_seconds=60)[0] == "j1"
+
+    _expire_leases(cache)
+    assert fresh.requeue_expired() == ["j1"]
+    assert fresh.claim(lease_seconds=60) == ("j1", {"prompt": "x"})
+    fresh.mark_running("j1")
+
+    # The slow process finishes late: its result may not touch the new run
+    slow.mark_succeeded("j1", {"audio": "stale"})
+    assert slow.get("j1").status == "running"
+    assert cache.get(fresh._payload_key("j1")) is not None
+    assert fresh._owns_lease("j1")
+
+    fresh.mark_succeeded("j1", {"audio": "fresh"})
+    rec = fresh.get("j1")
+    assert (rec.status, rec.result) == ("succeeded", {"audio": "fresh"})
+    assert cache.get(fresh._lease_key("j1")) is None
+    assert cache.get(fresh._payload_key("j1")) is None
+
+
+def test_requeue_skips_live_leases(cache):
+    store = _store(cache, "a")
+    store.create_with_id("j1")
+    store.enqueue("j1", {}, maxsize=0)
+    store.claim(lease_seconds=60)
+    assert store.requeue_expired() == []
+
+    cache.set(store._lease_key("j1"), {"worker": "a", "expires_at": time.time() - 1})
+    assert store.requeue_expired() == ["j1"]
+    assert store.queue_position("j1") == 1
+
+
+def test_failing_an_unclaimed_job_is_recorded(cache):
+    store = _store(cache, "a")
+    store.create_with_id("j1")
+    store.enqueue("j1", {}, maxsize=0)
+    assert store.remove_queued("j1")
+
+    store.mark_failed("j1", "Cancelled: user")
+    assert store.get("j1").status == "failed"